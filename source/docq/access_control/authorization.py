@@ -0,0 +1,146 @@
+"""Per user authorization context.
+
+What a user may access: their orgs and org admin flags, super admin, user groups, and the shared spaces in their orgs
+they've been granted access to, publicly, directly or through a user group. Archived spaces are left out.
+Loaded in one go from the system db and cached per user for `AUTHORIZATION_CONTEXT_TTL_SEC`, so an API request
+resolves permissions with a single lookup.
+
+The org, user, space and user group mutation functions invalidate the cache in the process making the change. Other
+processes pick the change up when their entry expires.
+"""
+
+import logging as log
+import sqlite3
+import threading
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Optional, Self
+
+from cachetools import TTLCache
+from opentelemetry import trace
+
+import docq
+
+from ..config import SpaceType
+from ..domain import SpaceKey
+from ..support.store import get_sqlite_shared_system_file
+from .main import SpaceAccessType
+
+tracer = trace.get_tracer(__name__, docq.__version_str__)
+
+AUTHORIZATION_CONTEXT_TTL_SEC = 60
+
+_contexts: TTLCache[int, "AuthorizationContext"] = TTLCache(1024 * 10, AUTHORIZATION_CONTEXT_TTL_SEC)
+_contexts_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class AuthorizationContext:
+    """What a user is authorized to access."""
+
+    user_id: int
+    super_admin: bool
+    member_orgs: tuple[tuple[int, str], ...]
+    """[org id, org name] of the orgs the user is a member of."""
+    admin_org_ids: frozenset[int]
+    user_group_ids: frozenset[int]
+    shared_space_org_ids: dict[int, int]
+    """Org id by space id of the shared spaces in the user's orgs that they have been granted access to."""
+
+    @property
+    def org_ids(self: Self) -> list[int]:
+        """Ids of the orgs the user is a member of."""
+        return [org_id for org_id, _ in self.member_orgs]
+
+    def is_org_member(self: Self, org_id: int) -> bool:
+        """True if the user is a member of the org."""
+        return org_id in self.org_ids
+
+    def is_org_admin(self: Self, org_id: int) -> bool:
+        """True if the user is an admin of the org."""
+        return org_id in self.admin_org_ids
+
+    def get_shared_space_keys(self: Self, space_ids: list[int]) -> list[SpaceKey]:
+        """Keys for the shared spaces the user can access, from `space_ids`. Others are left out."""
+        return [
+            SpaceKey(SpaceType.SHARED, space_id, self.shared_space_org_ids[space_id])
+            for space_id in space_ids
+            if space_id in self.shared_space_org_ids
+        ]
+
+
+def _load_authorization_context(user_id: int) -> Optional[AuthorizationContext]:
+    with closing(sqlite3.connect(get_sqlite_shared_system_file())) as connection, closing(
+        connection.cursor()
+    ) as cursor:
+        user = cursor.execute("SELECT super_admin FROM users WHERE id = ? AND archived = 0", (user_id,)).fetchone()
+        if user is None:
+            return None
+        orgs = cursor.execute(
+            "SELECT o.id, o.name, om.org_admin FROM org_members om INNER JOIN orgs o ON om.user_id = ? AND om.org_id = o.id",
+            (user_id,),
+        ).fetchall()
+        org_ids = [org[0] for org in orgs]
+        groups = cursor.execute("SELECT group_id FROM user_group_members WHERE user_id = ?", (user_id,)).fetchall()
+        group_ids = [group[0] for group in groups]
+        org_placeholders, group_placeholders = ", ".join("?" * len(org_ids)), ", ".join("?" * len(group_ids))
+        spaces = cursor.execute(
+            f"""
+            SELECT DISTINCT s.id, s.org_id
+            FROM spaces s
+            INNER JOIN space_access sa ON sa.space_id = s.id
+            WHERE s.space_type = ? AND s.archived = 0 AND s.org_id IN ({org_placeholders})
+            AND (
+                sa.access_type = ?
+                OR (sa.access_type = ? AND sa.accessor_id = ?)
+                OR (sa.access_type = ? AND sa.accessor_id IN ({group_placeholders}))
+            )
+            """,  # noqa: S608
+            (
+                SpaceType.SHARED.name,
+                *org_ids,
+                SpaceAccessType.PUBLIC.name,
+                SpaceAccessType.USER.name,
+                user_id,
+                SpaceAccessType.GROUP.name,
+                *group_ids,
+            ),
+        ).fetchall()
+
+    return AuthorizationContext(
+        user_id=user_id,
+        super_admin=bool(user[0]),
+        member_orgs=tuple((org[0], org[1]) for org in orgs),
+        admin_org_ids=frozenset(org[0] for org in orgs if org[2]),
+        user_group_ids=frozenset(group_ids),
+        shared_space_org_ids={space[0]: space[1] for space in spaces},
+    )
+
+
+@tracer.start_as_current_span("authorization.get_authorization_context")
+def get_authorization_context(user_id: int) -> Optional[AuthorizationContext]:
+    """Get a user's authorization context, from the cache if present.
+
+    Returns:
+        Optional[AuthorizationContext]: None if the user doesn't exist or is archived.
+    """
+    span = trace.get_current_span()
+    with _contexts_lock:
+        context = _contexts.get(user_id)
+    span.set_attribute("cache_hit", context is not None)
+    if context is None:
+        context = _load_authorization_context(user_id)
+        if context is not None:
+            with _contexts_lock:
+                _contexts[user_id] = context
+    return context
+
+
+def invalidate_authorization_context(user_id: Optional[int] = None) -> None:
+    """Drop a user's cached authorization context, or every user's if `user_id` is None."""
+    with _contexts_lock:
+        if user_id is None:
+            _contexts.clear()
+        else:
+            _contexts.pop(user_id, None)
+    log.debug("Invalidated authorization context for user: %s", "all" if user_id is None else user_id)
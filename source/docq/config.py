@@ -8,7 +8,17 @@ ENV_VAR_DOCQ_LOGLEVEL = "DOCQ_LOGLEVEL"
 ENV_VAR_OPENAI_API_KEY = "DOCQ_OPENAI_API_KEY"
 ENV_VAR_DOCQ_COOKIE_HMAC_SECRET_KEY = "DOCQ_COOKIE_HMAC_SECRET_KEY"
 ENV_VAR_DOCQ_API_SECRET = "DOCQ_API_SECRET"
+ENV_VAR_DOCQ_WRITE_BEHIND = "DOCQ_WRITE_BEHIND"
+ENV_VAR_DOCQ_SQLITE_WAL = "DOCQ_SQLITE_WAL"
+ENV_VAR_DOCQ_USAGE_DB_MODE = "DOCQ_USAGE_DB_MODE"
+ENV_VAR_DOCQ_HISTORY_MEMORY = "DOCQ_HISTORY_MEMORY"
+ENV_VAR_DOCQ_SESSION_STORE = "DOCQ_SESSION_STORE"
+ENV_VAR_DOCQ_SESSION_ENCRYPTION_KEY = "DOCQ_SESSION_ENCRYPTION_KEY"
+ENV_VAR_DOCQ_DEDUPE_STORE = "DOCQ_DEDUPE_STORE"
 SESSION_COOKIE_NAME = "docqai/_docq"
+ENV_VAR_DOCQ_LLM_ORG_RPM = "DOCQ_LLM_ORG_RPM"
+ENV_VAR_DOCQ_LLM_USER_RPM = "DOCQ_LLM_USER_RPM"
+ENV_VAR_DOCQ_LLM_MAX_WAIT_SEC = "DOCQ_LLM_MAX_WAIT_SEC"
 
 ENV_VAR_DOCQ_GROQ_API_KEY = "DOCQ_GROQ_API_KEY"
 
@@ -23,6 +33,8 @@ ENV_VAR_DOCQ_AZURE_OPENAI_API_KEY2 = "DOCQ_AZURE_OPENAI_API_KEY2"  # key for bas
 ENV_VAR_DOCQ_SLACK_CLIENT_ID = "DOCQ_SLACK_CLIENT_ID"
 ENV_VAR_DOCQ_SLACK_CLIENT_SECRET = "DOCQ_SLACK_CLIENT_SECRET"  # noqa: S105
 ENV_VAR_DOCQ_SLACK_SIGNING_SECRET = "DOCQ_SLACK_SIGNING_SECRET"  # noqa: S105
+ENV_VAR_DOCQ_SLACK_EVENT_WORKERS = "DOCQ_SLACK_EVENT_WORKERS"
+ENV_VAR_DOCQ_SLACK_EVENT_QUEUE_SIZE = "DOCQ_SLACK_EVENT_QUEUE_SIZE"
 
 
 class SpaceType(Enum):
@@ -34,6 +46,15 @@ class SpaceType(Enum):
     THREAD = "thread"  # a space that belongs to a thread used for adhoc uploads.
 
 
+class SpaceIndexStatus(Enum):
+    """Index status of a space. Kept in the spaces table by `manage_spaces.reindex`."""
+
+    EMPTY = "empty"
+    INDEXING = "indexing"
+    READY = "ready"
+    FAILED = "failed"
+
+
 class SystemFeatureType(Enum):
     """System level feature types."""
 
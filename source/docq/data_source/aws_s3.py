@@ -1,16 +1,49 @@
 """Data source backed by AWS S3 (bucket)."""
 
+import logging as log
+import os
+from datetime import datetime
 from typing import List, Self
+from urllib.parse import urlparse
 
 from llama_index.core.schema import Document
 
-from ..domain import ConfigKey, DocumentListItem, SpaceKey
-from .main import SpaceDataSourceFileBased
+from ..domain import ConfigKey, SpaceKey
+from ..support.store import get_download_cache_dir, get_index_dir
+from .main import DocumentMetadata, SpaceDataSourceFileBased
+from .support.opendal_reader.base import OpendalReader
+
+DEFAULT_REGION = "us-east-1"
+
+
+def _parse_bucket_url(bucket_url: str) -> tuple[str, str]:
+    """Split a bucket url like `s3://bucket/some/prefix/` into the bucket name and a prefix.
+
+    A bare bucket name is accepted too. The prefix is empty or ends with `/`.
+    """
+    parsed = urlparse(bucket_url.strip())
+    if parsed.scheme:
+        bucket, prefix = parsed.netloc, parsed.path.strip("/")
+    else:
+        bucket, _, prefix = parsed.path.strip("/").partition("/")
+    if not bucket:
+        raise ValueError(f"Invalid S3 bucket URL: '{bucket_url}'")
+    return bucket, f"{prefix.strip('/')}/" if prefix.strip("/") else ""
+
+
+def _parse_file_extensions(file_extensions: str | None) -> List[str] | None:
+    """Parse a comma separated list of file extensions e.g. `pdf, .docx` into suffixes `[".pdf", ".docx"]`."""
+    if not file_extensions:
+        return None
+    suffixes = [f".{ext.strip().lstrip('.').lower()}" for ext in file_extensions.split(",") if ext.strip()]
+    return suffixes or None
 
 
 class AwsS3(SpaceDataSourceFileBased):
     """Space with data from AWS S3."""
 
+    supports_incremental_reindex = True
+
     def __init__(self: Self) -> None:
         """Initialize the data source."""
         super().__init__("AWS S3")
@@ -18,23 +51,86 @@ class AwsS3(SpaceDataSourceFileBased):
     def get_config_keys(self: Self) -> List[ConfigKey]:
         """Get the config keys for aws s3 bucket."""
         return [
-            ConfigKey("bucket_url", "S3 Bucket URL"),
+            ConfigKey(
+                "bucket_url",
+                "S3 Bucket URL",
+                ref_link="https://docqai.github.io/docq/user-guide/config-spaces/#data-source-aws-s3",
+            ),
+            ConfigKey(
+                "region",
+                "Region",
+                is_optional=True,
+                ref_link="https://docqai.github.io/docq/user-guide/config-spaces/#data-source-aws-s3",
+            ),
+            ConfigKey(
+                "access_key_id",
+                "Access Key ID",
+                is_optional=True,
+                ref_link="https://docqai.github.io/docq/user-guide/config-spaces/#data-source-aws-s3",
+            ),
+            ConfigKey(
+                "secret_access_key",
+                "Secret Access Key",
+                is_optional=True,
+                is_secret=True,
+                ref_link="https://docqai.github.io/docq/user-guide/config-spaces/#data-source-aws-s3",
+            ),
+            ConfigKey(
+                "endpoint",
+                "Endpoint URL",
+                is_optional=True,
+                ref_link="https://docqai.github.io/docq/user-guide/config-spaces/#data-source-aws-s3",
+            ),
+            ConfigKey(
+                "file_extensions",
+                "File Extensions",
+                is_optional=True,
+                ref_link="https://docqai.github.io/docq/user-guide/config-spaces/#data-source-aws-s3",
+            ),
         ]
 
+    def _get_reader_options(self: Self, configs: dict) -> dict:
+        """Map space configs to OpenDAL s3 service options."""
+        bucket, prefix = _parse_bucket_url(configs["bucket_url"])
+        options = {
+            "bucket": bucket,
+            "root": f"/{prefix}",
+            "region": configs.get("region") or DEFAULT_REGION,
+        }
+        for key in ("endpoint", "access_key_id", "secret_access_key"):
+            if configs.get(key):
+                options[key] = configs[key]
+        return options
+
     def load(self: Self, space: SpaceKey, configs: dict) -> List[Document]:
         """Load the documents from aws s3 bucket."""
-        # TODO: use aws s3 bucket to load the documents
-        raise NotImplementedError("Not implemented")
+        bucket, prefix = _parse_bucket_url(configs["bucket_url"])
+
+        def lambda_metadata(x: str) -> dict:
+            return {
+                str(DocumentMetadata.FILE_PATH.name).lower(): x,
+                str(DocumentMetadata.SPACE_ID.name).lower(): space.id_,
+                str(DocumentMetadata.SPACE_TYPE.name).lower(): space.type_.name,
+                str(DocumentMetadata.DATA_SOURCE_NAME.name).lower(): self.get_name(),
+                str(DocumentMetadata.DATA_SOURCE_TYPE.name).lower(): self.__class__.__base__.__name__,
+                str(DocumentMetadata.SOURCE_URI.name).lower(): f"s3://{bucket}/{prefix}{x}",
+                str(DocumentMetadata.INDEXED_ON.name).lower(): datetime.timestamp(datetime.now().utcnow()),
+                "file_name": os.path.basename(x),
+            }
+
+        loader = OpendalReader(
+            scheme="s3",
+            file_metadata=lambda_metadata,
+            file_suffixes=_parse_file_extensions(configs.get("file_extensions")),
+            cache_dir=get_download_cache_dir(space),
+            **self._get_reader_options(configs),
+        )
 
-    def get_document_list(self: Self, space: SpaceKey, configs: dict) -> List[DocumentListItem]:
-        """Returns a list of tuples containing the name, creation time, and size (Mb) of each document in the specified space's cnfigured data source.
+        documents = loader.load_data()
 
-        Args:
-            space (SpaceKey): The space to retrieve the document list for.
-            configs (dict): A dictionary of configuration options.
+        file_list = loader.get_document_list()
+        log.debug("Number of files: %s", len(file_list))
+        persist_path = get_index_dir(space)
+        self._save_document_list(file_list, persist_path, self._DOCUMENT_LIST_FILENAME)
 
-        Returns:
-            List[DocumentListItem]: A list of tuples containing the name, creation time, and size of each document in the specified space's upload directory.
-        """
-        # TODO: use aws s3 bucket to get the document list
-        raise NotImplementedError("Not implemented")
+        return documents
@@ -6,7 +6,7 @@ import os
 from abc import ABC, abstractmethod
 from dataclasses import asdict
 from enum import Enum
-from typing import List, Self
+from typing import List, Optional, Self
 
 from llama_index.core.schema import Document
 from opentelemetry import trace
@@ -42,6 +42,9 @@ trace = trace.get_tracer("docq.api.data_source")
 class SpaceDataSource(ABC):
     """Abstract definition of the data source for a space. To be extended by concrete data sources."""
 
+    supports_incremental_reindex: bool = False
+    """Set when `load` returns documents with stable ids and metadata across loads so a reindex only needs to embed new or changed documents."""
+
     def __init__(self: Self, name: str) -> None:
         """Initialize the data source."""
         self.name = name
@@ -80,6 +83,13 @@ class SpaceDataSource(ABC):
         """
         pass
 
+    def get_document_list_version(self: Self, space: SpaceKey, configs: dict) -> Optional[str]:
+        """Returns a value that changes whenever the document list changes, and is cheaper to get than the list.
+
+        Used as a HTTP ETag so unchanged document lists aren't loaded and sent again. None if not supported.
+        """
+        return None
+
 
 class SpaceDataSourceFileBased(SpaceDataSource):
     """Abstract definition of a file-based data source for a space. To be extended by concrete data sources."""
@@ -91,6 +101,14 @@ class SpaceDataSourceFileBased(SpaceDataSource):
         persist_path = get_index_dir(space)
         return self._load_document_list(persist_path, self._DOCUMENT_LIST_FILENAME)
 
+    def get_document_list_version(self: Self, space: SpaceKey, configs: dict) -> Optional[str]:
+        """The modified time and size of the saved document list."""
+        try:
+            stat = os.stat(os.path.join(get_index_dir(space), self._DOCUMENT_LIST_FILENAME))
+        except FileNotFoundError:
+            return "0"
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
     @trace.start_as_current_span("SpaceDataSourceFileBased._save_document_list")
     def _save_document_list(self: Self, document_list: List[DocumentListItem], persist_path: str, filename: str) -> None:
         path = os.path.join(persist_path, filename)
@@ -1,8 +1,9 @@
 """Data source for documents uploaded manually."""
 
+import hashlib
 import os
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 from llama_index.core.readers import SimpleDirectoryReader
 from llama_index.core.schema import Document
@@ -87,3 +88,11 @@ class ManualUpload(SpaceDataSourceFileBased):
                 os.scandir(get_upload_dir(space)),
             )
         )
+
+    def get_document_list_version(self, space: SpaceKey, configs: dict) -> Optional[str]:
+        """Hash of the name, change time and size of each file in the space's upload directory."""
+        hasher = hashlib.sha256()
+        for f in sorted(os.scandir(get_upload_dir(space)), key=lambda f: f.name):
+            stat = f.stat()
+            hasher.update(f"{f.name}:{stat.st_ctime_ns}:{stat.st_size}\n".encode())
+        return hasher.hexdigest()
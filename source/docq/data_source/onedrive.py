@@ -9,7 +9,7 @@ from llama_index.core.schema import Document
 
 from .. import services
 from ..domain import ConfigKey, SpaceKey
-from ..support.store import get_index_dir
+from ..support.store import get_download_cache_dir, get_index_dir
 from .main import DocumentMetadata, FileStorageServiceKeys, SpaceDataSourceFileBased
 from .support.opendal_reader.base import OneDriveReader, OpendalReader
 
@@ -17,6 +17,8 @@ from .support.opendal_reader.base import OneDriveReader, OpendalReader
 class OneDrive(SpaceDataSourceFileBased):
     """Space data source for OneDrive."""
 
+    supports_incremental_reindex = True
+
     def __init__(self: Self) -> None:
         """Initialize the data source."""
         super().__init__("OneDrive")
@@ -95,7 +97,8 @@ class OneDrive(SpaceDataSourceFileBased):
                 file_metadata=lambda_metadata,
                 root=root_path["name"],
                 access_token=configs[self.credential],
-                selected_folder_id=root_path["id"]
+                selected_folder_id=root_path["id"],
+                cache_dir=get_download_cache_dir(space),
             )
 
         documents = loader.load_data()
@@ -26,8 +26,14 @@ A loader that fetches a file or iterates through a directory on a object store l
 
 """
 import asyncio
+import hashlib
+import json
 import logging as log
+import os
 import tempfile
+import threading
+import time
+from contextlib import suppress
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Callable, Dict, List, Optional, Self, Type, Union, cast
@@ -44,6 +50,7 @@ from llama_index.readers.file.mbox import MboxReader
 from llama_index.readers.file.slides import PptxReader
 from llama_index.readers.file.tabular import PandasCSVReader
 from llama_index.readers.file.video_audio import VideoAudioReader
+from opentelemetry import trace
 
 from .... import services
 from ....domain import DocumentListItem
@@ -64,6 +71,80 @@ DEFAULT_FILE_READER_CLS: Dict[str, Type[BaseReader]] = {
     ".ipynb": IPYNBReader,
 }
 
+MAX_CONCURRENT_EXTRACTIONS = 4
+"""Upper bound on the number of files having their content extracted at once. Each worker thread keeps its own reader instances."""
+
+MAX_CONCURRENT_DOWNLOADS = 8
+"""Upper bound on the number of files downloaded in parallel from a file storage service."""
+
+OPENDAL_READ_BUFFER_SIZE = 1024 * 1024 * 4  # 4MB
+"""Size of the chunks objects are copied to disk in. Bounds the memory used per download."""
+
+PROGRESS_REPORT_INTERVAL = 25
+"""Number of files downloaded between progress events on the indexing span."""
+
+_MANIFEST_FILENAME = ".manifest.json"
+_GDRIVE_SYNC_STATE_FILENAME = ".gdrive_sync.json"
+_INDEXED_ON_METADATA_KEY = "indexed_on"
+_PLAIN_TEXT_READER_NAME = "PlainText"
+
+
+class FileReaderRegistry:
+    """Maps file suffixes to reader factories and hands out cached reader instances.
+
+    Readers are only constructed the first time a file with a matching suffix is extracted, as some load heavy
+    dependencies or models. Instances are cached per thread, so each extraction worker reuses its own readers without
+    sharing them across threads. Suffixes that map to the same factory (e.g. `.jpg` and `.png`) share an instance.
+
+    Plug-in readers override the defaults for a suffix e.g. `file_reader_registry.register(".pdf", FastPDFReader)`.
+    """
+
+    def __init__(self: Self, readers: Optional[Dict[str, Callable[[], BaseReader]]] = None) -> None:
+        """Initialize the registry.
+
+        Args:
+            readers (Optional[Dict[str, Callable[[], BaseReader]]]): mapping of file suffix to a reader class, or any callable that returns a reader.
+        """
+        self._factories: Dict[str, Callable[[], BaseReader]] = {
+            suffix.lower(): factory for suffix, factory in (readers or {}).items()
+        }
+        self._local = threading.local()
+
+    def register(self: Self, suffix: str, factory: Callable[[], BaseReader]) -> None:
+        """Register a reader for a file suffix, replacing any existing reader for that suffix."""
+        self._factories = {**self._factories, suffix.lower(): factory}
+
+    def supports(self: Self, suffix: str) -> bool:
+        """True if there's a reader registered for the file suffix."""
+        return suffix.lower() in self._factories
+
+    @property
+    def suffixes(self: Self) -> List[str]:
+        """File suffixes with a registered reader."""
+        return list(self._factories.keys())
+
+    def get_reader(self: Self, suffix: str) -> Optional[BaseReader]:
+        """Get this thread's instance of the reader for a file suffix, constructing it on first use.
+
+        Returns:
+            The reader or None if no reader is registered for the suffix.
+        """
+        factory = self._factories.get(suffix.lower())
+        if factory is None:
+            return None
+        if not hasattr(self._local, "readers"):
+            self._local.readers = {}
+        reader = self._local.readers.get(factory)
+        if reader is None:
+            log.debug("constructing file reader for suffix: %s", suffix)
+            reader = factory()
+            self._local.readers[factory] = reader
+        return reader
+
+
+file_reader_registry = FileReaderRegistry(DEFAULT_FILE_READER_CLS)
+"""Default registry used to extract file content. Register plug-in readers here."""
+
 FILE_MIME_EXTENSION_MAP: Dict[str, str] = {
     "application/pdf": ".pdf",
     "application/vnd.openxmlformats-officedocument.wordprocessingml.document": ".docx",
@@ -96,6 +177,10 @@ class OpendalReader(BaseReader):
         path: str = "/",
         file_extractor: Optional[Dict[str, Union[str, BaseReader]]] = None,
         file_metadata: Optional[Callable[[str], Dict]] = None,
+        max_concurrency: int = MAX_CONCURRENT_DOWNLOADS,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        file_suffixes: Optional[List[str]] = None,
+        cache_dir: Optional[str] = None,
         **kwargs: Optional[dict[str, Any]],
     ) -> None:
         """Initialize opendal operator, along with credentials if needed.
@@ -105,16 +190,24 @@ class OpendalReader(BaseReader):
             path (str): the path of the data. If none is provided,
                 this loader will iterate through the entire bucket. If path is endswith `/`, this loader will iterate through the entire dir. Otherwise, this loader will load the file.
             file_extractor (Optional[Dict[str, BaseReader]]): A mapping of file
-                extension to a BaseReader class that specifies how to convert that file
-                to text. NOTE: this isn't implemented yet.
+                extension to a BaseReader instance that specifies how to convert that file
+                to text. Overrides the reader in `file_reader_registry` for that extension.
             file_metadata (Optional[Callable[[str], Dict]]): A function that takes a source file path and returns a dictionary of metadata to be added to the Document object.
+            max_concurrency (int): maximum number of objects downloaded at once when loading a dir.
+            on_progress (Optional[Callable[[int, int], None]]): called with (files downloaded, bytes downloaded) as each object completes. Defaults to adding events to the current trace span.
+            file_suffixes (Optional[List[str]]): only load objects with one of these suffixes e.g. `[".pdf"]`. Loads all objects when None.
+            cache_dir (Optional[str]): A directory to keep downloaded objects in between loads. When set, objects whose ETag hasn't changed since the last load aren't downloaded again. When None a temp directory is used.
             **kwargs (Optional dict[str, any]): Additional arguments to pass to the `opendal.AsyncOperator` constructor. These are the scheme (object store) specific options.
         """
         super().__init__()
         self.path = path
         self.file_metadata = file_metadata
+        self.max_concurrency = max_concurrency
+        self.on_progress = on_progress if on_progress is not None else _report_download_progress
+        self.file_suffixes = [suffix.lower() for suffix in file_suffixes] if file_suffixes else None
+        self.cache_dir = cache_dir
 
-        self.supported_suffix = list(DEFAULT_FILE_READER_CLS.keys())
+        self.supported_suffix = file_reader_registry.suffixes
 
         self.async_op = opendal.AsyncOperator(scheme, **kwargs)
 
@@ -124,24 +217,43 @@ class OpendalReader(BaseReader):
             self.file_extractor = {}
 
         self.documents: List[Document] = []
+        self.downloaded_files: List[tuple[str, str, int, int]] = []
 
     def load_data(self: Self) -> List[Document]:
         """Load file(s) from OpenDAL."""
+        if self.cache_dir is not None:
+            return self._load_data(self.cache_dir)
+
         # TODO: think about the private and secure aspect of this temp folder.
         # NOTE: the following code cleans up the temp folder when existing the context.
-
         with tempfile.TemporaryDirectory() as temp_dir:
-            if not self.path.endswith("/"):
-                result = asyncio.run(download_file_from_opendal(self.async_op, temp_dir, self.path))
-                self.downloaded_files.append(result)
-            else:
-                self.downloaded_files = asyncio.run(download_dir_from_opendal(self.async_op, temp_dir, self.path))
+            return self._load_data(temp_dir)
 
-            self.documents = asyncio.run(
-                extract_files(
-                    self.downloaded_files, file_extractor=self.file_extractor, file_metadata=self.file_metadata
+    def _load_data(self: Self, download_dir: str) -> List[Document]:
+        """Download file(s) into `download_dir` then extract their content."""
+        if not self.path.endswith("/"):
+            result = asyncio.run(download_file_from_opendal(self.async_op, download_dir, self.path))
+            self.downloaded_files = [result]
+        else:
+            manifest = _load_manifest(download_dir)
+            self.downloaded_files = asyncio.run(
+                download_dir_from_opendal(
+                    self.async_op,
+                    download_dir,
+                    self.path,
+                    max_concurrency=self.max_concurrency,
+                    on_progress=self.on_progress,
+                    file_suffixes=self.file_suffixes,
+                    manifest=manifest,
                 )
             )
+            _save_manifest(download_dir, manifest)
+
+        self.documents = asyncio.run(
+            extract_files(
+                self.downloaded_files, file_extractor=self.file_extractor, file_metadata=self.file_metadata
+            )
+        )
 
         return self.documents
 
@@ -168,6 +280,7 @@ class FileStorageBaseReader(BaseReader):
         path: str = "/",
         file_extractor: Optional[Dict[str, Union[str, BaseReader]]] = None,
         file_metadata: Optional[Callable[[str], Dict]] = None,
+        cache_dir: Optional[str] = None,
         **kwargs: Optional[dict[str, Any]],
         ) -> None:
         """Initialize File storage service reader.
@@ -179,25 +292,34 @@ class FileStorageBaseReader(BaseReader):
             root (str): the root folder to start the iteration
             selected_folder_id (Optional[str] = None): the selected folder id
             file_extractor (Optional[Dict[str, BaseReader]]): A mapping of file
-                extension to a BaseReader class that specifies how to convert that file
-                to text. NOTE: this isn't implemented yet.
+                extension to a BaseReader instance that specifies how to convert that file
+                to text. Overrides the reader in `file_reader_registry` for that extension.
             file_metadata (Optional[Callable[[str], Dict]]): A function that takes a source file path and returns a dictionary of metadata to be added to the Document object.
+            cache_dir (Optional[str]): A directory to keep downloaded files in between loads. When set, files whose version (`modifiedTime`/`eTag`) hasn't changed since the last load aren't downloaded again. When None a temp directory is used.
             kwargs (Optional dict[str, any]): Additional arguments to pass to the specific file storage service.
         """
         super().__init__()
         self.path = path
         self.file_extractor = file_extractor if file_extractor is not None else {}
-        self.supported_suffix = list(DEFAULT_FILE_READER_CLS.keys())
+        self.supported_suffix = file_reader_registry.suffixes
         self.access_token = access_token
         self.root = root
         self.file_metadata = file_metadata
         self.selected_folder_id = selected_folder_id
+        self.cache_dir = cache_dir
         self.documents: List[Document] = []
         self.kwargs = kwargs
         self.downloaded_files: List[tuple[str, str, int, int]] = []
 
     def load_data(self: Self) -> List[Document]:
         """Load file(s) from file storage."""
+        if self.cache_dir is not None:
+            return self._load_data(self.cache_dir)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            return self._load_data(temp_dir)
+
+    def _load_data(self: Self, download_dir: str) -> List[Document]:
+        """Download files into `download_dir` then extract their content."""
         raise NotImplementedError
 
     def get_document_list(self: Self) -> List[DocumentListItem]:
@@ -224,6 +346,7 @@ class GoogleDriveReader(FileStorageBaseReader):
         path: str = "/",
         file_extractor: Optional[Dict[str, Union[str, BaseReader]]] = None,
         file_metadata: Optional[Callable[[str], Dict]] = None,
+        cache_dir: Optional[str] = None,
     ) -> None:
         """Initialize Google Drive reader."""
         super().__init__(
@@ -233,27 +356,31 @@ class GoogleDriveReader(FileStorageBaseReader):
             path=path,
             file_extractor=file_extractor,
             file_metadata=file_metadata,
+            cache_dir=cache_dir,
         )
 
-    def load_data(self: Self) -> List[Document]:
-        """Load file(s) from Google Drive."""
-        service = services.google_drive.get_drive_service(self.access_token)
+    def _load_data(self: Self, download_dir: str) -> List[Document]:
+        """Load file(s) from Google Drive, including sub folders."""
+
+        def _get_service() -> Any:
+            return services.google_drive.get_thread_drive_service(self.access_token)
+
         id_ = self.selected_folder_id if self.selected_folder_id is not None else "root"
-        folder_content = service.files().list(
-            q=f"'{id_}' in parents and trashed=false",
-            fields="files(id, name, parents, mimeType, modifiedTime, webViewLink, webContentLink, size, fullFileExtension)",
-        ).execute()
-        files = folder_content.get("files", [])
-        with tempfile.TemporaryDirectory() as temp_dir:
-            self.downloaded_files = asyncio.run(
-                download_from_gdrive(files, temp_dir, service)
-            )
+        sync_state = _load_manifest(download_dir, _GDRIVE_SYNC_STATE_FILENAME)
+        files = asyncio.run(sync_gdrive_files(_get_service, id_, sync_state))
+        _save_manifest(download_dir, sync_state, _GDRIVE_SYNC_STATE_FILENAME)
 
-            self.documents = asyncio.run(
-                extract_files(
-                    self.downloaded_files, file_extractor=self.file_extractor, file_metadata=self.file_metadata
-                )
+        manifest = _load_manifest(download_dir)
+        self.downloaded_files = asyncio.run(
+            download_from_gdrive(list(files.values()), download_dir, _get_service, manifest=manifest)
+        )
+        _save_manifest(download_dir, manifest)
+
+        self.documents = asyncio.run(
+            extract_files(
+                self.downloaded_files, file_extractor=self.file_extractor, file_metadata=self.file_metadata
             )
+        )
 
         return self.documents
 
@@ -269,6 +396,7 @@ class OneDriveReader(FileStorageBaseReader):
         path: str = "/",
         file_extractor: Optional[Dict[str, Union[str, BaseReader]]] = None,
         file_metadata: Optional[Callable[[str], Dict]] = None,
+        cache_dir: Optional[str] = None,
     ) -> None:
         """Initialize OneDrive reader."""
         super().__init__(
@@ -278,79 +406,325 @@ class OneDriveReader(FileStorageBaseReader):
             path=path,
             file_extractor=file_extractor,
             file_metadata=file_metadata,
+            cache_dir=cache_dir,
         )
 
-    def load_data(self: Self) -> List[Document]:
+    def _load_data(self: Self, download_dir: str) -> List[Document]:
         """Load file(s) from OneDrive."""
         client = services.ms_onedrive.get_client(self.access_token)
         id_ = self.selected_folder_id if self.selected_folder_id is not None else "/drive/root:"
         if client is not None:
             response = client.files.drive_specific_folder(id_, {
-                "$select": "id,name,file,size,webUrl",
+                "$select": "id,name,file,size,webUrl,eTag,lastModifiedDateTime,@microsoft.graph.downloadUrl",
                 "$filter": "file ne null",
                 "$top": 100, # Limiting to a maximum of 100 files for now.
             })
             files = response.data.get("value", [])
-            with tempfile.TemporaryDirectory() as temp_dir:
-                self.downloaded_files = asyncio.run(
-                    download_from_onedrive(files, temp_dir, client)
-                )
+            manifest = _load_manifest(download_dir)
+            self.downloaded_files = asyncio.run(
+                download_from_onedrive(files, download_dir, client, manifest=manifest)
+            )
+            _save_manifest(download_dir, manifest)
 
-                self.documents = asyncio.run(
-                    extract_files(
-                        self.downloaded_files, file_extractor=self.file_extractor, file_metadata=self.file_metadata
-                    )
+            self.documents = asyncio.run(
+                extract_files(
+                    self.downloaded_files, file_extractor=self.file_extractor, file_metadata=self.file_metadata
                 )
+            )
         return self.documents
 
 
-async def download_from_onedrive(files: List[dict], temp_dir: str, client: Any,) -> List[tuple[str, str, int, int]]:
-    """Download files from OneDrive."""
-    downloaded_files: List[tuple[str, str, int, int]] = []
+def _load_manifest(download_dir: str, filename: str = _MANIFEST_FILENAME) -> dict[str, Any]:
+    """Load the record of files previously downloaded into `download_dir`, keyed by the storage service file id."""
+    path = os.path.join(download_dir, filename)
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        log.warning("Ignoring unreadable download manifest '%s': %s", path, e)
+        return {}
+
+
+def _save_manifest(download_dir: str, manifest: dict[str, Any], filename: str = _MANIFEST_FILENAME) -> None:
+    """Persist the download manifest."""
+    path = os.path.join(download_dir, filename)
+    try:
+        with open(path, "w") as f:
+            json.dump(manifest, f)
+    except Exception as e:
+        log.error("Failed to save download manifest '%s': %s", path, e)
+
+
+def _prune_manifest(manifest: dict[str, dict], keep_ids: set[str]) -> None:
+    """Drop manifest entries, and their local files, for files that no longer exist in the storage service."""
+    for file_id in [id_ for id_ in manifest if id_ not in keep_ids]:
+        entry = manifest.pop(file_id)
+        with suppress(FileNotFoundError):
+            os.remove(entry["local_path"])
+
+
+def _unchanged_download(manifest: dict[str, dict], file_id: str, version: Optional[str]) -> Optional[dict]:
+    """Return the manifest entry for a file if it was already downloaded at the same version."""
+    entry = manifest.get(file_id)
+    if entry is None or version is None or entry.get("version") != version:
+        return None
+    return entry if os.path.exists(entry["local_path"]) else None
+
+
+async def _download_files(
+    files: List[dict],
+    download: Callable[[dict], Any],
+    max_concurrency: int,
+) -> List[tuple[str, str, int, int]]:
+    """Run `download` for each file with at most `max_concurrency` in flight, preserving the order of `files`."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _bounded(file: dict) -> Optional[tuple[str, str, int, int]]:
+        async with semaphore:
+            return await download(file)
+
+    results = await asyncio.gather(*[_bounded(file) for file in files])
+    return [result for result in results if result is not None]
+
+
+async def download_from_onedrive(
+    files: List[dict],
+    temp_dir: str,
+    client: Any,
+    manifest: Optional[dict[str, dict]] = None,
+    max_concurrency: int = MAX_CONCURRENT_DOWNLOADS,
+) -> List[tuple[str, str, int, int]]:
+    """Download files from OneDrive in parallel.
+
+    Args:
+        files: OneDrive drive items to download.
+        temp_dir: directory to download into.
+        client: OneDrive client.
+        manifest: record of previous downloads into `temp_dir`. Files whose `eTag` is unchanged are not downloaded
+            again. It's updated in place.
+        max_concurrency: maximum number of files downloaded at once.
 
-    for file in files:
+    Returns:
+        a list of tuples (source path, local path, indexed_on, size).
+    """
+    manifest = manifest if manifest is not None else {}
+
+    async def _download(file: dict) -> Optional[tuple[str, str, int, int]]:
         suffix = Path(file["name"]).suffix
-        if suffix not in DEFAULT_FILE_READER_CLS:
+        if not file_reader_registry.supports(suffix):
             log.debug("file suffix not supported: %s", suffix)
-            continue
-        file_path = f"{temp_dir}/{file['name']}"
-        indexed_on = datetime.timestamp(datetime.now().utcnow())
-        await asyncio.to_thread(
-            services.ms_onedrive.download_file, client, file["id"], file_path
-        )
-        downloaded_files.append(
-            (file["webUrl"], file_path, int(indexed_on), int(file["size"]))
+            return None
+        version = file.get("eTag")
+        unchanged = _unchanged_download(manifest, file["id"], version)
+        if unchanged is not None:
+            log.debug("file unchanged since last download, skipping: %s", file["name"])
+            return (file["webUrl"], unchanged["local_path"], unchanged["indexed_on"], int(file["size"]))
+
+        file_path = f"{temp_dir}/{file['id']}{suffix}"
+        indexed_on = int(datetime.timestamp(datetime.now().utcnow()))
+        downloaded = await asyncio.to_thread(
+            services.ms_onedrive.download_file,
+            client,
+            file["id"],
+            file_path,
+            file.get("@microsoft.graph.downloadUrl"),
+            etag=version,
         )
+        if not downloaded:
+            return None
+        manifest[file["id"]] = {"version": version, "local_path": file_path, "indexed_on": indexed_on}
+        return (file["webUrl"], file_path, indexed_on, int(file["size"]))
 
-    return downloaded_files
+    _prune_manifest(manifest, {file["id"] for file in files})
+    return await _download_files(files, _download, max_concurrency)
 
 
-async def download_from_gdrive(files: List[dict], temp_dir: str, service: Any,) -> List[tuple[str, str, int, int]]:
-    """Download files from Google Drive."""
-    downloaded_files: List[tuple[str, str, int, int]] = []
+async def list_gdrive_files(
+    get_service: Callable[[], Any],
+    folder_id: str,
+    max_concurrency: int = MAX_CONCURRENT_DOWNLOADS,
+) -> tuple[dict[str, dict], set[str]]:
+    """Recursively list the files below a Google Drive folder.
 
-    for file in files:
-        if file["mimeType"] == "application/vnd.google-apps.folder":
-            # TODO: Implement recursive folder download
-            continue
-        suffix = FILE_MIME_EXTENSION_MAP.get(file["mimeType"], None)
-        if suffix not in DEFAULT_FILE_READER_CLS:
-            continue
+    The tree is walked one level at a time, listing the folders of each level in parallel.
+
+    Returns:
+        (files keyed by id, ids of all folders in the tree including `folder_id`).
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    files: dict[str, dict] = {}
+    folders = {folder_id}
+    pending = [folder_id]
+
+    async def _list(id_: str) -> List[dict]:
+        async with semaphore:
+            return await asyncio.to_thread(lambda: services.google_drive.list_folder_children(get_service(), id_))
+
+    while pending:
+        results = await asyncio.gather(*[_list(id_) for id_ in pending])
+        pending = []
+        for children in results:
+            for child in children:
+                if child["mimeType"] != services.google_drive.FOLDER_MIME_TYPE:
+                    files[child["id"]] = child
+                elif child["id"] not in folders:
+                    folders.add(child["id"])
+                    pending.append(child["id"])
+    log.debug("listed %s files in %s folders below %s", len(files), len(folders), folder_id)
+    return files, folders
+
+
+def _apply_gdrive_changes(state: dict[str, Any], changes: List[dict]) -> bool:
+    """Apply Drive changes API results to the synced file list in `state`.
+
+    Returns:
+        False if a folder was added to, moved or removed from the tree. The folder structure isn't tracked beyond
+        folder ids so the tree needs to be listed again.
+    """
+    files: dict[str, dict] = state["files"]
+    folders = set(state["folders"])
+    for change in changes:
+        file_id = change.get("fileId")
+        file = change.get("file")
+        removed = change.get("removed", False) or file is None or file.get("trashed", False)
+        parents = set(file.get("parents", [])) if file else set()
+        in_tree = not removed and bool(folders.intersection(parents))
+        if file_id in folders:
+            if removed or (file_id != state["root_id"] and not in_tree):
+                return False
+        elif file is not None and file["mimeType"] == services.google_drive.FOLDER_MIME_TYPE:
+            if in_tree:
+                return False
+        elif in_tree:
+            files[file_id] = file
+        else:
+            files.pop(file_id, None)
+    return True
+
+
+async def sync_gdrive_files(
+    get_service: Callable[[], Any],
+    folder_id: str,
+    state: dict[str, Any],
+    max_concurrency: int = MAX_CONCURRENT_DOWNLOADS,
+) -> dict[str, dict]:
+    """Get the files below a Google Drive folder, only fetching what changed since the last sync when possible.
+
+    The first sync lists the whole tree and records a changes API start page token in `state`. Later syncs apply the
+    changes since that token to the recorded file list. `state` is updated in place and should be persisted between
+    syncs.
+
+    Returns:
+        files keyed by id.
+    """
+    if state.get("root_id") == folder_id and state.get("start_page_token"):
+        try:
+            changes, new_start_page_token = await asyncio.to_thread(
+                lambda: services.google_drive.list_changes(get_service(), state["start_page_token"])
+            )
+            if _apply_gdrive_changes(state, changes):
+                state["start_page_token"] = new_start_page_token
+                log.debug("applied %s drive changes for folder %s", len(changes), folder_id)
+                return state["files"]
+            log.info("Folder structure below %s changed, listing all files again.", folder_id)
+        except Exception as e:
+            log.warning("Failed to list drive changes, listing all files again: %s", e)
+
+    # Take the token before listing so changes made during the listing are picked up by the next sync.
+    start_page_token = await asyncio.to_thread(lambda: services.google_drive.get_start_page_token(get_service()))
+    files, folders = await list_gdrive_files(get_service, folder_id, max_concurrency)
+    state.clear()
+    state.update(
+        {"root_id": folder_id, "start_page_token": start_page_token, "folders": sorted(folders), "files": files}
+    )
+    return files
+
+
+async def download_from_gdrive(
+    files: List[dict],
+    temp_dir: str,
+    get_service: Callable[[], Any],
+    manifest: Optional[dict[str, dict]] = None,
+    max_concurrency: int = MAX_CONCURRENT_DOWNLOADS,
+) -> List[tuple[str, str, int, int]]:
+    """Download files from Google Drive in parallel.
+
+    Args:
+        files: Google Drive files to download.
+        temp_dir: directory to download into.
+        get_service: returns a drive service for the calling thread. Downloads run on worker threads and the drive
+            service isn't thread-safe.
+        manifest: record of previous downloads into `temp_dir`. Files whose `modifiedTime` is unchanged are not
+            downloaded again. It's updated in place.
+        max_concurrency: maximum number of files downloaded at once.
 
-        file_path = f"{temp_dir}/{file['name']}"
-        indexed_on = datetime.timestamp(datetime.now().utcnow())
-        await asyncio.to_thread(
-            services.google_drive.download_file, service, file["id"], file_path, file["mimeType"]
+    Returns:
+        a list of tuples (source path, local path, indexed_on, size).
+    """
+    manifest = manifest if manifest is not None else {}
+
+    async def _download(file: dict) -> Optional[tuple[str, str, int, int]]:
+        if file["mimeType"] == services.google_drive.FOLDER_MIME_TYPE:
+            # folders are expanded when listing, see `list_gdrive_files`.
+            return None
+        suffix = FILE_MIME_EXTENSION_MAP.get(file["mimeType"], None)
+        if suffix is None or not file_reader_registry.supports(suffix):
+            return None
+        version = file.get("modifiedTime")
+        unchanged = _unchanged_download(manifest, file["id"], version)
+        if unchanged is not None:
+            log.debug("file unchanged since last download, skipping: %s", file["name"])
+            return (file["webViewLink"], unchanged["local_path"], unchanged["indexed_on"], int(file["size"]))
+
+        file_path = f"{temp_dir}/{file['id']}{suffix}"
+        indexed_on = int(datetime.timestamp(datetime.now().utcnow()))
+        downloaded = await asyncio.to_thread(
+            lambda: services.google_drive.download_file(
+                get_service(),
+                file["id"],
+                file_path,
+                file["mimeType"],
+                version=version,
+                size=int(file["size"]) if "size" in file else None,
+            )
         )
-        downloaded_files.append(
-            (file["webViewLink"], file_path, int(indexed_on), int(file["size"]))
+        if not downloaded:
+            return None
+        manifest[file["id"]] = {"version": version, "local_path": file_path, "indexed_on": indexed_on}
+        return (file["webViewLink"], file_path, indexed_on, int(file["size"]))
+
+    _prune_manifest(manifest, {file["id"] for file in files})
+    return await _download_files(files, _download, max_concurrency)
+
+
+def _report_download_progress(files_downloaded: int, bytes_downloaded: int) -> None:
+    """Record download progress as an event on the current span, which is the indexing job's span during reindex."""
+    if files_downloaded % PROGRESS_REPORT_INTERVAL == 0:
+        trace.get_current_span().add_event(
+            "download_progress", {"files_downloaded": files_downloaded, "bytes_downloaded": bytes_downloaded}
         )
+    log.debug("downloaded %s files, %s bytes", files_downloaded, bytes_downloaded)
 
-    return downloaded_files
 
+async def download_file_from_opendal(
+    op: Any,
+    temp_dir: str,
+    path: str,
+    buffer_size: int = OPENDAL_READ_BUFFER_SIZE,
+    filepath: Optional[str] = None,
+    content_length: Optional[int] = None,
+) -> tuple[str, str, int, int]:
+    """Download file from OpenDAL, copying it to disk in `buffer_size` chunks.
 
-async def download_file_from_opendal(op: Any, temp_dir: str, path: str) -> tuple[str, str, int, int]:
-    """Download file from OpenDAL.
+    Args:
+        op: opendal operator
+        temp_dir: directory to download into.
+        path: path of the object to download.
+        buffer_size: size of the chunks read from the object.
+        filepath: local path to download to. Defaults to a random file name in `temp_dir`.
+        content_length: size of the object if already known, saves a `stat` call.
 
     Returns:
         a tuple (source path, local path, indexed_on, size)
@@ -361,32 +735,83 @@ async def download_file_from_opendal(op: Any, temp_dir: str, path: str) -> tuple
     op = cast(opendal.AsyncOperator, op)
 
     suffix = Path(path).suffix
-    filepath = f"{temp_dir}/{next(tempfile._get_candidate_names())}{suffix}" # type: ignore
+    if filepath is None:
+        filepath = f"{temp_dir}/{next(tempfile._get_candidate_names())}{suffix}" # type: ignore
     file_size = 0
     indexed_on = datetime.timestamp(datetime.now().utcnow())
+    remaining = content_length if content_length is not None else (await op.stat(path)).content_length
     async with op.open_reader(path) as r:
         with open(filepath, "wb") as w:
-            b = await r.read()
-            w.write(b)
-            file_size = len(b)
+            while remaining > 0:
+                # NOTE: `read(size)` fails with 'early eof' if less than `size` bytes are left so never ask for more.
+                b = await r.read(min(buffer_size, remaining))
+                if not b:
+                    raise EOFError(f"'{path}' ended {remaining} bytes before its content length")
+                w.write(b)
+                remaining -= len(b)
+                file_size += len(b)
 
-    return (filepath, filepath, int(indexed_on), file_size)
+    return (path, filepath, int(indexed_on), file_size)
+
+
+async def list_opendal_dir(
+    op: Any,
+    dir_: str,
+    on_file: Callable[[str], Any],
+    max_concurrency: int = MAX_CONCURRENT_DOWNLOADS,
+) -> None:
+    """Recursively list a directory, awaiting `on_file` with the path of each file found.
+
+    The tree is walked one level at a time, listing the sub directories of each level in parallel. On object stores
+    each `list` is a paginated delimiter listing of one prefix, so large buckets are listed across many prefixes at
+    once rather than by a single sequential scan.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    pending = [dir_]
+
+    async def _list(path: str) -> List[str]:
+        sub_dirs = []
+        async with semaphore:
+            async for entry in await op.list(path):
+                if entry.path.endswith("/"):
+                    sub_dirs.append(entry.path)
+                else:
+                    await on_file(entry.path)
+        return sub_dirs
+
+    while pending:
+        results = await asyncio.gather(*[_list(path) for path in pending])
+        pending = [sub_dir for sub_dirs in results for sub_dir in sub_dirs]
+
+
+def _opendal_cache_filepath(temp_dir: str, path: str) -> str:
+    """A stable local file name for an object so documents keep the same id between loads."""
+    return f"{temp_dir}/{hashlib.sha256(path.encode()).hexdigest()[:32]}{Path(path).suffix}"
 
 
 async def download_dir_from_opendal(
     op: Any,
     temp_dir: str,
     download_dir: str,
+    max_concurrency: int = MAX_CONCURRENT_DOWNLOADS,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    file_suffixes: Optional[List[str]] = None,
+    manifest: Optional[dict[str, dict]] = None,
 ) -> List[tuple[str, str, int, int]]:
     """Download directory from opendal.
 
+    Objects are downloaded by `max_concurrency` workers while the directory is still being listed, so at most
+    `max_concurrency` objects are in flight and a few more are queued.
+
     Args:
         op: opendal operator
         temp_dir: temp directory to store the downloaded files
         download_dir: directory to download
-        supported_suffix: list of supported file suffixes
-        file_extractor: A mapping of file extractors to use for specific file types.
-        file_metadata: A function that takes a file path and returns a dictionary of metadata to be added to the Document object.
+        max_concurrency: maximum number of objects downloaded, and directories listed, at once.
+        on_progress: called with (files downloaded, bytes downloaded) after each object completes.
+        file_suffixes: only download objects with one of these (lower case) suffixes. All objects when None.
+        manifest: record of previous downloads into `temp_dir`. When given, objects are saved under stable file names
+            and objects whose ETag is unchanged are not downloaded again. It's updated in place.
 
     Returns:
       a list of tuples of 'source path' and 'local path'.
@@ -396,11 +821,62 @@ async def download_dir_from_opendal(
     log.debug("downloading dir using OpenDAL: %s", download_dir)
     downloaded_files: List[tuple[str, str, int, int]] = []  # (source path, local path, indexed_on, size)
     op = cast(opendal.AsyncOperator, op)
-    objs = await op.scan(download_dir)
-    async for obj in objs:
-        src_path, local_path, indexed_on, size = await download_file_from_opendal(op, temp_dir, obj.path)
-        downloaded_files.append((src_path, local_path, indexed_on, size))  # source path, local path
-
+    queue: asyncio.Queue[Optional[str]] = asyncio.Queue(maxsize=max_concurrency * 2)
+    listed_paths: set[str] = set()
+    bytes_downloaded = 0
+
+    async def _enqueue(path: str) -> None:
+        if file_suffixes is not None and Path(path).suffix.lower() not in file_suffixes:
+            return
+        listed_paths.add(path)
+        await queue.put(path)
+
+    async def _download(path: str) -> tuple[str, str, int, int]:
+        if manifest is None:
+            return await download_file_from_opendal(op, temp_dir, path)
+
+        metadata = await op.stat(path)
+        version = metadata.etag or metadata.content_md5
+        unchanged = _unchanged_download(manifest, path, version)
+        if unchanged is not None:
+            log.debug("object unchanged since last download, skipping: %s", path)
+            return (path, unchanged["local_path"], unchanged["indexed_on"], metadata.content_length)
+
+        result = await download_file_from_opendal(
+            op,
+            temp_dir,
+            path,
+            filepath=_opendal_cache_filepath(temp_dir, path),
+            content_length=metadata.content_length,
+        )
+        manifest[path] = {"version": version, "local_path": result[1], "indexed_on": result[2]}
+        return result
+
+    async def _worker() -> None:
+        nonlocal bytes_downloaded
+        while (path := await queue.get()) is not None:
+            try:
+                src_path, local_path, indexed_on, size = await _download(path)
+                downloaded_files.append((src_path, local_path, indexed_on, size))  # source path, local path
+                bytes_downloaded += size
+                if on_progress is not None:
+                    on_progress(len(downloaded_files), bytes_downloaded)
+            except Exception as e:
+                log.error("Failed to download '%s' using OpenDAL: %s", path, e)
+
+    workers = [asyncio.create_task(_worker()) for _ in range(max_concurrency)]
+    try:
+        await list_opendal_dir(op, download_dir, _enqueue, max_concurrency)
+    finally:
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    if manifest is not None:
+        _prune_manifest(manifest, listed_paths)
+
+    span = trace.get_current_span()
+    span.set_attributes({"files_downloaded": len(downloaded_files), "bytes_downloaded": bytes_downloaded})
     return downloaded_files
 
 
@@ -408,36 +884,68 @@ async def extract_files(
     downloaded_files: List[tuple[str, str, int, int]],
     file_extractor: Optional[Dict[str, Union[str, BaseReader]]] = None,
     file_metadata: Optional[Callable[[str], Dict]] = None,
+    max_concurrency: int = MAX_CONCURRENT_EXTRACTIONS,
+    registry: Optional[FileReaderRegistry] = None,
 ) -> List[Document]:
-    """Extract content of a list of files."""
-    documents: List[Document] = []
-    tasks = []
+    """Extract content of a list of files.
+
+    Files are extracted by up to `max_concurrency` worker threads, each reusing its own reader instances from
+    `registry`. Per-reader throughput (files, bytes, seconds) is recorded on the current span.
+    """
     log.debug("number files to extract: %s", len(downloaded_files))
-    for fe in downloaded_files:
-        source_path = fe[0]
-        local_path = fe[1]
+    semaphore = asyncio.Semaphore(max_concurrency)
+    reader_stats: Dict[str, Dict[str, float]] = {}
+
+    async def _extract(fe: tuple[str, str, int, int]) -> List[Document]:
+        source_path, local_path = fe[0], fe[1]
         metadata = None
         if file_metadata is not None:
             metadata = file_metadata(source_path)
+            if _INDEXED_ON_METADATA_KEY in metadata:
+                # keep metadata, and therefore the document hash, stable for files that haven't changed.
+                metadata[_INDEXED_ON_METADATA_KEY] = fe[2]
+
+        async with semaphore:
+            start = time.perf_counter()
+            docs, reader_name = await asyncio.to_thread(
+                _read_file,
+                Path(local_path),
+                filename_as_id=True,
+                file_extractor=file_extractor,
+                metadata=metadata,
+                registry=registry,
+            )
+            elapsed = time.perf_counter() - start
 
-        # TODO: this likely will not scale very much. We'll have to refactor to control the number of tasks.
-        task = asyncio.create_task(
-            extract_file(Path(local_path), filename_as_id=True, file_extractor=file_extractor, metadata=metadata)
-        )
-        tasks.append(task)
-        log.debug("extract task created for: %s", local_path)
+        stats = reader_stats.setdefault(reader_name, {"files": 0, "bytes": 0, "seconds": 0.0})
+        stats["files"] += 1
+        stats["bytes"] += fe[3]
+        stats["seconds"] += elapsed
+        return docs
 
-    log.debug("extract file - tasks started: %s", len(tasks))
+    results = await asyncio.gather(*[_extract(fe) for fe in downloaded_files])
+    log.debug("extract file - tasks completed: %s", len(results))
 
-    results = await asyncio.gather(*tasks)
+    _report_extract_throughput(reader_stats)
 
-    log.debug("extract file - tasks completed: %s", len(results))
+    # combine into a single Document list
+    return [doc for docs in results for doc in docs]
 
-    for result in results:
-        # combine into a single Document list
-        documents.extend(result)
 
-    return documents
+def _report_extract_throughput(reader_stats: Dict[str, Dict[str, float]]) -> None:
+    """Record per-reader extraction throughput on the current span."""
+    span = trace.get_current_span()
+    for reader_name, stats in reader_stats.items():
+        seconds = stats["seconds"]
+        span.set_attributes(
+            {
+                f"extract.{reader_name}.files": int(stats["files"]),
+                f"extract.{reader_name}.bytes": int(stats["bytes"]),
+                f"extract.{reader_name}.seconds": seconds,
+                f"extract.{reader_name}.bytes_per_sec": stats["bytes"] / seconds if seconds > 0 else 0.0,
+            }
+        )
+        log.debug("extract throughput - %s: %s", reader_name, stats)
 
 
 async def extract_file(
@@ -446,6 +954,7 @@ async def extract_file(
     errors: str = "ignore",
     file_extractor: Optional[Dict[str, Union[str, BaseReader]]] = None,
     metadata: Optional[Dict] = None,
+    registry: Optional[FileReaderRegistry] = None,
 ) -> List[Document]:
     """Extract content of a file on disk.
 
@@ -453,23 +962,58 @@ async def extract_file(
         file_path (str): path to the file
         filename_as_id (bool): whether to use the filename as the document id
         errors (str): how to handle errors when reading the file
-        supported_suffix (Optional[List[str]]): list of supported file suffixes
-        file_extractor (Optional[Dict[str, Union[str, BaseReader]]] = None): A mapping of file extractors to use for specific file types.
+        file_extractor (Optional[Dict[str, Union[str, BaseReader]]] = None): A mapping of file suffix to a reader instance. These take precedence over the registry.
         metadata (Optional[Dict] = None): metadata to add to the document. This will be appended to any metadata generated by the file extension specific extractor.
+        registry (Optional[FileReaderRegistry] = None): where readers are looked up. Defaults to `file_reader_registry`.
 
     Returns:
         List[Document]: list of documents containing the content of the file, one Document object per page.
     """
+    documents, _ = _read_file(
+        file_path,
+        filename_as_id=filename_as_id,
+        errors=errors,
+        file_extractor=file_extractor,
+        metadata=metadata,
+        registry=registry,
+    )
+    return documents
+
+
+def _get_reader(
+    file_suffix: str,
+    file_extractor: Optional[Dict[str, Union[str, BaseReader]]] = None,
+    registry: Optional[FileReaderRegistry] = None,
+) -> Optional[BaseReader]:
+    """Get the reader for a file suffix, preferring a `file_extractor` override to the registry."""
+    if file_extractor is not None:
+        reader = file_extractor.get(file_suffix)
+        if isinstance(reader, BaseReader):
+            return reader
+    return (registry or file_reader_registry).get_reader(file_suffix)
+
+
+def _read_file(
+    file_path: Path,
+    filename_as_id: bool = False,
+    errors: str = "ignore",
+    file_extractor: Optional[Dict[str, Union[str, BaseReader]]] = None,
+    metadata: Optional[Dict] = None,
+    registry: Optional[FileReaderRegistry] = None,
+) -> tuple[List[Document], str]:
+    """Extract content of a file on disk, see `extract_file`.
+
+    Returns:
+        a tuple of the documents and the name of the reader used.
+    """
     documents: List[Document] = []
 
     file_suffix = file_path.suffix.lower()
 
-    supported_suffix = list(DEFAULT_FILE_READER_CLS.keys())
-    if file_suffix in supported_suffix:
+    reader = _get_reader(file_suffix, file_extractor, registry)
+    if reader is not None:
         log.debug("file extractor found for file_suffix: %s", file_suffix)
-
-        # NOTE: pondering if its worth turning this into a class and uncomment the code above so reader classes are only instantiated once.
-        reader = DEFAULT_FILE_READER_CLS[file_suffix]()
+        reader_name = type(reader).__name__
         docs = reader.load_data(file_path, extra_info=metadata)
 
         # iterate over docs if needed
@@ -480,6 +1024,7 @@ async def extract_file(
         documents.extend(docs)
     else:
         log.debug("file extractor not found for file_suffix: %s", file_suffix)
+        reader_name = _PLAIN_TEXT_READER_NAME
         # do standard read
         with open(file_path, "r", errors=errors, encoding="utf8") as f:
             data = f.read()
@@ -489,4 +1034,4 @@ async def extract_file(
             doc.id_ = str(file_path)
 
         documents.append(doc)
-    return documents
+    return documents, reader_name
@@ -1,16 +1,51 @@
 """Database migration scripts for schema changes etc."""
 
+import json
 import logging
+import os
+import re
 import sqlite3
 from contextlib import closing
+from typing import Callable, Optional, Self
 
 from opentelemetry import trace
 
 import docq
-from docq.support.store import SpaceType, get_sqlite_org_slack_messages_file, get_sqlite_shared_system_file
+from docq.config import OrganisationFeatureType
+from docq.support.store import (
+    SpaceType,
+    UsageDbMode,
+    get_history_table_name,
+    get_history_thread_table_name,
+    get_sqlite_consolidated_usage_file,
+    get_sqlite_global_system_file,
+    get_sqlite_org_slack_messages_file,
+    get_sqlite_shared_system_file,
+    get_usage_db_mode,
+    get_usage_partition,
+    list_sqlite_usage_files,
+    list_sqlite_usage_partitions,
+)
 
 tracer = trace.get_tracer(__name__, docq.__version_str__)
 
+USAGE_DB_SCHEMA_VERSION = 3
+"""Schema version of the usage dbs. Bump when adding a usage db migration to `migrate_usage_dbs()`."""
+
+PUBLIC_SESSION_ACTIVITY_VERSION = 1
+
+THREAD_SPACES_VERSION = 1
+
+# Migrations that walk every usage db record the version they completed here, in the global system db, so later runs
+# skip the walk. Each usage db also records its own version in `PRAGMA user_version`.
+SQL_CREATE_SCHEMA_MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    migrated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
 
 @tracer.start_as_current_span("db_migrations.run")
 def run() -> None:
@@ -20,6 +55,71 @@ def run() -> None:
     """
     migration_sample1()
     add_space_type_to_spaces_table()
+    add_index_status_columns_to_spaces_table()
+    migrate_usage_dbs()
+    backfill_thread_spaces_table()
+    backfill_public_session_activity_table()
+
+
+def _get_migrated_version(name: str) -> int:
+    """The version a migration that walks many dbs last completed. 0 if it never has."""
+    with closing(sqlite3.connect(get_sqlite_global_system_file())) as connection, closing(connection.cursor()) as cursor:
+        cursor.execute(SQL_CREATE_SCHEMA_MIGRATIONS_TABLE)
+        row = cursor.execute("SELECT version FROM schema_migrations WHERE name = ?", (name,)).fetchone()
+        connection.commit()
+    return row[0] if row else 0
+
+
+def _set_migrated_version(name: str, version: int) -> None:
+    """Record that a migration that walks many dbs completed `version`."""
+    with closing(sqlite3.connect(get_sqlite_global_system_file())) as connection, closing(connection.cursor()) as cursor:
+        cursor.execute(SQL_CREATE_SCHEMA_MIGRATIONS_TABLE)
+        cursor.execute(
+            "INSERT INTO schema_migrations (name, version) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET version = excluded.version, migrated_at = CURRENT_TIMESTAMP",
+            (name, version),
+        )
+        connection.commit()
+
+
+def _migrate_usage_file(usage_file: str, version: int, migrate: Callable[[sqlite3.Cursor], int]) -> Optional[int]:
+    """Run `migrate` on a usage db unless its `user_version` is already at `version`, then set it to `version`.
+
+    Returns:
+        Optional[int]: what `migrate` returned, e.g. the number of tables changed. None if the file was skipped.
+    """
+    with closing(sqlite3.connect(usage_file)) as connection, closing(connection.cursor()) as cursor:
+        if cursor.execute("PRAGMA user_version").fetchone()[0] >= version:
+            return None
+        result = migrate(cursor)
+        cursor.execute(f"PRAGMA user_version = {int(version)}")
+        connection.commit()
+    return result
+
+
+def _has_table(cursor: sqlite3.Cursor, tablename: str) -> bool:
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name = ?", (tablename,))
+    return cursor.fetchone() is not None
+
+
+def migrate_usage_dbs() -> None:
+    """Bring every usage db up to `USAGE_DB_SCHEMA_VERSION`.
+
+    Walking every per user and per session usage db on each start costs more the more users there are, so once every
+    file is migrated the version is recorded and later runs return without opening any usage db. Usage dbs created
+    after that are created at the current schema. Files already at a migration's version are skipped, so a run that
+    had failures only retries what's left.
+    """
+    with tracer.start_as_current_span("migrate_usage_dbs") as span:
+        if _get_migrated_version("usage_dbs") >= USAGE_DB_SCHEMA_VERSION:
+            span.set_attribute("migration_skipped", "true")
+            return
+        failed = add_thread_indexes_to_history_tables()
+        failed += add_fts_to_history_tables()
+        failed += add_summary_columns_to_history_thread_tables()
+        if failed == 0:
+            _set_migrated_version("usage_dbs", USAGE_DB_SCHEMA_VERSION)
+        span.set_attribute("migration_successful", "true" if failed == 0 else "false")
+
 
 def migration_sample1() -> None:
     """Sample migration script."""
@@ -79,6 +179,487 @@ def add_space_type_to_spaces_table() -> None:
             span.record_exception(e)
             raise Exception("Migration add_space_type_to_spaces_table failed") from e
 
+def add_index_status_columns_to_spaces_table() -> None:
+    """Add the `document_count` and `index_status` columns to the spaces table.
+
+    Columns are only added where they are missing so re-running is a no-op. Existing spaces are left NULL, they're
+    counted on the next reindex or the first `is_space_empty` check.
+    """
+    with tracer.start_as_current_span("add_index_status_columns_to_spaces_table") as span:
+        span.add_event("Running migration add_index_status_columns_to_spaces_table")
+        logging.info("Running migration add_index_status_columns_to_spaces_table")
+        try:
+            with closing(sqlite3.connect(get_sqlite_shared_system_file())) as connection, closing(
+                connection.cursor()
+            ) as cursor:
+                columns = {row[0] for row in cursor.execute("SELECT name FROM pragma_table_info('spaces')")}
+                if "document_count" not in columns:
+                    cursor.execute("ALTER TABLE spaces ADD COLUMN document_count INTEGER")
+                if "index_status" not in columns:
+                    cursor.execute("ALTER TABLE spaces ADD COLUMN index_status TEXT")
+                connection.commit()
+            span.set_attribute("migration_successful", "true")
+        except sqlite3.Error as e:
+            logging.error("Migration add_index_status_columns_to_spaces_table failed: %s", e)
+            span.set_status(trace.Status(trace.StatusCode.ERROR, "Migration add_index_status_columns_to_spaces_table failed"))
+            span.record_exception(e)
+            raise Exception("Migration add_index_status_columns_to_spaces_table failed") from e
+
+
+def add_thread_indexes_to_history_tables() -> int:
+    """Add composite (thread_id, id) and (thread_id, timestamp) indexes to the history message tables in every usage db.
+
+    History is paged per thread. Without these indexes every page read scans the user's whole message table.
+    Usage dbs at schema version 1 or later are skipped. New tables get the indexes when they are created.
+
+    Returns:
+        int: the number of usage db files that failed to migrate.
+    """
+    with tracer.start_as_current_span("add_thread_indexes_to_history_tables") as span:
+        span.add_event("Running migration add_thread_indexes_to_history_tables")
+        logging.info("Running migration add_thread_indexes_to_history_tables")
+        usage_files = list_sqlite_usage_files()
+        failed, skipped = 0, 0
+        for usage_file in usage_files:
+            try:
+                if _migrate_usage_file(usage_file, 1, _add_thread_indexes) is None:
+                    skipped += 1
+            except sqlite3.Error as e:
+                failed += 1
+                logging.error(
+                    "db_migrations.add_thread_indexes_to_history_tables, failed to add indexes to %s: %s", usage_file, e
+                )
+                span.record_exception(e)
+
+        span.set_attribute("usage_files", len(usage_files))
+        span.set_attribute("usage_files_skipped", skipped)
+        span.set_attribute("usage_files_failed", failed)
+        span.set_attribute("migration_successful", "true" if failed == 0 else "false")
+        if failed > 0:
+            span.set_status(trace.Status(trace.StatusCode.ERROR, "Migration add_thread_indexes_to_history_tables failed"))
+        return failed
+
+
+def _add_thread_indexes(cursor: sqlite3.Cursor) -> int:
+    """Add the thread indexes to the message tables in a usage db. Returns the number of tables indexed."""
+    from docq.run_queries import SQL_CREATE_MESSAGE_INDEXES
+
+    indexed = 0
+    for feature_type in OrganisationFeatureType:
+        tablename = get_history_table_name(feature_type)
+        if not _has_table(cursor, tablename):
+            continue
+        for sql in SQL_CREATE_MESSAGE_INDEXES:
+            cursor.execute(sql.format(table=tablename))
+        indexed += 1
+    return indexed
+
+
+def add_fts_to_history_tables() -> int:
+    """Add the full text search index, and the triggers that keep it in sync, to history message tables in every usage db.
+
+    The index is rebuilt from the message table when the number of indexed messages doesn't match, which covers
+    tables created before search was added. Usage dbs at schema version 2 or later are skipped.
+
+    Returns:
+        int: the number of usage db files that failed to migrate.
+    """
+    with tracer.start_as_current_span("add_fts_to_history_tables") as span:
+        span.add_event("Running migration add_fts_to_history_tables")
+        logging.info("Running migration add_fts_to_history_tables")
+        usage_files = list_sqlite_usage_files()
+        if get_usage_db_mode() == UsageDbMode.CONSOLIDATED:
+            usage_files.append(get_sqlite_consolidated_usage_file())
+        failed, skipped, rebuilt = 0, 0, 0
+        for usage_file in usage_files:
+            try:
+                result = _migrate_usage_file(usage_file, 2, _add_fts)
+                if result is None:
+                    skipped += 1
+                else:
+                    rebuilt += result
+            except sqlite3.Error as e:
+                failed += 1
+                logging.error("db_migrations.add_fts_to_history_tables, failed to add fts to %s: %s", usage_file, e)
+                span.record_exception(e)
+
+        span.set_attribute("usage_files", len(usage_files))
+        span.set_attribute("usage_files_skipped", skipped)
+        span.set_attribute("fts_rebuilt", rebuilt)
+        span.set_attribute("usage_files_failed", failed)
+        span.set_attribute("migration_successful", "true" if failed == 0 else "false")
+        if failed > 0:
+            span.set_status(trace.Status(trace.StatusCode.ERROR, "Migration add_fts_to_history_tables failed"))
+        return failed
+
+
+def _add_fts(cursor: sqlite3.Cursor) -> int:
+    """Add the full text search index to the message tables in a usage db. Returns the number of indexes rebuilt."""
+    rebuilt = 0
+    for feature_type in OrganisationFeatureType:
+        tablename = get_history_table_name(feature_type)
+        columns = _table_columns(cursor, tablename)
+        if not columns:
+            continue
+        rebuilt += _create_fts(cursor, tablename, "row_id" if "scope" in columns else "id")
+    return rebuilt
+
+
+def _table_columns(cursor: sqlite3.Cursor, tablename: str) -> set[str]:
+    """The column names of a table. Empty if it doesn't exist."""
+    return {row[0] for row in cursor.execute("SELECT name FROM pragma_table_info(?)", (tablename,))}
+
+
+def _create_fts(cursor: sqlite3.Cursor, tablename: str, rowid: str) -> int:
+    """Create the full text search index on a message table, rebuilding it if it's behind. Returns 1 if rebuilt."""
+    from docq.run_queries import SQL_CREATE_MESSAGE_FTS
+
+    for sql in SQL_CREATE_MESSAGE_FTS:
+        cursor.execute(sql.format(table=tablename, rowid=rowid))
+    indexed = cursor.execute(f"SELECT COUNT(*) FROM {tablename}_fts_docsize").fetchone()[0]  # noqa: S608
+    count = cursor.execute(f"SELECT COUNT(*) FROM {tablename}").fetchone()[0]  # noqa: S608
+    if indexed == count:
+        return 0
+    cursor.execute(f"INSERT INTO {tablename}_fts ({tablename}_fts) VALUES ('rebuild')")  # noqa: S608
+    return 1
+
+
+def add_summary_columns_to_history_thread_tables() -> int:
+    """Add the `summary` and `summary_message_id` columns, used by summary memory mode, to history thread tables in every usage db.
+
+    Columns are only added where they are missing, and usage dbs at schema version 3 or later are skipped. Existing
+    threads are summarised on their next turn.
+
+    Returns:
+        int: the number of usage db files that failed to migrate.
+    """
+    with tracer.start_as_current_span("add_summary_columns_to_history_thread_tables") as span:
+        span.add_event("Running migration add_summary_columns_to_history_thread_tables")
+        logging.info("Running migration add_summary_columns_to_history_thread_tables")
+        usage_files = list_sqlite_usage_files()
+        if get_usage_db_mode() == UsageDbMode.CONSOLIDATED:
+            usage_files.append(get_sqlite_consolidated_usage_file())
+        failed, skipped = 0, 0
+        for usage_file in usage_files:
+            try:
+                if _migrate_usage_file(usage_file, 3, _add_summary_columns) is None:
+                    skipped += 1
+            except sqlite3.Error as e:
+                failed += 1
+                logging.error(
+                    "db_migrations.add_summary_columns_to_history_thread_tables, failed to add columns to %s: %s",
+                    usage_file,
+                    e,
+                )
+                span.record_exception(e)
+
+        span.set_attribute("usage_files", len(usage_files))
+        span.set_attribute("usage_files_skipped", skipped)
+        span.set_attribute("usage_files_failed", failed)
+        span.set_attribute("migration_successful", "true" if failed == 0 else "false")
+        if failed > 0:
+            span.set_status(
+                trace.Status(trace.StatusCode.ERROR, "Migration add_summary_columns_to_history_thread_tables failed")
+            )
+        return failed
+
+
+def _add_summary_columns(cursor: sqlite3.Cursor) -> int:
+    """Add the summary columns to the thread tables in a usage db. Returns the number of tables altered."""
+    altered = 0
+    for feature_type in OrganisationFeatureType:
+        thread_tablename = get_history_thread_table_name(feature_type)
+        columns = {row[0] for row in cursor.execute("SELECT name FROM pragma_table_info(?)", (thread_tablename,))}
+        if not columns or {"summary", "summary_message_id"} <= columns:
+            continue
+        if "summary" not in columns:
+            cursor.execute(f"ALTER TABLE {thread_tablename} ADD COLUMN summary TEXT")
+        if "summary_message_id" not in columns:
+            cursor.execute(f"ALTER TABLE {thread_tablename} ADD COLUMN summary_message_id INTEGER")
+        altered += 1
+    return altered
+
+
+def backfill_thread_spaces_table() -> None:
+    """Link thread spaces created before thread_spaces existed to their thread's owner.
+
+    Thread ids are only unique within an owner's history table, so a link needs the owner as well as the thread id.
+    Thread spaces from before the table existed, looked up with `name LIKE 'Thread-{thread_id} %'`, are given the owner
+    found by looking the thread id up in the history of the space's org members. Thread ids start at 1 for every user so
+    usually more than one member has a thread with that id. Then the owner is the member whose thread topic is the
+    space's summary, which thread spaces are created with. Spaces still without a single owner are left for
+    `manage_spaces.get_thread_space()` to link on first use. Runs once, recorded in `schema_migrations`, because it
+    opens org members' usage dbs.
+    """
+    from docq.manage_spaces import SQL_CREATE_THREAD_SPACES_TABLE
+
+    with tracer.start_as_current_span("backfill_thread_spaces_table") as span:
+        try:
+            if _get_migrated_version("thread_spaces") >= THREAD_SPACES_VERSION:
+                return
+            span.add_event("Running migration backfill_thread_spaces_table")
+            logging.info("Running migration backfill_thread_spaces_table")
+
+            with closing(sqlite3.connect(get_sqlite_shared_system_file())) as connection, closing(
+                connection.cursor()
+            ) as cursor:
+                cursor.execute(SQL_CREATE_THREAD_SPACES_TABLE)
+                cursor.execute(
+                    "SELECT id, org_id, name, summary, datasource_configs FROM spaces WHERE space_type = ? AND id NOT IN (SELECT space_id FROM thread_spaces)",
+                    (SpaceType.THREAD.name,),
+                )
+                owner_threads = _OwnerThreads()
+                links, unlinked = [], 0
+                for space_id, org_id, name, summary, datasource_configs in cursor.fetchall():
+                    thread_id = _get_thread_id_from_space(name, datasource_configs)
+                    if thread_id is None:
+                        logging.warning(
+                            "db_migrations.backfill_thread_spaces_table, no thread id found for space %s '%s'", space_id, name
+                        )
+                        unlinked += 1
+                        continue
+                    member_ids = [
+                        str(row[0])
+                        for row in cursor.execute("SELECT user_id FROM org_members WHERE org_id = ?", (org_id,))
+                    ]
+                    owners = owner_threads.find_owners(thread_id, member_ids, summary)
+                    if len(owners) != 1:
+                        logging.warning(
+                            "db_migrations.backfill_thread_spaces_table, %s owners found for thread %s of space %s, leaving it to be linked on first use",
+                            len(owners),
+                            thread_id,
+                            space_id,
+                        )
+                        unlinked += 1
+                        continue
+                    feature_type, owner_id = owners[0]
+                    links.append((feature_type, owner_id, thread_id, space_id, org_id))
+
+                cursor.executemany(
+                    "INSERT INTO thread_spaces (feature_type, owner_id, thread_id, space_id, org_id) VALUES (?, ?, ?, ?, ?)",
+                    links,
+                )
+                connection.commit()
+            _set_migrated_version("thread_spaces", THREAD_SPACES_VERSION)
+            logging.info(
+                "db_migrations.backfill_thread_spaces_table, %s thread spaces backfilled, %s left unlinked",
+                len(links),
+                unlinked,
+            )
+            span.set_attribute("thread_spaces_backfilled", len(links))
+            span.set_attribute("thread_spaces_unlinked", unlinked)
+            span.set_attribute("migration_successful", "true")
+
+        except Exception as e:
+            logging.error("Migration backfill_thread_spaces_table failed")
+            span.set_status(trace.Status(trace.StatusCode.ERROR, "Migration backfill_thread_spaces_table failed"))
+            span.record_exception(e)
+            raise Exception("Migration backfill_thread_spaces_table failed") from e
+
+
+def _params_for_owner(user_id: str) -> tuple[str, str]:
+    """The (scope, owner_id) of a user's personal history in the consolidated usage db."""
+    partition = get_usage_partition(user_id)
+    return partition.scope, partition.owner_id
+
+
+class _OwnerThreads:
+    """Threads in users' personal history, read from each user's usage db once. Used to find a thread's owner."""
+
+    FEATURE_TYPES = (OrganisationFeatureType.CHAT_PRIVATE, OrganisationFeatureType.ASK_SHARED)
+    """Features that have thread spaces."""
+
+    def __init__(self: Self) -> None:
+        consolidated = get_usage_db_mode() == UsageDbMode.CONSOLIDATED
+        self._consolidated_file = get_sqlite_consolidated_usage_file() if consolidated else None
+        self._usage_files = (
+            {}
+            if consolidated
+            else {
+                partition.owner_id: partition.file for partition in list_sqlite_usage_partitions() if not partition.public
+            }
+        )
+        self._threads: dict[str, dict[tuple[str, int], Optional[str]]] = {}
+
+    def find_owners(self: Self, thread_id: int, user_ids: list[str], topic: Optional[str] = None) -> list[tuple[str, str]]:
+        """The (feature type name, user id) of each of `user_ids` with a thread with id `thread_id`.
+
+        If there's more than one, only those whose thread has `topic`, if any do.
+        """
+        owners = [
+            (feature_type, user_id, topic_)
+            for user_id in user_ids
+            for (feature_type, id_), topic_ in self._list_threads(user_id).items()
+            if id_ == thread_id
+        ]
+        if len(owners) > 1 and topic is not None and any(topic_ == topic for *_, topic_ in owners):
+            owners = [owner for owner in owners if owner[2] == topic]
+        return [(feature_type, user_id) for feature_type, user_id, _ in owners]
+
+    def _list_threads(self: Self, user_id: str) -> dict[tuple[str, int], Optional[str]]:
+        """The topic of each of a user's threads keyed by (feature type name, thread id)."""
+        if user_id not in self._threads:
+            usage_file = self._consolidated_file or self._usage_files.get(user_id)
+            threads: dict[tuple[str, int], Optional[str]] = {}
+            if usage_file is not None:
+                with closing(sqlite3.connect(usage_file)) as connection:
+                    for feature_type in self.FEATURE_TYPES:
+                        tablename = get_history_thread_table_name(feature_type)
+                        if connection.execute(
+                            "SELECT name FROM sqlite_master WHERE type='table' AND name = ?", (tablename,)
+                        ).fetchone() is None:
+                            continue
+                        if self._consolidated_file:
+                            rows = connection.execute(
+                                f"SELECT id, topic FROM {tablename} WHERE scope = ? AND owner_id = ?",  # noqa: S608
+                                _params_for_owner(user_id),
+                            )
+                        else:
+                            rows = connection.execute(f"SELECT id, topic FROM {tablename}")  # noqa: S608
+                        threads.update(((feature_type.name, row[0]), row[1]) for row in rows)
+            self._threads[user_id] = threads
+        return self._threads[user_id]
+
+
+def backfill_public_session_activity_table() -> None:
+    """Record the last activity of public sessions created before the public_session_activity table existed.
+
+    Public session cleanup used to walk the PUBLIC sqlite dir and use each session dir's mtime. The mtimes are copied
+    into the table so those sessions are still cleaned up. Only runs once, recorded in `schema_migrations`, so the dir
+    isn't walked on every start.
+    """
+    from docq.support.public_sessions import (
+        SQL_CREATE_PUBLIC_SESSION_ACTIVITY_INDEX,
+        SQL_CREATE_PUBLIC_SESSION_ACTIVITY_TABLE,
+    )
+
+    with tracer.start_as_current_span("backfill_public_session_activity_table") as span:
+        try:
+            with closing(sqlite3.connect(get_sqlite_global_system_file())) as connection, closing(
+                connection.cursor()
+            ) as cursor:
+                cursor.execute(SQL_CREATE_PUBLIC_SESSION_ACTIVITY_TABLE)
+                cursor.execute(SQL_CREATE_PUBLIC_SESSION_ACTIVITY_INDEX)
+                connection.commit()
+                if _get_migrated_version("public_session_activity") >= PUBLIC_SESSION_ACTIVITY_VERSION:
+                    return
+                span.add_event("Running migration backfill_public_session_activity_table")
+                logging.info("Running migration backfill_public_session_activity_table")
+                sessions = [
+                    (partition.owner_id, int(os.path.getmtime(os.path.dirname(partition.file))))
+                    for partition in list_sqlite_usage_partitions()
+                    if partition.public
+                ]
+                cursor.executemany(
+                    "INSERT OR IGNORE INTO public_session_activity (session_id, last_activity_at) VALUES (?, ?)",
+                    sessions,
+                )
+                connection.commit()
+                _set_migrated_version("public_session_activity", PUBLIC_SESSION_ACTIVITY_VERSION)
+                logging.info(
+                    "db_migrations.backfill_public_session_activity_table, %s sessions backfilled", len(sessions)
+                )
+                span.set_attribute("sessions_backfilled", len(sessions))
+                span.set_attribute("migration_successful", "true")
+
+        except Exception as e:
+            logging.error("Migration backfill_public_session_activity_table failed")
+            span.set_status(
+                trace.Status(trace.StatusCode.ERROR, "Migration backfill_public_session_activity_table failed")
+            )
+            span.record_exception(e)
+            raise Exception("Migration backfill_public_session_activity_table failed") from e
+
+
+def migrate_usage_history_to_consolidated_db() -> int:
+    """Copy chat history from the per owner usage db files into the consolidated usage db.
+
+    Run this before switching DOCQ_USAGE_DB_MODE to `consolidated`. Threads and messages keep their ids, which are
+    per owner in both layouts, so thread spaces and bookmarked thread ids still resolve. Rows already copied are
+    skipped so re-running picks up anything written since. The per owner files are left in place.
+
+    Returns:
+        int: the number of usage db files copied.
+    """
+    from docq.run_queries import _message_table_sql
+
+    with tracer.start_as_current_span("migrate_usage_history_to_consolidated_db") as span:
+        span.add_event("Running migration migrate_usage_history_to_consolidated_db")
+        logging.info("Running migration migrate_usage_history_to_consolidated_db")
+        partitions = list_sqlite_usage_partitions()
+        migrated, failed = 0, 0
+        with closing(sqlite3.connect(get_sqlite_consolidated_usage_file())) as connection, closing(
+            connection.cursor()
+        ) as cursor:
+            for feature_type in OrganisationFeatureType:
+                for sql in _message_table_sql(feature_type, consolidated=True):
+                    cursor.execute(sql)
+            connection.commit()
+
+            for partition in partitions:
+                cursor.execute("ATTACH DATABASE ? AS src", (partition.file,))
+                try:
+                    for feature_type in OrganisationFeatureType:
+                        thread_tablename = get_history_thread_table_name(feature_type)
+                        tablename = get_history_table_name(feature_type)
+                        cursor.execute(
+                            "SELECT name FROM src.sqlite_master WHERE type='table' AND name IN (?, ?, ?)",
+                            (thread_tablename, tablename, f"{tablename}_sources"),
+                        )
+                        existing = {row[0] for row in cursor.fetchall()}
+                        if thread_tablename in existing:
+                            cursor.execute(
+                                f"INSERT OR IGNORE INTO main.{thread_tablename} (scope, owner_id, id, topic, created_at) SELECT ?, ?, id, topic, created_at FROM src.{thread_tablename}",  # noqa: S608
+                                (partition.scope, partition.owner_id),
+                            )
+                        if tablename in existing:
+                            cursor.execute(
+                                f"INSERT OR IGNORE INTO main.{tablename} (scope, owner_id, id, message, human, timestamp, thread_id) SELECT ?, ?, id, message, human, timestamp, thread_id FROM src.{tablename}",  # noqa: S608
+                                (partition.scope, partition.owner_id),
+                            )
+                        if f"{tablename}_sources" in existing:
+                            # sources have no per owner key so those already copied are skipped by message id.
+                            cursor.execute(
+                                f"INSERT INTO main.{tablename}_sources (scope, owner_id, message_id, node_id, space_id, uri, page, score, name, source_type) SELECT ?, ?, message_id, node_id, space_id, uri, page, score, name, source_type FROM src.{tablename}_sources WHERE message_id NOT IN (SELECT message_id FROM main.{tablename}_sources WHERE scope = ? AND owner_id = ?)",  # noqa: S608
+                                (partition.scope, partition.owner_id, partition.scope, partition.owner_id),
+                            )
+                    connection.commit()
+                    migrated += 1
+                except sqlite3.Error as e:
+                    connection.rollback()
+                    failed += 1
+                    logging.error(
+                        "db_migrations.migrate_usage_history_to_consolidated_db, failed to copy %s: %s", partition.file, e
+                    )
+                    span.record_exception(e)
+                finally:
+                    cursor.execute("DETACH DATABASE src")
+
+        logging.info(
+            "db_migrations.migrate_usage_history_to_consolidated_db, %s usage files copied, %s failed", migrated, failed
+        )
+        span.set_attribute("usage_files", len(partitions))
+        span.set_attribute("usage_files_failed", failed)
+        span.set_attribute("migration_successful", "true" if failed == 0 else "false")
+        if failed > 0:
+            span.set_status(
+                trace.Status(trace.StatusCode.ERROR, "Migration migrate_usage_history_to_consolidated_db failed")
+            )
+        return migrated
+
+
+def _get_thread_id_from_space(name: str, datasource_configs: str | None) -> int | None:
+    """Get the thread id a thread space was created for."""
+    try:
+        thread_id = json.loads(datasource_configs or "{}").get("thread_id")
+        if thread_id is not None:
+            return int(thread_id)
+    except (ValueError, TypeError, AttributeError):
+        pass
+    match = re.match(r"Thread-(\d+) ", name or "")
+    return int(match.group(1)) if match else None
+
+
 #####
 # NOTE: this is being called from the slack_messages init() function for ease because org scoped.
 #####
@@ -5,7 +5,7 @@ Though coincidentally they might be the same name and shape.
 """
 import logging as log
 import sys
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
 from typing import Any, Optional, Self
@@ -121,6 +121,48 @@ class DocumentListItem:
             raise e
 
 
+@dataclass
+class MessageSource:
+    """A document source referenced by a message, i.e. a node retrieved to answer a question.
+
+    Args:
+        node_id (str): The id of the retrieved node.
+        space_id (Optional[int]): The space the document belongs to.
+        uri (Optional[str]): The source URI of the document.
+        page (Optional[str]): The page label for files or the page title for web pages.
+        score (Optional[float]): The retrieval score of the node.
+        name (Optional[str]): The file name for files or the website for web pages.
+        source_type (Optional[str]): The data source type e.g. SpaceDataSourceFileBased.
+    """
+
+    node_id: str
+    space_id: Optional[int] = None
+    uri: Optional[str] = None
+    page: Optional[str] = None
+    score: Optional[float] = None
+    name: Optional[str] = None
+    source_type: Optional[str] = None
+
+
+@dataclass
+class BatchQueryResult:
+    """The answer to one question of a batch.
+
+    Args:
+        index (int): The position of the question in the batch.
+        input_ (str): The question.
+        response (Optional[str]): The answer. None if answering failed.
+        sources (list[MessageSource]): The document sources of the answer.
+        error (Optional[str]): Why answering failed.
+    """
+
+    index: int
+    input_: str
+    response: Optional[str] = None
+    sources: list[MessageSource] = field(default_factory=list)
+    error: Optional[str] = None
+
+
 class AssistantType(Enum):
     """Persona type."""
 
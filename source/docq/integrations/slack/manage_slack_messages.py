@@ -7,6 +7,7 @@ from typing import List, Optional
 from docq import db_migrations
 from llama_index.core.llms import ChatMessage, MessageRole
 
+from ...support import write_behind
 from ...support.store import get_sqlite_org_slack_messages_file
 from .models import SlackMessage
 
@@ -26,16 +27,24 @@ CREATE TABLE IF NOT EXISTS docq_slack_messages (
 """
 #
 
+# slack messages sqlite files already initialised by this process.
+_initialised_files: set[str] = set()
+
 
 def _init(org_id: int) -> None:
     """Initialize the Slack integration.
 
-    We don't call this in setup because and org_id context is required.
+    We don't call this in setup because and org_id context is required. Only does any work the first time it's called
+    for an org in a process.
     """
-    with closing(sqlite3.connect(get_sqlite_org_slack_messages_file(org_id=org_id))) as connection:
+    path = get_sqlite_org_slack_messages_file(org_id=org_id)
+    if path in _initialised_files:
+        return
+    with closing(sqlite3.connect(path)) as connection:
         connection.execute(SQL_CREATE_TABLE_DOCQ_SLACK_MESSAGES)
         connection.commit()
         db_migrations.add_column_threadts_to_slackmessages_table(org_id)
+    _initialised_files.add(path)
 
 
 def insert_or_update_message(
@@ -49,19 +58,24 @@ def insert_or_update_message(
     org_id: int,
     thread_ts: Optional[str] = None,
 ) -> None:
-    """Insert or update a message."""
+    """Insert or update a message. Queued when write-behind persistence is enabled."""
     _init(org_id)
-    with closing(sqlite3.connect(get_sqlite_org_slack_messages_file(org_id=org_id))) as connection:
-        connection.execute(
-            "INSERT OR REPLACE INTO docq_slack_messages (client_msg_id, type, channel_id, team_id, user_id, text, ts, thread_ts) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-            (client_msg_id, type_, channel, team, user, text, ts, thread_ts),
+    sql = "INSERT OR REPLACE INTO docq_slack_messages (client_msg_id, type, channel_id, team_id, user_id, text, ts, thread_ts) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+    row = (client_msg_id, type_, channel, team, user, text, ts, thread_ts)
+    if write_behind.is_enabled():
+        write_behind.enqueue(
+            get_sqlite_org_slack_messages_file(org_id=org_id), sql, [row], init_sql=(SQL_CREATE_TABLE_DOCQ_SLACK_MESSAGES,)
         )
+        return
+    with closing(sqlite3.connect(get_sqlite_org_slack_messages_file(org_id=org_id))) as connection:
+        connection.execute(sql, row)
         connection.commit()
 
 
 def is_message_handled(client_msg_id: str, ts: str, org_id: int) -> bool:
     """Check if a message exists."""
     _init(org_id)
+    write_behind.flush(get_sqlite_org_slack_messages_file(org_id=org_id))
     with closing(sqlite3.connect(get_sqlite_org_slack_messages_file(org_id=org_id))) as connection:
         cursor = connection.cursor()
         cursor.execute(
@@ -77,6 +91,7 @@ def list_slack_messages(channel: str, org_id: int) -> list[SlackMessage]:
     unthreaded and threaded messages.
     """
     _init(org_id)
+    write_behind.flush(get_sqlite_org_slack_messages_file(org_id=org_id))
     with closing(sqlite3.connect(get_sqlite_org_slack_messages_file(org_id=org_id))) as connection:
         cursor = connection.cursor()
         cursor.execute(
@@ -103,6 +118,7 @@ def list_slack_messages(channel: str, org_id: int) -> list[SlackMessage]:
 def list_slack_thread_messages(channel: str, org_id: int, thread_ts: str) -> list[SlackMessage]:
     """Get a list of messages for a specific thread."""
     _init(org_id)
+    write_behind.flush(get_sqlite_org_slack_messages_file(org_id=org_id))
     with closing(sqlite3.connect(get_sqlite_org_slack_messages_file(org_id=org_id))) as connection:
         cursor = connection.cursor()
         cursor.execute(
@@ -1,10 +1,15 @@
 """prompt templates that represent a persona."""
+import dataclasses
 import logging as log
 import sqlite3
+import threading
+import time
 from contextlib import closing
 from datetime import UTC, datetime
+from functools import lru_cache
 from typing import List, Optional
 
+from cachetools import TTLCache
 from llama_index.core.base.llms.types import ChatMessage, MessageRole
 from llama_index.core.prompts import ChatPromptTemplate
 
@@ -126,25 +131,68 @@ CREATE TABLE IF NOT EXISTS assistants (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 )
 """
+SQL_CREATE_ASSISTANTS_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS assistants_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+)
+"""
+
+SQL_BUMP_ASSISTANTS_VERSION = """
+INSERT INTO assistants_version (id, version) VALUES (1, 1)
+ON CONFLICT (id) DO UPDATE SET version = version + 1
+"""
 # # id, name, type, archived, system_prompt_template, user_prompt_template, llm_settings_collection_key, created_at, updated_at, scoped_id
 # ASSISTANT = tuple[int, str, str, bool, str, str, str, datetime, datetime, str]
 
+ASSISTANT_CACHE_TTL_SEC = 60 * 5
+"""How long an assistant stays cached before it's read again, so rarely used assistants don't hold on to memory."""
+
+VERSION_CHECK_INTERVAL_SEC = 1.0
+"""How long cached assistants are used before checking the assistants db version for changes made by other processes."""
+
+# (assistants sqlite file, assistant id) -> (version, assistant). The file is per org for org scoped assistants.
+_assistant_cache: TTLCache[tuple[str, str], tuple[int, Assistant]] = TTLCache(1024, ASSISTANT_CACHE_TTL_SEC)
+# assistants sqlite file -> (version, monotonic time it was read)
+_assistant_versions: dict[str, tuple[int, float]] = {}
+_assistant_cache_lock = threading.Lock()
+
+# assistants sqlite files already initialised by this process.
+_initialised_files: set[str] = set()
+
 
 def _init(org_id: Optional[int] = None) -> None:
     """Initialize the database.
 
     Needs to be called twice with the current context org_id and without org_id, to create the global scope table and the org scope table.
+    Only does any work the first time it's called for a scope in a process.
 
     Args:
         org_id (Optional[int]): The org id. If None then will initialise the global scope table.
     """
-    with closing(
-        sqlite3.connect(__get_assistants_sqlite_file(org_id=org_id), detect_types=sqlite3.PARSE_DECLTYPES)
-    ) as connection, closing(connection.cursor()) as cursor:
+    path = __get_assistants_sqlite_file(org_id=org_id)
+    if path in _initialised_files:
+        return
+    with closing(sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)) as connection, closing(
+        connection.cursor()
+    ) as cursor:
         cursor.execute(SQL_CREATE_ASSISTANTS_TABLE)
+        cursor.execute(SQL_CREATE_ASSISTANTS_VERSION_TABLE)
         connection.commit()
 
     __create_default_assistants_if_needed()
+    _initialised_files.add(path)
+
+
+@lru_cache(maxsize=256)
+def _compile_prompt_template(system_message_content: str, user_prompt_template_content: str) -> ChatPromptTemplate:
+    """Build the prompt template for an assistant's prompts. Cached by content so an updated assistant gets a new one."""
+    return ChatPromptTemplate(
+        message_templates=[
+            ChatMessage(content=system_message_content, role=MessageRole.SYSTEM),
+            ChatMessage(content=user_prompt_template_content, role=MessageRole.USER),
+        ]
+    )
 
 
 def llama_index_chat_prompt_template_from_assistant(
@@ -152,26 +200,23 @@ def llama_index_chat_prompt_template_from_assistant(
 ) -> ChatPromptTemplate:
     """Get the prompt template for llama index.
 
+    The template for the assistant's prompts is built once and reused. With chat history a new template is made from
+    the precompiled system and user messages.
+
     Args:
         assistant (Assistant): Docq assistant.
         chat_history (Optional[List[ChatMessage]]): A list of ChatMessages that will be inserted into the message stack of the LLM synth call. It will be inserted between the system message an the latest user query message.
     """
-    messages = chat_history or []
+    template = _compile_prompt_template(assistant.system_message_content, assistant.user_prompt_template_content)
+    if not chat_history:
+        return template
 
-    _system_prompt_message = ChatMessage(
-        content=assistant.system_message_content,
-        role=MessageRole.SYSTEM,
-    )
-
-    _user_prompt_message = ChatMessage(
-        content=assistant.user_prompt_template_content,
-        role=MessageRole.USER,
-    )
+    _system_prompt_message, _user_prompt_message = template.message_templates
 
     # hack because we are using message templates to push messages history into the LLM call messages collection. see issue #254
-    for m in messages:
-        s: str = m.content or ""
-        m.content = s.replace("{", "{{").replace("}", "}}")
+    messages = [
+        ChatMessage(role=m.role, content=(m.content or "").replace("{", "{{").replace("}", "}}")) for m in chat_history
+    ]
 
     return ChatPromptTemplate(message_templates=[_system_prompt_message, *messages, _user_prompt_message])
 
@@ -335,7 +380,9 @@ def list_assistants(org_id: Optional[int] = None, assistant_type: Optional[Assis
 def get_assistant(assistant_scoped_id: str, org_id: Optional[int]) -> Assistant:
     """Get the assistant.
 
-    If just assistant_id then will try to get from global scope table.
+    If just assistant_id then will try to get from global scope table. Assistants are cached. Each assistants db has a
+    version counter row that's bumped with every update. A process drops its cached assistant when it updates it and,
+    at most every VERSION_CHECK_INTERVAL_SEC, checks the version so updates made by other processes are picked up.
     """
     scope, id_ = assistant_scoped_id.split("_")
 
@@ -348,34 +395,79 @@ def get_assistant(assistant_scoped_id: str, org_id: Optional[int]) -> Assistant:
         # global scope
         path = __get_assistants_sqlite_file(org_id=None)
 
+    # keyed by the row read rather than the scoped id asked for, so every way of asking for it is invalidated together.
+    key = (path, id_)
+    with _assistant_cache_lock:
+        cached = _assistant_cache.get(key)
+        checked = _assistant_versions.get(path)
+    if (
+        cached is not None
+        and checked is not None
+        and cached[0] == checked[0]
+        and time.monotonic() - checked[1] < VERSION_CHECK_INTERVAL_SEC
+    ):
+        return dataclasses.replace(cached[1], scoped_id=f"{scope}_{cached[1].key}")
+
     with closing(sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)) as connection, closing(
         connection.cursor()
     ) as cursor:
-        cursor.execute(
-            "SELECT id, name, type, archived, system_prompt_template, user_prompt_template, llm_settings_collection_key, created_at, updated_at FROM assistants WHERE id = ?",
-            (id_,),
-        )
-        row = cursor.fetchone()
-        if row is None:
-            if org_id and scope == "org":
-                raise ValueError(
-                    f"No Assistant with: id = '{id_}' that belongs to org org_id= '{org_id}', scope= '{scope}'"
-                )
-            else:
-                raise ValueError(f"No Assistant with: id = '{id_}' in global scope. scope= '{scope}'")
-        # return (row[0], row[1], row[2], row[3], row[4], row[5], row[6], row[7], row[8], assistant_scoped_id)
-        return Assistant(
-            key=str(row[0]),
-            name=row[1],
-            type=AssistantType(row[2].capitalize()),
-            archived=row[3],
-            system_message_content=row[4],
-            user_prompt_template_content=row[5],
-            llm_settings_collection_key=row[6],
-            created_at=row[7],
-            updated_at=row[8],
-            scoped_id=f"{scope}_{row[0]}",
-        )
+        # read the version first so an assistant is never cached against a version newer than it.
+        version = _get_assistants_version(cursor)
+        if cached is None or cached[0] != version:
+            cached = (version, _get_assistant_from_db(cursor, scope, id_, org_id))
+
+    with _assistant_cache_lock:
+        _assistant_cache[key] = cached
+        _assistant_versions[path] = (version, time.monotonic())
+    return dataclasses.replace(cached[1], scoped_id=f"{scope}_{cached[1].key}")
+
+
+def _get_assistants_version(cursor: sqlite3.Cursor) -> int:
+    """The assistants db version. 0 for a db that hasn't been updated since versioning was added."""
+    try:
+        row = cursor.execute("SELECT version FROM assistants_version WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] if row else 0
+
+
+def _invalidate_assistant_cache(path: Optional[str] = None, id_: Optional[str] = None) -> None:
+    """Drop the cached assistant `id_` read from `path`, and the version checked for `path`. Everything if None."""
+    with _assistant_cache_lock:
+        if path is None:
+            _assistant_cache.clear()
+            _assistant_versions.clear()
+            return
+        _assistant_versions.pop(path, None)
+        _assistant_cache.pop((path, id_), None)
+
+
+def _get_assistant_from_db(cursor: sqlite3.Cursor, scope: str, id_: str, org_id: Optional[int]) -> Assistant:
+    cursor.execute(
+        "SELECT id, name, type, archived, system_prompt_template, user_prompt_template, llm_settings_collection_key, created_at, updated_at FROM assistants WHERE id = ?",
+        (id_,),
+    )
+    row = cursor.fetchone()
+    if row is None:
+        if org_id and scope == "org":
+            raise ValueError(
+                f"No Assistant with: id = '{id_}' that belongs to org org_id= '{org_id}', scope= '{scope}'"
+            )
+        else:
+            raise ValueError(f"No Assistant with: id = '{id_}' in global scope. scope= '{scope}'")
+    # return (row[0], row[1], row[2], row[3], row[4], row[5], row[6], row[7], row[8], assistant_scoped_id)
+    return Assistant(
+        key=str(row[0]),
+        name=row[1],
+        type=AssistantType(row[2].capitalize()),
+        archived=row[3],
+        system_message_content=row[4],
+        user_prompt_template_content=row[5],
+        llm_settings_collection_key=row[6],
+        created_at=row[7],
+        updated_at=row[8],
+        scoped_id=f"{scope}_{row[0]}",
+    )
 
 
 def create_or_update_assistant(
@@ -445,11 +537,14 @@ def create_or_update_assistant(
                 sql,
                 params,
             )
+            cursor.execute(SQL_CREATE_ASSISTANTS_VERSION_TABLE)
+            cursor.execute(SQL_BUMP_ASSISTANTS_VERSION)
             connection.commit()
             if assistant_id is None:
                 result_id = cursor.lastrowid
     except Exception as e:
         raise e
+    _invalidate_assistant_cache(__get_assistants_sqlite_file(org_id=org_id), str(result_id))
     return result_id
 
 
@@ -1,19 +1,28 @@
 """Functions to manage documents."""
+import hashlib
 import logging as log
 import os
 import shutil
+import threading
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from mimetypes import guess_type
-from typing import Optional
+from typing import Optional, Self
 
 from llama_index.core.schema import NodeWithScore
 from streamlit import runtime
 
 from docq.data_source.main import DocumentMetadata
-from docq.domain import SpaceKey
+from docq.domain import MessageSource, SpaceKey
 from docq.manage_spaces import reindex
-from docq.support.store import get_upload_dir, get_upload_file
+from docq.support.store import get_partial_upload_file, get_upload_dir, get_upload_file
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+_reindex_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="docq-reindex")
+_reindex_pending: set[tuple[str, int, int]] = set()
+_reindex_pending_lock = threading.Lock()
 
 
 def upload(filename: str, content: bytes, space: SpaceKey) -> None:
@@ -27,6 +36,123 @@ def upload(filename: str, content: bytes, space: SpaceKey) -> None:
     reindex(space)
 
 
+def get_upload_offset(filename: str, space: SpaceKey) -> int:
+    """Bytes received so far of an incomplete chunked upload. 0 if there isn't one."""
+    try:
+        return os.path.getsize(get_partial_upload_file(space, filename))
+    except FileNotFoundError:
+        return 0
+
+
+class ChunkedUpload:
+    """Write an upload to a space in chunks, hashing it as it's written.
+
+    Chunks go to a partial file outside the space's upload dir, so a half written file is never indexed. The partial
+    file is moved into the upload dir once `length` bytes have been written, or on `finish` if the length isn't known.
+    An incomplete upload is resumed by starting a new `ChunkedUpload` at `get_upload_offset`.
+    """
+
+    def __init__(self: Self, filename: str, space: SpaceKey, offset: int = 0, length: Optional[int] = None) -> None:
+        """Start or resume an upload.
+
+        Args:
+            filename (str): the file name in the space.
+            space (SpaceKey): the space to upload to.
+            offset (int): bytes already uploaded. 0 starts the upload over.
+            length (Optional[int]): the total size of the file if known.
+
+        Raises:
+            ValueError: if `offset` isn't the size of the incomplete upload.
+        """
+        self.filename = filename
+        self.space = space
+        self.length = length
+        self.size = offset
+        self._offset = offset
+        self._partial_file = get_partial_upload_file(space, filename)
+        self._sha256 = hashlib.sha256()
+        if offset > 0:
+            current_offset = get_upload_offset(filename, space)
+            if offset != current_offset:
+                raise ValueError(f"Upload offset {offset} doesn't match the {current_offset} bytes received")
+            # hashlib state can't be saved so the received bytes are hashed again on resume
+            with open(self._partial_file, "rb") as f:
+                while chunk := f.read(UPLOAD_CHUNK_SIZE):
+                    self._sha256.update(chunk)
+        self._file = open(self._partial_file, "ab" if offset > 0 else "wb")  # noqa: SIM115
+
+    @property
+    def sha256(self: Self) -> str:
+        """Hex SHA-256 of the bytes written so far."""
+        return self._sha256.hexdigest()
+
+    @property
+    def complete(self: Self) -> bool:
+        """True if the whole file has been received. Always True if the length isn't known."""
+        return self.length is None or self.size == self.length
+
+    def write(self: Self, chunk: bytes) -> None:
+        """Append a chunk."""
+        if self.length is not None and self.size + len(chunk) > self.length:
+            raise ValueError(f"Upload is longer than the {self.length} bytes expected")
+        self._file.write(chunk)
+        self._sha256.update(chunk)
+        self.size += len(chunk)
+
+    def close(self: Self) -> None:
+        """Close the partial file. An incomplete upload can be resumed later."""
+        if not self._file.closed:
+            self._file.close()
+
+    def discard(self: Self) -> None:
+        """Close the upload and drop what it wrote. A resumed upload goes back to the offset it was resumed at."""
+        self.close()
+        if os.path.exists(self._partial_file):
+            if self._offset > 0:
+                os.truncate(self._partial_file, self._offset)
+            else:
+                os.remove(self._partial_file)
+        self.size = self._offset
+
+    def finish(self: Self, expected_sha256: Optional[str] = None) -> bool:
+        """Close the upload and, if complete, move it into the space's upload dir.
+
+        Args:
+            expected_sha256 (Optional[str]): hex SHA-256 of the whole file to check against.
+
+        Returns:
+            bool: True if the file is complete and in the upload dir. False if more chunks are expected.
+
+        Raises:
+            ValueError: if the file is complete but doesn't match `expected_sha256`. The partial file is removed.
+        """
+        self.close()
+        if not self.complete:
+            return False
+        if expected_sha256 is not None and expected_sha256.lower() != self.sha256:
+            os.remove(self._partial_file)
+            raise ValueError("Upload SHA-256 doesn't match")
+        os.replace(self._partial_file, get_upload_file(self.space, self.filename))
+        log.info("Chunked upload of '%s' to space '%s' complete, %s bytes", self.filename, self.space, self.size)
+        return True
+
+
+def enqueue_reindex(space: SpaceKey) -> None:
+    """Reindex a space in the background, unless a reindex of the space is already queued."""
+    key = (space.type_.name, space.org_id, space.id_)
+    with _reindex_pending_lock:
+        if key in _reindex_pending:
+            return
+        _reindex_pending.add(key)
+
+    def _run() -> None:
+        with _reindex_pending_lock:
+            _reindex_pending.discard(key)
+        reindex(space)
+
+    _reindex_executor.submit(_run)
+
+
 def get_file(filename: str, space: SpaceKey) -> str:
     """Return the path to the file in the space."""
     return get_upload_file(space, filename)
@@ -134,22 +260,42 @@ def _generate_web_markdown(web_sources: dict) -> str:
     return "\n\n".join(markdown_list) + "\n\n" if markdown_list else ""
 
 
-def format_document_sources(source_nodes: list[NodeWithScore]) -> str:
-    """Format document sources."""
-    file_sources = {}
-    web_sources = {}
-    log.debug("format_document_sources() Source node count: %s", len(source_nodes))
+def get_message_sources(source_nodes: list[NodeWithScore]) -> list[MessageSource]:
+    """Get the document sources to save with a message from the nodes used to answer it."""
+    sources = []
     for source_node in source_nodes:
         metadata = source_node.node.metadata
         if metadata:
             name, page, uri, s_type = _parse_metadata(metadata)
-            log.debug("Source: %s", s_type)
-            if s_type == "SpaceDataSourceWebBased":
-                web_sources = _classify_web_sources(name, uri, page, web_sources)
-            elif s_type == "SpaceDataSourceFileBased":
-                file_sources = _classify_file_sources(name, uri, page, file_sources)
-            else:
-                log.warning("Unknown source type: %s. uri: %s, Node ID: %s", s_type, uri, source_node.node.id_)
+            sources.append(
+                MessageSource(
+                    node_id=source_node.node.id_,
+                    space_id=metadata.get(str(DocumentMetadata.SPACE_ID.name).lower()),
+                    uri=uri,
+                    page=page,
+                    score=source_node.score,
+                    name=name,
+                    source_type=s_type,
+                )
+            )
+    return sources
+
+
+def format_message_sources(sources: list[MessageSource]) -> str:
+    """Format message sources as markdown for display.
+
+    File download links are created here so they're only registered for messages that are displayed.
+    """
+    file_sources = {}
+    web_sources = {}
+    for source in sources:
+        log.debug("Source: %s", source.source_type)
+        if source.source_type == "SpaceDataSourceWebBased":
+            web_sources = _classify_web_sources(source.name, source.uri, source.page, web_sources)
+        elif source.source_type == "SpaceDataSourceFileBased":
+            file_sources = _classify_file_sources(source.name, source.uri, source.page, file_sources)
+        else:
+            log.warning("Unknown source type: %s. uri: %s, Node ID: %s", source.source_type, source.uri, source.node_id)
     total = len(file_sources) + len(web_sources)
     fmt_sources = (
         f"\n##### Source{'s' if total > 1 else ''}:\n"
@@ -157,3 +303,9 @@ def format_document_sources(source_nodes: list[NodeWithScore]) -> str:
         + _generate_web_markdown(web_sources)
     )
     return fmt_sources if total else ""
+
+
+def format_document_sources(source_nodes: list[NodeWithScore]) -> str:
+    """Format document sources."""
+    log.debug("format_document_sources() Source node count: %s", len(source_nodes))
+    return format_message_sources(get_message_sources(source_nodes))
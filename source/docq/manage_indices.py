@@ -32,6 +32,40 @@ def _create_vector_index(
     )
 
 
+@tracer.start_as_current_span("manage_indices._refresh_vector_index")
+def _refresh_vector_index(
+    documents: List[Document], space: SpaceKey, model_settings_collection: LlmUsageSettingsCollection
+) -> BaseIndex:
+    """Update the persisted index of a space in place so only new or changed documents are embedded.
+
+    Documents are matched on `doc_id` and compared by hash, so ids and metadata must be stable across loads.
+    Documents in the index that are no longer present are deleted. Falls back to building a new index if the space
+    doesn't have one yet.
+    """
+    span = trace.get_current_span()
+    try:
+        index = _load_index_from_storage(space, model_settings_collection)
+    except Exception as e:
+        log.info("No existing index to refresh for space '%s', creating a new one. %s", space, e)
+        span.add_event("no_existing_index")
+        return _create_vector_index(documents, model_settings_collection)
+
+    refreshed = index.refresh_ref_docs(documents)
+    current_doc_ids = {document.doc_id for document in documents}
+    removed_doc_ids = [ref_doc_id for ref_doc_id in index.ref_doc_info if ref_doc_id not in current_doc_ids]
+    for ref_doc_id in removed_doc_ids:
+        index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+
+    span.set_attributes(
+        {
+            "num_docs_refreshed": sum(refreshed),
+            "num_docs_unchanged": len(refreshed) - sum(refreshed),
+            "num_docs_removed": len(removed_doc_ids),
+        }
+    )
+    return index
+
+
 @tracer.start_as_current_span("manage_spaces._create_document_summary_index")
 def _create_document_summary_index(
     documents: List[Document], model_settings_collection: LlmUsageSettingsCollection
@@ -7,6 +7,7 @@ from datetime import datetime
 from typing import List, Tuple
 
 from . import manage_settings, manage_users
+from .access_control.authorization import invalidate_authorization_context
 from .constants import DEFAULT_ORG_ID, DEFAULT_ORG_NAME
 from .support.store import get_sqlite_shared_system_file
 
@@ -144,6 +145,7 @@ def create_organisation(name: str, creating_user_id: int) -> int | None:
             manage_users._add_organisation_member_sql(cursor, org_id, creating_user_id, is_default_org_admin)
             connection.commit()
             log.info("Created organization %s with member %s", org_id, creating_user_id)
+            invalidate_authorization_context(creating_user_id)
         except Exception as e:
             # Rollback transaction on error
             connection.rollback()
@@ -184,6 +186,7 @@ def update_organisation(id_: int, name: str = None) -> bool:
         try:
             cursor.execute(query, tuple(params))
             connection.commit()
+            invalidate_authorization_context()
             return True
         except Exception as e:
             log.error("Error updating org: %s", e)
@@ -211,4 +214,5 @@ def archive_organisation(id_: int) -> bool:
             ),
         )
         connection.commit()
+        invalidate_authorization_context()
         return True
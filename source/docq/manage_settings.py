@@ -4,11 +4,18 @@ Three scopes are supported:
 
 - Org: settings that apply to all users in a specific org. user_id=USER_ID_AS_SYSTEM
 - User Org: settings that apply to a specific user scoped to an org.
+
+Reads are served from an in-process cache. Each settings db has a version counter row that's bumped with every
+update. A process drops its cached settings when it updates them and, at most every VERSION_CHECK_INTERVAL_SEC,
+checks the version so updates made by other processes are picked up.
 """
 
+import copy
 import json
 import logging as log
 import sqlite3
+import threading
+import time
 from contextlib import closing
 from typing import Optional
 
@@ -38,10 +45,30 @@ CREATE TABLE IF NOT EXISTS settings (
 """
 
 
+SQL_CREATE_SETTINGS_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS settings_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+)
+"""
+
+SQL_BUMP_SETTINGS_VERSION = """
+INSERT INTO settings_version (id, version) VALUES (1, 1)
+ON CONFLICT (id) DO UPDATE SET version = version + 1
+"""
+
+
 USER_ID_AS_SYSTEM = 0
 ORG_ID_AS_SYSTEM = 0
 
+VERSION_CHECK_INTERVAL_SEC = 1.0
+"""How long cached settings are used before checking the settings db version for changes made by other processes."""
 
+# (sqlite file, org_id, user_id) -> (version, settings)
+_settings_cache: dict[tuple[str, int, int], tuple[int, dict]] = {}
+# sqlite file -> (version, monotonic time it was read)
+_settings_versions: dict[str, tuple[int, float]] = {}
+_settings_cache_lock = threading.Lock()
 
 
 @tracer.start_as_current_span("_init_org_settings")
@@ -77,6 +104,7 @@ def _init(user_id: Optional[int] = None) -> None:
         sqlite3.connect(_get_sqlite_file(user_id), detect_types=sqlite3.PARSE_DECLTYPES)
     ) as connection, closing(connection.cursor()) as cursor:
         cursor.execute(SQL_CREATE_SETTINGS_TABLE)
+        cursor.execute(SQL_CREATE_SETTINGS_VERSION_TABLE)
         connection.commit()
 
 def _get_sqlite_file(user_id: Optional[int] = None) -> str:
@@ -84,23 +112,64 @@ def _get_sqlite_file(user_id: Optional[int] = None) -> str:
     return get_sqlite_usage_file(user_id) if user_id else get_sqlite_shared_system_file()
 
 
+def _get_settings_version(cursor: sqlite3.Cursor) -> int:
+    """The settings db version. 0 for a db that hasn't been updated since versioning was added."""
+    try:
+        row = cursor.execute("SELECT version FROM settings_version WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] if row else 0
+
+
+def _invalidate_settings_cache(sqlite_file: Optional[str] = None) -> None:
+    """Drop cached settings read from `sqlite_file`, or all cached settings if None."""
+    with _settings_cache_lock:
+        if sqlite_file is None:
+            _settings_cache.clear()
+            _settings_versions.clear()
+            return
+        _settings_versions.pop(sqlite_file, None)
+        for key in [key for key in _settings_cache if key[0] == sqlite_file]:
+            del _settings_cache[key]
+
+
 def _get_settings(org_id: int, user_id: int) -> dict[str, str]:
+    sqlite_file = _get_sqlite_file(user_id)
+    key = (sqlite_file, org_id, user_id)
+    with _settings_cache_lock:
+        cached = _settings_cache.get(key)
+        checked = _settings_versions.get(sqlite_file)
+    if (
+        cached is not None
+        and checked is not None
+        and cached[0] == checked[0]
+        and time.monotonic() - checked[1] < VERSION_CHECK_INTERVAL_SEC
+    ):
+        return copy.deepcopy(cached[1])
+
     log.debug("Getting settings for user '%s'", str(user_id))
     with closing(
-        sqlite3.connect(_get_sqlite_file(user_id), detect_types=sqlite3.PARSE_DECLTYPES)
+        sqlite3.connect(sqlite_file, detect_types=sqlite3.PARSE_DECLTYPES)
     ) as connection, closing(connection.cursor()) as cursor:
-        rows = cursor.execute(
-            "SELECT key, val FROM settings WHERE user_id = ? AND org_id = ?",
-            (user_id, org_id),
-        ).fetchall()
-        if rows:
-            return {key: json.loads(val) for key, val in rows}
-        return {}
+        # read the version first so settings are never cached against a version newer than them.
+        version = _get_settings_version(cursor)
+        if cached is None or cached[0] != version:
+            rows = cursor.execute(
+                "SELECT key, val FROM settings WHERE user_id = ? AND org_id = ?",
+                (user_id, org_id),
+            ).fetchall()
+            cached = (version, {key: json.loads(val) for key, val in rows})
+
+    with _settings_cache_lock:
+        _settings_cache[key] = cached
+        _settings_versions[sqlite_file] = (version, time.monotonic())
+    return copy.deepcopy(cached[1])
 
 
 def _update_settings(settings: dict, org_id: int, user_id: Optional[int] = None) -> bool:
+    sqlite_file = _get_sqlite_file(user_id)
     with closing(
-        sqlite3.connect(_get_sqlite_file(user_id), detect_types=sqlite3.PARSE_DECLTYPES)
+        sqlite3.connect(sqlite_file, detect_types=sqlite3.PARSE_DECLTYPES)
     ) as connection, closing(connection.cursor()) as cursor:
         user_id = user_id or USER_ID_AS_SYSTEM
         log.debug("Updating settings for user %d", user_id)
@@ -108,9 +177,11 @@ def _update_settings(settings: dict, org_id: int, user_id: Optional[int] = None)
             "INSERT OR REPLACE INTO settings (user_id, org_id, key, val) VALUES (?, ?, ?, ?)",
             [(user_id, org_id, key, json.dumps(val)) for key, val in settings.items()],
         )
+        cursor.execute(SQL_CREATE_SETTINGS_VERSION_TABLE)
+        cursor.execute(SQL_BUMP_SETTINGS_VERSION)
         connection.commit()
-        return True
-
+    _invalidate_settings_cache(sqlite_file)
+    return True
 
 
 def get_system_settings(key: Optional[SystemSettingsKey] = None) -> dict | str | None:
@@ -8,14 +8,17 @@ from contextlib import closing
 from datetime import datetime
 from typing import Any, List, Optional
 
+from llama_index.core.schema import Document
 from opentelemetry import trace
 
 import docq
+from docq.access_control.authorization import invalidate_authorization_context
 from docq.access_control.main import SpaceAccessor, SpaceAccessType
-from docq.config import SpaceType
+from docq.config import SpaceIndexStatus, SpaceType
 from docq.data_source.list import SpaceDataSources
-from docq.domain import DocumentListItem, SpaceKey
-from docq.manage_indices import _create_vector_index, _persist_index
+from docq.data_source.main import DocumentMetadata
+from docq.domain import DocumentListItem, FeatureKey, SpaceKey
+from docq.manage_indices import _create_vector_index, _persist_index, _refresh_vector_index
 from docq.model_selection.main import get_saved_model_settings_collection
 from docq.support.store import get_sqlite_shared_system_file
 
@@ -31,6 +34,8 @@ CREATE TABLE IF NOT EXISTS spaces (
     archived BOOL DEFAULT 0,
     datasource_type TEXT,
     datasource_configs TEXT,
+    document_count INTEGER, -- NULL until counted by reindex
+    index_status TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (org_id) REFERENCES orgs (id)
@@ -47,6 +52,21 @@ CREATE TABLE IF NOT EXISTS space_access (
 )
 """
 
+# A thread is identified by its owner and feature as well as its id because thread ids are only unique within an
+# owner's history table for a feature.
+SQL_CREATE_THREAD_SPACES_TABLE = """
+CREATE TABLE IF NOT EXISTS thread_spaces (
+    feature_type TEXT NOT NULL, -- OrganisationFeatureType name, the history table the thread is in
+    owner_id TEXT NOT NULL, -- user id, or session id for public sessions
+    thread_id INTEGER NOT NULL,
+    space_id INTEGER NOT NULL,
+    org_id INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (feature_type, owner_id, thread_id, space_id),
+    FOREIGN KEY (space_id) REFERENCES spaces (id)
+)
+"""
+
 THREAD_SPACE_NAME_TEMPLATE = "Thread-{thread_id} {summary}"
 
 SPACE = tuple[int, int, str, str, bool, str, dict, str, datetime, datetime]
@@ -60,6 +80,7 @@ def _init() -> None:
     ) as connection, closing(connection.cursor()) as cursor:
         cursor.execute(SQL_CREATE_SPACES_TABLE)
         cursor.execute(SQL_CREATE_SPACE_ACCESS_TABLE)
+        cursor.execute(SQL_CREATE_THREAD_SPACES_TABLE)
         connection.commit()
 
 
@@ -106,26 +127,33 @@ def create_space(
         json.dumps(datasource_configs),
     )
     log.debug("Creating space with params: %s", params)
-    rowid = None
     with closing(
         sqlite3.connect(get_sqlite_shared_system_file(), detect_types=sqlite3.PARSE_DECLTYPES)
     ) as connection, closing(connection.cursor()) as cursor:
-        cursor.execute(
-            "INSERT INTO spaces (org_id, name, space_type, summary, datasource_type, datasource_configs) VALUES (?, ?, ?, ?, ?, ?)",
-            params,
-        )
-        rowid = cursor.lastrowid
+        space = _insert_space(cursor, space_type, params)
         connection.commit()
-        if rowid is None:
-            raise ValueError("Failed to create space")
-        log.debug("Created space with rowid: %d", rowid)
-        space = SpaceKey(space_type, rowid, org_id)
+
+    if space_type == SpaceType.SHARED:
+        invalidate_authorization_context()
 
     reindex(space)
 
     return space
 
 
+def _insert_space(cursor: sqlite3.Cursor, space_type: SpaceType, params: tuple) -> SpaceKey:
+    """Insert a spaces row without committing. `params` are (org_id, name, space_type, summary, datasource_type, datasource_configs)."""
+    cursor.execute(
+        "INSERT INTO spaces (org_id, name, space_type, summary, datasource_type, datasource_configs) VALUES (?, ?, ?, ?, ?, ?)",
+        params,
+    )
+    rowid = cursor.lastrowid
+    if rowid is None:
+        raise ValueError("Failed to create space")
+    log.debug("Created space with rowid: %d", rowid)
+    return SpaceKey(space_type, rowid, params[0])
+
+
 @tracer.start_as_current_span("manage_spaces.list_space")
 def list_space(org_id: int, space_type: Optional[str] = None) -> list[SPACE]:
     """List all spaces of a given type."""
@@ -154,11 +182,36 @@ def list_space(org_id: int, space_type: Optional[str] = None) -> list[SPACE]:
         return [_format_space(row) for row in rows]
 
 
+def _set_space_index_status(space: SpaceKey, status: SpaceIndexStatus, document_count: Optional[int] = None) -> None:
+    """Set the index status, and the document count if given, of a space. Errors are logged, not raised, so they never fail indexing."""
+    try:
+        with closing(
+            sqlite3.connect(get_sqlite_shared_system_file(), detect_types=sqlite3.PARSE_DECLTYPES)
+        ) as connection, closing(connection.cursor()) as cursor:
+            cursor.execute(
+                "UPDATE spaces SET index_status = ?, document_count = COALESCE(?, document_count) WHERE id = ? AND org_id = ?",
+                (status.name, document_count, space.id_, space.org_id),
+            )
+            connection.commit()
+    except Exception as e:
+        log.error("Failed to set index status %s for space '%s'. Error: %s", status.name, space, e)
+
+
+def _count_source_documents(documents: list[Document]) -> int:
+    """The number of source documents, e.g. files, that were loaded. A source can load as several documents, one per page."""
+    source_uri = str(DocumentMetadata.SOURCE_URI.name).lower()
+    return len({document.metadata.get(source_uri, document.doc_id) for document in documents})
+
+
 @tracer.start_as_current_span("manage_spaces.reindex")
 def reindex(space: SpaceKey) -> None:
-    """Reindex documents in a space from scratch. If an index already exists, it will be overwritten."""
+    """Reindex documents in a space from scratch. If an index already exists, it will be overwritten.
+
+    Keeps the space's index status and document count up to date.
+    """
     span = trace.get_current_span()
     span.set_attributes({"space_id": space.id_, "space_org_id": space.org_id})
+    _set_space_index_status(space, SpaceIndexStatus.INDEXING)
     try:
         log.debug("reindex(): Start...")
         log.debug("reindex(): get saved model settings")
@@ -168,7 +221,8 @@ def reindex(space: SpaceKey) -> None:
             raise ValueError(f"No data source found for space {space}")
         (ds_type, ds_configs) = _space_data_source
         log.debug("reindex(): get datasource instance")
-        documents = SpaceDataSources[ds_type].value.load(space, ds_configs)
+        data_source = SpaceDataSources[ds_type].value
+        documents = data_source.load(space, ds_configs)
 
         if documents:
             log.debug("reindex(): docs to index, %s", len(documents))
@@ -178,14 +232,26 @@ def reindex(space: SpaceKey) -> None:
 
             # summary_index = _create_document_summary_index(documents, saved_model_settings)
             # _persist_index(summary_index, space)
-            vector_index = _create_vector_index(documents, saved_model_settings)
+            vector_index = (
+                _refresh_vector_index(documents, space, saved_model_settings)
+                if data_source.supports_incremental_reindex
+                else _create_vector_index(documents, saved_model_settings)
+            )
             _persist_index(vector_index, space)
+            document_count = _count_source_documents(documents)
+            _set_space_index_status(
+                space, SpaceIndexStatus.READY if document_count else SpaceIndexStatus.EMPTY, document_count
+            )
+        else:
+            _set_space_index_status(space, SpaceIndexStatus.EMPTY, 0)
     except Exception as e:
         if e.__str__().__contains__("No files found"):
             log.info("Reindex skipped. No documents found in space '%s'", space)
             span.add_event("Reindex skipped. No documents found in space", {"space": str(space)})
+            _set_space_index_status(space, SpaceIndexStatus.EMPTY, 0)
         else:
             log.exception("Error indexing space '%s'. Error: %s", space, e)
+            _set_space_index_status(space, SpaceIndexStatus.FAILED)
     finally:
         log.debug("reindex(): Complete")
 
@@ -217,6 +283,22 @@ def list_documents(space: SpaceKey) -> List[DocumentListItem]:
     return documents_list
 
 
+def get_documents_version(space: SpaceKey) -> Optional[str]:
+    """Get a value that changes whenever the space's document list changes. None if the data source doesn't support it."""
+    _space_data_source = get_space_data_source(space)
+
+    if _space_data_source is None:
+        raise ValueError(f"No data source found for space {space}")
+
+    (ds_type, ds_configs) = _space_data_source
+
+    try:
+        return SpaceDataSources[ds_type].value.get_document_list_version(space, ds_configs)
+    except Exception as e:
+        log.error("Error getting document list version for space '%s': %s", space, e)
+        return None
+
+
 @tracer.start_as_current_span("manage_spaces.get_document")
 def get_space_data_source(space: SpaceKey) -> tuple[str, dict] | None:
     """Returns the data source type and configuration for the given space.
@@ -311,7 +393,10 @@ def update_shared_space(
         cursor.execute(query, params)
         connection.commit()
         log.debug("Updated space %d", id_)
-        return True
+
+    # archiving changes who can access the space
+    invalidate_authorization_context()
+    return True
 
 
 @tracer.start_as_current_span("manage_spaces.create_shared_space")
@@ -330,50 +415,94 @@ def create_shared_space(
 
 
 @tracer.start_as_current_span("manage_spaces.create_thread_space")
-def create_thread_space(org_id: int, thread_id: int, summary: str, datasource_type: str) -> SpaceKey:
-    """Create a spcace for chat thread uploads."""
+def create_thread_space(
+    org_id: int, thread_id: int, summary: str, datasource_type: str, feature: FeatureKey
+) -> SpaceKey:
+    """Create a spcace for chat thread uploads.
+
+    The space and its link to the thread are written in one transaction so a space is never left without its thread.
+    `feature` is the feature key of the thread's owner.
+    """
     rnd = str(random.randint(56450, 9999999999))
     name = f"Thread-{thread_id} {summary} {rnd}"
     log.info("Creating thread space with name: '%s'", name)
-    return create_space(
-        org_id=org_id,
-        name=name,
-        summary=summary,
-        datasource_type=datasource_type,
-        datasource_configs={"name": name, "summary": summary, "thread_id": thread_id},
-        space_type=SpaceType.THREAD,
+    params = (
+        org_id,
+        name,
+        SpaceType.THREAD.name,
+        summary,
+        datasource_type,
+        json.dumps({"name": name, "summary": summary, "thread_id": thread_id}),
     )
+    with closing(
+        sqlite3.connect(get_sqlite_shared_system_file(), detect_types=sqlite3.PARSE_DECLTYPES)
+    ) as connection, closing(connection.cursor()) as cursor:
+        space = _insert_space(cursor, SpaceType.THREAD, params)
+        cursor.execute(
+            "INSERT INTO thread_spaces (feature_type, owner_id, thread_id, space_id, org_id) VALUES (?, ?, ?, ?, ?)",
+            (feature.type_.name, str(feature.id_), thread_id, space.id_, org_id),
+        )
+        connection.commit()
+
+    reindex(space)
+
+    return space
 
 
-def get_thread_space(org_id: int, thread_id: int) -> SpaceKey | None:
-    """Get a space for chat thread uploads.
+def get_thread_space(org_id: int, thread_id: int, feature: FeatureKey) -> SpaceKey | None:
+    """Get a space for chat thread uploads. `feature` is the feature key of the thread's owner.
 
-    NOTE: if this doesn't return it doesn't mean the space doesn't exist as it's filtered by org_id. Use space_name_exists() to check if a space with name already exists.
+    A thread space from before thread_spaces that the migration couldn't link to a single owner is found by its name,
+    as it used to be, and linked to the first owner of a thread with that id to ask for it.
+
+    NOTE: if this doesn't return it doesn't mean the space doesn't exist as it's filtered by org_id. Use thread_space_exists() to check if a space for the thread already exists.
     """
     result = None
     with closing(
         sqlite3.connect(get_sqlite_shared_system_file(), detect_types=sqlite3.PARSE_DECLTYPES)
     ) as connection, closing(connection.cursor()) as cursor:
-        name = f"Thread-{thread_id} %"  # FIXME: urg this is nasty.
         cursor.execute(
-            "SELECT id FROM spaces WHERE org_id = ? AND name LIKE ? AND space_type = ?",
-            (org_id, name, SpaceType.THREAD.name),
+            "SELECT space_id FROM thread_spaces WHERE feature_type = ? AND owner_id = ? AND thread_id = ? AND org_id = ? ORDER BY space_id LIMIT 1",
+            (feature.type_.name, str(feature.id_), thread_id, org_id),
         )
         row = cursor.fetchone()
+        if row is None:
+            row = _link_unlinked_thread_space(cursor, org_id, thread_id, feature)
+            connection.commit()
         if row:
             result = SpaceKey(SpaceType.THREAD, row[0], org_id)
             log.debug("Found space with Id: %d", row[0])
     return result
 
 
-def thread_space_exists(thread_id: int) -> bool:
-    """Check if a thread space exists. Space names are unique. Thread spaces have a special naming convention based on thread_id. Use this to check if a Space with the generated name already exists."""
+def _link_unlinked_thread_space(
+    cursor: sqlite3.Cursor, org_id: int, thread_id: int, feature: FeatureKey
+) -> Optional[tuple[int]]:
+    """Link a thread space not yet linked to any thread, found by name, to the thread. Returns (space_id,) if found."""
+    cursor.execute(
+        "SELECT id FROM spaces WHERE org_id = ? AND name LIKE ? AND space_type = ? AND id NOT IN (SELECT space_id FROM thread_spaces) ORDER BY id LIMIT 1",
+        (org_id, f"Thread-{thread_id} %", SpaceType.THREAD.name),
+    )
+    row = cursor.fetchone()
+    if row:
+        log.info("Linking thread space %s to thread %s of %s", row[0], thread_id, feature)
+        cursor.execute(
+            "INSERT INTO thread_spaces (feature_type, owner_id, thread_id, space_id, org_id) VALUES (?, ?, ?, ?, ?)",
+            (feature.type_.name, str(feature.id_), thread_id, row[0], org_id),
+        )
+    return row
+
+
+def thread_space_exists(thread_id: int, feature: FeatureKey) -> bool:
+    """Check if a space for a thread exists in any org. `feature` is the feature key of the thread's owner."""
     exists = True  # default to true as the safer option
-    name = f"Thread-{thread_id} %"
     with closing(
         sqlite3.connect(get_sqlite_shared_system_file(), detect_types=sqlite3.PARSE_DECLTYPES)
     ) as connection, closing(connection.cursor()) as cursor:
-        cursor.execute("SELECT id, name FROM spaces WHERE name LIKE ?", (name,))
+        cursor.execute(
+            "SELECT space_id FROM thread_spaces WHERE feature_type = ? AND owner_id = ? AND thread_id = ? LIMIT 1",
+            (feature.type_.name, str(feature.id_), thread_id),
+        )
         row = cursor.fetchone()
         exists = row is not None
 
@@ -458,7 +587,9 @@ def update_shared_space_permissions(id_: int, accessors: List[SpaceAccessor]) ->
                     (id_, accessor.type_.name, accessor.accessor_id),
                 )
         connection.commit()
-        return True
+
+    invalidate_authorization_context()
+    return True
 
 
 def get_space(space_id: int, org_id: int) -> Optional[SPACE]:
@@ -474,7 +605,38 @@ def get_space(space_id: int, org_id: int) -> Optional[SPACE]:
         row = cursor.fetchone()
         return _format_space(row) if row else None
 
+def get_space_index_status(space: SpaceKey) -> tuple[Optional[SpaceIndexStatus], Optional[int]]:
+    """Get the index status and document count of a space. Both None if the space hasn't been indexed since they were added.
+
+    Raises:
+        ValueError: if the space doesn't exist.
+    """
+    with closing(
+        sqlite3.connect(get_sqlite_shared_system_file(), detect_types=sqlite3.PARSE_DECLTYPES)
+    ) as connection, closing(connection.cursor()) as cursor:
+        row = cursor.execute(
+            "SELECT index_status, document_count FROM spaces WHERE id = ? AND org_id = ?", (space.id_, space.org_id)
+        ).fetchone()
+    if row is None:
+        raise ValueError(f"No space found with id {space.id_} and org_id {space.org_id}")
+    return (SpaceIndexStatus[row[0]] if row[0] else None), row[1]
+
+
+@tracer.start_as_current_span("manage_spaces.is_space_empty")
 def is_space_empty(space: SpaceKey) -> bool:
-    """Check if a space has any docs or not."""
-    docs = list_documents(space)
-    return len(docs) == 0
+    """Check if a space has any docs or not.
+
+    Uses the document count kept by `reindex`. Spaces not indexed since counts were added are listed once to get it.
+    """
+    _, document_count = get_space_index_status(space)
+    if document_count is None:
+        document_count = len(list_documents(space))
+        with closing(
+            sqlite3.connect(get_sqlite_shared_system_file(), detect_types=sqlite3.PARSE_DECLTYPES)
+        ) as connection, closing(connection.cursor()) as cursor:
+            cursor.execute(
+                "UPDATE spaces SET document_count = ? WHERE id = ? AND org_id = ? AND document_count IS NULL",
+                (document_count, space.id_, space.org_id),
+            )
+            connection.commit()
+    return document_count == 0
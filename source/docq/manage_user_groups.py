@@ -6,6 +6,7 @@ from contextlib import closing
 from datetime import datetime
 from typing import List, Tuple
 
+from .access_control.authorization import invalidate_authorization_context
 from .support.store import get_sqlite_shared_system_file
 
 SQL_CREATE_USER_GROUPS_TABLE = """
@@ -133,6 +134,7 @@ def update_user_group(id_: int, members: List[int], name: str = None) -> bool:
             "INSERT INTO user_group_members (group_id, user_id) VALUES (?, ?)", [(id_, x) for x in members]
         )
         connection.commit()
+        invalidate_authorization_context()
         return True
 
 
@@ -153,4 +155,5 @@ def delete_user_group(id_: int, org_id: int) -> bool:
         cursor.execute("DELETE FROM user_group_members WHERE group_id = ? ", (id_,))
         cursor.execute("DELETE FROM user_groups WHERE id = ? AND org_id = ?", (id_, org_id))
         connection.commit()
+        invalidate_authorization_context()
         return True
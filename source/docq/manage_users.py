@@ -15,6 +15,7 @@ import docq
 
 from . import manage_organisations
 from . import manage_settings as msettings
+from .access_control.authorization import invalidate_authorization_context
 from .constants import DEFAULT_ADMIN_FULLNAME, DEFAULT_ADMIN_ID, DEFAULT_ADMIN_PASSWORD, DEFAULT_ADMIN_USERNAME
 from .support.store import get_sqlite_shared_system_file
 
@@ -299,6 +300,7 @@ def update_user(
     ) as connection, closing(connection.cursor()) as cursor:
         cursor.execute(query, tuple(params))
         connection.commit()
+        invalidate_authorization_context(id_)
         return True
 
 @tracer.start_as_current_span(name="manage_users.create_user")
@@ -463,6 +465,7 @@ def archive_user(id_: int) -> bool:
             ),
         )
         connection.commit()
+        invalidate_authorization_context(id_)
         return True
 
 @tracer.start_as_current_span(name="manage_users._add_organisation_member_sql")
@@ -491,6 +494,7 @@ def add_organisation_member(org_id: int, user_id: int, org_admin: bool = False)
         try:
             _add_organisation_member_sql(cursor, org_id, user_id, org_admin)
             connection.commit()
+            invalidate_authorization_context(user_id)
             success = True
         except Exception as e:
             success = False
@@ -549,6 +553,8 @@ def update_organisation_members(org_id: int, users: List[Tuple[int, bool]]) -> b
                 [(org_id, x[0], x[1]) for x in users],
             )
             connection.commit()
+            # members removed from the org aren't in `users` so drop everyone's
+            invalidate_authorization_context()
             success = True
         except Exception as e:
             success = False
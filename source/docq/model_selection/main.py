@@ -25,6 +25,7 @@ from docq.config import (
 )
 from docq.manage_settings import get_organisation_settings
 from docq.support.llama_index.callbackhandlers import OtelCallbackHandler
+from docq.support.llama_index.llms import RateLimitedLiteLLM
 from docq.support.store import get_models_dir
 from llama_index.core.callbacks.base import CallbackManager
 from llama_index.core.embeddings import BaseEmbedding
@@ -34,7 +35,6 @@ from llama_index.core.service_context import ServiceContext
 from llama_index.embeddings.azure_openai import AzureOpenAIEmbedding
 from llama_index.embeddings.huggingface_optimum import OptimumEmbedding
 from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.llms.litellm import LiteLLM
 from opentelemetry import trace
 from vertexai.preview.generative_models import HarmBlockThreshold, HarmCategory
 
@@ -102,6 +102,32 @@ class LlmServiceInstanceConfig:
     """The licenses under which the model is released. Especially important for open source models."""
     additional_properties: Dict[str, Any] = field(default_factory=dict)
     """Any additional properties that are specific to the model hosting service."""
+    max_concurrency: Optional[int] = None
+    """The most calls made to this instance at once from a process. The provider default when None. 0 for no cap."""
+
+
+DEFAULT_MAX_CONCURRENCY = {
+    ModelProvider.OPENAI: 32,
+    ModelProvider.AZURE_OPENAI: 16,
+    ModelProvider.GROQ: 8,
+    ModelProvider.GOOGLE_VERTEXAI_PALM2: 16,
+    ModelProvider.GOOGLE_VERTEXTAI_GEMINI_PRO: 16,
+}
+"""Concurrency caps of model service instances by provider. Conservative for the lowest quota tiers we deploy on."""
+
+DEFAULT_MAX_CONCURRENCY_OTHER = 8
+
+
+def get_service_instance_max_concurrency(config: LlmServiceInstanceConfig) -> int:
+    """Get the concurrency cap of a model service instance."""
+    if config.max_concurrency is not None:
+        return config.max_concurrency
+    return DEFAULT_MAX_CONCURRENCY.get(config.provider, DEFAULT_MAX_CONCURRENCY_OTHER)
+
+
+def get_service_instance_key(config: LlmServiceInstanceConfig) -> str:
+    """Get a key that identifies a model service instance, the deployment calls are made to."""
+    return f"{config.provider.value}:{config.api_base or ''}:{config.model_deployment_name or config.model_name}"
 
 
 @dataclass
@@ -481,7 +507,7 @@ def _get_generation_model(model_settings_collection: LlmUsageSettingsCollection)
         if sc.provider == ModelProvider.AZURE_OPENAI:
             _additional_kwargs: Dict[str, Any] = {}
             _additional_kwargs["api_version"] = chat_model_settings.service_instance_config.api_version
-            model = LiteLLM(
+            model = RateLimitedLiteLLM(
                 temperature=chat_model_settings.temperature,
                 model=f"azure/{sc.model_deployment_name}",
                 additional_kwargs=_additional_kwargs,
@@ -495,7 +521,7 @@ def _get_generation_model(model_settings_collection: LlmUsageSettingsCollection)
             if _env_missing:
                 log.warning("Chat model: env var values missing.")
         elif sc.provider == ModelProvider.OPENAI:
-            model = LiteLLM(
+            model = RateLimitedLiteLLM(
                 temperature=chat_model_settings.temperature,
                 model=sc.model_name,
                 api_key=sc.api_key,
@@ -507,14 +533,14 @@ def _get_generation_model(model_settings_collection: LlmUsageSettingsCollection)
                 log.warning("Chat model: env var values missing")
         elif sc.provider == ModelProvider.GOOGLE_VERTEXAI_PALM2:
             # GCP project_id is coming from the credentials json.
-            model = LiteLLM(
+            model = RateLimitedLiteLLM(
                 temperature=chat_model_settings.temperature,
                 model=sc.model_name,
                 callback_manager=_callback_manager,
             )
         elif sc.provider == ModelProvider.GOOGLE_VERTEXTAI_GEMINI_PRO:
             # GCP project_id is coming from the credentials json.
-            model = LiteLLM(
+            model = RateLimitedLiteLLM(
                 temperature=chat_model_settings.temperature,
                 model=sc.model_name,
                 callback_manager=_callback_manager,
@@ -524,7 +550,7 @@ def _get_generation_model(model_settings_collection: LlmUsageSettingsCollection)
             litellm.VertexAIConfig()
             litellm.vertex_location = sc.additional_properties["vertex_location"]
         elif sc.provider == ModelProvider.GROQ:
-            model = LiteLLM(
+            model = RateLimitedLiteLLM(
                 temperature=chat_model_settings.temperature,
                 model=f"groq/{sc.model_name}",
                 api_key=sc.api_key,
@@ -541,7 +567,11 @@ def _get_generation_model(model_settings_collection: LlmUsageSettingsCollection)
         else:
             raise ValueError("Chat model: model settings with a supported model provider not found.")
 
-        model.max_retries = 3
+        # retries are made by RateLimitedLiteLLM through the rate limiter
+        model.max_retries = 1
+        model.max_attempts = 3
+        model.service_instance_key = get_service_instance_key(sc)
+        model.max_concurrency = get_service_instance_max_concurrency(sc)
 
         print("model: ", model)
         print("model_settings_collection: ", model_settings_collection)
@@ -1,24 +1,38 @@
 """Functions to run queries."""
 
 import logging as log
+import os
+import re
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import closing
+from contextvars import copy_context
 from datetime import datetime
-from typing import Literal, Optional
+from enum import Enum
+from typing import Iterator, Literal, Optional
 
 from llama_index.core.llms import ChatMessage, MessageRole
 
-from docq.config import OrganisationFeatureType
-from docq.domain import Assistant, FeatureKey, SpaceKey
-from docq.manage_documents import format_document_sources
+from docq.config import ENV_VAR_DOCQ_HISTORY_MEMORY, OrganisationFeatureType
+from docq.domain import Assistant, BatchQueryResult, FeatureKey, MessageSource, SpaceKey
+from docq.manage_documents import get_message_sources
 from docq.model_selection.main import LlmUsageSettingsCollection
-from docq.support.llm import query_error, run_ask, run_chat
+from docq.support import public_sessions, write_behind
+from docq.support.llm import (
+    BATCH_MAX_CONCURRENCY,
+    query_error,
+    run_ask,
+    run_ask_batch,
+    run_chat,
+    summarise_chat_history,
+)
 from docq.support.store import (
+    UsagePartition,
     get_history_table_name,
     get_history_thread_table_name,
-    get_public_sqlite_usage_file,
     get_sqlite_shared_system_file,
-    get_sqlite_usage_file,
+    get_usage_partition,
 )
 
 # TODO: add thread_space_id to hold the space that's hard attached to a thread for adhoc uploads
@@ -28,7 +42,9 @@ SQL_CREATE_THREAD_TABLE = """
 CREATE TABLE IF NOT EXISTS {table} (
     id INTEGER PRIMARY KEY,
     topic TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    summary TEXT,
+    summary_message_id INTEGER
 )
 """
 
@@ -45,37 +61,312 @@ CREATE TABLE IF NOT EXISTS {table} (
 """
 
 
+# Keyset pagination walks messages by (thread_id, id). The timestamp index serves the cutoff queries.
+SQL_CREATE_MESSAGE_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_{table}_thread_id_id ON {table} (thread_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_{table}_thread_id_timestamp ON {table} (thread_id, timestamp)",
+)
+
+
+# Document sources of messages, e.g. the nodes retrieved to answer a question. Kept out of the message text so history
+# reads and history sent to the LLM don't carry them. Rendered for display from these rows.
+SQL_CREATE_MESSAGE_SOURCES_TABLE = """
+CREATE TABLE IF NOT EXISTS {table}_sources (
+    id INTEGER PRIMARY KEY,
+    message_id INTEGER NOT NULL,
+    node_id TEXT,
+    space_id INTEGER,
+    uri TEXT,
+    page TEXT,
+    score REAL,
+    name TEXT,
+    source_type TEXT,
+    FOREIGN KEY (message_id) REFERENCES {table} (id)
+)
+"""
+
+
+SQL_CREATE_MESSAGE_SOURCES_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_{table}_sources_message_id ON {table}_sources (message_id)",
+)
+
+
+# Consolidated usage db. One file holds every owner's history, partitioned by (scope, owner_id). Thread and message
+# ids are allocated per owner so they match the per owner layout and rows migrate across unchanged.
+SQL_CREATE_CONSOLIDATED_THREAD_TABLE = """
+CREATE TABLE IF NOT EXISTS {table} (
+    scope TEXT NOT NULL,
+    owner_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    topic TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    summary TEXT,
+    summary_message_id INTEGER,
+    PRIMARY KEY (scope, owner_id, id)
+)
+"""
+
+
+# row_id is a stable rowid for the full text search index to reference.
+SQL_CREATE_CONSOLIDATED_MESSAGE_TABLE = """
+CREATE TABLE IF NOT EXISTS {table} (
+    row_id INTEGER PRIMARY KEY,
+    scope TEXT NOT NULL,
+    owner_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    message TEXT,
+    human BOOL,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    thread_id INTEGER NOT NULL,
+    UNIQUE (scope, owner_id, id)
+)
+"""
+
+
+SQL_CREATE_CONSOLIDATED_MESSAGE_SOURCES_TABLE = """
+CREATE TABLE IF NOT EXISTS {table}_sources (
+    id INTEGER PRIMARY KEY,
+    scope TEXT NOT NULL,
+    owner_id TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    node_id TEXT,
+    space_id INTEGER,
+    uri TEXT,
+    page TEXT,
+    score REAL,
+    name TEXT,
+    source_type TEXT
+)
+"""
+
+
+SQL_CREATE_CONSOLIDATED_THREAD_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_{table}_owner_created_at ON {table} (scope, owner_id, created_at)",
+)
+
+
+SQL_CREATE_CONSOLIDATED_MESSAGE_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_{table}_owner_thread_id_id ON {table} (scope, owner_id, thread_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_{table}_owner_thread_id_timestamp ON {table} (scope, owner_id, thread_id, timestamp)",
+)
+
+
+SQL_CREATE_CONSOLIDATED_MESSAGE_SOURCES_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_{table}_sources_owner_message_id ON {table}_sources (scope, owner_id, message_id)",
+)
+
+
+# Full text search over messages. An external content FTS5 table per message table, kept in sync by triggers so
+# message text isn't stored twice. The prefix indexes serve search as you type.
+SQL_CREATE_MESSAGE_FTS = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(message, content='{table}', content_rowid='{rowid}', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN INSERT INTO {table}_fts (rowid, message) VALUES (new.{rowid}, new.message); END",
+    "CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN INSERT INTO {table}_fts ({table}_fts, rowid, message) VALUES ('delete', old.{rowid}, old.message); END",
+    "CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE OF message ON {table} BEGIN INSERT INTO {table}_fts ({table}_fts, rowid, message) VALUES ('delete', old.{rowid}, old.message); INSERT INTO {table}_fts (rowid, message) VALUES (new.{rowid}, new.message); END",
+)
+
+SEARCH_SNIPPET_TOKENS = 16
+
 MESSAGE_TEMPLATE = "{message}"
 
+# messages saved before sources were stored in their own table have them appended with this template.
 MESSAGE_WITH_SOURCES_TEMPLATE = "{message}\n{source}"
 
 NUMBER_OF_MESSAGES_IN_HISTORY = 10
 
+SUMMARY_MEMORY_TURNS = 2
+"""In summary memory mode the last k turns (a human and an assistant message each) are sent as is with the summary."""
 
-def _save_messages(data: list[tuple[str, bool, datetime, int]], feature: FeatureKey) -> list:
-    """feature.id_ needs to be the user_id."""
-    rows = []
-    tablename = get_history_table_name(feature.type_)
-    thread_tablename = get_history_thread_table_name(feature.type_)
-    usage_file = (
-        get_sqlite_usage_file(feature.id_)
-        if feature.type_ != OrganisationFeatureType.ASK_PUBLIC
-        else get_public_sqlite_usage_file(str(feature.id_))
+# the sources block appended by MESSAGE_WITH_SOURCES_TEMPLATE. See manage_documents.format_message_sources().
+SOURCES_BLOCK_PATTERN = re.compile(r"\n+##### Sources?:\n.*\Z", re.DOTALL)
+
+# thread summaries are updated in the background after each turn. A thread with an update already queued isn't queued
+# again because the queued update folds in every message not yet summarised when it runs.
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="docq-history-summary")
+_summary_updates_pending: set[tuple[str, str, str, str, int]] = set()
+_summary_updates_pending_lock = threading.Lock()
+
+
+class HistoryMemoryMode(Enum):
+    """How chat history is sent to the LLM with each turn. Set with the DOCQ_HISTORY_MEMORY env var."""
+
+    WINDOW = "window"  # the last NUMBER_OF_MESSAGES_IN_HISTORY messages as is.
+    SUMMARY = "summary"  # a rolling summary of the thread plus the last SUMMARY_MEMORY_TURNS turns without sources.
+
+
+def get_history_memory_mode() -> HistoryMemoryMode:
+    """The chat history memory mode. Defaults to window."""
+    value = os.getenv(ENV_VAR_DOCQ_HISTORY_MEMORY, HistoryMemoryMode.WINDOW.value).strip().lower()
+    try:
+        return HistoryMemoryMode(value)
+    except ValueError:
+        log.warning("Unknown %s '%s', using '%s'", ENV_VAR_DOCQ_HISTORY_MEMORY, value, HistoryMemoryMode.WINDOW.value)
+        return HistoryMemoryMode.WINDOW
+
+
+def _thread_table_sql(feature_type: OrganisationFeatureType, consolidated: bool = False) -> tuple[str, ...]:
+    """Statements that create the thread table for a feature."""
+    thread_tablename = get_history_thread_table_name(feature_type)
+    if consolidated:
+        return (
+            SQL_CREATE_CONSOLIDATED_THREAD_TABLE.format(table=thread_tablename),
+            *[sql.format(table=thread_tablename) for sql in SQL_CREATE_CONSOLIDATED_THREAD_INDEXES],
+        )
+    return (SQL_CREATE_THREAD_TABLE.format(table=thread_tablename),)
+
+
+def _message_table_sql(feature_type: OrganisationFeatureType, consolidated: bool = False) -> tuple[str, ...]:
+    """Statements that create the thread, message and message sources tables, and their indexes, for a feature."""
+    tablename = get_history_table_name(feature_type)
+    thread_tablename = get_history_thread_table_name(feature_type)
+    if consolidated:
+        return (
+            *_thread_table_sql(feature_type, consolidated),
+            SQL_CREATE_CONSOLIDATED_MESSAGE_TABLE.format(table=tablename),
+            *[sql.format(table=tablename) for sql in SQL_CREATE_CONSOLIDATED_MESSAGE_INDEXES],
+            *[sql.format(table=tablename, rowid="row_id") for sql in SQL_CREATE_MESSAGE_FTS],
+            SQL_CREATE_CONSOLIDATED_MESSAGE_SOURCES_TABLE.format(table=tablename),
+            *[sql.format(table=tablename) for sql in SQL_CREATE_CONSOLIDATED_MESSAGE_SOURCES_INDEXES],
+        )
+    return (
+        *_thread_table_sql(feature_type),
+        SQL_CREATE_MESSAGE_TABLE.format(table=tablename, thread_table=thread_tablename),
+        *[sql.format(table=tablename) for sql in SQL_CREATE_MESSAGE_INDEXES],
+        *[sql.format(table=tablename, rowid="id") for sql in SQL_CREATE_MESSAGE_FTS],
+        SQL_CREATE_MESSAGE_SOURCES_TABLE.format(table=tablename),
+        *[sql.format(table=tablename) for sql in SQL_CREATE_MESSAGE_SOURCES_INDEXES],
     )
-    with closing(sqlite3.connect(usage_file, detect_types=sqlite3.PARSE_DECLTYPES)) as connection, closing(
-        connection.cursor()
-    ) as cursor:
-        cursor.execute(
-            SQL_CREATE_MESSAGE_TABLE.format(
-                table=tablename,
-                thread_table=thread_tablename,
+
+
+def _create_thread_table(
+    cursor: sqlite3.Cursor, feature_type: OrganisationFeatureType, consolidated: bool = False
+) -> None:
+    """Create the thread table for a feature if it doesn't exist."""
+    for sql in _thread_table_sql(feature_type, consolidated):
+        cursor.execute(sql)
+
+
+def _create_message_table(
+    cursor: sqlite3.Cursor, feature_type: OrganisationFeatureType, consolidated: bool = False
+) -> None:
+    """Create the thread and message tables, and the message indexes, for a feature if they don't exist."""
+    for sql in _message_table_sql(feature_type, consolidated):
+        cursor.execute(sql)
+
+
+def _get_usage_partition(feature: FeatureKey) -> UsagePartition:
+    """Where the usage data for a feature lives. feature.id_ is the user_id, or the session id for public features."""
+    return get_usage_partition(feature.id_, public=feature.type_ == OrganisationFeatureType.ASK_PUBLIC)
+
+
+def _where(partition: UsagePartition, *conditions: str, alias: str = "") -> str:
+    """Build a WHERE clause. The (scope, owner_id) filter is added when usage data is consolidated."""
+    if partition.consolidated:
+        conditions = (f"{alias}scope = ?", f"{alias}owner_id = ?", *conditions)
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+def _params(partition: UsagePartition, *params: object) -> tuple:
+    """Query params to go with `_where()`."""
+    return (partition.scope, partition.owner_id, *params) if partition.consolidated else params
+
+
+def _next_id_sql(tablename: str) -> str:
+    """Subquery for the next id in an owner's partition of a consolidated table. Served by the primary key."""
+    return f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {tablename} WHERE scope = ? AND owner_id = ?)"  # noqa: S608
+
+
+def _read_back_id(cursor: sqlite3.Cursor, tablename: str) -> int:
+    """The per owner id of the row just inserted into a consolidated table. Read in the insert's transaction."""
+    return cursor.execute(f"SELECT id FROM {tablename} WHERE rowid = ?", (cursor.lastrowid,)).fetchone()[0]  # noqa: S608
+
+
+def _insert_sources_sql(feature_type: OrganisationFeatureType, partition: UsagePartition) -> str:
+    tablename = f"{get_history_table_name(feature_type)}_sources"
+    if partition.consolidated:
+        return f"INSERT INTO {tablename} (scope, owner_id, message_id, node_id, space_id, uri, page, score, name, source_type) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"  # noqa: S608
+    return f"INSERT INTO {tablename} (message_id, node_id, space_id, uri, page, score, name, source_type) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"  # noqa: S608
+
+
+def _source_rows(
+    partition: UsagePartition, message_ids: list[int], sources: Optional[list[Optional[list[MessageSource]]]]
+) -> list[tuple]:
+    """Rows for the message sources table. `sources` lines up with `message_ids`."""
+    if not sources:
+        return []
+    return [
+        _params(partition, id_, x.node_id, x.space_id, x.uri, x.page, x.score, x.name, x.source_type)
+        for id_, message_sources in zip(message_ids, sources, strict=True)
+        for x in message_sources or []
+    ]
+
+
+def _insert_messages(
+    cursor: sqlite3.Cursor,
+    partition: UsagePartition,
+    feature_type: OrganisationFeatureType,
+    data: list[tuple[str, bool, datetime, int]],
+    sources: Optional[list[Optional[list[MessageSource]]]] = None,
+) -> list:
+    """Insert messages and their sources with `cursor`, letting SQLite assign the ids. Doesn't commit."""
+    rows = []
+    tablename = get_history_table_name(feature_type)
+    for x in data:
+        log.debug("Saving message: %s", x)
+        if partition.consolidated:
+            cursor.execute(
+                f"INSERT INTO {tablename} (scope, owner_id, id, message, human, timestamp, thread_id) VALUES (?, ?, {_next_id_sql(tablename)}, ?, ?, ?, ?)",  # noqa: S608
+                (*_params(partition), *_params(partition), *x),
             )
+            id_ = _read_back_id(cursor, tablename)
+        else:
+            cursor.execute(f"INSERT INTO {tablename} (message, human, timestamp, thread_id) VALUES (?, ?, ?, ?)", x)  # noqa: S608
+            id_ = cursor.lastrowid
+        rows.append((id_, x[0], x[1], x[2], x[3]))
+    source_rows = _source_rows(partition, [row[0] for row in rows], sources)
+    if source_rows:
+        cursor.executemany(_insert_sources_sql(feature_type, partition), source_rows)
+    return rows
+
+
+def _save_messages(
+    data: list[tuple[str, bool, datetime, int]],
+    feature: FeatureKey,
+    sources: Optional[list[Optional[list[MessageSource]]]] = None,
+) -> list:
+    """feature.id_ needs to be the user_id.
+
+    When write-behind persistence is enabled the messages are queued and written by the background flush of the usage
+    db, where SQLite assigns their ids. They aren't known yet so the id of each returned row is None.
+
+    Args:
+        data: (message, human, timestamp, thread_id) of each message.
+        feature: The feature key.
+        sources: The document sources of each message, lined up with `data`. None for messages without sources.
+
+    Returns:
+        list of tuples of (id:int|None, message:str, human:bool, timestamp, thread_id:int).
+    """
+    partition = _get_usage_partition(feature)
+    if feature.type_ == OrganisationFeatureType.ASK_PUBLIC:
+        public_sessions.record_activity(str(feature.id_))
+    if write_behind.is_enabled():
+        write_behind.enqueue_write(
+            partition.file,
+            _insert_messages,
+            partition,
+            feature.type_,
+            data,
+            sources,
+            init_sql=_message_table_sql(feature.type_, partition.consolidated),
         )
+        return [(None, *x) for x in data]
 
-        for x in data:
-            log.debug("Saving message: %s", x)
-            cursor.execute(f"INSERT INTO {tablename} (message, human, timestamp, thread_id) VALUES (?, ?, ?, ?)", x)  # noqa: S608
-            rows.append((cursor.lastrowid, x[0], x[1], x[2], x[3]))
+    with closing(
+        sqlite3.connect(partition.file, detect_types=sqlite3.PARSE_DECLTYPES)
+    ) as connection, closing(connection.cursor()) as cursor:
+        _create_message_table(cursor, feature.type_, partition.consolidated)
+        rows = _insert_messages(cursor, partition, feature.type_, data, sources)
         connection.commit()
 
     return rows
@@ -97,74 +388,205 @@ def _retrieve_messages(
         list pf tuples of (id:int, message:str, human:bool, timestamp, thread_id:int).
     """
     tablename = get_history_table_name(feature.type_)
-    thread_tablename = get_history_thread_table_name(feature.type_)
-    usage_file = (
-        get_sqlite_usage_file(feature.id_)
-        if feature.type_ != OrganisationFeatureType.ASK_PUBLIC
-        else get_public_sqlite_usage_file(str(feature.id_))
-    )
     rows = None
-    with closing(sqlite3.connect(usage_file, detect_types=sqlite3.PARSE_DECLTYPES)) as connection, closing(
-        connection.cursor()
-    ) as cursor:
-        cursor.execute(SQL_CREATE_THREAD_TABLE.format(table=thread_tablename))
-        cursor.execute(SQL_CREATE_MESSAGE_TABLE.format(table=tablename, thread_table=thread_tablename))
+    partition = _get_usage_partition(feature)
+    write_behind.flush(partition.file)  # read your writes
+    with closing(
+        sqlite3.connect(partition.file, detect_types=sqlite3.PARSE_DECLTYPES)
+    ) as connection, closing(connection.cursor()) as cursor:
+        _create_message_table(cursor, feature.type_, partition.consolidated)
         log.debug("Retrieving message params: thread_id=%s, cutoff=%s, size=%s", thread_id, cutoff, size)
+        where = _where(partition, "thread_id = ?", "timestamp < ?")
         if sort_order == "ASC":
             rows = cursor.execute(
-                f"SELECT id, message, human, timestamp, thread_id FROM {tablename} WHERE thread_id = ? AND timestamp < ? ORDER BY timestamp LIMIT ?",  # noqa: S608
-                (thread_id, cutoff, size),
+                f"SELECT id, message, human, timestamp, thread_id FROM {tablename} {where} ORDER BY timestamp LIMIT ?",  # noqa: S608
+                _params(partition, thread_id, cutoff, size),
             ).fetchall()
         else:
             rows = cursor.execute(
-                f"SELECT id, message, human, timestamp, thread_id FROM {tablename} WHERE thread_id = ? AND timestamp < ? ORDER BY timestamp DESC LIMIT ?",  # noqa: S608
-                (thread_id, cutoff, size),
+                f"SELECT id, message, human, timestamp, thread_id FROM {tablename} {where} ORDER BY timestamp DESC LIMIT ?",  # noqa: S608
+                _params(partition, thread_id, cutoff, size),
             ).fetchall()
             rows.reverse()
 
     return rows
 
 
+def _retrieve_messages_page(
+    feature: FeatureKey,
+    thread_id: int,
+    size: int,
+    cursor: Optional[int] = None,
+    sort_order: Literal["ASC", "DESC"] = "DESC",
+) -> tuple[list[tuple[int, str, bool, datetime, int]], Optional[int]]:
+    """Retrieve a page of messages using keyset pagination on the message id.
+
+    Args:
+        feature: The feature key.
+        thread_id: The thread id.
+        size: The number of messages to retrieve.
+        cursor: The `next_cursor` returned with the previous page. None for the first page.
+        sort_order: DESC pages back from the latest message, ASC pages forward from the first message.
+
+    Returns:
+        tuple of (messages, next_cursor). Messages are list of tuples of (id:int, message:str, human:bool, timestamp, thread_id:int) oldest first. next_cursor is None when there are no more pages.
+    """
+    tablename = get_history_table_name(feature.type_)
+    op, order = ("<", "DESC") if sort_order == "DESC" else (">", "ASC")
+    partition = _get_usage_partition(feature)
+    write_behind.flush(partition.file)  # read your writes
+    with closing(
+        sqlite3.connect(partition.file, detect_types=sqlite3.PARSE_DECLTYPES)
+    ) as connection, closing(connection.cursor()) as cursor_:
+        _create_message_table(cursor_, feature.type_, partition.consolidated)
+        log.debug("Retrieving message page params: thread_id=%s, cursor=%s, size=%s", thread_id, cursor, size)
+        conditions = ("thread_id = ?", f"id {op} ?") if cursor is not None else ("thread_id = ?",)
+        params = (thread_id, cursor) if cursor is not None else (thread_id,)
+        # fetch one extra row to know if there's another page without a COUNT query.
+        rows = cursor_.execute(
+            f"SELECT id, message, human, timestamp, thread_id FROM {tablename} {_where(partition, *conditions)} ORDER BY id {order} LIMIT ?",  # noqa: S608
+            _params(partition, *params, size + 1),
+        ).fetchall()
+
+    has_more = len(rows) > size
+    rows = rows[:size]
+    next_cursor = rows[-1][0] if has_more else None
+    if sort_order == "DESC":
+        rows.reverse()
+    return rows, next_cursor
+
+
+def get_thread_history_version(feature: FeatureKey, thread_id: int) -> tuple[Optional[int], int]:
+    """Get the (latest message id, message count) of a thread. Messages are never edited so this changes with the history."""
+    tablename = get_history_table_name(feature.type_)
+    partition = _get_usage_partition(feature)
+    write_behind.flush(partition.file)  # read your writes
+    with closing(sqlite3.connect(partition.file)) as connection, closing(connection.cursor()) as cursor:
+        _create_message_table(cursor, feature.type_, partition.consolidated)
+        row = cursor.execute(
+            f"SELECT MAX(id), COUNT(*) FROM {tablename} {_where(partition, 'thread_id = ?')}",  # noqa: S608
+            _params(partition, thread_id),
+        ).fetchone()
+    return row[0], row[1]
+
+
+def get_sources_for_messages(feature: FeatureKey, message_ids: list[int]) -> dict[int, list[MessageSource]]:
+    """Retrieve the document sources of messages, for rendering them when the messages are displayed.
+
+    Returns:
+        dict of message id to its sources, highest score first. Messages without sources aren't included.
+    """
+    result: dict[int, list[MessageSource]] = {}
+    if not message_ids:
+        return result
+    tablename = f"{get_history_table_name(feature.type_)}_sources"
+    partition = _get_usage_partition(feature)
+    write_behind.flush(partition.file)  # read your writes
+    placeholders = ", ".join("?" * len(message_ids))
+    with closing(sqlite3.connect(partition.file)) as connection, closing(connection.cursor()) as cursor:
+        _create_message_table(cursor, feature.type_, partition.consolidated)
+        rows = cursor.execute(
+            f"SELECT message_id, node_id, space_id, uri, page, score, name, source_type FROM {tablename} {_where(partition, f'message_id IN ({placeholders})')} ORDER BY message_id, score DESC",  # noqa: S608
+            _params(partition, *message_ids),
+        ).fetchall()
+    for row in rows:
+        result.setdefault(row[0], []).append(MessageSource(*row[1:]))
+    return result
+
+
 def list_thread_history(feature: FeatureKey, id_: Optional[int] = None) -> list[tuple[int, str, int, int]]:
     """List threads or a thread if id_ is provided."""
     tablename = get_history_thread_table_name(feature.type_)
     rows = None
+    partition = _get_usage_partition(feature)
     with closing(
-        sqlite3.connect(get_sqlite_usage_file(feature.id_), detect_types=sqlite3.PARSE_DECLTYPES)
+        sqlite3.connect(partition.file, detect_types=sqlite3.PARSE_DECLTYPES)
     ) as connection, closing(connection.cursor()) as cursor:
-        cursor.execute(
-            SQL_CREATE_THREAD_TABLE.format(
-                table=tablename,
-            )
-        )
+        _create_thread_table(cursor, feature.type_, partition.consolidated)
 
         connection.execute(f"ATTACH DATABASE '{get_sqlite_shared_system_file()}' AS db2")
+        # the thread's first space. Served by the thread_spaces primary key.
+        space_id_sql = "(SELECT MIN(s.space_id) FROM db2.thread_spaces AS s WHERE s.feature_type = ? AND s.owner_id = ? AND s.thread_id = t.id)"
+        owner_params = (feature.type_.name, str(feature.id_))
         if id_:
             rows = cursor.execute(
-                f"SELECT t.id, t.topic, t.created_at, s.id as space_id FROM {tablename} as t LEFT JOIN db2.spaces AS s ON s.name LIKE 'Thread-' || t.id || ' %' WHERE t.id = ?",
-                (id_,),
+                f"SELECT t.id, t.topic, t.created_at, {space_id_sql} FROM {tablename} as t {_where(partition, 't.id = ?', alias='t.')}",
+                (*owner_params, *_params(partition, id_)),
             ).fetchall()  # noqa: S608
         else:
             rows = cursor.execute(
-                f"SELECT t.id, t.topic, t.created_at, s.id as space_id FROM {tablename} as t LEFT JOIN db2.spaces as s ON s.name LIKE 'Thread-' || t.id || ' %' ORDER BY t.created_at DESC",
+                f"SELECT t.id, t.topic, t.created_at, {space_id_sql} FROM {tablename} as t {_where(partition, alias='t.')} ORDER BY t.created_at DESC",
+                (*owner_params, *_params(partition)),
             ).fetchall()  # noqa: S608
 
     return rows
 
 
+def _fts_query(text: str) -> Optional[str]:
+    """Turn search input into an FTS5 query. Terms are quoted so input can't inject query syntax.
+
+    All terms must match and the last is a prefix so results update as the user types.
+    """
+    terms = re.findall(r"\w+", text)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"' for term in terms) + "*"
+
+
+def search_threads(feature: FeatureKey, text: str, limit: int = 20) -> list[tuple[int, str, int, str, float]]:
+    """Full text search the messages in a user's threads.
+
+    Args:
+        feature: The feature key. feature.id_ is the user_id.
+        text: The search input.
+        limit: The maximum number of threads to return.
+
+    Returns:
+        list of tuples of (thread_id:int, topic:str, message_id:int, snippet:str, rank:float) best match first. One per
+        thread, for its best matching message. Matched terms in the snippet are wrapped in `<b></b>`.
+    """
+    query = _fts_query(text)
+    if query is None:
+        return []
+    tablename = get_history_table_name(feature.type_)
+    thread_tablename = get_history_thread_table_name(feature.type_)
+    partition = _get_usage_partition(feature)
+    write_behind.flush(partition.file)  # read your writes
+    rowid = "row_id" if partition.consolidated else "id"
+    thread_join = (
+        "t.scope = m.scope AND t.owner_id = m.owner_id AND t.id = m.thread_id"
+        if partition.consolidated
+        else "t.id = m.thread_id"
+    )
+    with closing(
+        sqlite3.connect(partition.file, detect_types=sqlite3.PARSE_DECLTYPES)
+    ) as connection, closing(connection.cursor()) as cursor:
+        _create_message_table(cursor, feature.type_, partition.consolidated)
+        # threads with many matching messages take several rows, so over fetch and keep the best hit per thread.
+        rows = cursor.execute(
+            f"SELECT m.thread_id, t.topic, m.id, snippet({tablename}_fts, 0, '<b>', '</b>', '…', ?), bm25({tablename}_fts) AS rank FROM {tablename}_fts JOIN {tablename} AS m ON m.{rowid} = {tablename}_fts.rowid LEFT JOIN {thread_tablename} AS t ON {thread_join} {_where(partition, f'{tablename}_fts MATCH ?', alias='m.')} ORDER BY rank LIMIT ?",  # noqa: S608
+            (SEARCH_SNIPPET_TOKENS, *_params(partition, query), limit * 5),
+        ).fetchall()
+
+    results: dict[int, tuple[int, str, int, str, float]] = {}
+    for row in rows:
+        if row[0] not in results:
+            results[row[0]] = row
+    return list(results.values())[:limit]
+
+
 def get_thread_topic(feature: FeatureKey, thread_id: int) -> str | None:
     """Retrieve the topic of a thread."""
     tablename = get_history_thread_table_name(feature.type_)
     row = None
+    partition = _get_usage_partition(feature)
     with closing(
-        sqlite3.connect(get_sqlite_usage_file(feature.id_), detect_types=sqlite3.PARSE_DECLTYPES)
+        sqlite3.connect(partition.file, detect_types=sqlite3.PARSE_DECLTYPES)
     ) as connection, closing(connection.cursor()) as cursor:
-        cursor.execute(
-            SQL_CREATE_THREAD_TABLE.format(
-                table=tablename,
-            )
-        )
-        row = cursor.execute(f"SELECT topic FROM {tablename} WHERE id = ?", (thread_id,)).fetchone()  # noqa: S608
+        _create_thread_table(cursor, feature.type_, partition.consolidated)
+        row = cursor.execute(
+            f"SELECT topic FROM {tablename} {_where(partition, 'id = ?')}", _params(partition, thread_id)  # noqa: S608
+        ).fetchone()
 
     return row[0] if row else None  # f"New thread {thread_id}"
 
@@ -172,15 +594,15 @@ def get_thread_topic(feature: FeatureKey, thread_id: int) -> str | None:
 def update_thread_topic(topic: str, feature: FeatureKey, thread_id: int) -> None:
     """Update the topic of a thread."""
     tablename = get_history_thread_table_name(feature.type_)
+    partition = _get_usage_partition(feature)
     with closing(
-        sqlite3.connect(get_sqlite_usage_file(feature.id_), detect_types=sqlite3.PARSE_DECLTYPES)
+        sqlite3.connect(partition.file, detect_types=sqlite3.PARSE_DECLTYPES)
     ) as connection, closing(connection.cursor()) as cursor:
+        _create_thread_table(cursor, feature.type_, partition.consolidated)
         cursor.execute(
-            SQL_CREATE_THREAD_TABLE.format(
-                table=tablename,
-            )
+            f"UPDATE {tablename} SET topic = ? {_where(partition, 'id = ?')}",  # noqa: S608
+            (topic, *_params(partition, thread_id)),
         )
-        cursor.execute(f"UPDATE {tablename} SET topic = ? WHERE id = ?", (topic, thread_id))  # noqa: S608
         connection.commit()
 
 
@@ -202,36 +624,163 @@ def _retrieve_last_n_history(feature: FeatureKey, thread_id: int) -> str:
     )
 
 
+def _strip_sources(message: str) -> str:
+    """Remove the sources block appended to answers saved before sources were stored in their own table."""
+    return SOURCES_BLOCK_PATTERN.sub("", message)
+
+
+def _to_chat_messages(rows: list[tuple[int, str, bool]]) -> list[ChatMessage]:
+    """Convert (id, message, human) rows to ChatMessage objects for the LLM, without sources."""
+    return [
+        ChatMessage(role=(MessageRole.USER if x[2] else MessageRole.ASSISTANT), content=_strip_sources(x[1]))
+        for x in rows
+    ]
+
+
+def _get_thread_summary(
+    cursor: sqlite3.Cursor, partition: UsagePartition, feature: FeatureKey, thread_id: int
+) -> tuple[Optional[str], int] | None:
+    """The (summary, summary_message_id) of a thread. summary_message_id is the last message folded in, 0 for none."""
+    row = cursor.execute(
+        f"SELECT summary, COALESCE(summary_message_id, 0) FROM {get_history_thread_table_name(feature.type_)} {_where(partition, 'id = ?')}",  # noqa: S608
+        _params(partition, thread_id),
+    ).fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def _retrieve_summary_memory(feature: FeatureKey, thread_id: int) -> tuple[Optional[str], list[tuple[int, str, bool]]]:
+    """The thread summary and the messages after it, up to NUMBER_OF_MESSAGES_IN_HISTORY, oldest first.
+
+    Normally that's the last SUMMARY_MEMORY_TURNS turns, plus the latest turn while its summary update is running.
+    """
+    tablename = get_history_table_name(feature.type_)
+    partition = _get_usage_partition(feature)
+    write_behind.flush(partition.file)  # read your writes
+    with closing(
+        sqlite3.connect(partition.file, detect_types=sqlite3.PARSE_DECLTYPES)
+    ) as connection, closing(connection.cursor()) as cursor:
+        _create_message_table(cursor, feature.type_, partition.consolidated)
+        summary, summary_message_id = _get_thread_summary(cursor, partition, feature, thread_id) or (None, 0)
+        rows = cursor.execute(
+            f"SELECT id, message, human FROM {tablename} {_where(partition, 'thread_id = ?', 'id > ?')} ORDER BY id DESC LIMIT ?",  # noqa: S608
+            _params(partition, thread_id, summary_message_id, NUMBER_OF_MESSAGES_IN_HISTORY),
+        ).fetchall()
+    rows.reverse()
+    return summary, rows
+
+
 def get_history_as_chat_messages(
     feature: FeatureKey, thread_id: int, size: Optional[int] = NUMBER_OF_MESSAGES_IN_HISTORY
 ) -> list[ChatMessage]:
-    """Retrieve the history of as LlamaIndex ChatMessage objects."""
+    """Retrieve the history of as LlamaIndex ChatMessage objects.
+
+    In summary memory mode this is the thread summary, as a system message, followed by the recent turns. Otherwise
+    it's the last NUMBER_OF_MESSAGES_IN_HISTORY messages. Document sources are never included.
+    """
+    if get_history_memory_mode() == HistoryMemoryMode.SUMMARY:
+        summary, rows = _retrieve_summary_memory(feature, thread_id)
+        history_chat_message = _to_chat_messages(rows)
+        if summary:
+            history_chat_message.insert(
+                0, ChatMessage(role=MessageRole.SYSTEM, content=f"Summary of the conversation so far:\n{summary}")
+            )
+        return history_chat_message
+
     result = _retrieve_messages(datetime.now(), NUMBER_OF_MESSAGES_IN_HISTORY, feature, thread_id)
     # id, message, human, timestamp, thread_id
-    history_chat_message = [
-        ChatMessage(role=(MessageRole.USER if x[2] else MessageRole.ASSISTANT), content=x[1]) for x in result
-    ]
+    return _to_chat_messages([x[:3] for x in result])
 
-    return history_chat_message
+
+def update_thread_summary(
+    feature: FeatureKey, thread_id: int, model_settings_collection: LlmUsageSettingsCollection
+) -> bool:
+    """Fold the messages before the last SUMMARY_MEMORY_TURNS turns into the thread summary.
+
+    Messages are folded in batches of NUMBER_OF_MESSAGES_IN_HISTORY so a long thread summarised for the first time
+    doesn't make one huge LLM call. Each batch is saved only if the summary hasn't moved on in the meantime, e.g. by
+    another process.
+
+    Returns:
+        bool: True if the summary was updated.
+    """
+    thread_tablename = get_history_thread_table_name(feature.type_)
+    tablename = get_history_table_name(feature.type_)
+    partition = _get_usage_partition(feature)
+    write_behind.flush(partition.file)
+    updated = False
+    with closing(
+        sqlite3.connect(partition.file, detect_types=sqlite3.PARSE_DECLTYPES)
+    ) as connection, closing(connection.cursor()) as cursor:
+        _create_message_table(cursor, feature.type_, partition.consolidated)
+        memory = _get_thread_summary(cursor, partition, feature, thread_id)
+        if memory is None:
+            return False
+        summary, summary_message_id = memory
+        rows = cursor.execute(
+            f"SELECT id, message, human FROM {tablename} {_where(partition, 'thread_id = ?', 'id > ?')} ORDER BY id",  # noqa: S608
+            _params(partition, thread_id, summary_message_id),
+        ).fetchall()
+        to_fold = rows[: max(len(rows) - SUMMARY_MEMORY_TURNS * 2, 0)]
+        for i in range(0, len(to_fold), NUMBER_OF_MESSAGES_IN_HISTORY):
+            batch = to_fold[i : i + NUMBER_OF_MESSAGES_IN_HISTORY]
+            new_summary = summarise_chat_history(summary, _to_chat_messages(batch), model_settings_collection)
+            cursor.execute(
+                f"UPDATE {thread_tablename} SET summary = ?, summary_message_id = ? {_where(partition, 'id = ?', 'COALESCE(summary_message_id, 0) = ?')}",  # noqa: S608
+                (new_summary, batch[-1][0], *_params(partition, thread_id, summary_message_id)),
+            )
+            connection.commit()
+            if cursor.rowcount != 1:
+                break
+            summary, summary_message_id = new_summary, batch[-1][0]
+            updated = True
+    return updated
+
+
+def _schedule_thread_summary_update(
+    feature: FeatureKey, thread_id: int, model_settings_collection: LlmUsageSettingsCollection
+) -> None:
+    """Update the thread summary in the background, unless an update for the thread is already queued."""
+    partition = _get_usage_partition(feature)
+    key = (partition.file, get_history_thread_table_name(feature.type_), partition.scope, partition.owner_id, thread_id)
+    with _summary_updates_pending_lock:
+        if key in _summary_updates_pending:
+            return
+        _summary_updates_pending.add(key)
+
+    def _run() -> None:
+        with _summary_updates_pending_lock:
+            _summary_updates_pending.discard(key)
+        try:
+            update_thread_summary(feature, thread_id, model_settings_collection)
+        except Exception as e:
+            log.error("Failed to update the summary of thread %s: %s", thread_id, e)
+
+    _summary_executor.submit(copy_context().run, _run)
 
 
 def create_history_thread(topic: str, feature: FeatureKey) -> int | None:
     """Create a new thread for the history i.e a new chat session."""
     tablename = get_history_thread_table_name(feature.type_)
+    partition = _get_usage_partition(feature)
     with closing(
-        sqlite3.connect(get_sqlite_usage_file(feature.id_), detect_types=sqlite3.PARSE_DECLTYPES)
+        sqlite3.connect(partition.file, detect_types=sqlite3.PARSE_DECLTYPES)
     ) as connection, closing(connection.cursor()) as cursor:
-        cursor.execute(
-            SQL_CREATE_THREAD_TABLE.format(
-                table=tablename,
-            )
-        )
-
-        cursor.execute(f"INSERT INTO {tablename} (topic) VALUES (?)", (topic,))  # noqa: S608
+        _create_thread_table(cursor, feature.type_, partition.consolidated)
 
-        id_ = cursor.lastrowid
+        if partition.consolidated:
+            cursor.execute(
+                f"INSERT INTO {tablename} (scope, owner_id, id, topic) VALUES (?, ?, {_next_id_sql(tablename)}, ?)",  # noqa: S608
+                (*_params(partition), *_params(partition), topic),
+            )
+            id_ = _read_back_id(cursor, tablename)
+        else:
+            cursor.execute(f"INSERT INTO {tablename} (topic) VALUES (?)", (topic,))  # noqa: S608
+            id_ = cursor.lastrowid
         connection.commit()
 
+    if feature.type_ == OrganisationFeatureType.ASK_PUBLIC:
+        public_sessions.record_activity(str(feature.id_))
+
     return id_
 
 def delete_thread(thread_id: int, feature: FeatureKey) -> bool:
@@ -241,19 +790,28 @@ def delete_thread(thread_id: int, feature: FeatureKey) -> bool:
     """
     thread_tablename = get_history_thread_table_name(feature.type_)
     message_tablename = get_history_table_name(feature.type_)
-    usage_file = (
-        get_sqlite_usage_file(feature.id_)
-        if feature.type_ != OrganisationFeatureType.ASK_PUBLIC
-        else get_public_sqlite_usage_file(str(feature.id_))
-    )
+    partition = _get_usage_partition(feature)
+    write_behind.flush(partition.file)  # so queued messages for the thread aren't written after it's deleted
     is_deleted = False
-    with closing(sqlite3.connect(usage_file, detect_types=sqlite3.PARSE_DECLTYPES)) as connection, closing(
+    with closing(sqlite3.connect(partition.file, detect_types=sqlite3.PARSE_DECLTYPES)) as connection, closing(
         connection.cursor()
     ) as cursor:
         cursor.execute("PRAGMA foreign_keys = ON;")
         try:
-            cursor.execute(f"DELETE FROM {message_tablename} WHERE thread_id = ?", (thread_id,))  # noqa: S608
-            cursor.execute(f"DELETE FROM {thread_tablename} WHERE id = ?", (thread_id,))  # noqa: S608
+            _create_message_table(cursor, feature.type_, partition.consolidated)
+            thread_message_ids = f"SELECT id FROM {message_tablename} {_where(partition, 'thread_id = ?')}"  # noqa: S608
+            cursor.execute(
+                f"DELETE FROM {message_tablename}_sources {_where(partition, f'message_id IN ({thread_message_ids})')}",  # noqa: S608
+                (*_params(partition), *_params(partition, thread_id)),
+            )
+            cursor.execute(
+                f"DELETE FROM {message_tablename} {_where(partition, 'thread_id = ?')}",  # noqa: S608
+                _params(partition, thread_id),
+            )
+            cursor.execute(
+                f"DELETE FROM {thread_tablename} {_where(partition, 'id = ?')}",  # noqa: S608
+                _params(partition, thread_id),
+            )
             connection.commit()
             is_deleted = True
         except sqlite3.Error as e:
@@ -273,16 +831,14 @@ def get_latest_thread(feature: FeatureKey) -> tuple[int, str, int] | None:
     """
     tablename = get_history_thread_table_name(feature.type_)
     rows = None
+    partition = _get_usage_partition(feature)
     with closing(
-        sqlite3.connect(get_sqlite_usage_file(feature.id_), detect_types=sqlite3.PARSE_DECLTYPES)
+        sqlite3.connect(partition.file, detect_types=sqlite3.PARSE_DECLTYPES)
     ) as connection, closing(connection.cursor()) as cursor:
-        cursor.execute(
-            SQL_CREATE_THREAD_TABLE.format(
-                table=tablename,
-            )
-        )
+        _create_thread_table(cursor, feature.type_, partition.consolidated)
         rows = cursor.execute(
-            f"SELECT id, topic, created_at FROM {tablename} ORDER BY created_at DESC LIMIT 1"  # noqa: S608
+            f"SELECT id, topic, created_at FROM {tablename} {_where(partition)} ORDER BY created_at DESC LIMIT 1",  # noqa: S608
+            _params(partition),
         ).fetchall()
         rows.reverse()
 
@@ -293,11 +849,14 @@ def thread_exists(thread_id: int, user_id: int, feature_type: OrganisationFeatur
     """Check if a thread exists."""
     thread_exists = False
     tablename = get_history_thread_table_name(feature_type)
+    partition = _get_usage_partition(FeatureKey(feature_type, user_id))
     try:
         with closing(
-            sqlite3.connect(get_sqlite_usage_file(user_id), detect_types=sqlite3.PARSE_DECLTYPES)
+            sqlite3.connect(partition.file, detect_types=sqlite3.PARSE_DECLTYPES)
         ) as connection, closing(connection.cursor()) as cursor:
-            row = cursor.execute(f"SELECT id FROM {tablename} WHERE id = ?", (thread_id,)).fetchone()  # noqa: S608
+            row = cursor.execute(
+                f"SELECT id FROM {tablename} {_where(partition, 'id = ?')}", _params(partition, thread_id)  # noqa: S608
+            ).fetchone()
             thread_exists = row is not None
     except Exception:
         thread_exists = False
@@ -340,20 +899,102 @@ def query(
         response = query_error(e, model_settings_collection)
 
     log.debug("thread_id: %s", thread_id)
-    data.append(
-        (
-            MESSAGE_TEMPLATE.format(message=response.response)
-            if is_chat
-            else MESSAGE_WITH_SOURCES_TEMPLATE.format(
-                message=response, source=format_document_sources(response.source_nodes)
-            ),
-            False,
-            datetime.now(),
-            thread_id,
-        )
+    data.append((MESSAGE_TEMPLATE.format(message=response.response), False, datetime.now(), thread_id))
+    sources = None if is_chat else [None, get_message_sources(getattr(response, "source_nodes", None) or [])]
+
+    saved = _save_messages(data, feature, sources)
+    if get_history_memory_mode() == HistoryMemoryMode.SUMMARY:
+        _schedule_thread_summary_update(feature, thread_id, model_settings_collection)
+    return saved
+
+
+def run_queries(
+    inputs: list[str],
+    feature: FeatureKey,
+    model_settings_collection: LlmUsageSettingsCollection,
+    assistant: Assistant,
+    spaces: list[SpaceKey],
+    thread_id: Optional[int] = None,
+    save_history: bool = False,
+    max_concurrency: int = BATCH_MAX_CONCURRENCY,
+) -> Iterator[BatchQueryResult]:
+    """Answer a batch of questions against the same spaces, e.g. an evaluation set.
+
+    The spaces' indices and retrievers are loaded once for the batch. Unlike `query()` a failed question doesn't fail
+    the batch, its result has the error instead.
+
+    Args:
+        inputs (list[str]): the questions.
+        feature (FeatureKey): the feature key. feature.id_ needs to be the user_id.
+        model_settings_collection (LlmUsageSettingsCollection): the model settings.
+        assistant (Assistant): the assistant to answer with.
+        spaces (list[SpaceKey]): the spaces to answer from.
+        thread_id (Optional[int]): a thread whose history is given to every question. Required to save history.
+        save_history (bool): save each question and answer to the thread. Off by default so evaluation runs don't
+            fill up thread history.
+        max_concurrency (int): the maximum number of answers generated at the same time.
+
+    Returns:
+        Iterator[BatchQueryResult]: a result per question in the order the answers complete.
+
+    Raises:
+        ValueError: if there are no questions or spaces, or save_history is set without a thread_id.
+    """
+    if not inputs:
+        raise ValueError("At least one input is required")
+    if not spaces:
+        raise ValueError("At least one space is required")
+    if save_history and thread_id is None:
+        raise ValueError("thread_id is required to save history")
+
+    history_messages = (
+        get_history_as_chat_messages(feature=feature, thread_id=thread_id) if thread_id is not None else []
     )
+    return _run_queries(
+        inputs,
+        feature,
+        model_settings_collection,
+        assistant,
+        spaces,
+        thread_id if save_history else None,
+        max_concurrency,
+        history_messages,
+    )
+
+
+def _run_queries(
+    inputs: list[str],
+    feature: FeatureKey,
+    model_settings_collection: LlmUsageSettingsCollection,
+    assistant: Assistant,
+    spaces: list[SpaceKey],
+    save_to_thread_id: Optional[int],
+    max_concurrency: int,
+    history_messages: list[ChatMessage],
+) -> Iterator[BatchQueryResult]:
+    log.debug("Batch query of %s inputs for feature: '%s' with spaces: '%s'", len(inputs), feature, spaces)
+    for index, response in run_ask_batch(
+        inputs, history_messages, model_settings_collection, assistant, spaces, max_concurrency
+    ):
+        if isinstance(response, Exception):
+            log.warning("Batch query input %s failed: %s", index, response)
+            yield BatchQueryResult(index=index, input_=inputs[index], error=str(response))
+            continue
+
+        sources = get_message_sources(getattr(response, "source_nodes", None) or [])
+        if save_to_thread_id is not None:
+            _save_messages(
+                [
+                    (inputs[index], True, datetime.now(), save_to_thread_id),
+                    (MESSAGE_TEMPLATE.format(message=response.response), False, datetime.now(), save_to_thread_id),
+                ],
+                feature,
+                [None, sources],
+            )
+        yield BatchQueryResult(index=index, input_=inputs[index], response=str(response.response), sources=sources)
 
-    return _save_messages(data, feature)
+    if save_to_thread_id is not None and get_history_memory_mode() == HistoryMemoryMode.SUMMARY:
+        _schedule_thread_summary_update(feature, save_to_thread_id, model_settings_collection)
 
 
 def history(
@@ -361,3 +1002,17 @@ def history(
 ) -> list[tuple[int, str, bool, datetime, int]]:
     """Retrieve the history of messages up to certain size and cutoff."""
     return _retrieve_messages(cutoff, size, feature, thread_id)
+
+
+def history_page(
+    feature: FeatureKey,
+    thread_id: int,
+    size: int,
+    cursor: Optional[int] = None,
+    sort_order: Literal["ASC", "DESC"] = "DESC",
+) -> tuple[list[tuple[int, str, bool, datetime, int]], Optional[int]]:
+    """Retrieve a page of the history of messages. Pass the returned cursor to get the next page.
+
+    See `_retrieve_messages_page` for details.
+    """
+    return _retrieve_messages_page(feature, thread_id, size, cursor, sort_order)
@@ -3,6 +3,7 @@
 import json
 import logging as log
 import os
+import threading
 from typing import Any, Optional, Union
 
 from google.auth.external_account_authorized_user import Credentials as ExtCredentials
@@ -10,6 +11,7 @@ from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseDownload
 
 CREDENTIALS_KEY = "DOCQ_GOOGLE_APPLICATION_CREDENTIALS"
@@ -33,6 +35,14 @@ AUTH_WRONG_EMAIL = "auth_wrong_email"
 AUTH_URL = "auth_url"
 AUTH_ERROR = "auth_error"
 
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+FILE_FIELDS = "id, name, parents, mimeType, modifiedTime, webViewLink, webContentLink, size, fullFileExtension, trashed"
+LIST_PAGE_SIZE = 1000
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024 * 8  # 8MB
+PARTIAL_DOWNLOAD_SUFFIX = ".part"
+PARTIAL_VERSION_SUFFIX = ".part.version"  # the version of the file a partial download is of
+
 CREDENTIALS = Union[Credentials,  ExtCredentials]
 CREDENTIAL_FILE_EXISTS = GOOGLE_APPLICATION_CREDS_PATH is not None and os.path.isfile(GOOGLE_APPLICATION_CREDS_PATH)
 
@@ -115,6 +125,48 @@ def list_folders(creds: dict) -> list[dict]:
     return folders.get('files', [])
 
 
+def list_folder_children(service: Any, folder_id: str) -> list[dict]:
+    """List all files and folders directly inside a folder, following pagination."""
+    children: list[dict] = []
+    page_token = None
+    while True:
+        response = service.files().list(
+            q=f"'{folder_id}' in parents and trashed=false",
+            fields=f"nextPageToken, files({FILE_FIELDS})",
+            pageSize=LIST_PAGE_SIZE,
+            pageToken=page_token,
+        ).execute()
+        children.extend(response.get("files", []))
+        page_token = response.get("nextPageToken")
+        if page_token is None:
+            return children
+
+
+def get_start_page_token(service: Any) -> str:
+    """Get the changes API page token for the current state of the drive."""
+    return service.changes().getStartPageToken().execute()["startPageToken"]
+
+
+def list_changes(service: Any, page_token: str) -> tuple[list[dict], str]:
+    """List changes to the drive since `page_token`, following pagination.
+
+    Returns:
+        (changes, new start page token). Save the token to list changes from this point next time.
+    """
+    changes: list[dict] = []
+    while True:
+        response = service.changes().list(
+            pageToken=page_token,
+            includeRemoved=True,
+            pageSize=LIST_PAGE_SIZE,
+            fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}))",
+        ).execute()
+        changes.extend(response.get("changes", []))
+        if "newStartPageToken" in response:
+            return changes, response["newStartPageToken"]
+        page_token = response["nextPageToken"]
+
+
 def get_drive_service(creds: dict | str) -> Any:
     """Get drive service."""
     _cred_dict = {}
@@ -123,24 +175,118 @@ def get_drive_service(creds: dict | str) -> Any:
     return build('drive', 'v3', credentials=_creds)
 
 
+_thread_local = threading.local()
+
+
+def get_thread_drive_service(creds: dict | str) -> Any:
+    """Get a drive service owned by the calling thread.
+
+    The `httplib2.Http` transport behind a drive service isn't thread-safe so each download worker thread needs its own.
+    """
+    key = creds if isinstance(creds, str) else json.dumps(creds, sort_keys=True)
+    services_ = getattr(_thread_local, "services", None)
+    if services_ is None:
+        services_ = _thread_local.services = {}
+    if key not in services_:
+        services_[key] = get_drive_service(creds)
+    return services_[key]
+
+
 def _export_gdrive_docs(service: Any, file_id: str) -> Any:
     """Export google docs."""
     return service.files().export(fileId=file_id, mimeType="application/pdf")
 
 
-def download_file(service: Any, file_id: str, file_name: str, mime: str) -> bool:
-    """Download file."""
+def _partial_offset(file_name: str, version: Optional[str]) -> int:
+    """Bytes already downloaded to the partial file of `file_name` if it's of `version`. Else it's removed and 0."""
+    part_file_name = f"{file_name}{PARTIAL_DOWNLOAD_SUFFIX}"
+    version_file_name = f"{file_name}{PARTIAL_VERSION_SUFFIX}"
+    if not os.path.exists(part_file_name):
+        return 0
+    partial_version = None
+    if os.path.exists(version_file_name):
+        with open(version_file_name, encoding="utf-8") as f:
+            partial_version = f.read()
+    if version is None or partial_version != version:
+        log.debug("Download - %s: partial download is of another version, starting over", file_name)
+        os.remove(part_file_name)
+        return 0
+    return os.path.getsize(part_file_name)
+
+
+def _content_range_total(resp: Any) -> Optional[int]:
+    """The total size from a `Content-Range: bytes <range>/<total>` response header. None if not given."""
+    total = resp.get("content-range", "*/*").split("/")[-1]
+    return int(total) if total.isdigit() else None
+
+
+def _download_media(request: Any, fh: Any, offset: int, size: Optional[int], chunk_size: int, file_name: str) -> None:
+    """Download the media of `request` from `offset` to the end, a `Range` request per chunk, appending to `fh`."""
+    while True:
+        headers = {**request.headers, "range": f"bytes={offset}-{offset + chunk_size - 1}"}
+        resp, content = request.http.request(request.uri, method="GET", headers=headers)
+        if resp.status == 416:
+            # nothing after `offset`. Done if that's because the partial file is already complete.
+            if offset and offset == (size if size is not None else _content_range_total(resp)):
+                return
+            raise HttpError(resp, content, uri=request.uri)
+        if resp.status not in (200, 206):
+            raise HttpError(resp, content, uri=request.uri)
+        if resp.status == 200 and offset:
+            log.debug("Download - %s: Range ignored, starting over", file_name)
+            fh.seek(0)
+            fh.truncate()
+            offset = 0
+        fh.write(content)
+        offset += len(content)
+        total = _content_range_total(resp)
+        log.debug("Download - %s: %s of %s bytes", file_name, offset, total)
+        if resp.status == 200 or not content or total is None or offset >= total:
+            return
+
+
+def download_file(
+    service: Any,
+    file_id: str,
+    file_name: str,
+    mime: str,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    resume: bool = True,
+    version: Optional[str] = None,
+    size: Optional[int] = None,
+) -> bool:
+    """Download file, streaming it to disk in chunks.
+
+    Content is written to `<file_name>.part` and only moved to `file_name` once complete. When `resume` is set and a
+    partial file of the same `version`, e.g. the file's `modifiedTime`, is left over from an interrupted download,
+    binary files continue from where it stopped with a `Range` request. A partial file of another version is
+    discarded. Google Workspace documents are exported to PDF which can't be resumed so they always start over.
+    """
     try:
         if "google-apps" in mime:
-            request = _export_gdrive_docs(service, file_id)
-            file_name = f"{file_name}.pdf"
-        else:
-            request = service.files().get_media(fileId=file_id)
-        with open(file_name, "wb") as fh:
-            downloader, done = MediaIoBaseDownload(fh, request), False
-            while done is False:
-                status, done = downloader.next_chunk()
-                log.debug("Download - %s", f"{file_name}: {str(status.progress() * 100)}%")
+            part_file_name = f"{file_name}.pdf{PARTIAL_DOWNLOAD_SUFFIX}"
+            with open(part_file_name, "wb") as fh:
+                downloader = MediaIoBaseDownload(fh, _export_gdrive_docs(service, file_id), chunksize=chunk_size)
+                done = False
+                while done is False:
+                    status, done = downloader.next_chunk()
+                    log.debug("Download - %s", f"{file_name}: {str(status.progress() * 100)}%")
+            os.replace(part_file_name, f"{file_name}.pdf")
+            return True
+
+        part_file_name = f"{file_name}{PARTIAL_DOWNLOAD_SUFFIX}"
+        version_file_name = f"{file_name}{PARTIAL_VERSION_SUFFIX}"
+        offset = _partial_offset(file_name, version) if resume else 0
+        if offset:
+            log.debug("Download - %s: resuming from byte %s", file_name, offset)
+        elif version is not None:
+            with open(version_file_name, "w", encoding="utf-8") as f:
+                f.write(version)
+        with open(part_file_name, "ab" if offset else "wb") as fh:
+            _download_media(service.files().get_media(fileId=file_id), fh, offset, size, chunk_size, file_name)
+        os.replace(part_file_name, file_name)
+        if os.path.exists(version_file_name):
+            os.remove(version_file_name)
         return True
     except Exception as e:
         log.error("Failed to download file: %s", e)
@@ -4,12 +4,17 @@ import os
 from datetime import datetime, timedelta
 from typing import Optional
 
+import requests
 from microsoftgraph.client import Client
 
 DOCQ_MS_ONEDRIVE_CLIENT_ID_KEY = "DOCQ_MS_ONEDRIVE_CLIENT_ID"
 DOCQ_MS_ONEDRIVE_CLIENT_SEC_RET_KEY = "DOCQ_MS_ONEDRIVE_CLIENT_SECRET"
 DOCQ_MS_ONEDRIVE_REDIRECT_URI_KEY = "DOCQ_MS_ONEDRIVE_REDIRECT_URI"
 
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024 * 8  # 8MB
+DOWNLOAD_TIMEOUT_SEC = 60
+PARTIAL_DOWNLOAD_SUFFIX = ".part"
+
 SCOPES = [
     "offline_access",
     "User.Read",
@@ -99,14 +104,53 @@ def list_folders(token: dict) -> list[dict]:
         return []
 
 
-def download_file(client: Client, file_id: str, file_path: str) -> None:
-    """Download a file from Microsoft OneDrive."""
+def download_file(
+    client: Client,
+    file_id: str,
+    file_path: str,
+    download_url: Optional[str] = None,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    resume: bool = True,
+    etag: Optional[str] = None,
+) -> bool:
+    """Download a file from Microsoft OneDrive.
+
+    When the item's pre-authenticated `@microsoft.graph.downloadUrl` is given the content is streamed to
+    `<file_path>.part` in chunks and moved to `file_path` once complete. A partial download left over is resumed with
+    `If-Range: <etag>`, so if the file has changed since the whole new version is sent and written over it. Without an
+    `etag` the download starts over. Otherwise the whole file is fetched through the Graph client.
+    """
     try:
-        with open(file_path, "wb") as file:
-            data = client.files.drive_download_contents(file_id).data
-            file.write(data)
+        if download_url is None:
+            with open(file_path, "wb") as file:
+                data = client.files.drive_download_contents(file_id).data
+                file.write(data)
+            return True
+
+        part_file_path = f"{file_path}{PARTIAL_DOWNLOAD_SUFFIX}"
+        offset = os.path.getsize(part_file_path) if resume and etag and os.path.exists(part_file_path) else 0
+        headers = {"Range": f"bytes={offset}-", "If-Range": etag} if offset else {}
+        with requests.get(download_url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT_SEC) as response:
+            # nothing after `offset` because the partial file is already complete.
+            if (
+                offset
+                and response.status_code == requests.codes.requested_range_not_satisfiable
+                and response.headers.get("Content-Range", "").endswith(f"/{offset}")
+            ):
+                os.replace(part_file_path, file_path)
+                return True
+            response.raise_for_status()
+            if offset and response.status_code != requests.codes.partial_content:
+                log.debug("services.ms_onedrive -- download_file -- file changed or Range ignored, restarting: %s", file_id)
+                offset = 0
+            with open(part_file_path, "ab" if offset else "wb") as file:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    file.write(chunk)
+        os.replace(part_file_path, file_path)
+        return True
     except Exception as e:
         log.error("services.ms_onedrive -- download_file -- Error: %s", e)
+        return False
 
 
 def api_enabled() -> bool:
@@ -18,7 +18,7 @@ from . import (
     services,
 )
 from .config import ENV_VAR_DOCQ_LOGLEVEL
-from .support import auth_utils, llm, store
+from .support import auth_utils, llm, public_sessions, write_behind
 
 tracer = trace.get_tracer(__name__, docq.__version_str__)
 
@@ -48,7 +48,8 @@ def init() -> None:
         services._init()
         integrations._init()
         services.credential_utils.setup_all_service_credentials()
-        store._init()
+        public_sessions._init()
+        write_behind._init()
         manage_organisations._init_default_org_if_necessary()
         manage_users._init_admin_if_necessary()
         auth_utils.init_session_cache()
@@ -1,4 +1,10 @@
-"""Cache user sessions."""
+"""Cache user sessions.
+
+Sessions are kept in the session store, see `session_store`, so they survive restarts and are shared by processes.
+Session data is encrypted with a key that's stable across processes: DOCQ_SESSION_ENCRYPTION_KEY if set, otherwise
+derived from DOCQ_COOKIE_HMAC_SECRET_KEY.
+"""
+import base64
 import hashlib
 import hmac
 import json
@@ -10,26 +16,35 @@ from typing import Dict, Optional
 
 import docq
 import streamlit as st
-from cachetools import TTLCache
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from opentelemetry import trace
 from streamlit.components.v1 import html
 
-from ..config import ENV_VAR_DOCQ_COOKIE_HMAC_SECRET_KEY, SESSION_COOKIE_NAME
+from ..config import ENV_VAR_DOCQ_COOKIE_HMAC_SECRET_KEY, ENV_VAR_DOCQ_SESSION_ENCRYPTION_KEY, SESSION_COOKIE_NAME
+from .session_store import Session, get_session_store
 
 tracer = trace.get_tracer(__name__, docq.__version_str__)
 
 TTL_HOURS = 1
 TTL_SEC = 60 * 60 * TTL_HOURS
-CACHE_CONFIG = (1024 * 1, TTL_SEC)
-AUTH_KEY = Fernet.generate_key()
 AUTH_SESSION_SECRET_KEY = os.environ.get(ENV_VAR_DOCQ_COOKIE_HMAC_SECRET_KEY)
 
-# Cache of session data keyed by hmac hash (hmac of session id)
-cached_session_data: TTLCache[str, bytes] = TTLCache(*CACHE_CONFIG)
 
-# Cache of session id's keyed by hmac hash (hmac of session id)
-cached_session_ids: TTLCache[str, str] = TTLCache(*CACHE_CONFIG)
+def _get_auth_key() -> bytes:
+    """The Fernet key for session data and cookie values. The same in every process so sessions can be shared."""
+    key = os.environ.get(ENV_VAR_DOCQ_SESSION_ENCRYPTION_KEY)
+    if key:
+        return key.encode()
+    if AUTH_SESSION_SECRET_KEY:
+        hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"docq auth session encryption")
+        return base64.urlsafe_b64encode(hkdf.derive(AUTH_SESSION_SECRET_KEY.encode()))
+    log.warning("No session encryption key configured. Sessions won't be readable by other processes or after a restart.")
+    return Fernet.generate_key()
+
+
+AUTH_KEY = _get_auth_key()
 
 
 # TODO: the code that handles the cookie should move to the web side. session state tracking is in the backend but not a public API as it's just cross cutting.
@@ -43,6 +58,7 @@ def init_session_cache() -> None:
     if len(AUTH_SESSION_SECRET_KEY) < 32:
         log.fatal("Failed to initialize session cache: DOCQ_COOKIE_HMAC_SECRET_KEY must be 32 or more characters")
         raise ValueError("DOCQ_COOKIE_HMAC_SECRET_KEY must be 32 or more characters")
+    get_session_store().init()
 
 
 def _set_cookie(cookie: str) -> None:
@@ -108,7 +124,7 @@ def generate_hmac_session_id(length: int = 32) -> str:
     """Generate a secure (HMAC) and unique session_id then track in session cache."""
     id_ = token_hex(length // 2)
     hmac_ = _create_hmac(id_)
-    cached_session_ids[hmac_] = id_
+    get_session_store().put(hmac_, Session(session_id=id_))
     log.debug("Generated new hmac session id: %s", hmac_)
     return hmac_
 
@@ -141,17 +157,16 @@ def verify_cookie_hmac_session_id() -> str | None:
     """
     hmac_session_id = None
     hmac_session_id = _get_cookie_session_id()
+    session = get_session_store().get(hmac_session_id) if hmac_session_id is not None else None
 
     if hmac_session_id is None:
         log.debug("verify_cookie_hmac_session_id(): No session id (auth token) cookie found.")
-    elif hmac_session_id not in cached_session_ids:
+    elif session is None:
         log.warning(
-            "verify_cookie_hmac_session_id(): item with key=hmac_session_id `cached_session_ids`. The auth session either expired or explicitly removed."
+            "verify_cookie_hmac_session_id(): hmac_session_id not found in the session store. The auth session either expired or explicitly removed."
         )
-        log.debug("cached session ids : %s", len(cached_session_ids.keys()))
-        log.debug("cached session data: %s", len(cached_session_data.keys()))
         hmac_session_id = None
-    elif not _verify_hmac(cached_session_ids[hmac_session_id], hmac_session_id):
+    elif not _verify_hmac(session.session_id, hmac_session_id):
         log.warning("verify_cookie_hmac_session_id(): HMAC Session ID failed verification.")
         hmac_session_id = None
     return hmac_session_id
@@ -180,16 +195,6 @@ def _decrypt(encrypted_payload: bytes) -> dict | None:
         return None
 
 
-def _reset_expiry_cache_auth_session(hmac_session_id: str) -> None:
-    """Update the auth expiry time."""
-    try:
-        cached_session_data[hmac_session_id] = cached_session_data[hmac_session_id]
-        cached_session_ids[hmac_session_id] = cached_session_ids[hmac_session_id]
-        # _set_cookie_session_id(session_id)
-    except Exception as e:
-        log.error("Failed to update auth expiry: %s", e)
-
-
 def set_cache_auth_session(val: dict) -> None:
     """Caches the session state configs for auth, persisting across connections.
 
@@ -197,18 +202,19 @@ def set_cache_auth_session(val: dict) -> None:
         val (dict): The session state for auth.
     """
     try:
+        store = get_session_store()
         hmac_session_id = _get_cookie_session_id()
         log.debug("set_cache_auth_session() - hmac session id: %s", hmac_session_id)
 
-        if hmac_session_id is None or hmac_session_id not in cached_session_ids:
-            log.debug(
-                "set_cache_auth_session() - Valid session id (auth token) not found. session_data: %s",
-                len(cached_session_ids.keys()),
-            )
+        session = store.get(hmac_session_id) if hmac_session_id is not None else None
+        if session is None:
+            log.debug("set_cache_auth_session() - Valid session id (auth token) not found.")
             hmac_session_id = generate_hmac_session_id()
             _set_cookie_session_id(hmac_session_id)
-        cached_session_data[hmac_session_id] = _encrypt(val)
-        _reset_expiry_cache_auth_session(hmac_session_id)
+            session = store.get(hmac_session_id)
+        session.data = _encrypt(val)
+        # resets the expiry
+        store.put(hmac_session_id, session)
     except Exception as e:
         log.error("Error caching auth session: %s", e)
 
@@ -222,10 +228,9 @@ def get_cache_auth_session() -> dict | None:
         span.set_attribute("session_id", "value present" if hmac_session_id else "value missing")
         if hmac_session_id:
             log.debug("get_cache_auth_session() - hmac session id: %s", hmac_session_id)
-            log.debug("get_cache_auth_session(): %s", cached_session_data.keys().__str__())
-            if hmac_session_id in cached_session_data:
-                encrypted_auth_session_data = cached_session_data[hmac_session_id]
-                decrypted_auth_session_data = _decrypt(encrypted_auth_session_data)
+            session = get_session_store().get(hmac_session_id)
+            if session is not None and session.data is not None:
+                decrypted_auth_session_data = _decrypt(session.data)
             else:
                 log.debug("Session id not found in cache")
                 span.add_event("session_id not found in session cache data")
@@ -244,12 +249,8 @@ def remove_cache_auth_session() -> None:
     try:
         hmac_session_id = _get_cookie_session_id()
         if hmac_session_id:
-            if hmac_session_id in cached_session_data:
-                del cached_session_data[hmac_session_id]
-                log.debug("Removed from cached_session: %s", hmac_session_id)
-            if hmac_session_id in cached_session_ids:
-                del cached_session_ids[hmac_session_id]
-                log.debug("Removed from session_data: %s", hmac_session_id)
+            get_session_store().delete(hmac_session_id)
+            log.debug("Removed from session store: %s", hmac_session_id)
         else:
             log.warning("Session id not found in cache")
     except Exception as e:
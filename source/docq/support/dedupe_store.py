@@ -0,0 +1,332 @@
+"""Dedupe stores. Remember the keys of events already seen so redelivered events are only handled once.
+
+A key is claimed with `add()` and stays claimed for `ttl_sec`, after which the same key can be claimed again. Both
+stores are bounded, so memory and disk use don't grow with the number of events seen.
+
+- `SqliteDedupeStore`, the default, keeps keys in a WAL mode SQLite file in the data dir. Claims survive restarts and
+  are shared by every process on the node using the same `DOCQ_DATA`. Expired keys are deleted in batches by a sweep
+  that runs at most every `SWEEP_INTERVAL_SEC` per process. The sweep also trims the keys closest to expiry past
+  `max_keys`.
+- `MemoryDedupeStore` keeps keys in process, expiring them off a min-heap of expiry times. Only for a single process.
+
+Set with the DOCQ_DEDUPE_STORE env var, `sqlite` or `memory`.
+"""
+
+import heapq
+import logging as log
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import closing
+from enum import Enum
+from typing import Callable, Optional, Self
+
+from opentelemetry import trace
+
+import docq
+
+from ..config import ENV_VAR_DOCQ_DEDUPE_STORE
+from .store import get_sqlite_dedupe_file
+
+tracer = trace.get_tracer(__name__, docq.__version_str__)
+
+DEDUPE_TTL_SEC = 60 * 60 * 1  # 1 hour
+"""How long a key stays claimed. Slack gives up retrying an event well within this."""
+
+SWEEP_INTERVAL_SEC = 60 * 5
+"""How often each process deletes expired keys."""
+
+SWEEP_BATCH_SIZE = 1000
+"""Expired keys deleted per transaction so a sweep never holds the write lock for long."""
+
+BUSY_TIMEOUT_SEC = 5
+
+MEMORY_STORE_MAX_KEYS = 100_000
+
+SQLITE_STORE_MAX_KEYS = 1_000_000
+
+HEAP_COMPACT_MIN_STALE = 1024
+"""The memory store's heap is rebuilt once stale entries outnumber live keys and this."""
+
+SQL_CREATE_DEDUPE_KEYS_TABLE = """
+CREATE TABLE IF NOT EXISTS dedupe_keys (
+    key TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL -- unix time
+)
+"""
+
+SQL_CREATE_DEDUPE_KEYS_EXPIRES_AT_INDEX = "CREATE INDEX IF NOT EXISTS idx_dedupe_keys_expires_at ON dedupe_keys (expires_at)"
+
+
+class DedupeStoreType(Enum):
+    """Where dedupe keys are kept. Set with the DOCQ_DEDUPE_STORE env var."""
+
+    SQLITE = "sqlite"
+    """A WAL mode SQLite file in the data dir shared by all processes. The default."""
+    MEMORY = "memory"
+    """In process memory. Keys are lost on restart and not shared between processes."""
+
+
+class DedupeStore(ABC):
+    """Store of claimed event keys."""
+
+    def __init__(self: Self, ttl_sec: float = DEDUPE_TTL_SEC) -> None:
+        """Initialise the store."""
+        self.ttl_sec = ttl_sec
+
+    @abstractmethod
+    def add(self: Self, key: str) -> bool:
+        """Claim a key.
+
+        Returns:
+            bool: True if the key was claimed, False if it's already claimed and hasn't expired i.e. a duplicate.
+        """
+
+    @abstractmethod
+    def remove(self: Self, key: str) -> bool:
+        """Release a claimed key so the event can be handled again e.g. when handling it failed.
+
+        Returns:
+            bool: True if the key was removed, False if it wasn't claimed.
+        """
+
+    def sweep_expired(self: Self) -> int:
+        """Delete expired keys. Returns the number deleted."""
+        return 0
+
+
+class MemoryDedupeStore(DedupeStore):
+    """Claimed keys in process memory, at most `max_keys` of them.
+
+    Each claim's expiry is pushed on a min-heap. Expired keys are popped off the top as keys are added, so expiry costs
+    O(log n) per key and never scans. When the store is full the key closest to expiry is evicted early. Heap entries of
+    keys that were removed or reclaimed are skipped when they reach the top, and the heap is rebuilt if they pile up.
+    """
+
+    def __init__(
+        self: Self,
+        ttl_sec: float = DEDUPE_TTL_SEC,
+        max_keys: int = MEMORY_STORE_MAX_KEYS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Initialise the store.
+
+        Args:
+            ttl_sec (float): how long a key stays claimed.
+            max_keys (int): the most keys held.
+            clock (Callable[[], float]): monotonic clock in seconds.
+        """
+        super().__init__(ttl_sec)
+        self.max_keys = max_keys
+        self._clock = clock
+        self._expires_at: dict[str, float] = {}
+        self._heap: list[tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self: Self) -> int:
+        """Number of keys held, including any expired keys not yet popped."""
+        return len(self._expires_at)
+
+    def add(self: Self, key: str) -> bool:
+        """Claim a key. True if claimed, False if it's a duplicate."""
+        now = self._clock()
+        with self._lock:
+            self._expire(now)
+            if key in self._expires_at:
+                return False
+            if len(self._expires_at) >= self.max_keys:
+                self._evict_next()
+            expires_at = now + self.ttl_sec
+            self._expires_at[key] = expires_at
+            heapq.heappush(self._heap, (expires_at, key))
+            return True
+
+    def remove(self: Self, key: str) -> bool:
+        """Release a claimed key. True if it was claimed."""
+        with self._lock:
+            expires_at = self._expires_at.get(key)
+            if expires_at is None or expires_at <= self._clock():
+                return False
+            del self._expires_at[key]
+            # the heap entry is left to be skipped, unless stale entries are piling up
+            if len(self._heap) - len(self._expires_at) > len(self._expires_at) + HEAP_COMPACT_MIN_STALE:
+                self._heap = [(e, k) for k, e in self._expires_at.items()]
+                heapq.heapify(self._heap)
+            return True
+
+    def sweep_expired(self: Self) -> int:
+        """Delete expired keys. Returns the number deleted."""
+        with self._lock:
+            count = len(self._expires_at)
+            self._expire(self._clock())
+            return count - len(self._expires_at)
+
+    def _is_current(self: Self, entry: tuple[float, str]) -> bool:
+        return self._expires_at.get(entry[1]) == entry[0]
+
+    def _expire(self: Self, now: float) -> None:
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if self._is_current(entry):
+                del self._expires_at[entry[1]]
+
+    def _evict_next(self: Self) -> None:
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if self._is_current(entry):
+                del self._expires_at[entry[1]]
+                return
+
+
+class SqliteDedupeStore(DedupeStore):
+    """Claimed keys in a WAL mode SQLite file shared by all processes using the file."""
+
+    def __init__(
+        self: Self,
+        sqlite_file: Optional[str] = None,
+        ttl_sec: float = DEDUPE_TTL_SEC,
+        sweep_interval_sec: float = SWEEP_INTERVAL_SEC,
+        sweep_batch_size: int = SWEEP_BATCH_SIZE,
+        max_keys: int = SQLITE_STORE_MAX_KEYS,
+    ) -> None:
+        """Initialise the store.
+
+        Args:
+            sqlite_file (Optional[str]): the SQLite file. Defaults to the dedupe file in the data dir.
+            ttl_sec (float): how long a key stays claimed.
+            sweep_interval_sec (float): how often this process deletes expired keys.
+            sweep_batch_size (int): expired keys deleted per transaction.
+            max_keys (int): keys kept after a sweep. Between sweeps there may be more.
+        """
+        super().__init__(ttl_sec)
+        self._sqlite_file = sqlite_file
+        self.max_keys = max_keys
+        self.sweep_interval_sec = sweep_interval_sec
+        self.sweep_batch_size = sweep_batch_size
+        self._initialised_files: set[str] = set()
+        self._swept_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def sqlite_file(self: Self) -> str:
+        """The SQLite file keys are stored in."""
+        return self._sqlite_file or get_sqlite_dedupe_file()
+
+    def init(self: Self) -> None:
+        """Create the keys table and switch the file to WAL so readers in other processes aren't blocked."""
+        sqlite_file = self.sqlite_file
+        if sqlite_file in self._initialised_files:
+            return
+        with closing(sqlite3.connect(sqlite_file, timeout=BUSY_TIMEOUT_SEC)) as connection, closing(
+            connection.cursor()
+        ) as cursor:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute(SQL_CREATE_DEDUPE_KEYS_TABLE)
+            cursor.execute(SQL_CREATE_DEDUPE_KEYS_EXPIRES_AT_INDEX)
+            connection.commit()
+        with self._lock:
+            self._initialised_files.add(sqlite_file)
+
+    def _connect(self: Self) -> sqlite3.Connection:
+        """Get this thread's connection to the file.
+
+        Connections are kept open as closing the last connection to a WAL file checkpoints and deletes the WAL, which
+        costs far more than the claim itself.
+        """
+        sqlite_file = self.sqlite_file
+        connections: dict[str, sqlite3.Connection] = self._local.__dict__.setdefault("connections", {})
+        connection = connections.get(sqlite_file)
+        if connection is None:
+            self.init()
+            connection = sqlite3.connect(sqlite_file, timeout=BUSY_TIMEOUT_SEC)
+            # commits then don't fsync in WAL mode. a claim lost to a power cut only means an event may be handled twice.
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connections[sqlite_file] = connection
+        return connection
+
+    def add(self: Self, key: str) -> bool:
+        """Claim a key. True if claimed, False if it's a duplicate."""
+        now = time.time()
+        connection = self._connect()
+        with closing(connection.cursor()) as cursor:
+            # one statement, so two processes claiming the same key can't both succeed
+            cursor.execute(
+                """
+                INSERT INTO dedupe_keys (key, expires_at) VALUES (?, ?)
+                ON CONFLICT (key) DO UPDATE SET expires_at = excluded.expires_at WHERE dedupe_keys.expires_at <= ?
+                """,
+                (key, now + self.ttl_sec, now),
+            )
+            connection.commit()
+            added = cursor.rowcount == 1
+        self._sweep_if_due()
+        return added
+
+    def remove(self: Self, key: str) -> bool:
+        """Release a claimed key. True if it was claimed."""
+        connection = self._connect()
+        with closing(connection.cursor()) as cursor:
+            cursor.execute("DELETE FROM dedupe_keys WHERE key = ? AND expires_at > ?", (key, time.time()))
+            connection.commit()
+            return cursor.rowcount == 1
+
+    def sweep_expired(self: Self) -> int:
+        """Delete expired keys in batches, committing after each, then any over `max_keys`. Returns the number deleted."""
+        with tracer.start_as_current_span("dedupe_store.sweep_expired") as span:
+            now, deleted = time.time(), 0
+            connection = self._connect()
+            with closing(connection.cursor()) as cursor:
+                while True:
+                    cursor.execute(
+                        "DELETE FROM dedupe_keys WHERE rowid IN (SELECT rowid FROM dedupe_keys WHERE expires_at <= ? LIMIT ?)",
+                        (now, self.sweep_batch_size),
+                    )
+                    connection.commit()
+                    deleted += cursor.rowcount
+                    if cursor.rowcount < self.sweep_batch_size:
+                        break
+                excess = cursor.execute("SELECT COUNT(*) FROM dedupe_keys").fetchone()[0] - self.max_keys
+                while excess > 0:
+                    cursor.execute(
+                        "DELETE FROM dedupe_keys WHERE rowid IN (SELECT rowid FROM dedupe_keys ORDER BY expires_at LIMIT ?)",
+                        (min(excess, self.sweep_batch_size),),
+                    )
+                    connection.commit()
+                    deleted += cursor.rowcount
+                    excess -= cursor.rowcount
+            span.set_attribute("keys_deleted", deleted)
+            return deleted
+
+    def _sweep_if_due(self: Self) -> None:
+        with self._lock:
+            if time.monotonic() - self._swept_at < self.sweep_interval_sec:
+                return
+            self._swept_at = time.monotonic()
+        try:
+            self.sweep_expired()
+        except sqlite3.Error as e:
+            log.error("Failed to sweep expired dedupe keys: %s", e)
+
+
+def get_dedupe_store_type() -> DedupeStoreType:
+    """Get the dedupe store type from the DOCQ_DEDUPE_STORE env var. Defaults to SQLite."""
+    return DedupeStoreType(os.environ.get(ENV_VAR_DOCQ_DEDUPE_STORE, DedupeStoreType.SQLITE.value).lower())
+
+
+_store: Optional[DedupeStore] = None
+_store_lock = threading.Lock()
+
+
+def get_dedupe_store() -> DedupeStore:
+    """Get this process' dedupe store, creating it based on DOCQ_DEDUPE_STORE on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store_type = get_dedupe_store_type()
+                _store = SqliteDedupeStore() if store_type == DedupeStoreType.SQLITE else MemoryDedupeStore()
+                log.info("Using %s dedupe store", store_type.value)
+    return _store
@@ -0,0 +1,174 @@
+"""LLM clients."""
+
+import asyncio
+import logging as log
+import random
+import time
+import weakref
+from contextlib import ExitStack
+from typing import Any, AsyncGenerator, Awaitable, Callable, Generator, Self, Sequence, TypeVar
+
+from litellm.exceptions import APIConnectionError, RateLimitError, ServiceUnavailableError, Timeout
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    ChatResponseGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+)
+from llama_index.core.bridge.pydantic import Field
+from llama_index.llms.litellm import LiteLLM
+
+from ..llm_rate_limiter import get_llm_rate_limiter
+
+T = TypeVar("T")
+
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, ServiceUnavailableError, Timeout)
+
+RETRY_BACKOFF_BASE_SEC = 1.0
+RETRY_BACKOFF_MAX_SEC = 20.0
+
+
+class RateLimitedLiteLLM(LiteLLM):
+    """LiteLLM client whose calls go through the LLM rate limiter.
+
+    Each attempt takes a rate limit token and a concurrency slot on the service instance, and backs off between
+    attempts without holding the slot. So retries can't amplify load on a provider that's already rate limiting us. Set
+    `max_retries` to 1 so the LiteLLM client doesn't also retry within an attempt.
+
+    Streamed responses hold the slot until the stream is consumed, closed or garbage collected. They are not retried as
+    the caller may already have part of the response.
+    """
+
+    service_instance_key: str = Field(default="", description="Key of the model service instance called.")
+    max_concurrency: int = Field(default=0, description="Concurrency cap of the service instance. 0 for no cap.")
+    max_attempts: int = Field(default=3, description="Attempts per call, including the first.")
+
+    async def _ahold_slot(self: Self, stack: ExitStack) -> None:
+        """Wait for the limiter and hold its slot in `stack`.
+
+        Waiting blocks so it's done off the event loop. If cancelled while waiting the wait can't be stopped, so the
+        slot is released as soon as the wait ends.
+        """
+        wait = asyncio.ensure_future(
+            asyncio.to_thread(
+                stack.enter_context, get_llm_rate_limiter().limit(self.service_instance_key, self.max_concurrency)
+            )
+        )
+        try:
+            await asyncio.shield(wait)
+        except asyncio.CancelledError:
+            wait.add_done_callback(lambda _: _release_slot(wait, stack))
+            raise
+
+    def _backoff(self: Self, attempt: int) -> float:
+        return random.uniform(0, min(RETRY_BACKOFF_MAX_SEC, RETRY_BACKOFF_BASE_SEC * 2**attempt))  # noqa: S311
+
+    def _call(self: Self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        limiter = get_llm_rate_limiter()
+        attempt = 1
+        while True:
+            with limiter.limit(self.service_instance_key, self.max_concurrency):
+                try:
+                    return fn(*args, **kwargs)
+                except RETRYABLE_ERRORS as e:
+                    if attempt >= self.max_attempts:
+                        raise
+                    log.warning("LLM call attempt %s of %s failed: %s", attempt, self.max_attempts, e)
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def _acall(self: Self, fn: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> T:
+        attempt = 1
+        while True:
+            with ExitStack() as stack:
+                await self._ahold_slot(stack)
+                try:
+                    return await fn(*args, **kwargs)
+                except RETRYABLE_ERRORS as e:
+                    if attempt >= self.max_attempts:
+                        raise
+                    log.warning("LLM call attempt %s of %s failed: %s", attempt, self.max_attempts, e)
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def _stream(self: Self, fn: Callable[..., Generator[T, None, None]], *args: Any, **kwargs: Any) -> Generator:
+        stack = ExitStack()
+        stack.enter_context(get_llm_rate_limiter().limit(self.service_instance_key, self.max_concurrency))
+        try:
+            gen = fn(*args, **kwargs)
+        except BaseException:
+            stack.close()
+            raise
+
+        def _hold_slot() -> Generator[T, None, None]:
+            with stack:
+                yield from gen
+
+        stream = _hold_slot()
+        # a generator that's never iterated never runs the `with`, so release the slot when it's collected.
+        weakref.finalize(stream, stack.close)
+        return stream
+
+    async def _astream(
+        self: Self, fn: Callable[..., Awaitable[AsyncGenerator[T, None]]], *args: Any, **kwargs: Any
+    ) -> AsyncGenerator:
+        stack = ExitStack()
+        await self._ahold_slot(stack)
+        try:
+            gen = await fn(*args, **kwargs)
+        except BaseException:
+            stack.close()
+            raise
+
+        async def _hold_slot() -> AsyncGenerator[T, None]:
+            with stack:
+                async for item in gen:
+                    yield item
+
+        stream = _hold_slot()
+        weakref.finalize(stream, stack.close)
+        return stream
+
+    def chat(self: Self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        """Chat, rate limited."""
+        return self._call(super().chat, messages, **kwargs)
+
+    def complete(self: Self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        """Complete, rate limited."""
+        return self._call(super().complete, prompt, formatted=formatted, **kwargs)
+
+    def stream_chat(self: Self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseGen:
+        """Stream chat, rate limited."""
+        return self._stream(super().stream_chat, messages, **kwargs)
+
+    def stream_complete(self: Self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        """Stream complete, rate limited."""
+        return self._stream(super().stream_complete, prompt, formatted=formatted, **kwargs)
+
+    async def achat(self: Self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        """Async chat, rate limited."""
+        return await self._acall(super().achat, messages, **kwargs)
+
+    async def acomplete(self: Self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        """Async complete, rate limited."""
+        return await self._acall(super().acomplete, prompt, formatted=formatted, **kwargs)
+
+    async def astream_chat(self: Self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseAsyncGen:
+        """Async stream chat, rate limited."""
+        return await self._astream(super().astream_chat, messages, **kwargs)
+
+    async def astream_complete(
+        self: Self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseAsyncGen:
+        """Async stream complete, rate limited."""
+        return await self._astream(super().astream_complete, prompt, formatted=formatted, **kwargs)
+
+
+def _release_slot(wait: asyncio.Future, stack: ExitStack) -> None:
+    """Release a slot acquired after the caller waiting for it was cancelled."""
+    if not wait.cancelled() and wait.exception() is not None:
+        log.debug("LLM rate limiter wait ended after cancellation: %s", wait.exception())
+    stack.close()
@@ -3,7 +3,10 @@
 import logging as log
 import os
 import traceback
-from typing import List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+from dataclasses import dataclass, replace
+from typing import Iterator, List, Optional, Self
 from uu import Error
 
 import docq
@@ -23,7 +26,9 @@ from docq.support.llama_index.query_pipeline_components import (
     KwargPackComponent,
     ResponseWithChatHistory,
 )
+from docq.support.llm_rate_limiter import LlmRateLimitExceededError
 from docq.support.store import get_models_dir
+from llama_index.core.base.embeddings.base import BaseEmbedding
 from llama_index.core.base.response.schema import RESPONSE_TYPE, Response
 from llama_index.core.chat_engine import SimpleChatEngine
 from llama_index.core.chat_engine.types import AGENT_CHAT_RESPONSE_TYPE, AgentChatResponse
@@ -40,6 +45,8 @@ from llama_index.core.query_pipeline.components import FnComponent
 # from llama_index.core.query_pipeline.components.argpacks import KwargPackComponent
 from llama_index.core.retrievers import BaseRetriever, QueryFusionRetriever
 from llama_index.core.retrievers.fusion_retriever import FUSION_MODES
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.service_context import ServiceContext
 
 # load_index_from_storage
 from llama_index.embeddings.huggingface_optimum import OptimumEmbedding
@@ -59,6 +66,28 @@ ERROR: {error}
 """
 
 
+SUMMARISE_HISTORY_PROMPT = """
+Progressively summarise the conversation between a human and an AI assistant.
+Extend the <summary> with the <new_lines> of the conversation and return only the new summary.
+Keep the facts, names, numbers, decisions and open questions needed to continue the conversation. Leave out pleasantries and document source listings.
+Keep the summary under {max_words} words.
+
+<summary>
+{summary}
+</summary>
+<new_lines>
+{new_lines}
+</new_lines>
+
+New summary:
+"""
+
+SUMMARY_MAX_WORDS = 250
+
+BATCH_MAX_CONCURRENCY = 4
+"""Default number of questions in a batch that are answered at the same time."""
+
+
 @tracer.start_as_current_span(name="_init_local_models")
 def _init_local_models() -> None:
     """Initialize local models."""
@@ -241,15 +270,22 @@ def run_ask1(
     return output
 
 
-@tracer.start_as_current_span(name="run_ask2")
-def run_ask2(
-    input_: str,
-    history: List[ChatMessage],
+@dataclass
+class RagRetrievers:
+    """The retrievers for a set of spaces. Built once and shared by every question asked against those spaces."""
+
+    service_context: ServiceContext
+    vector_retriever: BaseRetriever
+    bm25_retriever: BaseRetriever
+
+
+@tracer.start_as_current_span(name="get_rag_retrievers")
+def get_rag_retrievers(
+    spaces: Optional[list[SpaceKey]],
     model_settings_collection: LlmUsageSettingsCollection,
-    assistant: Assistant,
-    spaces: Optional[list[SpaceKey]] = None,
-) -> RESPONSE_TYPE | AGENT_CHAT_RESPONSE_TYPE:
-    """Implements logic of run_ask() using LlamaIndex query pipelines."""
+    similarity_top_k: int = 6,
+) -> RagRetrievers:
+    """Load the indices of the spaces and create the vector and BM25 retrievers over them."""
     span = trace.get_current_span()
 
     service_context = _get_service_context(model_settings_collection)
@@ -272,11 +308,9 @@ def run_ask2(
         # text_qa_template = llama_index_chat_prompt_template_from_assistant(assistant, history)
         # span.add_event(name="prompt_created")
 
-        similarity_top_k = 6
         span.set_attributes(
             attributes={
                 "model_settings_collection": str(model_settings_collection),
-                "assistant": str(assistant),
                 "similarity_top_k": similarity_top_k,
             }
         )
@@ -323,6 +357,20 @@ def run_ask2(
 
         raise Error(f"Error: {e}") from e
 
+    return RagRetrievers(
+        service_context=service_context, vector_retriever=vector_retriever, bm25_retriever=bm25_retriever
+    )
+
+
+@tracer.start_as_current_span(name="run_ask_pipeline")
+def _run_ask_pipeline(
+    input_: str, history: List[ChatMessage], assistant: Assistant, retrievers: RagRetrievers
+) -> RESPONSE_TYPE:
+    """Answer a question with the RAG query pipeline over already created retrievers."""
+    span = trace.get_current_span()
+    service_context = retrievers.service_context
+    vector_retriever = retrievers.vector_retriever
+    bm25_retriever = retrievers.bm25_retriever
     llm = service_context.llm
 
     # First, we create an input component to capture the user query
@@ -458,15 +506,143 @@ def run_ask2(
     )
 
 
+@tracer.start_as_current_span(name="run_ask2")
+def run_ask2(
+    input_: str,
+    history: List[ChatMessage],
+    model_settings_collection: LlmUsageSettingsCollection,
+    assistant: Assistant,
+    spaces: Optional[list[SpaceKey]] = None,
+) -> RESPONSE_TYPE | AGENT_CHAT_RESPONSE_TYPE:
+    """Implements logic of run_ask() using LlamaIndex query pipelines."""
+    trace.get_current_span().set_attribute("assistant", str(assistant))
+    retrievers = get_rag_retrievers(spaces, model_settings_collection)
+    return _run_ask_pipeline(input_, history, assistant, retrievers)
+
+
+class _PrecomputedQueryEmbeddingRetriever(BaseRetriever):
+    """Wraps a vector retriever to use query embeddings computed up front in a batch."""
+
+    def __init__(self: Self, retriever: BaseRetriever, query_embeddings: dict[str, list[float]]) -> None:
+        """Initialise the retriever."""
+        super().__init__(callback_manager=retriever.callback_manager)
+        self._retriever = retriever
+        self._query_embeddings = query_embeddings
+
+    def _retrieve(self: Self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        if query_bundle.embedding is None and query_bundle.query_str in self._query_embeddings:
+            query_bundle.embedding = self._query_embeddings[query_bundle.query_str]
+        return self._retriever.retrieve(query_bundle)
+
+
+@tracer.start_as_current_span(name="embed_queries")
+def _embed_queries(inputs: list[str], embed_model: BaseEmbedding) -> dict[str, list[float]]:
+    """Embed the distinct questions in batches of the embed model's batch size."""
+    queries = list(dict.fromkeys(inputs))
+    embeddings: dict[str, list[float]] = {}
+    batch_size = max(1, embed_model.embed_batch_size)
+    for i in range(0, len(queries), batch_size):
+        batch = queries[i : i + batch_size]
+        # the public get_query_embedding() is one at a time. this is the batch variant it's built on.
+        embeddings.update(zip(batch, embed_model._get_query_embeddings(batch), strict=True))
+    trace.get_current_span().set_attribute("num_queries", len(queries))
+    return embeddings
+
+
+def run_ask_batch(
+    inputs: list[str],
+    history: List[ChatMessage],
+    model_settings_collection: LlmUsageSettingsCollection,
+    assistant: Assistant,
+    spaces: list[SpaceKey],
+    max_concurrency: int = BATCH_MAX_CONCURRENCY,
+) -> Iterator[tuple[int, RESPONSE_TYPE | Exception]]:
+    """Ask many questions against the same spaces.
+
+    The indices and retrievers are loaded once and the question embeddings computed in batches up front. Answers are
+    generated `max_concurrency` at a time.
+
+    Args:
+        inputs (list[str]): the questions.
+        history (List[ChatMessage]): chat history shared by all the questions.
+        model_settings_collection (LlmUsageSettingsCollection): the model settings.
+        assistant (Assistant): the assistant to answer with.
+        spaces (list[SpaceKey]): the spaces to answer from.
+        max_concurrency (int): the maximum number of answers generated at the same time.
+
+    Yields:
+        tuple[int, RESPONSE_TYPE | Exception]: the index of the question in `inputs` and the response, or the error
+            raised answering it, in the order the answers complete.
+    """
+    retrievers = get_rag_retrievers(spaces, model_settings_collection)
+    try:
+        query_embeddings = _embed_queries(inputs, retrievers.service_context.embed_model)
+        retrievers = replace(
+            retrievers,
+            vector_retriever=_PrecomputedQueryEmbeddingRetriever(retrievers.vector_retriever, query_embeddings),
+        )
+    except Exception as e:
+        # not fatal, each question is embedded as it's answered instead
+        log.warning("Batch embedding of %s questions failed: %s", len(inputs), e)
+
+    executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="docq-ask-batch")
+    try:
+        futures: dict[Future, int] = {
+            # in a copy of the context so the LLM calls are attributed to the caller
+            executor.submit(copy_context().run, _run_ask_pipeline, input_, history, assistant, retrievers): i
+            for i, input_ in enumerate(inputs)
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
+    finally:
+        # don't generate answers nobody is waiting for if the caller stops early
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+@tracer.start_as_current_span(name="summarise_chat_history")
+def summarise_chat_history(
+    summary: Optional[str], messages: List[ChatMessage], model_settings_collection: LlmUsageSettingsCollection
+) -> str:
+    """Fold messages into a rolling summary of a conversation.
+
+    Args:
+        summary: the summary so far. None when the conversation hasn't been summarised yet.
+        messages: the messages to add to the summary, oldest first.
+        model_settings_collection: the model settings to use for the summarising LLM call.
+
+    Returns:
+        str: the new summary.
+    """
+    llm = _get_service_context(model_settings_collection).llm
+    prompt = SUMMARISE_HISTORY_PROMPT.format(
+        summary=summary or "",
+        new_lines="\n".join([str(x) for x in messages]),
+        max_words=SUMMARY_MAX_WORDS,
+    )
+    return llm.complete(prompt).text.strip()
+
+
 @tracer.start_as_current_span(name="_default_response")
 def _default_response() -> Response:
     """A default response incase of any failure."""
     return Response("I don't know.")
 
 
+def _rate_limited_response() -> Response:
+    """The response when the LLM call rate limit is reached."""
+    return Response("Too many questions are being asked right now. Please try again in a minute.")
+
+
 @tracer.start_as_current_span(name="query_error")
 def query_error(error: Exception, model_settings_collection: LlmUsageSettingsCollection) -> Response:
     """Query for a response to an error message."""
+    if isinstance(error, LlmRateLimitExceededError):
+        # asking the LLM about it would only add to the load
+        log.warning("Rate limited: %s", error)
+        return _rate_limited_response()
     try:  # Try re-prompting with the AI
         log.exception("Error: %s", error)
         input_ = ERROR_PROMPT.format(error=error)
@@ -0,0 +1,364 @@
+"""Rate limiting and fair scheduling of LLM calls.
+
+All orgs share the same model deployments. Every call to a generation model goes through `LlmRateLimiter.limit()`
+(see `RateLimitedLiteLLM`). A call first takes a token from the calling org's and user's token buckets, waiting for one
+if needed, then waits for one of the model service instance's concurrency slots. When all the slots are taken, waiting
+calls are admitted by weighted fair queuing across orgs so one org with a lot of calls queued doesn't hold up the rest.
+
+The request handlers set who is calling with `llm_caller()`. Calls made with no caller set share one bucket.
+"""
+
+import heapq
+import itertools
+import logging as log
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Hashable, Iterator, Mapping, Optional, Self
+
+from cachetools import TTLCache
+from opentelemetry import metrics, trace
+
+import docq
+
+from ..config import ENV_VAR_DOCQ_LLM_MAX_WAIT_SEC, ENV_VAR_DOCQ_LLM_ORG_RPM, ENV_VAR_DOCQ_LLM_USER_RPM
+
+meter = metrics.get_meter(__name__, docq.__version_str__)
+
+queue_depth_counter = meter.create_up_down_counter(
+    "docq.llm.queue.depth", unit="1", description="LLM calls waiting for a concurrency slot."
+)
+active_calls_counter = meter.create_up_down_counter(
+    "docq.llm.calls.active", unit="1", description="LLM calls holding a concurrency slot."
+)
+wait_time_histogram = meter.create_histogram(
+    "docq.llm.wait", unit="s", description="Time LLM calls waited for the rate limiter and a concurrency slot."
+)
+rejected_counter = meter.create_counter(
+    "docq.llm.rejected", unit="1", description="LLM calls rejected because they would wait longer than the max wait."
+)
+
+DEFAULT_ORG_RPM = 600
+"""Default LLM calls per minute per org. 0 for no limit."""
+
+DEFAULT_USER_RPM = 60
+"""Default LLM calls per minute per user. 0 for no limit."""
+
+DEFAULT_MAX_WAIT_SEC = 60
+"""Default time a call waits for a token and a concurrency slot before it's rejected."""
+
+BURST_SEC = 10
+"""Token buckets hold this many seconds worth of tokens, so short bursts aren't slowed down."""
+
+BUCKET_CACHE_SIZE = 10000
+
+BUCKET_IDLE_TTL = 60 * 60
+"""Buckets not used for this many seconds are dropped. Much longer than a bucket takes to refill."""
+
+
+class LlmRateLimitExceededError(Exception):
+    """An LLM call would have to wait longer than the max wait for the rate limit or a concurrency slot."""
+
+
+@dataclass(frozen=True)
+class LlmCaller:
+    """Who an LLM call is made for."""
+
+    org_id: Optional[int] = None
+    user_id: Optional[int] = None
+
+
+_ANONYMOUS_CALLER = LlmCaller()
+
+_llm_caller: ContextVar[Optional[LlmCaller]] = ContextVar("docq_llm_caller", default=None)
+
+
+@contextmanager
+def llm_caller(org_id: Optional[int], user_id: Optional[int] = None) -> Iterator[LlmCaller]:
+    """Attribute the LLM calls made in the block to an org and user.
+
+    The caller is held in a context variable. It follows async tasks, but threads started in the block need to be run
+    in a copy of the context, `contextvars.copy_context().run`, to see it.
+    """
+    caller = LlmCaller(org_id, user_id)
+    token = _llm_caller.set(caller)
+    try:
+        yield caller
+    finally:
+        _llm_caller.reset(token)
+
+
+def get_llm_caller() -> LlmCaller:
+    """Get the caller set by the enclosing `llm_caller()`. Outside of one the caller has no org or user."""
+    caller = _llm_caller.get()
+    return caller if caller is not None else _ANONYMOUS_CALLER
+
+
+class TokenBucket:
+    """A token bucket. Tokens can be reserved ahead, so callers queue for future tokens instead of polling."""
+
+    def __init__(
+        self: Self, rate_per_sec: float, capacity: float, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        """Initialise a full bucket.
+
+        Args:
+            rate_per_sec (float): tokens added per second.
+            capacity (float): the most tokens the bucket holds.
+            clock (Callable[[], float]): monotonic clock in seconds.
+        """
+        self._rate = rate_per_sec
+        self._capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self: Self, max_wait: float) -> Optional[float]:
+        """Take a token.
+
+        Returns:
+            Optional[float]: seconds to wait before the token may be used, or None, with no token taken, if that's
+                longer than `max_wait`.
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+            self._updated_at = now
+            wait = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self._rate
+            if wait > max_wait:
+                return None
+            # may go negative, which is the queue of reservations ahead of the next caller
+            self._tokens -= 1
+            return wait
+
+    def refund(self: Self) -> None:
+        """Give back a reserved token that wasn't used."""
+        with self._lock:
+            self._tokens = min(self._capacity, self._tokens + 1)
+
+
+@dataclass(order=True)
+class _Waiter:
+    finish_tag: float
+    seq: int
+    flow: Hashable = field(compare=False)
+    granted: threading.Event = field(compare=False, default_factory=threading.Event)
+    cancelled: bool = field(compare=False, default=False)
+
+
+class FairScheduler:
+    """A concurrency cap that admits waiting calls by weighted fair queuing across flows (orgs).
+
+    Each waiting call is tagged `max(virtual time, the flow's last tag) + 1 / weight` and free slots go to the lowest
+    tag. So flows take turns, in proportion to their weights, however many calls each has queued. A freed slot is
+    handed straight to the next waiter so newcomers can't jump the queue.
+    """
+
+    def __init__(self: Self, name: str, max_concurrency: int) -> None:
+        """Initialise the scheduler.
+
+        Args:
+            name (str): name for the metrics, the model service instance.
+            max_concurrency (int): the most calls holding a slot at once.
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self._active = 0
+        self._waiting = 0
+        self._queue: list[_Waiter] = []
+        self._virtual_time = 0.0
+        self._last_tags: dict[Hashable, float] = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._attributes = {"service_instance": name}
+
+    @property
+    def active(self: Self) -> int:
+        """Calls holding a slot."""
+        return self._active
+
+    @property
+    def queue_depth(self: Self) -> int:
+        """Calls waiting for a slot."""
+        return self._waiting
+
+    def acquire(self: Self, flow: Hashable, timeout: float, weight: float = 1.0) -> bool:
+        """Wait for a slot. Returns False if none was free within `timeout` seconds."""
+        with self._lock:
+            if self._active < self.max_concurrency and self._waiting == 0:
+                self._active += 1
+                active_calls_counter.add(1, self._attributes)
+                return True
+            tag = max(self._virtual_time, self._last_tags.get(flow, 0.0)) + 1.0 / weight
+            self._last_tags[flow] = tag
+            waiter = _Waiter(tag, next(self._seq), flow)
+            heapq.heappush(self._queue, waiter)
+            self._waiting += 1
+            queue_depth_counter.add(1, self._attributes)
+
+        if waiter.granted.wait(timeout):
+            return True
+        with self._lock:
+            if waiter.granted.is_set():
+                return True
+            waiter.cancelled = True
+            self._waiting -= 1
+            queue_depth_counter.add(-1, self._attributes)
+            return False
+
+    def release(self: Self) -> None:
+        """Give up a slot, handing it to the next waiter if there is one."""
+        with self._lock:
+            # no hand over if the cap was lowered while the slot was held
+            while self._queue and self._active <= self.max_concurrency:
+                waiter = heapq.heappop(self._queue)
+                if waiter.cancelled:
+                    continue
+                self._waiting -= 1
+                queue_depth_counter.add(-1, self._attributes)
+                self._virtual_time = waiter.finish_tag
+                waiter.granted.set()
+                return
+            # idle, so no flow has earned a place ahead of any other
+            self._last_tags.clear()
+            self._active -= 1
+            active_calls_counter.add(-1, self._attributes)
+
+
+class LlmRateLimiter:
+    """Per org and per user token buckets plus a fair scheduler per model service instance."""
+
+    def __init__(
+        self: Self,
+        org_rpm: float = DEFAULT_ORG_RPM,
+        user_rpm: float = DEFAULT_USER_RPM,
+        max_wait_sec: float = DEFAULT_MAX_WAIT_SEC,
+        org_weights: Optional[Mapping[int, float]] = None,
+    ) -> None:
+        """Initialise the limiter.
+
+        Args:
+            org_rpm (float): calls per minute per org. 0 for no limit.
+            user_rpm (float): calls per minute per user. 0 for no limit.
+            max_wait_sec (float): the longest a call waits before it's rejected.
+            org_weights (Optional[Mapping[int, float]]): share of the concurrency slots of orgs relative to the default
+                of 1.
+        """
+        self.org_rpm = org_rpm
+        self.user_rpm = user_rpm
+        self.max_wait_sec = max_wait_sec
+        self.org_weights = dict(org_weights or {})
+        self._buckets: TTLCache = TTLCache(maxsize=BUCKET_CACHE_SIZE, ttl=BUCKET_IDLE_TTL)
+        self._schedulers: dict[str, FairScheduler] = {}
+        self._lock = threading.Lock()
+
+    def _get_bucket(self: Self, key: tuple, rpm: float) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                rate = rpm / 60
+                bucket = TokenBucket(rate, max(1.0, rate * BURST_SEC))
+            # set on every use to push back the expiry of buckets in use
+            self._buckets[key] = bucket
+            return bucket
+
+    def get_scheduler(self: Self, service_instance: str, max_concurrency: int) -> FairScheduler:
+        """Get the scheduler of a model service instance, picking up any change to its concurrency cap."""
+        with self._lock:
+            scheduler = self._schedulers.get(service_instance)
+            if scheduler is None:
+                scheduler = self._schedulers[service_instance] = FairScheduler(service_instance, max_concurrency)
+            scheduler.max_concurrency = max_concurrency
+            return scheduler
+
+    def _reserve_tokens(self: Self, caller: LlmCaller, attributes: dict, deadline: float) -> list[TokenBucket]:
+        """Take a token from each of the caller's buckets and wait until they can be used."""
+        limits = [("org_rate", ("org", caller.org_id), self.org_rpm)]
+        if caller.user_id is not None:
+            limits.append(("user_rate", ("user", caller.user_id), self.user_rpm))
+        reserved: list[TokenBucket] = []
+        wait = 0.0
+        for reason, key, rpm in limits:
+            if rpm <= 0:
+                continue
+            bucket = self._get_bucket(key, rpm)
+            bucket_wait = bucket.reserve(max(0.0, deadline - time.monotonic()))
+            if bucket_wait is None:
+                for b in reserved:
+                    b.refund()
+                rejected_counter.add(1, {**attributes, "reason": reason})
+                raise LlmRateLimitExceededError(f"LLM call rate limit reached for {key[0]} {key[1]}")
+            reserved.append(bucket)
+            # the buckets refill at the same time so the waits overlap
+            wait = max(wait, bucket_wait)
+        if wait > 0:
+            time.sleep(wait)
+        return reserved
+
+    @contextmanager
+    def limit(self: Self, service_instance: str, max_concurrency: int) -> Iterator[None]:
+        """Wait for the caller's rate limits and a concurrency slot on the service instance, holding the slot in the block.
+
+        Args:
+            service_instance (str): key of the model service instance the call is made to.
+            max_concurrency (int): the service instance's concurrency cap. 0 for no cap.
+
+        Raises:
+            LlmRateLimitExceededError: if the call would wait longer than the max wait.
+        """
+        caller = get_llm_caller()
+        attributes = {"service_instance": service_instance}
+        start = time.monotonic()
+        deadline = start + self.max_wait_sec
+        reserved = self._reserve_tokens(caller, attributes, deadline)
+
+        scheduler = self.get_scheduler(service_instance, max_concurrency) if max_concurrency > 0 else None
+        if scheduler is not None:
+            weight = self.org_weights.get(caller.org_id, 1.0) if caller.org_id is not None else 1.0
+            if not scheduler.acquire(caller.org_id, max(0.0, deadline - time.monotonic()), weight):
+                for bucket in reserved:
+                    bucket.refund()
+                rejected_counter.add(1, {**attributes, "reason": "concurrency"})
+                raise LlmRateLimitExceededError(f"No free LLM call slot on {service_instance}")
+
+        waited = time.monotonic() - start
+        wait_time_histogram.record(waited, attributes)
+        trace.get_current_span().set_attribute("llm_rate_limiter.wait_sec", waited)
+        try:
+            yield
+        finally:
+            if scheduler is not None:
+                scheduler.release()
+
+
+_limiter: Optional[LlmRateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def _get_env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        log.error("Invalid value '%s' for %s, using %s", value, name, default)
+        return default
+
+
+def get_llm_rate_limiter() -> LlmRateLimiter:
+    """Get the process wide rate limiter, configured from the environment."""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = LlmRateLimiter(
+                    org_rpm=_get_env_float(ENV_VAR_DOCQ_LLM_ORG_RPM, DEFAULT_ORG_RPM),
+                    user_rpm=_get_env_float(ENV_VAR_DOCQ_LLM_USER_RPM, DEFAULT_USER_RPM),
+                    max_wait_sec=_get_env_float(ENV_VAR_DOCQ_LLM_MAX_WAIT_SEC, DEFAULT_MAX_WAIT_SEC),
+                )
+    return _limiter
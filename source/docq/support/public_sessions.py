@@ -0,0 +1,225 @@
+"""Public session activity tracking and cleanup of expired public session history.
+
+Each public session's last activity is recorded in an indexed table when it saves a thread or message. A cleanup
+worker thread runs in every process but only the holder of a lease in the global system db does any work. Expired
+sessions are found with the last-activity index and deleted in batches, so there's no scan of the PUBLIC data dir.
+"""
+
+import logging as log
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import closing, suppress
+from typing import Optional
+
+from opentelemetry import metrics, trace
+
+import docq
+
+from ..config import OrganisationFeatureType
+from . import write_behind
+from .store import (
+    UsageDbMode,
+    get_history_table_name,
+    get_history_thread_table_name,
+    get_public_sqlite_usage_dir,
+    get_sqlite_global_system_file,
+    get_usage_db_mode,
+    get_usage_partition,
+)
+
+tracer = trace.get_tracer(__name__, docq.__version_str__)
+meter = metrics.get_meter(__name__, docq.__version_str__)
+
+sessions_reaped_counter = meter.create_counter(
+    "docq.public_sessions.reaped", unit="1", description="Expired public sessions whose history was deleted."
+)
+
+INACTIVITY_THRESHOLD = 60 * 60 * 2 * 24  # 2 days
+"""Public sessions with no activity for this many seconds are deleted."""
+
+CLEANUP_FREQUENCY = 60 * 60 * 1  # 1 hour
+"""How often the cleanup worker runs."""
+
+CLEANUP_BATCH_SIZE = 500
+"""Expired sessions deleted per batch."""
+
+CLEANUP_LEASE_NAME = "public_session_cleanup"
+
+CLEANUP_LEASE_DURATION = CLEANUP_FREQUENCY + 60 * 5
+"""The leader renews the lease each run. If it goes away another process takes over once the lease expires."""
+
+SQL_CREATE_PUBLIC_SESSION_ACTIVITY_TABLE = """
+CREATE TABLE IF NOT EXISTS public_session_activity (
+    session_id TEXT PRIMARY KEY,
+    last_activity_at INTEGER NOT NULL -- unix time
+)
+"""
+
+SQL_CREATE_PUBLIC_SESSION_ACTIVITY_INDEX = "CREATE INDEX IF NOT EXISTS idx_public_session_activity_last_activity_at ON public_session_activity (last_activity_at)"
+
+SQL_CREATE_WORKER_LEASES_TABLE = """
+CREATE TABLE IF NOT EXISTS worker_leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at INTEGER NOT NULL -- unix time
+)
+"""
+
+SQL_RECORD_ACTIVITY = """
+INSERT INTO public_session_activity (session_id, last_activity_at) VALUES (?, ?)
+ON CONFLICT (session_id) DO UPDATE SET last_activity_at = MAX(last_activity_at, excluded.last_activity_at)
+"""
+
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+def record_activity(session_id: str, at: Optional[int] = None) -> None:
+    """Record activity on a public session so its history isn't cleaned up.
+
+    Args:
+        session_id (str): the public session id.
+        at (Optional[int]): unix time of the activity. Defaults to now.
+    """
+    row = (session_id, at if at is not None else int(time.time()))
+    if write_behind.is_enabled():
+        write_behind.enqueue(
+            get_sqlite_global_system_file(),
+            SQL_RECORD_ACTIVITY,
+            [row],
+            init_sql=(SQL_CREATE_PUBLIC_SESSION_ACTIVITY_TABLE, SQL_CREATE_PUBLIC_SESSION_ACTIVITY_INDEX),
+        )
+        return
+    with closing(sqlite3.connect(get_sqlite_global_system_file())) as connection, closing(
+        connection.cursor()
+    ) as cursor:
+        cursor.execute(SQL_CREATE_PUBLIC_SESSION_ACTIVITY_TABLE)
+        cursor.execute(SQL_CREATE_PUBLIC_SESSION_ACTIVITY_INDEX)
+        cursor.execute(SQL_RECORD_ACTIVITY, row)
+        connection.commit()
+
+
+def acquire_lease(name: str, holder: str, duration_sec: int) -> bool:
+    """Acquire or renew a named lease. Returns True if `holder` holds the lease for the next `duration_sec`.
+
+    A single upsert so two processes can't both take an expired lease.
+    """
+    now = int(time.time())
+    with closing(sqlite3.connect(get_sqlite_global_system_file())) as connection, closing(
+        connection.cursor()
+    ) as cursor:
+        cursor.execute(
+            """
+            INSERT INTO worker_leases (name, holder, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+            WHERE worker_leases.holder = excluded.holder OR worker_leases.expires_at < ?
+            """,
+            (name, holder, now + duration_sec, now),
+        )
+        connection.commit()
+        return cursor.rowcount == 1
+
+
+def _delete_session_history(session_ids: list[str]) -> None:
+    """Delete the usage data of public sessions in both the per owner and consolidated layouts."""
+    for session_id in session_ids:
+        dir_ = get_public_sqlite_usage_dir(session_id)
+        if dir_ is not None:
+            with suppress(FileNotFoundError):
+                shutil.rmtree(dir_)
+
+    if get_usage_db_mode() != UsageDbMode.CONSOLIDATED:
+        return
+    partitions = [get_usage_partition(session_id, public=True) for session_id in session_ids]
+    placeholders = ", ".join("?" * len(partitions))
+    with closing(sqlite3.connect(partitions[0].file)) as connection, closing(connection.cursor()) as cursor:
+        tablenames = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        for feature_type in OrganisationFeatureType:
+            history_table = get_history_table_name(feature_type)
+            for tablename in (f"{history_table}_sources", history_table, get_history_thread_table_name(feature_type)):
+                if tablename in tablenames:
+                    cursor.execute(
+                        f"DELETE FROM {tablename} WHERE scope = ? AND owner_id IN ({placeholders})",  # noqa: S608
+                        (partitions[0].scope, *[partition.owner_id for partition in partitions]),
+                    )
+        connection.commit()
+
+
+def reap_expired_sessions(
+    inactivity_threshold_sec: int = INACTIVITY_THRESHOLD, batch_size: int = CLEANUP_BATCH_SIZE
+) -> int:
+    """Delete the history of public sessions inactive for longer than the threshold, in batches.
+
+    Returns:
+        int: the number of sessions deleted.
+    """
+    with tracer.start_as_current_span("public_sessions.reap_expired_sessions") as span:
+        cutoff = int(time.time()) - inactivity_threshold_sec
+        reaped, batches = 0, 0
+        with closing(sqlite3.connect(get_sqlite_global_system_file())) as connection, closing(
+            connection.cursor()
+        ) as cursor:
+            while True:
+                session_ids = [
+                    row[0]
+                    for row in cursor.execute(
+                        "SELECT session_id FROM public_session_activity WHERE last_activity_at < ? ORDER BY last_activity_at LIMIT ?",
+                        (cutoff, batch_size),
+                    ).fetchall()
+                ]
+                if not session_ids:
+                    break
+                _delete_session_history(session_ids)
+                placeholders = ", ".join("?" * len(session_ids))
+                cursor.execute(
+                    f"DELETE FROM public_session_activity WHERE session_id IN ({placeholders}) AND last_activity_at < ?",  # noqa: S608
+                    (*session_ids, cutoff),
+                )
+                connection.commit()
+                reaped += len(session_ids)
+                batches += 1
+                sessions_reaped_counter.add(len(session_ids))
+                if len(session_ids) < batch_size:
+                    break
+
+        span.set_attributes({"sessions_reaped": reaped, "batches": batches})
+        if reaped > 0:
+            log.info("Removed public chat history for %s expired sessions", reaped)
+        return reaped
+
+
+def _run_cleanup_worker() -> None:
+    holder = f"{socket.gethostname()}:{os.getpid()}"
+    while True:
+        try:
+            if acquire_lease(CLEANUP_LEASE_NAME, holder, CLEANUP_LEASE_DURATION):
+                write_behind.flush(get_sqlite_global_system_file())
+                reap_expired_sessions()
+        except Exception as e:
+            log.error("Public session cleanup failed: %s", e)
+        time.sleep(CLEANUP_FREQUENCY)
+
+
+def _init_tables() -> None:
+    with closing(sqlite3.connect(get_sqlite_global_system_file())) as connection, closing(
+        connection.cursor()
+    ) as cursor:
+        cursor.execute(SQL_CREATE_PUBLIC_SESSION_ACTIVITY_TABLE)
+        cursor.execute(SQL_CREATE_PUBLIC_SESSION_ACTIVITY_INDEX)
+        cursor.execute(SQL_CREATE_WORKER_LEASES_TABLE)
+        connection.commit()
+
+
+def _init() -> None:
+    """Create the tables and start this process' cleanup worker. Safe to call more than once."""
+    global _worker
+    _init_tables()
+    with _worker_lock:
+        if _worker is not None:
+            return
+        _worker = threading.Thread(target=_run_cleanup_worker, name="docq-public-session-cleanup", daemon=True)
+        _worker.start()
@@ -0,0 +1,276 @@
+"""Auth session stores.
+
+A session is keyed by the hmac session id held in the browser cookie and holds the session id and the encrypted
+session data. Sessions expire `ttl_sec` after they were last used (sliding expiry).
+
+- `SqliteSessionStore`, the default, keeps sessions in a WAL mode SQLite file in the data dir. Sessions survive
+  restarts and are shared by every process on the node using the same `DOCQ_DATA`. Expired rows are ignored on read
+  and deleted in batches by a sweep that runs at most every `SWEEP_INTERVAL_SEC` per process.
+- `MemorySessionStore` keeps sessions in process. Only for a single process e.g. local dev.
+
+Set with the DOCQ_SESSION_STORE env var, `sqlite` or `memory`.
+"""
+
+import logging as log
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import closing
+from dataclasses import dataclass
+from enum import Enum
+from typing import Optional, Self
+
+from cachetools import TTLCache
+from opentelemetry import trace
+
+import docq
+
+from ..config import ENV_VAR_DOCQ_SESSION_STORE
+from .store import get_sqlite_session_file
+
+tracer = trace.get_tracer(__name__, docq.__version_str__)
+
+SESSION_TTL_SEC = 60 * 60 * 1  # 1 hour
+"""Sessions expire this long after they were last used."""
+
+TOUCH_INTERVAL_SEC = 60
+"""A read only extends the expiry if it was last extended longer ago than this. Saves a write on every read."""
+
+SWEEP_INTERVAL_SEC = 60 * 5
+"""How often each process deletes expired sessions."""
+
+SWEEP_BATCH_SIZE = 500
+"""Expired sessions deleted per transaction so a sweep never holds the write lock for long."""
+
+MEMORY_STORE_MAX_SESSIONS = 1024 * 10
+
+SQL_CREATE_AUTH_SESSIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS auth_sessions (
+    hmac_session_id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    data BLOB,
+    expires_at INTEGER NOT NULL -- unix time
+)
+"""
+
+SQL_CREATE_AUTH_SESSIONS_EXPIRES_AT_INDEX = (
+    "CREATE INDEX IF NOT EXISTS idx_auth_sessions_expires_at ON auth_sessions (expires_at)"
+)
+
+
+class SessionStoreType(Enum):
+    """Where auth sessions are kept. Set with the DOCQ_SESSION_STORE env var."""
+
+    SQLITE = "sqlite"
+    """A WAL mode SQLite file in the data dir shared by all processes. The default."""
+    MEMORY = "memory"
+    """In process memory. Sessions are lost on restart and not shared between processes."""
+
+
+@dataclass
+class Session:
+    """An auth session."""
+
+    session_id: str
+    data: Optional[bytes] = None
+    """Encrypted session data."""
+
+
+class SessionStore(ABC):
+    """Auth session store."""
+
+    def __init__(self: Self, ttl_sec: int = SESSION_TTL_SEC) -> None:
+        """Initialise the store."""
+        self.ttl_sec = ttl_sec
+
+    def init(self: Self) -> None:  # noqa: B027
+        """Create any storage the store needs. Safe to call more than once."""
+
+    @abstractmethod
+    def get(self: Self, hmac_session_id: str) -> Optional[Session]:
+        """Get a session that hasn't expired, and extend its expiry."""
+
+    @abstractmethod
+    def put(self: Self, hmac_session_id: str, session: Session) -> None:
+        """Create or replace a session and reset its expiry."""
+
+    @abstractmethod
+    def delete(self: Self, hmac_session_id: str) -> None:
+        """Remove a session."""
+
+    def sweep_expired(self: Self) -> int:
+        """Delete expired sessions. Returns the number deleted."""
+        return 0
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions in process memory."""
+
+    def __init__(self: Self, ttl_sec: int = SESSION_TTL_SEC, max_sessions: int = MEMORY_STORE_MAX_SESSIONS) -> None:
+        """Initialise the store."""
+        super().__init__(ttl_sec)
+        self._sessions: TTLCache[str, Session] = TTLCache(max_sessions, ttl_sec)
+        self._lock = threading.Lock()
+
+    def get(self: Self, hmac_session_id: str) -> Optional[Session]:
+        """Get a session that hasn't expired, and extend its expiry."""
+        with self._lock:
+            session = self._sessions.get(hmac_session_id)
+            if session is not None:
+                self._sessions[hmac_session_id] = session
+            return session
+
+    def put(self: Self, hmac_session_id: str, session: Session) -> None:
+        """Create or replace a session and reset its expiry."""
+        with self._lock:
+            self._sessions[hmac_session_id] = session
+
+    def delete(self: Self, hmac_session_id: str) -> None:
+        """Remove a session."""
+        with self._lock:
+            self._sessions.pop(hmac_session_id, None)
+
+
+class SqliteSessionStore(SessionStore):
+    """Sessions in a WAL mode SQLite file shared by all processes using the file."""
+
+    def __init__(
+        self: Self,
+        sqlite_file: Optional[str] = None,
+        ttl_sec: int = SESSION_TTL_SEC,
+        touch_interval_sec: int = TOUCH_INTERVAL_SEC,
+        sweep_interval_sec: int = SWEEP_INTERVAL_SEC,
+        sweep_batch_size: int = SWEEP_BATCH_SIZE,
+    ) -> None:
+        """Initialise the store.
+
+        Args:
+            sqlite_file (Optional[str]): the SQLite file. Defaults to the sessions file in the data dir.
+            ttl_sec (int): sessions expire this long after they were last used.
+            touch_interval_sec (int): minimum time between expiry extensions of a session on read.
+            sweep_interval_sec (int): how often this process deletes expired sessions.
+            sweep_batch_size (int): expired sessions deleted per transaction.
+        """
+        super().__init__(ttl_sec)
+        self._sqlite_file = sqlite_file
+        self.touch_interval_sec = touch_interval_sec
+        self.sweep_interval_sec = sweep_interval_sec
+        self.sweep_batch_size = sweep_batch_size
+        self._initialised_files: set[str] = set()
+        self._swept_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def sqlite_file(self: Self) -> str:
+        """The SQLite file sessions are stored in."""
+        return self._sqlite_file or get_sqlite_session_file()
+
+    def init(self: Self) -> None:
+        """Create the sessions table and switch the file to WAL so readers in other processes aren't blocked."""
+        sqlite_file = self.sqlite_file
+        if sqlite_file in self._initialised_files:
+            return
+        with closing(sqlite3.connect(sqlite_file)) as connection, closing(connection.cursor()) as cursor:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute(SQL_CREATE_AUTH_SESSIONS_TABLE)
+            cursor.execute(SQL_CREATE_AUTH_SESSIONS_EXPIRES_AT_INDEX)
+            connection.commit()
+        with self._lock:
+            self._initialised_files.add(sqlite_file)
+
+    def _connect(self: Self) -> sqlite3.Connection:
+        self.init()
+        return sqlite3.connect(self.sqlite_file)
+
+    def get(self: Self, hmac_session_id: str) -> Optional[Session]:
+        """Get a session that hasn't expired, and extend its expiry if it wasn't extended in the last touch interval."""
+        now = int(time.time())
+        with closing(self._connect()) as connection, closing(connection.cursor()) as cursor:
+            row = cursor.execute(
+                "SELECT session_id, data, expires_at FROM auth_sessions WHERE hmac_session_id = ? AND expires_at > ?",
+                (hmac_session_id, now),
+            ).fetchone()
+            if row is None:
+                return None
+            session_id, data, expires_at = row
+            if expires_at - now < self.ttl_sec - self.touch_interval_sec:
+                cursor.execute(
+                    "UPDATE auth_sessions SET expires_at = ? WHERE hmac_session_id = ?",
+                    (now + self.ttl_sec, hmac_session_id),
+                )
+                connection.commit()
+        return Session(session_id=session_id, data=data)
+
+    def put(self: Self, hmac_session_id: str, session: Session) -> None:
+        """Create or replace a session and reset its expiry."""
+        with closing(self._connect()) as connection, closing(connection.cursor()) as cursor:
+            cursor.execute(
+                """
+                INSERT INTO auth_sessions (hmac_session_id, session_id, data, expires_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (hmac_session_id) DO UPDATE SET
+                    session_id = excluded.session_id, data = excluded.data, expires_at = excluded.expires_at
+                """,
+                (hmac_session_id, session.session_id, session.data, int(time.time()) + self.ttl_sec),
+            )
+            connection.commit()
+        self._sweep_if_due()
+
+    def delete(self: Self, hmac_session_id: str) -> None:
+        """Remove a session."""
+        with closing(self._connect()) as connection, closing(connection.cursor()) as cursor:
+            cursor.execute("DELETE FROM auth_sessions WHERE hmac_session_id = ?", (hmac_session_id,))
+            connection.commit()
+
+    def sweep_expired(self: Self) -> int:
+        """Delete expired sessions in batches, committing after each. Returns the number deleted."""
+        with tracer.start_as_current_span("session_store.sweep_expired") as span:
+            now, deleted = int(time.time()), 0
+            with closing(self._connect()) as connection, closing(connection.cursor()) as cursor:
+                while True:
+                    cursor.execute(
+                        """
+                        DELETE FROM auth_sessions WHERE rowid IN (
+                            SELECT rowid FROM auth_sessions WHERE expires_at <= ? LIMIT ?
+                        )
+                        """,
+                        (now, self.sweep_batch_size),
+                    )
+                    connection.commit()
+                    deleted += cursor.rowcount
+                    if cursor.rowcount < self.sweep_batch_size:
+                        break
+            span.set_attribute("sessions_deleted", deleted)
+            return deleted
+
+    def _sweep_if_due(self: Self) -> None:
+        with self._lock:
+            if time.monotonic() - self._swept_at < self.sweep_interval_sec:
+                return
+            self._swept_at = time.monotonic()
+        try:
+            self.sweep_expired()
+        except sqlite3.Error as e:
+            log.error("Failed to sweep expired auth sessions: %s", e)
+
+
+def get_session_store_type() -> SessionStoreType:
+    """Get the session store type from the DOCQ_SESSION_STORE env var. Defaults to SQLite."""
+    return SessionStoreType(os.environ.get(ENV_VAR_DOCQ_SESSION_STORE, SessionStoreType.SQLITE.value).lower())
+
+
+_store: Optional[SessionStore] = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """Get this process' session store, creating it based on DOCQ_SESSION_STORE on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store_type = get_session_store_type()
+                _store = SqliteSessionStore() if store_type == SessionStoreType.SQLITE else MemorySessionStore()
+                log.info("Using %s auth session store", store_type.value)
+    return _store
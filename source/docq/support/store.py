@@ -2,15 +2,12 @@
 
 import logging as log
 import os
-import shutil
-import time
-from contextlib import suppress
+from dataclasses import dataclass
 from enum import Enum
-from threading import Timer
-from typing import Optional
+from typing import Optional, Self
 
 import docq
-from docq.config import ENV_VAR_DOCQ_DATA, OrganisationFeatureType, SpaceType
+from docq.config import ENV_VAR_DOCQ_DATA, ENV_VAR_DOCQ_USAGE_DB_MODE, OrganisationFeatureType, SpaceType
 from docq.domain import SpaceKey
 from llama_index.core.storage import StorageContext
 from opentelemetry import trace
@@ -24,7 +21,9 @@ class _StoreDir(Enum):
     SQLITE = "sqlite"
     INDEX = "index"
     UPLOAD = "upload"
+    UPLOAD_PARTIAL = "upload_partial"
     MODELS = "models"
+    DOWNLOAD = "download"
 
 
 class _SqliteFilename(Enum):
@@ -33,6 +32,8 @@ class _SqliteFilename(Enum):
     USAGE = "usage.db"
     SYSTEM = "system.db"
     SLACK_MESSAGES = "slack_messages.db"
+    SESSIONS = "sessions.db"
+    DEDUPE = "dedupe.db"
 
 
 class _DataScope(Enum):
@@ -55,13 +56,38 @@ class _DataScope(Enum):
     """DEPRECATED. don't use for new features. Typically should use PERSONAL instead. Here for backwards compatibility."""
 
 
+class UsageDbMode(Enum):
+    """How usage data (chat history) is laid out in SQLite. Set with the DOCQ_USAGE_DB_MODE env var."""
+
+    PER_OWNER = "per_owner"
+    """One usage.db per user, and per session for public sessions. The default."""
+    CONSOLIDATED = "consolidated"
+    """A single usage.db for everyone with rows partitioned by (scope, owner_id)."""
+
+
+@dataclass(frozen=True)
+class UsagePartition:
+    """Where an owner's usage data lives.
+
+    With the consolidated layout every owner shares `file` and rows are keyed by (scope, owner_id).
+    """
+
+    file: str
+    scope: str
+    """PERSONAL or PUBLIC data scope value."""
+    owner_id: str
+    """The user id, or the session id for public sessions."""
+    consolidated: bool = False
+
+    @property
+    def public(self: Self) -> bool:
+        """True if this is a public session's usage data."""
+        return self.scope == _DataScope.PUBLIC.value
+
+
 HISTORY_TABLE_NAME = "history_{feature}"
 HISTORY_THREAD_TABLE_NAME = "history_thread_{feature}"
 
-# These variable are used to clean up public chat history.
-INACTIVITY_THRESHOLD = 60 * 60 * 2 * 24  # 1 day
-CLEANUP_FREQUENCY = 60 * 60 * 1  # 1 hour
-
 
 def _get_path(
     store: _StoreDir, data_scope: _DataScope, subtype: Optional[str] = None, filename: Optional[str] = None
@@ -139,6 +165,16 @@ def _map_space_type_to_datascope(space_type: SpaceType) -> _DataScope:
         raise ValueError(f"Invalid space type: {space_type}")
     return data_scope
 
+def get_partial_upload_file(space: SpaceKey, filename: str) -> str:
+    """Get the file an upload to a space is written to until it's complete. Kept out of the upload dir so it isn't indexed."""
+    return _get_path(
+        store=_StoreDir.UPLOAD_PARTIAL,
+        data_scope=_map_space_type_to_datascope(space.type_),
+        subtype=os.path.join(str(space.org_id), str(space.id_)),
+        filename=filename,
+    )
+
+
 def get_index_dir(space: SpaceKey) -> str:
     """Get the index directory for a space."""
     _data_scope = _map_space_type_to_datascope(space.type_)
@@ -146,6 +182,13 @@ def get_index_dir(space: SpaceKey) -> str:
         store=_StoreDir.INDEX, data_scope=_data_scope, subtype=os.path.join(str(space.org_id), str(space.id_))
     )
 
+def get_download_cache_dir(space: SpaceKey) -> str:
+    """Get the directory where files fetched from a space's remote data source are cached between reindexes."""
+    _data_scope = _map_space_type_to_datascope(space.type_)
+    return _get_path(
+        store=_StoreDir.DOWNLOAD, data_scope=_data_scope, subtype=os.path.join(str(space.org_id), str(space.id_))
+    )
+
 def get_sqlite_usage_file(user_id: int) -> str:
     """Get the SQLite file for storing usage related data. All usage related data is segregated by user i.e. inherently PERSONAL."""
     return _get_path(
@@ -156,12 +199,54 @@ def get_sqlite_usage_file(user_id: int) -> str:
     )
 
 
+def get_usage_db_mode() -> UsageDbMode:
+    """Get the usage db layout from the DOCQ_USAGE_DB_MODE env var. Defaults to per owner files."""
+    return UsageDbMode(os.environ.get(ENV_VAR_DOCQ_USAGE_DB_MODE, UsageDbMode.PER_OWNER.value).lower())
+
+
+def get_sqlite_consolidated_usage_file() -> str:
+    """Get the SQLite file holding usage data for all users and public sessions in the consolidated layout."""
+    return _get_path(store=_StoreDir.SQLITE, data_scope=_DataScope.GLOBAL, filename=_SqliteFilename.USAGE.value)
+
+
+def get_usage_partition(owner_id: int | str, public: bool = False) -> UsagePartition:
+    """Get where usage data for a user, or a public session if `public`, is stored based on the usage db mode."""
+    scope = _DataScope.PUBLIC if public else _DataScope.PERSONAL
+    if get_usage_db_mode() == UsageDbMode.CONSOLIDATED:
+        return UsagePartition(get_sqlite_consolidated_usage_file(), scope.value, str(owner_id), consolidated=True)
+    file_ = get_public_sqlite_usage_file(str(owner_id)) if public else get_sqlite_usage_file(owner_id)  # type: ignore[arg-type]
+    return UsagePartition(file_, scope.value, str(owner_id))
+
+
+def list_sqlite_usage_partitions() -> list[UsagePartition]:
+    """List the per owner usage SQLite files that exist, as partitions. Used to migrate to the consolidated layout."""
+    partitions = []
+    for data_scope in (_DataScope.PERSONAL, _DataScope.PUBLIC):
+        scope_dir = _get_path(store=_StoreDir.SQLITE, data_scope=data_scope)
+        for dir_ in os.listdir(scope_dir):
+            usage_file = os.path.join(scope_dir, dir_, _SqliteFilename.USAGE.value)
+            if os.path.isfile(usage_file):
+                partitions.append(UsagePartition(usage_file, data_scope.value, dir_))
+    return partitions
+
+
+def list_sqlite_usage_files() -> list[str]:
+    """List the existing personal and public usage SQLite files. Used by migrations that apply to every user's usage data."""
+    return [partition.file for partition in list_sqlite_usage_partitions()]
+
+
 def get_public_sqlite_usage_file(id_: str) -> str:
     """Get the SQLite file for storing usage related data for public spaces."""
     return _get_path(
         store=_StoreDir.SQLITE, data_scope=_DataScope.PUBLIC, subtype=id_, filename=_SqliteFilename.USAGE.value
     )
 
+def get_public_sqlite_usage_dir(id_: str) -> Optional[str]:
+    """Get the directory holding a public session's usage data without creating it. None if `id_` isn't a valid dir name."""
+    if id_ in ("", ".", "..") or os.path.basename(id_) != id_:
+        return None
+    return os.path.join(_get_path(store=_StoreDir.SQLITE, data_scope=_DataScope.PUBLIC), id_)
+
 def get_sqlite_shared_system_file() -> str:
     """Get the SQLite file for storing global scoped system data."""
     # TODO: migrate old features over to use DataScope.GLOBAL. Requires migration scripts because shared has global and org scoped data.
@@ -171,6 +256,14 @@ def get_sqlite_global_system_file() -> str:
     """Get the SQLite file for storing global scoped system data."""
     return _get_path(store=_StoreDir.SQLITE, data_scope=_DataScope.GLOBAL, filename=_SqliteFilename.SYSTEM.value)
 
+def get_sqlite_session_file() -> str:
+    """Get the SQLite file for storing web auth sessions shared by all the processes using the data dir."""
+    return _get_path(store=_StoreDir.SQLITE, data_scope=_DataScope.GLOBAL, filename=_SqliteFilename.SESSIONS.value)
+
+def get_sqlite_dedupe_file() -> str:
+    """Get the SQLite file for keys of events already seen, shared by all the processes using the data dir."""
+    return _get_path(store=_StoreDir.SQLITE, data_scope=_DataScope.GLOBAL, filename=_SqliteFilename.DEDUPE.value)
+
 def get_sqlite_user_system_file(user_id: int) -> str:
     """Get the SQLite file for storing user scoped system data."""
     return _get_path(store=_StoreDir.SQLITE, data_scope=_DataScope.PERSONAL, subtype=str(user_id), filename=_SqliteFilename.SYSTEM.value)
@@ -201,24 +294,6 @@ def get_history_thread_table_name(type_: OrganisationFeatureType) -> str:
     return HISTORY_THREAD_TABLE_NAME.format(feature=type_.name.lower())
 
 
-def _clean_public_chat_history() -> None:
-    """Clean public chat history."""
-    scheduler = Timer(CLEANUP_FREQUENCY, _clean_public_chat_history)
-    scheduler.daemon = True
-    scheduler.start()
-
-    public_session_data_dir = _get_path(_StoreDir.SQLITE, _DataScope.PUBLIC)
-    current_time = int(time.time())
-
-    for dir_ in os.listdir(public_session_data_dir):
-        dir_path = os.path.join(public_session_data_dir, dir_)
-        last_activity = os.path.getmtime(dir_path)
-        time_diffence = current_time - last_activity
-        if time_diffence > INACTIVITY_THRESHOLD:
-            with suppress(FileNotFoundError):
-                log.info("Removing public chat history for session %s", dir_)
-                shutil.rmtree(dir_path)
-
 @tracer.start_as_current_span(name="_get_storage_context")
 def _get_storage_context(space: SpaceKey) -> StorageContext:
     """Get the storage context for a Space. This loads all stores from the Space directory aka `persist_dir`."""
@@ -228,8 +303,3 @@ def _get_storage_context(space: SpaceKey) -> StorageContext:
 @tracer.start_as_current_span(name="_get_default_storage_context")
 def _get_default_storage_context() -> StorageContext:
     return StorageContext.from_defaults()
-
-
-def _init() -> None:
-    """Initialise storage."""
-    _clean_public_chat_history()
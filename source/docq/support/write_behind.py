@@ -0,0 +1,397 @@
+"""Write-behind persistence for SQLite.
+
+Writes are queued in memory and a background thread flushes them in batches, one transaction per database file, using
+`executemany`. This takes the open, commit and fsync per write off the request path.
+
+- The queue is bounded. `enqueue` blocks when it's full until the flusher catches up.
+- `enqueue_write(db_file, fn, *args)` queues `fn(cursor, *args)` for writes that need more than one statement, e.g. to
+  insert rows that reference the ids SQLite assigns to other rows.
+- `flush(db_file)` writes everything pending for a file. Call it before reading from that file to read your own writes.
+  Flushes of different files don't wait for each other.
+- Batches are never dropped. A batch that fails as a whole, e.g. the database is locked, stays queued and is retried on
+  the next flush. A single write the database rejects, e.g. a constraint violation, is spilled to a file next to the
+  database and logged so it can't block the queue. Anything still queued when the writer stops is spilled too.
+- Optionally the databases are switched to WAL journal mode so readers aren't blocked by the flusher.
+
+Enabled with `DOCQ_WRITE_BEHIND=true`. When disabled, callers write synchronously as before.
+"""
+
+import atexit
+import json
+import logging as log
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Optional, Self, TypeVar
+
+from opentelemetry import trace
+
+import docq
+
+from ..config import ENV_VAR_DOCQ_SQLITE_WAL, ENV_VAR_DOCQ_WRITE_BEHIND
+
+tracer = trace.get_tracer(__name__, docq.__version_str__)
+
+T = TypeVar("T")
+
+MAX_PENDING_ROWS = 10000
+"""Upper bound on rows queued in memory. `enqueue` blocks when reached."""
+
+FLUSH_INTERVAL_SEC = 0.5
+"""How often the background flusher writes queued rows."""
+
+SPILL_FILE_SUFFIX = ".write-behind-failed.jsonl"
+"""Writes that can't be written are appended, one JSON object per line, to the database file name plus this suffix."""
+
+
+@dataclass
+class _PendingWrite:
+    sql: str
+    rows: list[tuple]
+    init_sql: tuple[str, ...] = ()
+    attempts: int = 0
+    # a write run with the flush's cursor instead of `sql`, and the future for its result.
+    write: Optional[Callable[[sqlite3.Cursor], Any]] = None
+    future: Optional[Future] = None
+    result: Any = None
+    error: Optional[Exception] = None
+
+    @property
+    def size(self: Self) -> int:
+        """Rows counted against the queue bound."""
+        return max(1, len(self.rows))
+
+
+class WriteBehindWriter:
+    """Queue SQLite writes in memory and flush them in batches from a background thread."""
+
+    def __init__(
+        self: Self,
+        max_pending_rows: int = MAX_PENDING_ROWS,
+        flush_interval_sec: float = FLUSH_INTERVAL_SEC,
+        wal: bool = False,
+    ) -> None:
+        """Initialize the writer. Call `start()` to start the background flusher.
+
+        Args:
+            max_pending_rows (int): rows queued before `enqueue` blocks.
+            flush_interval_sec (float): how often the background flusher runs.
+            wal (bool): switch database files to WAL journal mode before writing.
+        """
+        self.max_pending_rows = max_pending_rows
+        self.flush_interval_sec = flush_interval_sec
+        self.wal = wal
+        self._pending: dict[str, list[_PendingWrite]] = defaultdict(list)
+        self._pending_rows = 0
+        self._condition = threading.Condition()
+        # held for the duration of a flush of a file so a read-your-writes flush waits for a background flush of it.
+        self._flush_locks: dict[str, threading.Lock] = defaultdict(threading.Lock)
+        self._wal_files: set[str] = set()
+        self._initialised: set[tuple[str, str]] = set()  # (db_file, init_sql) already run
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    @property
+    def running(self: Self) -> bool:
+        """True while the background flusher is running."""
+        return self._running
+
+    def start(self: Self) -> None:
+        """Start the background flusher. Pending writes are flushed at interpreter exit."""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="docq-write-behind", daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self: Self) -> None:
+        """Stop the background flusher and flush everything pending. Writes that still fail are spilled to disk."""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+        with self._condition:
+            batches = dict(self._pending)
+            self._pending.clear()
+            self._pending_rows = 0
+        for db_file, writes in batches.items():
+            self._spill(db_file, writes, "still failing when the write-behind writer stopped")
+
+    def enqueue(self: Self, db_file: str, sql: str, rows: list[tuple], init_sql: tuple[str, ...] = ()) -> None:
+        """Queue rows to be written with `sql`.
+
+        Args:
+            db_file (str): the SQLite file to write to.
+            sql (str): a parameterised statement executed with `executemany` for the rows.
+            rows (list[tuple]): the parameters, one tuple per row.
+            init_sql (tuple[str, ...]): statements e.g. `CREATE TABLE IF NOT EXISTS` run once per file before writing.
+        """
+        self._queue(db_file, _PendingWrite(sql, rows, init_sql))
+
+    def enqueue_write(
+        self: Self, db_file: str, fn: Callable[..., Any], *args: Any, init_sql: tuple[str, ...] = ()
+    ) -> None:
+        """Queue `fn(cursor, *args)` to run in the transaction of a flush of `db_file`.
+
+        Retried and spilled like rows queued with `enqueue`. Spilled writes are recorded with the name of `fn` and args.
+
+        Args:
+            db_file (str): the SQLite file to write to.
+            fn (Callable[..., Any]): runs the write's statements with the flush's cursor. Must not commit.
+            *args (Any): passed to `fn` after the cursor.
+            init_sql (tuple[str, ...]): statements e.g. `CREATE TABLE IF NOT EXISTS` run once per file before writing.
+        """
+        self._queue(
+            db_file,
+            _PendingWrite(
+                f"{fn.__module__}.{fn.__qualname__}", [args], init_sql, write=lambda cursor: fn(cursor, *args)
+            ),
+        )
+
+    def submit(
+        self: Self, db_file: str, write: Callable[[sqlite3.Cursor], T], init_sql: tuple[str, ...] = ()
+    ) -> "Future[T]":
+        """Queue `write(cursor)` to run in the transaction of the next flush of `db_file`.
+
+        Unlike `enqueue` the write isn't retried. If it, or the transaction, fails the error is set on the future.
+
+        Args:
+            db_file (str): the SQLite file to write to.
+            write (Callable[[sqlite3.Cursor], T]): runs the write's statements with the flush's cursor. Must not commit.
+            init_sql (tuple[str, ...]): statements e.g. `CREATE TABLE IF NOT EXISTS` run once per file before writing.
+
+        Returns:
+            Future[T]: the result of `write` once flushed.
+        """
+        future: Future[T] = Future()
+        self._queue(db_file, _PendingWrite("", [], init_sql, write=write, future=future))
+        return future
+
+    def _queue(self: Self, db_file: str, pending: _PendingWrite) -> None:
+        with self._condition:
+            while self._running and self._pending_rows >= self.max_pending_rows:
+                self._condition.notify_all()
+                self._condition.wait(self.flush_interval_sec)
+            self._pending[db_file].append(pending)
+            self._pending_rows += pending.size
+            if self._pending_rows >= self.max_pending_rows:
+                self._condition.notify_all()
+            running = self._running
+
+        if not running:
+            self.flush(db_file)
+
+    def has_pending(self: Self, db_file: Optional[str] = None) -> bool:
+        """True if there are writes queued for `db_file`, or any file if None."""
+        with self._condition:
+            return bool(self._pending.get(db_file)) if db_file is not None else self._pending_rows > 0
+
+    def flush(self: Self, db_file: Optional[str] = None) -> None:
+        """Write everything queued for `db_file`, or all files if None, and wait for it to complete."""
+        with self._condition:
+            files = [db_file] if db_file is not None else list(self._pending)
+        for file_ in files:
+            self._flush_file(file_)
+
+    def _flush_file(self: Self, db_file: str) -> None:
+        with self._condition:
+            lock = self._flush_locks[db_file]
+        with lock:
+            with self._condition:
+                writes = self._pending.pop(db_file, [])
+                self._pending_rows -= sum(w.size for w in writes)
+                self._condition.notify_all()
+            if writes:
+                self._write(db_file, writes)
+
+    def _write(self: Self, db_file: str, writes: list[_PendingWrite]) -> None:
+        """Write a batch to one file in a single transaction.
+
+        A batch that fails as a whole is re-queued. A write rejected on its own is rolled back to its savepoint and
+        spilled, or its error set on its future, while the rest of the batch is committed.
+        """
+        row_count = sum(len(w.rows) for w in writes)
+        with tracer.start_as_current_span("write_behind.flush") as span:
+            span.set_attributes({"rows": row_count, "statements": len(writes)})
+            try:
+                with closing(sqlite3.connect(db_file, detect_types=sqlite3.PARSE_DECLTYPES)) as connection, closing(
+                    connection.cursor()
+                ) as cursor:
+                    if self.wal and db_file not in self._wal_files:
+                        cursor.execute("PRAGMA journal_mode=WAL")
+                        self._wal_files.add(db_file)
+                    init_sql = [
+                        sql
+                        for sql in dict.fromkeys(sql for w in writes for sql in w.init_sql)
+                        if (db_file, sql) not in self._initialised
+                    ]
+                    for sql in init_sql:
+                        cursor.execute(sql)
+                    connection.commit()
+                    self._initialised.update((db_file, sql) for sql in init_sql)
+                    try:
+                        # take the write lock up front so a busy database fails the batch as a whole.
+                        cursor.execute("BEGIN IMMEDIATE")
+                        self._execute(cursor, writes)
+                        connection.commit()
+                    except sqlite3.Error:
+                        connection.rollback()
+                        raise
+            except sqlite3.Error as e:
+                log.error("write_behind: failed to write %s rows to '%s', will retry: %s", row_count, db_file, e)
+                span.record_exception(e)
+                span.set_status(trace.Status(trace.StatusCode.ERROR, "write-behind flush failed"))
+                self._initialised.difference_update([(f, sql) for f, sql in self._initialised if f == db_file])
+                self._requeue(db_file, writes, e)
+                return
+
+            rejected = [w for w in writes if w.error is not None and w.future is None]
+            if rejected:
+                span.set_status(trace.Status(trace.StatusCode.ERROR, "write-behind writes rejected"))
+                self._spill(db_file, rejected, "rejected by the database")
+            for w in writes:
+                if w.future is not None:
+                    if w.error is not None:
+                        w.future.set_exception(w.error)
+                    else:
+                        w.future.set_result(w.result)
+
+    @staticmethod
+    def _execute(cursor: sqlite3.Cursor, writes: list[_PendingWrite]) -> None:
+        """Run the writes, each group in a savepoint, recording the result or error on each write.
+
+        Consecutive writes with the same statement are merged into one executemany, keeping order. If the group is
+        rejected its writes are run one by one to find the culprit. An `OperationalError` fails the whole batch.
+        """
+        i = 0
+        while i < len(writes):
+            j = i + 1
+            if writes[i].write is None:
+                while j < len(writes) and writes[j].write is None and writes[j].sql == writes[i].sql:
+                    j += 1
+            group = writes[i:j]
+            if not WriteBehindWriter._execute_group(cursor, group) and len(group) > 1:
+                for w in group:
+                    WriteBehindWriter._execute_group(cursor, [w])
+            i = j
+
+    @staticmethod
+    def _execute_group(cursor: sqlite3.Cursor, group: list[_PendingWrite]) -> bool:
+        """Run a group of writes in a savepoint. Returns False, with the error recorded, if it was rolled back."""
+        cursor.execute("SAVEPOINT write_behind")
+        try:
+            if group[0].write is not None:
+                group[0].result = group[0].write(cursor)
+            else:
+                cursor.executemany(group[0].sql, [row for w in group for row in w.rows])
+        except sqlite3.OperationalError:
+            raise
+        except Exception as e:
+            cursor.execute("ROLLBACK TO write_behind")
+            cursor.execute("RELEASE write_behind")
+            for w in group:
+                w.error = e
+            return False
+        cursor.execute("RELEASE write_behind")
+        for w in group:
+            w.error = None
+        return True
+
+    def _requeue(self: Self, db_file: str, writes: list[_PendingWrite], error: Exception) -> None:
+        """Re-queue statement writes to retry them on the next flush, and fail submitted writes with `error`."""
+        retry = []
+        for w in writes:
+            if w.future is not None:
+                w.future.set_exception(error)
+                continue
+            w.attempts += 1
+            retry.append(w)
+        with self._condition:
+            # ahead of anything queued since, to keep the order of writes to the file.
+            self._pending[db_file] = retry + self._pending.get(db_file, [])
+            self._pending_rows += sum(w.size for w in retry)
+
+    @staticmethod
+    def _spill(db_file: str, writes: list[_PendingWrite], reason: str) -> None:
+        """Append writes that can't be written to the spill file next to `db_file` so they aren't lost."""
+        writes = [w for w in writes if w.future is None]
+        if not writes:
+            return
+        spill_file = f"{db_file}{SPILL_FILE_SUFFIX}"
+        failed_at = datetime.now().isoformat()
+        with open(spill_file, "a", encoding="utf-8") as f:
+            for w in writes:
+                line = {
+                    "sql": w.sql,
+                    "rows": w.rows,
+                    "attempts": w.attempts,
+                    "error": str(w.error) if w.error is not None else reason,
+                    "failed_at": failed_at,
+                }
+                f.write(json.dumps(line, default=str) + "\n")
+        log.error(
+            "write_behind: %s rows for '%s' %s, spilled to '%s'",
+            sum(len(w.rows) for w in writes),
+            db_file,
+            reason,
+            spill_file,
+        )
+
+    def _run(self: Self) -> None:
+        while True:
+            with self._condition:
+                if self._running and self._pending_rows < self.max_pending_rows:
+                    self._condition.wait(self.flush_interval_sec)
+                if not self._running:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                log.error("write_behind: background flush failed: %s", e)
+
+
+_writer: Optional[WriteBehindWriter] = None
+
+
+def is_enabled() -> bool:
+    """True if write-behind persistence is running."""
+    return _writer is not None and _writer.running
+
+
+def enqueue(db_file: str, sql: str, rows: list[tuple], init_sql: tuple[str, ...] = ()) -> None:
+    """Queue rows on the write-behind writer, see `WriteBehindWriter.enqueue`."""
+    if _writer is None:
+        raise RuntimeError("write-behind persistence is not enabled")
+    _writer.enqueue(db_file, sql, rows, init_sql)
+
+
+def enqueue_write(db_file: str, fn: Callable[..., Any], *args: Any, init_sql: tuple[str, ...] = ()) -> None:
+    """Queue a write on the write-behind writer, see `WriteBehindWriter.enqueue_write`."""
+    if _writer is None:
+        raise RuntimeError("write-behind persistence is not enabled")
+    _writer.enqueue_write(db_file, fn, *args, init_sql=init_sql)
+
+
+def flush(db_file: Optional[str] = None) -> None:
+    """Write queued rows for `db_file`, or all files if None. Does nothing if write-behind isn't enabled."""
+    if _writer is not None:
+        _writer.flush(db_file)
+
+
+def _init() -> None:
+    """Start the write-behind writer if enabled with the DOCQ_WRITE_BEHIND env var."""
+    global _writer
+    if _writer is not None or os.environ.get(ENV_VAR_DOCQ_WRITE_BEHIND, "false").lower() != "true":
+        return
+    _writer = WriteBehindWriter(wal=os.environ.get(ENV_VAR_DOCQ_SQLITE_WAL, "false").lower() == "true")
+    _writer.start()
+    log.info("write-behind persistence enabled. wal: %s", _writer.wal)
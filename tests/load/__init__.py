@@ -0,0 +1 @@
+"""Load tests. Not part of the unit test run, see `poe test-load`."""
@@ -0,0 +1,61 @@
+"""API auth overhead per request micro-benchmark.
+
+Times authenticating a request with a JWT: loading and parsing the key and verifying every request (as before the key
+and verified token caches), with the cached keys, and repeat requests with the same token. Set
+`DOCQ_LOAD_TEST_AUTH_REQUESTS` to change the number of requests, default 2000. Records the time per request for each
+path. Run with `poe test-load`.
+"""
+import os
+import time
+from typing import Callable, Generator
+
+import pytest
+
+REQUESTS = int(os.environ.get("DOCQ_LOAD_TEST_AUTH_REQUESTS", "2000"))
+
+_results: dict[str, float] = {}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _report() -> Generator:
+    yield
+    print(f"\nAPI auth overhead, {REQUESTS} requests")
+    for name, us in _results.items():
+        print(f"  {name:>12}: {us:.1f}us/request")
+
+
+def _time_per_request_us(fn: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        fn()
+    return (time.perf_counter() - start) / REQUESTS * 1_000_000
+
+
+def test_api_auth_overhead(tmp_path: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Every path authenticates the same user."""
+    from jwt import jwk_from_pem
+
+    from web.api.models import UserModel
+    from web.api.utils import auth_utils
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(auth_utils, "KEY_RING", auth_utils.JwtKeyRing())
+    user = UserModel(uid=1, fullname="Load Test", super_admin=False, username="load@docq.ai")
+    token = auth_utils.encode_jwt(user)
+
+    def uncached() -> UserModel:
+        key = jwk_from_pem(auth_utils.get_key("public"))
+        payload = auth_utils.INSTANCE.decode(token, key, algorithms={"RS256"})
+        return UserModel.model_validate(payload.get("data"))
+
+    def cached_keys() -> UserModel:
+        auth_utils._verified_tokens.clear()
+        return auth_utils.get_user_from_jwt(token)
+
+    def cached_token() -> UserModel:
+        return auth_utils.get_user_from_jwt(token)
+
+    for name, fn in [("uncached", uncached), ("cached keys", cached_keys), ("cached token", cached_token)]:
+        _results[name] = _time_per_request_us(fn)
+
+    assert uncached() == cached_keys() == cached_token() == user
@@ -0,0 +1,117 @@
+"""Dedupe store benchmark: an unbounded dict vs the bounded memory and SQLite dedupe stores.
+
+Feeds DOCQ_LOAD_TEST_DEDUPE_EVENTS events (default 1M) arriving at 1000 per second, one in ten a redelivery of a recent
+event as Slack does when an ack is late. Records the time per event and how many keys each store holds at the end.
+Run with `poe test-load`.
+"""
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+from typing import Callable, Generator
+
+import pytest
+
+EVENTS = int(os.environ.get("DOCQ_LOAD_TEST_DEDUPE_EVENTS", "1000000"))
+EVENTS_PER_SEC = 1000
+REDELIVERY_RATE = 0.1
+TTL_SEC = 60
+MAX_KEYS = 100_000
+
+_results: dict[str, dict[str, float]] = {}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _report() -> Generator:
+    yield
+    print(f"\nDedupe store benchmark, {EVENTS_PER_SEC} events/s, {REDELIVERY_RATE:.0%} redelivered")
+    for name, result in _results.items():
+        print(
+            f"  {name:>16}: {result['events']:.0f} events, {result['us_per_event']:.2f}us/event, "
+            f"{result['keys']:.0f} keys held, {result['duplicates']:.0f}/{result['redeliveries']:.0f} duplicates caught"
+        )
+
+
+def _run(name: str, events: int, add: Callable[[str], bool], tick: Callable[[float], None]) -> dict[str, float]:
+    """Feed the events to `add`, advancing the clock with `tick`. Returns the counts and time per event."""
+    rng = random.Random(42)  # noqa: S311
+    redeliveries = duplicates = new_events = 0
+    elapsed = 0.0
+    for i in range(events):
+        tick(i / EVENTS_PER_SEC)
+        redelivery = new_events > 100 and rng.random() < REDELIVERY_RATE
+        if redelivery:
+            # one of the last 100 new events
+            key = f"C1_Ev{new_events - rng.randint(1, 100)}"
+            redeliveries += 1
+        else:
+            key = f"C1_Ev{new_events}"
+            new_events += 1
+        start = time.perf_counter()
+        added = add(key)
+        elapsed += time.perf_counter() - start
+        if redelivery and not added:
+            duplicates += 1
+    result = {
+        "events": events,
+        "us_per_event": elapsed / events * 1_000_000,
+        "redeliveries": redeliveries,
+        "duplicates": duplicates,
+    }
+    _results[name] = result
+    return result
+
+
+def test_unbounded_dict() -> None:
+    """The baseline, what `Tracker` used to do: every key is kept forever."""
+    seen: dict[str, float] = {}
+
+    def add(key: str) -> bool:
+        if key in seen:
+            return False
+        seen[key] = time.time()
+        return True
+
+    result = _run("unbounded dict", EVENTS, add, lambda _: None)
+    result["keys"] = len(seen)
+
+    assert result["duplicates"] == result["redeliveries"]
+
+
+def test_memory_dedupe_store() -> None:
+    """Every redelivery is caught while the store holds only the last TTL's worth of keys."""
+    from docq.support.dedupe_store import HEAP_COMPACT_MIN_STALE, MemoryDedupeStore
+
+    now = [0.0]
+    store = MemoryDedupeStore(ttl_sec=TTL_SEC, max_keys=MAX_KEYS, clock=lambda: now[0])
+
+    def tick(t: float) -> None:
+        now[0] = t
+
+    result = _run("memory", EVENTS, store.add, tick)
+    result["keys"] = len(store)
+
+    assert result["duplicates"] == result["redeliveries"]
+    assert len(store) <= min(MAX_KEYS, TTL_SEC * EVENTS_PER_SEC)
+    assert len(store._heap) <= 2 * len(store) + HEAP_COMPACT_MIN_STALE
+
+
+def test_sqlite_dedupe_store() -> None:
+    """Every redelivery is caught and the sweep keeps the file to `max_keys`."""
+    from docq.support.dedupe_store import SqliteDedupeStore
+
+    max_keys = EVENTS // 10
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = SqliteDedupeStore(
+            os.path.join(temp_dir, "dedupe.db"), ttl_sec=TTL_SEC * 60, sweep_interval_sec=1, max_keys=max_keys
+        )
+        result = _run("sqlite", EVENTS, store.add, lambda _: None)
+        store.sweep_expired()
+        with closing(sqlite3.connect(store.sqlite_file)) as connection:
+            result["keys"] = connection.execute("SELECT COUNT(*) FROM dedupe_keys").fetchone()[0]
+
+    # trimming to max keys may forget a key just before its redelivery
+    assert result["duplicates"] >= 0.99 * result["redeliveries"]
+    assert result["keys"] <= max_keys
@@ -0,0 +1,81 @@
+"""Usage db layout load test: a usage.db per owner vs the consolidated usage db.
+
+Simulates DOCQ_LOAD_TEST_USERS users (default 10k) each starting a thread, saving a question and answer and reading
+the thread back, then times the per user reads again on the warm store. Run with `poe test-load`.
+"""
+import os
+import tempfile
+import time
+from datetime import datetime
+from typing import Generator
+from unittest.mock import patch
+
+import pytest
+from docq.config import OrganisationFeatureType
+from docq.domain import FeatureKey
+
+USERS = int(os.environ.get("DOCQ_LOAD_TEST_USERS", "10000"))
+
+_results: dict[str, dict[str, float]] = {}
+
+
+def _count_files(dir_: str) -> int:
+    return sum(len(files) for _, _, files in os.walk(dir_))
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _report() -> Generator:
+    yield
+    print(f"\nUsage db load test, {USERS} users")
+    for mode, result in _results.items():
+        print(
+            f"  {mode:>12}: write {result['write_sec']:.2f}s ({USERS / result['write_sec']:.0f} users/s), "
+            f"read {result['read_sec']:.2f}s ({USERS / result['read_sec']:.0f} users/s), "
+            f"{result['files']:.0f} files, {result['bytes'] / 1024 / 1024:.1f}MB"
+        )
+
+
+@pytest.mark.parametrize("mode", ["per_owner", "consolidated"])
+def test_usage_db_load(mode: str) -> None:
+    """Each user's history round trips and the time, file count and size for the layout are recorded."""
+    from docq import manage_spaces
+    from docq.run_queries import _save_messages, create_history_thread, history_page
+
+    with tempfile.TemporaryDirectory() as temp_dir, patch.dict(
+        os.environ, {"DOCQ_DATA": temp_dir, "DOCQ_USAGE_DB_MODE": mode}
+    ):
+        manage_spaces._init()
+        features = [FeatureKey(OrganisationFeatureType.CHAT_PRIVATE, user_id) for user_id in range(1, USERS + 1)]
+
+        start = time.perf_counter()
+        threads = {}
+        for feature in features:
+            thread_id = create_history_thread("load test", feature)
+            _save_messages(
+                [
+                    (f"question from {feature.id_}", True, datetime.now(), thread_id),
+                    (f"answer for {feature.id_}", False, datetime.now(), thread_id),
+                ],
+                feature,
+            )
+            threads[feature.id_] = thread_id
+        write_sec = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for feature in features:
+            rows, _ = history_page(feature, threads[feature.id_], 10)
+            assert [row[1] for row in rows] == [f"question from {feature.id_}", f"answer for {feature.id_}"]
+        read_sec = time.perf_counter() - start
+
+        sqlite_dir = os.path.join(temp_dir, "sqlite")
+        _results[mode] = {
+            "write_sec": write_sec,
+            "read_sec": read_sec,
+            "files": _count_files(sqlite_dir),
+            "bytes": sum(
+                os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(sqlite_dir) for f in files
+            ),
+        }
+
+    if mode == "consolidated":
+        assert _results[mode]["files"] < USERS
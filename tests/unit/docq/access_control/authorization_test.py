@@ -0,0 +1,125 @@
+"""Tests for docq.access_control.authorization module."""
+import os
+import sqlite3
+import tempfile
+from contextlib import closing
+from typing import Generator
+from unittest.mock import patch
+
+import pytest
+from docq.config import SpaceType
+from docq.domain import SpaceKey
+
+TEST_USER_ID = 6001
+
+
+@pytest.fixture
+def system_file() -> Generator:
+    """Point the data dir at a temp dir with a user who is an admin of org 1 and a member of org 2.
+
+    Shared space 10 is public, 20 is granted to the user, 22 to a group the user is in, 23 to another user only, 24 is
+    public but archived and 25 has no grants.
+    """
+    from docq import manage_organisations, manage_spaces, manage_user_groups, manage_users
+    from docq.access_control import authorization
+    from docq.support.store import get_sqlite_shared_system_file
+
+    with tempfile.TemporaryDirectory() as temp_dir, patch.dict(os.environ, {"DOCQ_DATA": temp_dir}):
+        manage_organisations._init()
+        manage_users._init()
+        manage_spaces._init()
+        manage_user_groups._init()
+        sqlite_file = get_sqlite_shared_system_file()
+        with closing(sqlite3.connect(sqlite_file)) as connection:
+            connection.execute("INSERT INTO users (id, username, fullname) VALUES (?, 'a@b.c', 'A')", (TEST_USER_ID,))
+            connection.executemany("INSERT INTO orgs (id, name) VALUES (?, ?)", [(1, "one"), (2, "two"), (3, "three")])
+            connection.executemany(
+                "INSERT INTO org_members (org_id, user_id, org_admin) VALUES (?, ?, ?)",
+                [(1, TEST_USER_ID, True), (2, TEST_USER_ID, False)],
+            )
+            connection.executemany(
+                "INSERT INTO spaces (id, org_id, name, space_type, archived) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (10, 1, "s10", "SHARED", False),
+                    (20, 2, "s20", "SHARED", False),
+                    (21, 2, "t21", "THREAD", False),
+                    (22, 2, "s22", "SHARED", False),
+                    (23, 2, "s23", "SHARED", False),
+                    (24, 2, "s24", "SHARED", True),
+                    (25, 2, "s25", "SHARED", False),
+                    (30, 3, "s30", "SHARED", False),
+                ],
+            )
+            connection.execute("INSERT INTO user_groups (id, name, org_id) VALUES (40, 'g40', 2)")
+            connection.execute("INSERT INTO user_group_members (group_id, user_id) VALUES (40, ?)", (TEST_USER_ID,))
+            connection.executemany(
+                "INSERT INTO space_access (space_id, access_type, accessor_id) VALUES (?, ?, ?)",
+                [
+                    (10, "PUBLIC", None),
+                    (20, "USER", TEST_USER_ID),
+                    (22, "GROUP", 40),
+                    (23, "USER", TEST_USER_ID + 1),
+                    (24, "PUBLIC", None),
+                    (30, "PUBLIC", None),
+                ],
+            )
+            connection.commit()
+        yield sqlite_file
+        authorization.invalidate_authorization_context()
+
+
+def test_authorization_context(system_file: str) -> None:
+    """Orgs, admin flags and the granted shared spaces in the user's orgs are loaded, and other orgs' spaces left out."""
+    from docq.access_control.authorization import get_authorization_context
+
+    context = get_authorization_context(TEST_USER_ID)
+
+    assert sorted(context.org_ids) == [1, 2]
+    assert context.is_org_admin(1)
+    assert not context.is_org_admin(2)
+    assert context.user_group_ids == {40}
+    assert context.get_shared_space_keys([10, 20, 21, 22, 30]) == [
+        SpaceKey(SpaceType.SHARED, 10, 1),
+        SpaceKey(SpaceType.SHARED, 20, 2),
+        SpaceKey(SpaceType.SHARED, 22, 2),
+    ]
+    assert get_authorization_context(TEST_USER_ID + 1) is None
+
+
+def test_authorization_context_cached_and_invalidated(system_file: str) -> None:
+    """Repeat lookups don't touch SQLite and a membership change is seen on the next lookup."""
+    from docq.access_control.authorization import get_authorization_context
+    from docq.manage_users import add_organisation_member
+
+    get_authorization_context(TEST_USER_ID)
+    with patch("docq.access_control.authorization.sqlite3.connect") as connect:
+        get_authorization_context(TEST_USER_ID)
+    connect.assert_not_called()
+
+    add_organisation_member(3, TEST_USER_ID)
+
+    assert sorted(get_authorization_context(TEST_USER_ID).org_ids) == [1, 2, 3]
+
+
+def test_authorization_context_member_without_grant(system_file: str) -> None:
+    """Org membership alone doesn't give access to a shared space, nor does a grant on an archived space."""
+    from docq.access_control.authorization import get_authorization_context
+
+    context = get_authorization_context(TEST_USER_ID)
+
+    assert context.get_shared_space_keys([23, 24, 25]) == []
+
+
+def test_authorization_context_invalidated_by_space_changes(system_file: str) -> None:
+    """Granting access to a space and archiving it are seen on the next lookup."""
+    from docq.access_control.authorization import get_authorization_context
+    from docq.access_control.main import SpaceAccessor, SpaceAccessType
+    from docq.manage_spaces import update_shared_space, update_shared_space_permissions
+
+    assert get_authorization_context(TEST_USER_ID).get_shared_space_keys([25]) == []
+
+    update_shared_space_permissions(25, [SpaceAccessor(SpaceAccessType.USER, TEST_USER_ID)])
+    assert get_authorization_context(TEST_USER_ID).get_shared_space_keys([25]) == [SpaceKey(SpaceType.SHARED, 25, 2)]
+
+    update_shared_space(25, 2, archived=True)
+    assert get_authorization_context(TEST_USER_ID).get_shared_space_keys([25]) == []
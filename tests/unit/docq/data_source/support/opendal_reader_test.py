@@ -0,0 +1,420 @@
+"""Tests for the file storage download helpers in the OpenDAL reader module."""
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from typing import Self
+from unittest.mock import MagicMock, patch
+
+import opendal
+import pytest
+from docq.data_source.support.opendal_reader.base import (
+    FileReaderRegistry,
+    download_dir_from_opendal,
+    download_file_from_opendal,
+    download_from_gdrive,
+    download_from_onedrive,
+    extract_files,
+    list_gdrive_files,
+    sync_gdrive_files,
+)
+from llama_index.core.readers.base import BaseReader
+from llama_index.core.schema import Document
+
+FOLDER = "application/vnd.google-apps.folder"
+
+
+def _gdrive_file(id_: str, modified_time: str = "2024-01-01T00:00:00.000Z") -> dict:
+    return {
+        "id": id_,
+        "name": f"{id_}.pdf",
+        "mimeType": "application/pdf",
+        "modifiedTime": modified_time,
+        "webViewLink": f"https://drive.google.com/file/d/{id_}/view",
+        "size": "4",
+    }
+
+
+class _Request:
+    def __init__(self: Self, response: dict) -> None:
+        self.response = response
+
+    def execute(self: Self) -> dict:
+        return self.response
+
+
+class FakeDriveService:
+    """In-memory stand-in for the parts of the Google Drive v3 service used by the reader."""
+
+    def __init__(self: Self, page_size: int = 2) -> None:
+        """Start with an empty drive."""
+        self.items: dict[str, dict] = {}
+        self.change_log: list[dict] = []
+        self.page_size = page_size
+        self.list_calls = 0
+
+    def add(self: Self, id_: str, parent: str, mime: str = "application/pdf") -> None:
+        """Add or move a file or folder and record the change."""
+        self.items[id_] = {**_gdrive_file(id_), "mimeType": mime, "parents": [parent]}
+        self.change_log.append({"fileId": id_, "removed": False, "file": self.items[id_]})
+
+    def remove(self: Self, id_: str) -> None:
+        """Delete a file and record the change."""
+        del self.items[id_]
+        self.change_log.append({"fileId": id_, "removed": True})
+
+    def files(self: Self) -> "FakeDriveService":  # noqa: D102
+        return self
+
+    def changes(self: Self) -> "FakeDriveService":  # noqa: D102
+        return self
+
+    def list(self: Self, q: str | None = None, pageToken: str | None = None, **kwargs: object) -> _Request:  # noqa: A003, N803, D102
+        start = int(pageToken or 0)
+        if q is None:  # changes().list()
+            page = self.change_log[start : start + self.page_size]
+            next_start = start + len(page)
+            if next_start < len(self.change_log):
+                return _Request({"changes": page, "nextPageToken": str(next_start)})
+            return _Request({"changes": page, "newStartPageToken": str(next_start)})
+        self.list_calls += 1
+        folder_id = q.split("'")[1]
+        children = [item for item in self.items.values() if folder_id in item["parents"]]
+        page = children[start : start + self.page_size]
+        response: dict = {"files": page}
+        if start + self.page_size < len(children):
+            response["nextPageToken"] = str(start + self.page_size)
+        return _Request(response)
+
+    def getStartPageToken(self: Self) -> _Request:  # noqa: N802, D102
+        return _Request({"startPageToken": str(len(self.change_log))})
+
+
+class TestGdriveListing(unittest.TestCase):
+    """Test recursive listing and delta sync against a fake drive."""
+
+    def setUp(self: Self) -> None:
+        """Create a small folder tree."""
+        self.drive = FakeDriveService()
+        self.drive.add("sub", "root", FOLDER)
+        self.drive.add("subsub", "sub", FOLDER)
+        for id_, parent in [("a", "root"), ("b", "root"), ("c", "root"), ("d", "sub"), ("e", "subsub")]:
+            self.drive.add(id_, parent)
+        self.drive.add("elsewhere", "other_folder")
+
+    def test_list_gdrive_files_recursive(self: Self) -> None:
+        """All files in sub folders are listed, across pages, and folders themselves are not returned."""
+        files, folders = asyncio.run(list_gdrive_files(lambda: self.drive, "root"))
+
+        assert set(files.keys()) == {"a", "b", "c", "d", "e"}
+        assert folders == {"root", "sub", "subsub"}
+
+    def test_sync_gdrive_files_applies_changes(self: Self) -> None:
+        """A second sync uses the changes API instead of listing the tree again."""
+        state: dict = {}
+        asyncio.run(sync_gdrive_files(lambda: self.drive, "root", state))
+        list_calls = self.drive.list_calls
+
+        self.drive.add("f", "subsub")
+        self.drive.remove("a")
+        self.drive.add("b", "other_folder")  # moved out of the tree
+        self.drive.add("g", "other_folder")
+        files = asyncio.run(sync_gdrive_files(lambda: self.drive, "root", state))
+
+        assert set(files.keys()) == {"c", "d", "e", "f"}
+        assert self.drive.list_calls == list_calls, "files should not be listed again"
+        assert state["start_page_token"] == str(len(self.drive.change_log))
+
+    def test_sync_gdrive_files_relists_when_folder_added(self: Self) -> None:
+        """A folder moved into the tree triggers a full listing so its contents are found."""
+        state: dict = {}
+        asyncio.run(sync_gdrive_files(lambda: self.drive, "root", state))
+
+        self.drive.add("other_folder", "sub", FOLDER)
+        files = asyncio.run(sync_gdrive_files(lambda: self.drive, "root", state))
+
+        assert "elsewhere" in files
+        assert "other_folder" in state["folders"]
+
+
+class TestDownloadFromGdrive(unittest.TestCase):
+    """Test parallel Google Drive downloads."""
+
+    def setUp(self: Self) -> None:
+        """Set up a download dir and a fake download that writes a small file."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+        def _fake_download(service: object, file_id: str, file_name: str, mime: str, **kwargs: object) -> bool:
+            with self.lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            time.sleep(0.05)
+            with open(file_name, "wb") as f:
+                f.write(b"data")
+            with self.lock:
+                self.in_flight -= 1
+            return True
+
+        self.fake_download = MagicMock(side_effect=_fake_download)
+
+    def tearDown(self: Self) -> None:
+        """Clean up the download dir."""
+        self.temp_dir.cleanup()
+
+    def test_downloads_are_bounded_and_parallel(self: Self) -> None:
+        """Downloads run concurrently but never more than `max_concurrency` at once."""
+        files = [_gdrive_file(f"file{i}") for i in range(8)]
+        with patch("docq.services.google_drive.download_file", self.fake_download):
+            result = asyncio.run(download_from_gdrive(files, self.temp_dir.name, MagicMock, max_concurrency=3))
+
+        assert len(result) == 8
+        assert [r[0] for r in result] == [f["webViewLink"] for f in files]
+        assert 1 < self.max_in_flight <= 3
+
+    def test_unchanged_files_are_not_downloaded_again(self: Self) -> None:
+        """A second load only downloads files whose modifiedTime changed and drops deleted files."""
+        manifest: dict = {}
+        files = [_gdrive_file("a"), _gdrive_file("b"), _gdrive_file("c")]
+        with patch("docq.services.google_drive.download_file", self.fake_download):
+            first = asyncio.run(download_from_gdrive(files, self.temp_dir.name, MagicMock, manifest=manifest))
+            self.fake_download.reset_mock()
+
+            files = [_gdrive_file("a"), _gdrive_file("b", modified_time="2024-02-01T00:00:00.000Z")]
+            second = asyncio.run(download_from_gdrive(files, self.temp_dir.name, MagicMock, manifest=manifest))
+
+        assert self.fake_download.call_count == 1
+        assert self.fake_download.call_args.args[1] == "b"
+        assert second[0] == first[0], "unchanged file should keep its local path and indexed_on"
+        assert set(manifest.keys()) == {"a", "b"}
+        assert not os.path.exists(first[2][1]), "file removed from the drive should be removed locally"
+
+
+class TestDownloadFromOnedrive(unittest.TestCase):
+    """Test parallel OneDrive downloads."""
+
+    def test_unchanged_etag_is_skipped(self: Self) -> None:
+        """Files with an unchanged eTag are not downloaded again."""
+
+        def _fake_download(client: object, file_id: str, file_path: str, download_url: str, etag: str) -> bool:
+            with open(file_path, "wb") as f:
+                f.write(b"data")
+            return True
+
+        files = [
+            {"id": "1", "name": "one.pdf", "eTag": "v1", "webUrl": "https://onedrive/one.pdf", "size": 4},
+            {"id": "2", "name": "two.pdf", "eTag": "v1", "webUrl": "https://onedrive/two.pdf", "size": 4},
+        ]
+        manifest: dict = {}
+        with tempfile.TemporaryDirectory() as temp_dir, patch(
+            "docq.services.ms_onedrive.download_file", MagicMock(side_effect=_fake_download)
+        ) as mock_download:
+            asyncio.run(download_from_onedrive(files, temp_dir, MagicMock(), manifest=manifest))
+            assert mock_download.call_count == 2
+
+            mock_download.reset_mock()
+            files[1]["eTag"] = "v2"
+            result = asyncio.run(download_from_onedrive(files, temp_dir, MagicMock(), manifest=manifest))
+
+        assert mock_download.call_count == 1
+        assert mock_download.call_args.args[1] == "2"
+        assert len(result) == 2
+
+
+class TestDownloadFromOpendal(unittest.TestCase):
+    """Test chunked, parallel downloads using OpenDAL's fs scheme."""
+
+    def setUp(self: Self) -> None:
+        """Create a source and a download dir."""
+        self.source_dir = tempfile.TemporaryDirectory()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.op = opendal.AsyncOperator("fs", root=self.source_dir.name)
+
+    def tearDown(self: Self) -> None:
+        """Clean up."""
+        self.source_dir.cleanup()
+        self.temp_dir.cleanup()
+
+    def _write(self: Self, path: str, content: bytes) -> None:
+        full_path = os.path.join(self.source_dir.name, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "wb") as f:
+            f.write(content)
+
+    def test_download_file_in_chunks(self: Self) -> None:
+        """Files larger and not a multiple of the buffer size are copied intact."""
+        content = os.urandom(1000)
+        self._write("docs/file.pdf", content)
+
+        src_path, local_path, _, size = asyncio.run(
+            download_file_from_opendal(self.op, self.temp_dir.name, "docs/file.pdf", buffer_size=64)
+        )
+
+        assert src_path == "docs/file.pdf"
+        assert local_path.endswith(".pdf")
+        assert size == len(content)
+        with open(local_path, "rb") as f:
+            assert f.read() == content
+
+    def test_download_file_truncated(self: Self) -> None:
+        """An object that ends before its content length fails the download instead of reading forever."""
+        self._write("docs/file.pdf", b"0123456789")
+
+        with pytest.raises(EOFError, match="ended 90 bytes before"):
+            asyncio.run(
+                download_file_from_opendal(
+                    _TruncatedOperator(self.op), self.temp_dir.name, "docs/file.pdf", buffer_size=4, content_length=100
+                )
+            )
+
+    def test_download_dir_reports_progress(self: Self) -> None:
+        """All objects in the dir, including nested ones, are downloaded and progress is reported per file."""
+        for i in range(5):
+            self._write(f"docs/file{i}.md", b"x" * (i + 1))
+        self._write("docs/nested/file.md", b"nested")
+        progress = MagicMock()
+
+        result = asyncio.run(
+            download_dir_from_opendal(self.op, self.temp_dir.name, "docs/", max_concurrency=2, on_progress=progress)
+        )
+
+        assert sorted(r[0] for r in result) == sorted([f"docs/file{i}.md" for i in range(5)] + ["docs/nested/file.md"])
+        assert progress.call_count == 6
+        assert progress.call_args.args == (6, 1 + 2 + 3 + 4 + 5 + len(b"nested"))
+
+    def test_download_dir_filters_suffixes(self: Self) -> None:
+        """Only objects with one of the given suffixes are downloaded."""
+        self._write("docs/keep.pdf", b"pdf")
+        self._write("docs/nested/KEEP.PDF", b"pdf")
+        self._write("docs/skip.png", b"png")
+
+        result = asyncio.run(
+            download_dir_from_opendal(self.op, self.temp_dir.name, "docs/", file_suffixes=[".pdf"])
+        )
+
+        assert sorted(r[0] for r in result) == ["docs/keep.pdf", "docs/nested/KEEP.PDF"]
+
+    def test_download_dir_skips_unchanged_etag(self: Self) -> None:
+        """Objects with an unchanged ETag keep their local copy and objects removed from the store are pruned."""
+        etags = {"docs/a.md": "v1", "docs/b.md": "v1", "docs/c.md": "v1"}
+        for path in etags:
+            self._write(path, b"content")
+        op = _EtagOperator(self.op, etags)
+        manifest: dict = {}
+
+        first = asyncio.run(download_dir_from_opendal(op, self.temp_dir.name, "docs/", manifest=manifest))
+        assert op.reads == 3
+
+        etags["docs/b.md"] = "v2"
+        del etags["docs/c.md"]
+        os.remove(os.path.join(self.source_dir.name, "docs/c.md"))
+        second = asyncio.run(download_dir_from_opendal(op, self.temp_dir.name, "docs/", manifest=manifest))
+
+        assert op.reads == 4, "only the changed object should be read again"
+        assert sorted(r[0] for r in second) == ["docs/a.md", "docs/b.md"]
+        assert {r[0]: r[1] for r in second} == {r[0]: r[1] for r in first if r[0] != "docs/c.md"}
+        assert set(manifest.keys()) == {"docs/a.md", "docs/b.md"}
+        assert not os.path.exists({r[0]: r[1] for r in first}["docs/c.md"])
+
+
+class _EtagOperator:
+    """Delegates to an fs operator but reports ETags, which the fs service doesn't, and counts reads."""
+
+    def __init__(self: Self, op: opendal.AsyncOperator, etags: dict[str, str]) -> None:
+        self.op = op
+        self.etags = etags
+        self.reads = 0
+
+    async def list(self: Self, path: str) -> object:  # noqa: A003
+        return await self.op.list(path)
+
+    async def stat(self: Self, path: str) -> MagicMock:
+        metadata = await self.op.stat(path)
+        return MagicMock(etag=self.etags[path], content_md5=None, content_length=metadata.content_length)
+
+    def open_reader(self: Self, path: str) -> object:
+        self.reads += 1
+        return self.op.open_reader(path)
+
+
+class _CountingReader(BaseReader):
+    """Reader that records how many times it's constructed."""
+
+    instances = 0
+
+    def __init__(self: Self) -> None:
+        type(self).instances += 1
+
+    def load_data(self: Self, file: Path, extra_info: dict | None = None) -> list[Document]:
+        return [Document(text=f"counted:{file.read_text()}", extra_info=extra_info or {})]
+
+
+class TestExtractFiles(unittest.TestCase):
+    """Test extracting content with cached readers from the registry."""
+
+    def setUp(self: Self) -> None:
+        """Write some files to extract."""
+        _CountingReader.instances = 0
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.files = []
+        for i in range(10):
+            path = os.path.join(self.temp_dir.name, f"file{i}.abc" if i % 2 else f"file{i}.txt")
+            with open(path, "w") as f:
+                f.write(str(i))
+            self.files.append((f"src/file{i}", path, 0, 1))
+
+    def tearDown(self: Self) -> None:
+        """Clean up."""
+        self.temp_dir.cleanup()
+
+    def test_readers_are_constructed_lazily_and_reused(self: Self) -> None:
+        """A plug-in reader is constructed at most once per worker thread, not once per file."""
+        registry = FileReaderRegistry()
+        registry.register(".ABC", _CountingReader)
+        assert _CountingReader.instances == 0
+
+        docs = asyncio.run(extract_files(self.files, registry=registry, max_concurrency=2))
+
+        assert len(docs) == 10
+        assert sorted(d.text for d in docs if d.text.startswith("counted:")) == [f"counted:{i}" for i in (1, 3, 5, 7, 9)]
+        assert 1 <= _CountingReader.instances <= 2
+
+    def test_throughput_reported_per_reader(self: Self) -> None:
+        """Files, bytes and throughput are recorded for each reader."""
+        registry = FileReaderRegistry({".abc": _CountingReader})
+        span = MagicMock()
+        with patch("docq.data_source.support.opendal_reader.base.trace.get_current_span", return_value=span):
+            asyncio.run(extract_files(self.files, registry=registry))
+
+        attributes = {k: v for call in span.set_attributes.call_args_list for k, v in call.args[0].items()}
+        assert attributes["extract._CountingReader.files"] == 5
+        assert attributes["extract._CountingReader.bytes"] == 5
+        assert attributes["extract.PlainText.files"] == 5
+        assert "extract.PlainText.bytes_per_sec" in attributes
+
+
+class _TruncatedOperator:
+    """Delegates to an fs operator but its readers return an empty read at the end like a truncated stream."""
+
+    def __init__(self: Self, op: opendal.AsyncOperator) -> None:
+        self.op = op
+
+    def open_reader(self: Self, path: str) -> "_TruncatedOperator":
+        self.path = path
+        return self
+
+    async def __aenter__(self: Self) -> "_TruncatedOperator":
+        self.content = await self.op.read(self.path)
+        return self
+
+    async def __aexit__(self: Self, *args: object) -> None:
+        pass
+
+    async def read(self: Self, size: int) -> bytes:
+        b, self.content = self.content[:size], self.content[size:]
+        return bytes(b)
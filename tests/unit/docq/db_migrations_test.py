@@ -0,0 +1,221 @@
+"""Tests for docq.db_migrations module."""
+import json
+import os
+import sqlite3
+import tempfile
+from contextlib import closing
+from datetime import datetime
+from unittest.mock import patch
+
+from docq.config import OrganisationFeatureType, SpaceType
+from docq.domain import FeatureKey
+
+TEST_ORG_ID = 3000
+TEST_USER_ID = 3001
+
+
+def test_backfill_thread_spaces_table() -> None:
+    """Thread spaces are linked to the org member with the thread, by topic when more than one member has it.
+
+    Spaces whose owner still isn't known are linked on first use by the first owner to ask for them.
+    """
+    from docq import db_migrations, manage_spaces
+    from docq.manage_users import SQL_CREATE_ORG_MEMBERS_TABLE
+    from docq.support.store import get_sqlite_shared_system_file, get_sqlite_usage_file
+
+    other_user_id = TEST_USER_ID + 1
+    threads = {
+        TEST_USER_ID: [(12, "twelve"), (34, "thirty four"), (56, "mine"), (90, "same")],
+        other_user_id: [(56, "theirs"), (90, "same")],
+    }
+    with tempfile.TemporaryDirectory() as temp_dir, patch.dict(os.environ, {"DOCQ_DATA": temp_dir}):
+        for user_id, user_threads in threads.items():
+            with closing(sqlite3.connect(get_sqlite_usage_file(user_id))) as connection:
+                connection.execute("CREATE TABLE history_thread_chat_private (id INTEGER PRIMARY KEY, topic TEXT)")
+                connection.executemany("INSERT INTO history_thread_chat_private (id, topic) VALUES (?, ?)", user_threads)
+                connection.commit()
+
+        with closing(sqlite3.connect(get_sqlite_shared_system_file())) as connection, closing(connection.cursor()) as cursor:
+            cursor.execute(manage_spaces.SQL_CREATE_SPACES_TABLE)
+            cursor.execute(SQL_CREATE_ORG_MEMBERS_TABLE)
+            cursor.executemany(
+                "INSERT INTO org_members (org_id, user_id) VALUES (?, ?)", [(TEST_ORG_ID, TEST_USER_ID), (TEST_ORG_ID, other_user_id)]
+            )
+            spaces = [
+                ("Thread-12 from configs 1234", "twelve", SpaceType.THREAD.name, {"thread_id": 12}),
+                ("Thread-34 from name 5678", "thirty four", SpaceType.THREAD.name, {}),
+                ("Thread-56 both members have it 91011", "theirs", SpaceType.THREAD.name, {}),
+                ("Thread-78 not a thread space", "", SpaceType.SHARED.name, {}),
+                ("Thread-90 both members have the topic 1213", "same", SpaceType.THREAD.name, {}),
+            ]
+            cursor.executemany(
+                "INSERT INTO spaces (org_id, name, summary, space_type, datasource_configs) VALUES (?, ?, ?, ?, ?)",
+                [(TEST_ORG_ID, name, summary, space_type, json.dumps(configs)) for name, summary, space_type, configs in spaces],
+            )
+            connection.commit()
+
+        db_migrations.backfill_thread_spaces_table()
+        db_migrations.backfill_thread_spaces_table()
+
+        sql = "SELECT feature_type, owner_id, thread_id, space_id, org_id FROM thread_spaces ORDER BY space_id"
+        with closing(sqlite3.connect(get_sqlite_shared_system_file())) as connection:
+            rows = connection.execute(sql).fetchall()
+        feature = FeatureKey(OrganisationFeatureType.CHAT_PRIVATE, TEST_USER_ID)
+        other_feature = FeatureKey(OrganisationFeatureType.CHAT_PRIVATE, other_user_id)
+        with patch("docq.manage_spaces.get_sqlite_shared_system_file", get_sqlite_shared_system_file):
+            thread_space = manage_spaces.get_thread_space(TEST_ORG_ID, 34, feature)
+            claimed_space = manage_spaces.get_thread_space(TEST_ORG_ID, 90, other_feature)
+            unclaimed_space = manage_spaces.get_thread_space(TEST_ORG_ID, 90, feature)
+        with closing(sqlite3.connect(get_sqlite_shared_system_file())) as connection:
+            claimed_rows = connection.execute(sql).fetchall()
+
+    owner = (OrganisationFeatureType.CHAT_PRIVATE.name, str(TEST_USER_ID))
+    other_owner = (OrganisationFeatureType.CHAT_PRIVATE.name, str(other_user_id))
+    assert rows == [(*owner, 12, 1, TEST_ORG_ID), (*owner, 34, 2, TEST_ORG_ID), (*other_owner, 56, 3, TEST_ORG_ID)]
+    assert thread_space is not None
+    assert thread_space.id_ == 2
+    assert claimed_space is not None
+    assert claimed_space.id_ == 5
+    assert unclaimed_space is None
+    assert claimed_rows == [*rows, (*other_owner, 90, 5, TEST_ORG_ID)]
+
+
+def test_migrate_usage_history_to_consolidated_db() -> None:
+    """History copies from per owner files into the consolidated db keeping ids, and re-running doesn't duplicate."""
+    from docq import db_migrations, manage_spaces
+    from docq.run_queries import _save_messages, create_history_thread, history_page, list_thread_history
+    from docq.support.store import get_sqlite_shared_system_file
+
+    feature = FeatureKey(OrganisationFeatureType.CHAT_PRIVATE, TEST_USER_ID)
+    public_feature = FeatureKey(OrganisationFeatureType.ASK_PUBLIC, "session-1")
+    with tempfile.TemporaryDirectory() as temp_dir, patch.dict(os.environ, {"DOCQ_DATA": temp_dir}):
+        # not manage_spaces._init(), other tests patch its system file path for the session
+        with closing(sqlite3.connect(get_sqlite_shared_system_file())) as connection:
+            connection.execute(manage_spaces.SQL_CREATE_THREAD_SPACES_TABLE)
+        create_history_thread("first", feature)
+        thread_id = create_history_thread("second", feature)
+        saved = _save_messages(
+            [("hello", True, datetime.now(), thread_id), ("hi", False, datetime.now(), thread_id)], feature
+        )
+        public_thread_id = create_history_thread("public", public_feature)
+        _save_messages([("anon", True, datetime.now(), public_thread_id)], public_feature)
+
+        assert db_migrations.migrate_usage_history_to_consolidated_db() == 2
+        assert db_migrations.migrate_usage_history_to_consolidated_db() == 2
+
+        with patch.dict(os.environ, {"DOCQ_USAGE_DB_MODE": "consolidated"}):
+            threads = list_thread_history(feature)
+            rows, _ = history_page(feature, thread_id, 10)
+            public_rows, _ = history_page(public_feature, public_thread_id, 10)
+
+    assert sorted((row[0], row[1]) for row in threads) == [(1, "first"), (thread_id, "second")]
+    assert [(row[0], row[1]) for row in rows] == [(row[0], row[1]) for row in saved]
+    assert [row[1] for row in public_rows] == ["anon"]
+
+
+def test_backfill_public_session_activity_table() -> None:
+    """Existing public session dirs are added with their mtime, only while the activity table is empty."""
+    from docq import db_migrations
+    from docq.support.store import get_public_sqlite_usage_file, get_sqlite_global_system_file
+
+    with tempfile.TemporaryDirectory() as temp_dir, patch.dict(os.environ, {"DOCQ_DATA": temp_dir}):
+        usage_file = get_public_sqlite_usage_file("session-1")
+        with closing(sqlite3.connect(usage_file)) as connection:
+            connection.execute("CREATE TABLE t (id INTEGER)")
+        os.utime(os.path.dirname(usage_file), (1000, 1000))
+
+        db_migrations.backfill_public_session_activity_table()
+        get_public_sqlite_usage_file("session-2")
+        db_migrations.backfill_public_session_activity_table()
+
+        with closing(sqlite3.connect(get_sqlite_global_system_file())) as connection:
+            rows = connection.execute("SELECT session_id, last_activity_at FROM public_session_activity").fetchall()
+
+    assert rows == [("session-1", 1000)]
+
+
+def test_add_fts_to_history_tables() -> None:
+    """Messages saved before search existed are indexed by the migration."""
+    from docq import db_migrations
+    from docq.run_queries import SQL_CREATE_MESSAGE_TABLE, SQL_CREATE_THREAD_TABLE, search_threads
+    from docq.support.store import get_sqlite_usage_file
+
+    feature = FeatureKey(OrganisationFeatureType.CHAT_PRIVATE, TEST_USER_ID)
+    with tempfile.TemporaryDirectory() as temp_dir, patch.dict(os.environ, {"DOCQ_DATA": temp_dir}):
+        with closing(sqlite3.connect(get_sqlite_usage_file(TEST_USER_ID))) as connection:
+            connection.execute(SQL_CREATE_THREAD_TABLE.format(table="history_thread_chat_private"))
+            connection.execute(
+                SQL_CREATE_MESSAGE_TABLE.format(
+                    table="history_chat_private", thread_table="history_thread_chat_private"
+                )
+            )
+            connection.execute("INSERT INTO history_thread_chat_private (topic) VALUES ('old')")
+            connection.execute(
+                "INSERT INTO history_chat_private (message, human, thread_id) VALUES ('legacy text', 1, 1)"
+            )
+            connection.commit()
+
+        db_migrations.add_fts_to_history_tables()
+        results = search_threads(feature, "legacy")
+
+    assert [r[0] for r in results] == [1]
+
+
+def test_add_summary_columns_to_history_thread_tables() -> None:
+    """Thread tables created before summary memory get the summary columns, and re-running is a no-op."""
+    from docq import db_migrations
+    from docq.support.store import get_sqlite_usage_file
+
+    with tempfile.TemporaryDirectory() as temp_dir, patch.dict(os.environ, {"DOCQ_DATA": temp_dir}):
+        usage_file = get_sqlite_usage_file(TEST_USER_ID)
+        with closing(sqlite3.connect(usage_file)) as connection:
+            connection.execute("CREATE TABLE history_thread_chat_private (id INTEGER PRIMARY KEY, topic TEXT)")
+
+        db_migrations.add_summary_columns_to_history_thread_tables()
+        db_migrations.add_summary_columns_to_history_thread_tables()
+
+        with closing(sqlite3.connect(usage_file)) as connection:
+            columns = [
+                row[0] for row in connection.execute("SELECT name FROM pragma_table_info('history_thread_chat_private')")
+            ]
+
+    assert columns == ["id", "topic", "summary", "summary_message_id"]
+
+
+def test_add_index_status_columns_to_spaces_table() -> None:
+    """A spaces table created before index status gets the columns, and re-running is a no-op."""
+    from docq import db_migrations
+    from docq.support.store import get_sqlite_shared_system_file
+
+    with tempfile.TemporaryDirectory() as temp_dir, patch.dict(os.environ, {"DOCQ_DATA": temp_dir}):
+        with closing(sqlite3.connect(get_sqlite_shared_system_file())) as connection:
+            connection.execute("CREATE TABLE spaces (id INTEGER PRIMARY KEY, org_id INTEGER, name TEXT)")
+
+        db_migrations.add_index_status_columns_to_spaces_table()
+        db_migrations.add_index_status_columns_to_spaces_table()
+
+        with closing(sqlite3.connect(get_sqlite_shared_system_file())) as connection:
+            columns = [row[0] for row in connection.execute("SELECT name FROM pragma_table_info('spaces')")]
+
+    assert columns == ["id", "org_id", "name", "document_count", "index_status"]
+
+
+def test_migrate_usage_dbs_skips_migrated() -> None:
+    """Usage dbs are stamped with the schema version and once all are migrated later runs don't open them."""
+    from docq import db_migrations
+    from docq.support.store import get_sqlite_usage_file
+
+    with tempfile.TemporaryDirectory() as temp_dir, patch.dict(os.environ, {"DOCQ_DATA": temp_dir}):
+        usage_file = get_sqlite_usage_file(TEST_USER_ID)
+        with closing(sqlite3.connect(usage_file)) as connection:
+            connection.execute("CREATE TABLE history_thread_chat_private (id INTEGER PRIMARY KEY, topic TEXT)")
+
+        db_migrations.migrate_usage_dbs()
+        with patch("docq.db_migrations.list_sqlite_usage_files") as mock_list_usage_files:
+            db_migrations.migrate_usage_dbs()
+
+        with closing(sqlite3.connect(usage_file)) as connection:
+            user_version = connection.execute("PRAGMA user_version").fetchone()[0]
+
+    assert user_version == db_migrations.USAGE_DB_SCHEMA_VERSION
+    mock_list_usage_files.assert_not_called()
@@ -0,0 +1,103 @@
+"""Tests for docq.manage_assistants module."""
+import os
+import sqlite3
+import tempfile
+from contextlib import closing
+from typing import Generator
+from unittest.mock import patch
+
+import pytest
+from docq.domain import AssistantType
+
+TEST_ORG_ID = 5000
+
+
+@pytest.fixture
+def data_dir() -> Generator:
+    """Point the data dir at a temp dir with the global assistants table initialised."""
+    from docq import manage_assistants
+
+    with tempfile.TemporaryDirectory() as temp_dir, patch.dict(os.environ, {"DOCQ_DATA": temp_dir}):
+        manage_assistants._init()
+        yield temp_dir
+        manage_assistants._invalidate_assistant_cache()
+
+
+def _create_assistant(
+    name: str, assistant_id: int | None = None, system_prompt: str = "system", org_id: int | None = TEST_ORG_ID
+) -> int | None:
+    from docq.manage_assistants import create_or_update_assistant
+
+    return create_or_update_assistant(
+        name=name,
+        assistant_type=AssistantType.ASK,
+        archived=False,
+        system_prompt_template=system_prompt,
+        user_prompt_template="{query_str}",
+        llm_settings_collection_key="key",
+        assistant_id=assistant_id,
+        org_id=org_id,
+    )
+
+
+def test_get_assistant_cached_and_invalidated_on_update(data_dir: str) -> None:
+    """Repeat gets don't touch SQLite, and an update is seen by the next get."""
+    from docq.manage_assistants import get_assistant
+
+    assistant_id = _create_assistant("cached")
+    scoped_id = f"org_{assistant_id}"
+    assert get_assistant(scoped_id, TEST_ORG_ID).system_message_content == "system"
+
+    with patch("docq.manage_assistants.sqlite3.connect") as connect:
+        assistant = get_assistant(scoped_id, TEST_ORG_ID)
+        assistant.name = "changed by caller"
+        assert get_assistant(scoped_id, TEST_ORG_ID).name == "cached"
+    connect.assert_not_called()
+
+    _create_assistant("cached", assistant_id=assistant_id, system_prompt="updated")
+    assert get_assistant(scoped_id, TEST_ORG_ID).system_message_content == "updated"
+
+
+def test_get_assistant_by_any_scoped_id_invalidated_on_update(data_dir: str) -> None:
+    """Getting a global assistant by an org scoped id without an org caches it where an update invalidates it."""
+    from docq.manage_assistants import get_assistant
+
+    assistant_id = _create_assistant("global", org_id=None)
+    assert get_assistant(f"org_{assistant_id}", None).system_message_content == "system"
+
+    _create_assistant("global", assistant_id=assistant_id, system_prompt="updated", org_id=None)
+    assistant = get_assistant(f"org_{assistant_id}", None)
+
+    assert assistant.system_message_content == "updated"
+    assert assistant.scoped_id == f"org_{assistant_id}"
+    assert get_assistant(f"global_{assistant_id}", None).scoped_id == f"global_{assistant_id}"
+
+
+def test_update_from_another_process_seen_after_version_check(data_dir: str) -> None:
+    """An update made by another process is picked up once the version is checked again."""
+    from docq import manage_assistants
+    from docq.support.store import get_sqlite_org_system_file
+
+    assistant_id = _create_assistant("shared")
+    scoped_id = f"org_{assistant_id}"
+    manage_assistants.get_assistant(scoped_id, TEST_ORG_ID)
+
+    with closing(sqlite3.connect(get_sqlite_org_system_file(TEST_ORG_ID))) as connection:
+        connection.execute("UPDATE assistants SET name = 'renamed' WHERE id = ?", (assistant_id,))
+        connection.execute(manage_assistants.SQL_BUMP_ASSISTANTS_VERSION)
+        connection.commit()
+
+    assert manage_assistants.get_assistant(scoped_id, TEST_ORG_ID).name == "shared"
+    with patch("docq.manage_assistants.VERSION_CHECK_INTERVAL_SEC", 0):
+        assert manage_assistants.get_assistant(scoped_id, TEST_ORG_ID).name == "renamed"
+
+
+def test_init_runs_once_per_scope(data_dir: str) -> None:
+    """The table and default assistant checks only run the first time a scope is initialised."""
+    from docq import manage_assistants
+
+    manage_assistants._init(TEST_ORG_ID)
+    with patch("docq.manage_assistants.sqlite3.connect") as connect:
+        manage_assistants._init(TEST_ORG_ID)
+        manage_assistants._init()
+    connect.assert_not_called()
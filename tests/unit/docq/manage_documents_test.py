@@ -5,6 +5,8 @@ import unittest
 from typing import Self
 from unittest.mock import MagicMock, Mock, patch
 
+import pytest
+
 
 class TestManageDocuments(unittest.TestCase):
     """Test manage_documents."""
@@ -53,6 +55,70 @@ class TestManageDocuments(unittest.TestCase):
             assert os.path.isfile(temp_file.name), f"File {temp_file.name} should be a file"
             assert os.path.getsize(temp_file.name) == len(file_content), f"File {temp_file.name} should have content"
 
+    def test_chunked_upload_resume(self: Self) -> None:
+        """Test a chunked upload stays out of the upload dir until complete and can be resumed."""
+        import hashlib
+
+        from docq.config import SpaceType
+        from docq.domain import SpaceKey
+        from docq.manage_documents import ChunkedUpload, get_upload_offset
+        from docq.support.store import get_upload_file
+
+        content = b"0123456789" * 10
+        with tempfile.TemporaryDirectory() as temp_dir, patch.dict(os.environ, {"DOCQ_DATA": temp_dir}):
+            space = SpaceKey(SpaceType.SHARED, 1, 1)
+            upload = ChunkedUpload("file.txt", space, length=len(content))
+            upload.write(content[:40])
+            assert not upload.finish()
+            assert not os.path.exists(get_upload_file(space, "file.txt"))
+            assert get_upload_offset("file.txt", space) == 40
+
+            with pytest.raises(ValueError, match="doesn't match the 40 bytes received"):
+                ChunkedUpload("file.txt", space, offset=30, length=len(content))
+
+            upload = ChunkedUpload("file.txt", space, offset=40, length=len(content))
+            upload.write(content[40:])
+            assert upload.finish(hashlib.sha256(content).hexdigest())
+            with open(get_upload_file(space, "file.txt"), "rb") as f:
+                assert f.read() == content
+            assert get_upload_offset("file.txt", space) == 0
+
+    def test_chunked_upload_sha256_mismatch(self: Self) -> None:
+        """Test a complete chunked upload that doesn't match the expected hash is discarded."""
+        from docq.config import SpaceType
+        from docq.domain import SpaceKey
+        from docq.manage_documents import ChunkedUpload, get_upload_offset
+        from docq.support.store import get_upload_file
+
+        with tempfile.TemporaryDirectory() as temp_dir, patch.dict(os.environ, {"DOCQ_DATA": temp_dir}):
+            space = SpaceKey(SpaceType.SHARED, 1, 1)
+            upload = ChunkedUpload("file.txt", space)
+            upload.write(b"test")
+            with pytest.raises(ValueError, match="SHA-256 doesn't match"):
+                upload.finish("0" * 64)
+            assert not os.path.exists(get_upload_file(space, "file.txt"))
+            assert get_upload_offset("file.txt", space) == 0
+
+    def test_chunked_upload_discard(self: Self) -> None:
+        """Test a discarded upload is removed, and a discarded resumed upload goes back to where it was resumed."""
+        from docq.config import SpaceType
+        from docq.domain import SpaceKey
+        from docq.manage_documents import ChunkedUpload, get_upload_offset
+
+        with tempfile.TemporaryDirectory() as temp_dir, patch.dict(os.environ, {"DOCQ_DATA": temp_dir}):
+            space = SpaceKey(SpaceType.SHARED, 1, 1)
+            upload = ChunkedUpload("file.txt", space, length=100)
+            upload.write(b"0" * 40)
+            upload.close()
+
+            resumed = ChunkedUpload("file.txt", space, offset=40, length=100)
+            resumed.write(b"1" * 30)
+            resumed.discard()
+            assert get_upload_offset("file.txt", space) == 40
+
+            ChunkedUpload("file.txt", space).discard()
+            assert get_upload_offset("file.txt", space) == 0
+
     @patch("docq.manage_documents.get_upload_file")
     def test_get_file(self: Self, get_upload_file: Mock) -> None:
         """Test get_file."""
@@ -212,3 +278,24 @@ class TestManageDocuments(unittest.TestCase):
 
         with patch("docq.manage_documents._parse_metadata", MagicMock(return_value=("name", "page", "uri", "UNKNOWN_DS"))):
             assert format_document_sources(self.file_source_node) == "", "Unknown data source should return empty string"
+
+    @patch("docq.manage_documents._get_download_link")
+    def test_get_message_sources(self: Self, file_link: Mock) -> None:
+        """Test get_message_sources and format_message_sources."""
+        from docq.domain import MessageSource
+        from docq.manage_documents import format_document_sources, format_message_sources, get_message_sources
+
+        file_link.return_value = "https://some_link.host"
+        self.file_source_node[0].node.id_ = "node_id"
+        self.file_source_node[0].node.metadata = {**self.file_metadata, "space_id": 7}
+
+        sources = get_message_sources(self.file_source_node)
+
+        assert sources == [
+            MessageSource("node_id", 7, "source_uri", "page_label", 1, "file_name", "SpaceDataSourceFileBased")
+        ], "File node should map to a message source"
+        assert format_message_sources(sources) == format_document_sources(
+            self.file_source_node
+        ), "Formatting saved sources should match formatting the nodes"
+        assert get_message_sources([]) == [], "No nodes should return no sources"
+        file_link.assert_called_with("file_name", "source_uri")
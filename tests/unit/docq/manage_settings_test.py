@@ -0,0 +1,71 @@
+"""Tests for docq.manage_settings module."""
+import json
+import os
+import sqlite3
+import tempfile
+from contextlib import closing
+from typing import Generator
+from unittest.mock import patch
+
+import pytest
+from docq.config import OrganisationSettingsKey
+
+TEST_ORG_ID = 4000
+
+
+@pytest.fixture
+def settings_file() -> Generator:
+    """Point the data dir at a temp dir and return the shared system db holding org settings."""
+    from docq import manage_settings
+    from docq.support.store import get_sqlite_shared_system_file
+
+    with tempfile.TemporaryDirectory() as temp_dir, patch.dict(os.environ, {"DOCQ_DATA": temp_dir}):
+        manage_settings._init()
+        yield get_sqlite_shared_system_file()
+        manage_settings._invalidate_settings_cache()
+
+
+def test_settings_read_from_cache(settings_file: str) -> None:
+    """Repeat reads don't touch SQLite and callers can't change the cached settings."""
+    from docq import manage_settings
+
+    manage_settings.update_organisation_settings({"MODEL_COLLECTION": "a", "ENABLED_FEATURES": ["X"]}, TEST_ORG_ID)
+    manage_settings.get_organisation_settings(TEST_ORG_ID)
+
+    with patch("docq.manage_settings.sqlite3.connect") as connect:
+        settings = manage_settings.get_organisation_settings(TEST_ORG_ID)
+        settings["ENABLED_FEATURES"].append("Y")
+        features = manage_settings.get_organisation_settings(TEST_ORG_ID, OrganisationSettingsKey.ENABLED_FEATURES)
+
+    connect.assert_not_called()
+    assert features == ["X"]
+
+
+def test_update_invalidates_cache(settings_file: str) -> None:
+    """An update in this process is seen by the next read."""
+    from docq import manage_settings
+
+    manage_settings.update_organisation_settings({"MODEL_COLLECTION": "a"}, TEST_ORG_ID)
+    assert manage_settings.get_organisation_settings(TEST_ORG_ID, OrganisationSettingsKey.MODEL_COLLECTION) == "a"
+
+    manage_settings.update_organisation_settings({"MODEL_COLLECTION": "b"}, TEST_ORG_ID)
+    assert manage_settings.get_organisation_settings(TEST_ORG_ID, OrganisationSettingsKey.MODEL_COLLECTION) == "b"
+
+
+def test_update_from_another_process_seen_after_version_check(settings_file: str) -> None:
+    """An update made by another process is picked up once the version is checked again."""
+    from docq import manage_settings
+
+    manage_settings.update_organisation_settings({"MODEL_COLLECTION": "a"}, TEST_ORG_ID)
+    manage_settings.get_organisation_settings(TEST_ORG_ID)
+
+    with closing(sqlite3.connect(settings_file)) as connection:
+        connection.execute(
+            "UPDATE settings SET val = ? WHERE org_id = ? AND key = 'MODEL_COLLECTION'", (json.dumps("b"), TEST_ORG_ID)
+        )
+        connection.execute(manage_settings.SQL_BUMP_SETTINGS_VERSION)
+        connection.commit()
+
+    assert manage_settings.get_organisation_settings(TEST_ORG_ID, OrganisationSettingsKey.MODEL_COLLECTION) == "a"
+    with patch("docq.manage_settings.VERSION_CHECK_INTERVAL_SEC", 0):
+        assert manage_settings.get_organisation_settings(TEST_ORG_ID, OrganisationSettingsKey.MODEL_COLLECTION) == "b"
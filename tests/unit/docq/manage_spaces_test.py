@@ -10,11 +10,12 @@ from unittest.mock import MagicMock, Mock, patch
 import pytest
 from docq import manage_spaces
 from docq.access_control.main import SpaceAccessor, SpaceAccessType
-from docq.config import SpaceType
-from docq.domain import SpaceKey
+from docq.config import OrganisationFeatureType, SpaceType
+from docq.domain import FeatureKey, SpaceKey
 from llama_index.core.schema import Document
 
 TEST_ORG_ID = 1000
+TEST_FEATURE = FeatureKey(OrganisationFeatureType.CHAT_PRIVATE, 1001)
 
 @pytest.fixture(scope="session")
 def manage_spaces_test_dir() -> Generator:
@@ -235,6 +236,7 @@ def test_create_thread_space(manage_spaces_test_dir: tuple) -> None:
             test_thread_id,
             space_summary,
             space_datasource_type,
+            TEST_FEATURE,
         )
 
     assert space is not None, "Space not found."
@@ -263,16 +265,58 @@ def test_get_thread_space() -> None:
             test_thread_id,
             space_summary,
             space_datasource_type,
+            TEST_FEATURE,
         )
 
     assert space is not None, "Space not found."
     reindex.assert_called_once_with(space)
 
     from docq.manage_spaces import get_thread_space
-    space_result = get_thread_space(TEST_ORG_ID, test_thread_id)
+    space_result = get_thread_space(TEST_ORG_ID, test_thread_id, TEST_FEATURE)
 
     assert space_result is not None, "Space not found."
     assert space_result.id_ == space.id_, "Space id mismatch."
+    other_owner = FeatureKey(OrganisationFeatureType.CHAT_PRIVATE, 1002)
+    assert get_thread_space(TEST_ORG_ID, test_thread_id, other_owner) is None, "Thread ids repeat across owners."
+    other_feature = FeatureKey(OrganisationFeatureType.ASK_SHARED, TEST_FEATURE.id_)
+    assert get_thread_space(TEST_ORG_ID, test_thread_id, other_feature) is None, "Thread ids repeat across features."
+
+
+def test_thread_space_exists() -> None:
+    """Test thread space exists uses the owner and thread id, not a name prefix."""
+    from docq.manage_spaces import create_thread_space, thread_space_exists
+
+    with patch("docq.manage_spaces.reindex"):
+        create_thread_space(TEST_ORG_ID, 5678, "thread_space_exists test summary", "test ds_type", TEST_FEATURE)
+
+    assert thread_space_exists(5678, TEST_FEATURE)
+    assert not thread_space_exists(567, TEST_FEATURE), "Thread ids that are a prefix of another shouldn't match."
+    assert not thread_space_exists(56789, TEST_FEATURE)
+    assert not thread_space_exists(5678, FeatureKey(OrganisationFeatureType.CHAT_PRIVATE, 1002))
+
+
+def test_create_thread_space_rolls_back_space_without_link(manage_spaces_test_dir: tuple) -> None:
+    """The space and its thread link are written in one transaction, so a failed link leaves no space behind."""
+    from docq.manage_spaces import create_thread_space
+
+    sqlite_system_file = manage_spaces_test_dir[1]
+    with closing(sqlite3.connect(sqlite_system_file)) as connection:
+        count = connection.execute("SELECT COUNT(*) FROM spaces").fetchone()[0]
+    with closing(sqlite3.connect(sqlite_system_file)) as connection:
+        connection.execute(
+            "CREATE TRIGGER fail_thread_space_link BEFORE INSERT ON thread_spaces BEGIN SELECT RAISE(ABORT, 'link failed'); END"
+        )
+        connection.commit()
+    try:
+        with patch("docq.manage_spaces.reindex"), pytest.raises(sqlite3.IntegrityError):
+            create_thread_space(TEST_ORG_ID, 9999, "rollback test summary", "test ds_type", TEST_FEATURE)
+    finally:
+        with closing(sqlite3.connect(sqlite_system_file)) as connection:
+            connection.execute("DROP TRIGGER fail_thread_space_link")
+            connection.commit()
+
+    with closing(sqlite3.connect(sqlite_system_file)) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM spaces").fetchone()[0] == count
 
 
 def test_list_shared_space(manage_spaces_test_dir: tuple) -> None:
@@ -383,3 +427,49 @@ def test_update_shared_space_permissions(manage_spaces_test_dir: tuple) -> None:
     updates = update_shared_space_permissions(space_id, [public_accessor, user_accessor, group_accessor])
 
     assert updates, "Update failed."
+
+
+def test_is_space_empty_uses_document_count(manage_spaces_test_dir: tuple) -> None:
+    """Documents are listed once for a space without a count, after that the stored count kept by reindex is used."""
+    from docq.config import SpaceIndexStatus
+    from docq.manage_spaces import get_space_index_status, is_space_empty, reindex
+
+    space = SpaceKey(SpaceType.SHARED, insert_test_space(manage_spaces_test_dir[1], "is_space_empty test"), TEST_ORG_ID)
+
+    with patch("docq.manage_spaces.list_documents", return_value=["doc"]) as list_documents:
+        assert not is_space_empty(space)
+        assert not is_space_empty(space)
+    list_documents.assert_called_once()
+
+    with patch("docq.manage_spaces.get_saved_model_settings_collection"), patch(
+        "docq.manage_spaces.get_space_data_source", return_value=("ds_type", {})
+    ), patch("docq.manage_spaces.SpaceDataSources") as space_data_sources:
+        space_data_sources.__getitem__.return_value.value.load.return_value = []
+        reindex(space)
+
+    assert get_space_index_status(space) == (SpaceIndexStatus.EMPTY, 0)
+    assert is_space_empty(space)
+
+
+def test_reindex_counts_loaded_documents(manage_spaces_test_dir: tuple) -> None:
+    """The document count is taken from the documents loaded for indexing, one per source, without listing them again."""
+    from docq.config import SpaceIndexStatus
+    from docq.manage_spaces import get_space_index_status, reindex
+
+    space = SpaceKey(SpaceType.SHARED, insert_test_space(manage_spaces_test_dir[1], "reindex count test"), TEST_ORG_ID)
+
+    with patch("docq.manage_spaces.get_saved_model_settings_collection"), patch(
+        "docq.manage_spaces.get_space_data_source", return_value=("ds_type", {})
+    ), patch("docq.manage_spaces._refresh_vector_index"), patch("docq.manage_spaces._persist_index"), patch(
+        "docq.manage_spaces.SpaceDataSources"
+    ) as space_data_sources:
+        data_source = space_data_sources.__getitem__.return_value.value
+        data_source.load.return_value = [
+            Document(doc_id="a-1", text="a page 1", extra_info={"source_uri": "a.pdf"}),
+            Document(doc_id="a-2", text="a page 2", extra_info={"source_uri": "a.pdf"}),
+            Document(doc_id="b-1", text="b page 1", extra_info={"source_uri": "b.pdf"}),
+        ]
+        reindex(space)
+
+    data_source.get_document_list.assert_not_called()
+    assert get_space_index_status(space) == (SpaceIndexStatus.READY, 2)
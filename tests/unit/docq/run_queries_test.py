@@ -0,0 +1,317 @@
+"""Tests for docq.run_queries module."""
+import os
+import sqlite3
+import tempfile
+from contextlib import closing
+from datetime import datetime
+from typing import Generator
+from unittest.mock import Mock, patch
+
+import pytest
+from docq.config import OrganisationFeatureType
+from docq.domain import FeatureKey, MessageSource
+
+TEST_USER_ID = 2001
+
+
+@pytest.fixture
+def usage_file() -> Generator:
+    """Point the data dir at a temp dir and return the test user's usage db."""
+    from docq import manage_spaces
+    from docq.support.store import get_sqlite_shared_system_file, get_sqlite_usage_file
+
+    with tempfile.TemporaryDirectory() as temp_dir, patch.dict(os.environ, {"DOCQ_DATA": temp_dir}):
+        # not manage_spaces._init(), other tests patch its system file path for the session
+        with closing(sqlite3.connect(get_sqlite_shared_system_file())) as connection:
+            connection.execute(manage_spaces.SQL_CREATE_THREAD_SPACES_TABLE)
+        yield get_sqlite_usage_file(TEST_USER_ID)
+
+
+@pytest.fixture
+def consolidated_usage_file(usage_file: str) -> Generator:
+    """Switch to the consolidated usage db layout and return the consolidated usage db."""
+    from docq.support.store import get_sqlite_consolidated_usage_file
+
+    with patch.dict(os.environ, {"DOCQ_USAGE_DB_MODE": "consolidated"}):
+        yield get_sqlite_consolidated_usage_file()
+
+
+def _save_test_messages(feature: FeatureKey, thread_id: int, count: int) -> list:
+    from docq.run_queries import _save_messages
+
+    return _save_messages([(f"message {i}", i % 2 == 0, datetime.now(), thread_id) for i in range(count)], feature)
+
+
+def test_history_page_keyset_pagination(usage_file: str) -> None:
+    """Pages walk back from the latest message without overlap, oldest first within a page."""
+    from docq.run_queries import history_page
+
+    feature = FeatureKey(OrganisationFeatureType.CHAT_PRIVATE, TEST_USER_ID)
+    _save_test_messages(feature, 2, 3)  # another thread
+    saved = _save_test_messages(feature, 1, 25)
+    saved_ids = [row[0] for row in saved]
+
+    pages = []
+    cursor = None
+    while True:
+        rows, cursor = history_page(feature, 1, 10, cursor=cursor)
+        pages.append([row[0] for row in rows])
+        if cursor is None:
+            break
+
+    assert pages == [saved_ids[15:], saved_ids[5:15], saved_ids[:5]]
+
+
+def test_history_page_ascending(usage_file: str) -> None:
+    """ASC pages walk forward from the first message."""
+    from docq.run_queries import history_page
+
+    feature = FeatureKey(OrganisationFeatureType.CHAT_PRIVATE, TEST_USER_ID)
+    saved_ids = [row[0] for row in _save_test_messages(feature, 1, 4)]
+
+    first, cursor = history_page(feature, 1, 2, sort_order="ASC")
+    second, last_cursor = history_page(feature, 1, 2, cursor=cursor, sort_order="ASC")
+
+    assert [row[0] for row in first] == saved_ids[:2]
+    assert [row[0] for row in second] == saved_ids[2:]
+    assert last_cursor is None
+
+
+def test_history_queries_use_thread_index(usage_file: str) -> None:
+    """Reading a thread's history uses the composite index instead of scanning the table."""
+    from docq.run_queries import history_page
+
+    feature = FeatureKey(OrganisationFeatureType.CHAT_PRIVATE, TEST_USER_ID)
+    history_page(feature, 1, 10)
+
+    with closing(sqlite3.connect(usage_file)) as connection, closing(connection.cursor()) as cursor:
+        plan = cursor.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM history_chat_private WHERE thread_id = ? AND id < ? ORDER BY id DESC LIMIT 10",
+            (1, 100),
+        ).fetchall()
+
+    assert any("idx_history_chat_private_thread_id_id" in row[-1] for row in plan)
+
+
+def test_save_messages_write_behind(usage_file: str) -> None:
+    """With write-behind enabled messages are queued without waiting, and get ids from SQLite when they're flushed."""
+    from docq.run_queries import _save_messages, get_sources_for_messages, history_page
+    from docq.support.write_behind import WriteBehindWriter
+
+    writer = WriteBehindWriter(flush_interval_sec=60)
+    writer.start()
+    try:
+        with patch("docq.support.write_behind._writer", writer):
+            feature = FeatureKey(OrganisationFeatureType.CHAT_PRIVATE, TEST_USER_ID)
+            saved = _save_test_messages(feature, 1, 3)
+            saved += _save_messages(
+                [("question", True, datetime.now(), 1), ("answer", False, datetime.now(), 1)],
+                feature,
+                [None, [MessageSource(node_id="n1", uri="file:///a.pdf")]],
+            )
+            assert writer.has_pending(usage_file)
+
+            rows, _ = history_page(feature, 1, 10)
+            sources = get_sources_for_messages(feature, [5])
+    finally:
+        writer.stop()
+
+    assert [row[0] for row in saved] == [None] * 5
+    assert [row[0] for row in rows] == [1, 2, 3, 4, 5]
+    assert [row[1] for row in rows] == [row[1] for row in saved]
+    assert [x.node_id for x in sources[5]] == ["n1"]
+
+
+def test_consolidated_history_partitioned_by_owner(consolidated_usage_file: str) -> None:
+    """Owners sharing the consolidated usage db only see their own threads and messages, with ids per owner."""
+    from docq.run_queries import create_history_thread, history_page, list_thread_history, thread_exists
+
+    feature = FeatureKey(OrganisationFeatureType.CHAT_PRIVATE, TEST_USER_ID)
+    other_feature = FeatureKey(OrganisationFeatureType.CHAT_PRIVATE, TEST_USER_ID + 1)
+    public_feature = FeatureKey(OrganisationFeatureType.ASK_PUBLIC, str(TEST_USER_ID))
+
+    thread_id = create_history_thread("mine", feature)
+    other_thread_id = create_history_thread("theirs", other_feature)
+    public_thread_id = create_history_thread("public", public_feature)
+    saved_ids = [row[0] for row in _save_test_messages(feature, thread_id, 3)]
+    _save_test_messages(other_feature, other_thread_id, 2)
+
+    assert thread_id == other_thread_id == public_thread_id == 1
+    assert saved_ids == [1, 2, 3]
+    assert [row[1] for row in list_thread_history(feature)] == ["mine"]
+    assert [row[0] for row in history_page(feature, thread_id, 10)[0]] == saved_ids
+    assert [row[0] for row in history_page(other_feature, other_thread_id, 10)[0]] == [1, 2]
+    assert history_page(public_feature, public_thread_id, 10)[0] == []
+    assert not thread_exists(2, TEST_USER_ID, OrganisationFeatureType.CHAT_PRIVATE)
+
+    with closing(sqlite3.connect(consolidated_usage_file)) as connection, closing(connection.cursor()) as cursor:
+        plan = cursor.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM history_chat_private WHERE scope = ? AND owner_id = ? AND thread_id = ? AND id < ? ORDER BY id DESC LIMIT 10",
+            ("personal", str(TEST_USER_ID), 1, 100),
+        ).fetchall()
+
+    assert any("idx_history_chat_private_owner_thread_id_id" in row[-1] for row in plan)
+
+
+def test_search_threads(usage_file: str) -> None:
+    """Search returns the best matching message per thread, matches prefixes and follows deletes."""
+    from docq.run_queries import _save_messages, create_history_thread, delete_thread, search_threads
+
+    feature = FeatureKey(OrganisationFeatureType.CHAT_PRIVATE, TEST_USER_ID)
+    kubernetes_thread = create_history_thread("kubernetes", feature)
+    cooking_thread = create_history_thread("cooking", feature)
+    _save_messages(
+        [
+            ("How do I scale a kubernetes deployment?", True, datetime.now(), kubernetes_thread),
+            ("Use kubectl scale on the kubernetes deployment.", False, datetime.now(), kubernetes_thread),
+            ("What temperature for roasting vegetables?", True, datetime.now(), cooking_thread),
+        ],
+        feature,
+    )
+
+    results = search_threads(feature, "kubernetes deploy")
+    assert [(r[0], r[1]) for r in results] == [(kubernetes_thread, "kubernetes")]
+    assert "<b>kubernetes</b>" in results[0][3]
+    assert [r[0] for r in search_threads(feature, "roast")] == [cooking_thread]
+    assert search_threads(feature, '" OR NOT *') == []
+
+    delete_thread(cooking_thread, feature)
+    assert search_threads(feature, "roast") == []
+
+
+def test_search_threads_consolidated(consolidated_usage_file: str) -> None:
+    """With the consolidated usage db search only returns the owner's threads."""
+    from docq.run_queries import _save_messages, create_history_thread, search_threads
+
+    feature = FeatureKey(OrganisationFeatureType.CHAT_PRIVATE, TEST_USER_ID)
+    other_feature = FeatureKey(OrganisationFeatureType.CHAT_PRIVATE, TEST_USER_ID + 1)
+    for f in (feature, other_feature):
+        thread_id = create_history_thread("topic", f)
+        _save_messages([(f"shared words from {f.id_}", True, datetime.now(), thread_id)], f)
+
+    results = search_threads(feature, "shared words")
+    assert len(results) == 1
+    assert str(TEST_USER_ID) in results[0][3]
+
+
+def test_summary_memory_history(usage_file: str) -> None:
+    """In summary mode older turns are folded into the thread summary and recent turns are sent without sources."""
+    from docq.run_queries import (
+        MESSAGE_WITH_SOURCES_TEMPLATE,
+        _retrieve_summary_memory,
+        _save_messages,
+        _strip_sources,
+        create_history_thread,
+        get_history_as_chat_messages,
+        update_thread_summary,
+    )
+
+    feature = FeatureKey(OrganisationFeatureType.ASK_SHARED, TEST_USER_ID)
+    thread_id = create_history_thread("topic", feature)
+    answer = MESSAGE_WITH_SOURCES_TEMPLATE.format(message="answer", source="\n##### Source:\n> *File:* doc.pdf\n")
+    for i in range(4):
+        _save_messages(
+            [(f"question {i}", True, datetime.now(), thread_id), (answer, False, datetime.now(), thread_id)], feature
+        )
+
+    with patch.dict(os.environ, {"DOCQ_HISTORY_MEMORY": "summary"}), patch(
+        "docq.run_queries.summarise_chat_history", return_value="summary of 0 and 1"
+    ) as summarise:
+        assert len(get_history_as_chat_messages(feature, thread_id)) == 8
+        assert update_thread_summary(feature, thread_id, None)
+        assert not update_thread_summary(feature, thread_id, None)
+        history = get_history_as_chat_messages(feature, thread_id)
+
+    assert summarise.call_count == 1
+    assert len(summarise.call_args.args[1]) == 4
+    assert len(history) == 5  # the summary and the last two turns
+    summary, rows = _retrieve_summary_memory(feature, thread_id)
+    assert summary == "summary of 0 and 1"
+    assert [row[1] for row in rows] == ["question 2", answer, "question 3", answer]
+    assert _strip_sources(answer) == "answer"
+
+
+@pytest.mark.parametrize("write_behind_enabled", [False, True])
+def test_message_sources_saved_separately(usage_file: str, write_behind_enabled: bool) -> None:
+    """Sources are stored in their own table, not the message text, and are deleted with the thread."""
+    from docq.run_queries import (
+        _save_messages,
+        create_history_thread,
+        delete_thread,
+        get_sources_for_messages,
+        history_page,
+    )
+    from docq.support.write_behind import WriteBehindWriter
+
+    feature = FeatureKey(OrganisationFeatureType.ASK_SHARED, TEST_USER_ID)
+    sources = [
+        MessageSource("node-1", 7, "/a.pdf", "1", 0.5, "a.pdf", "SpaceDataSourceFileBased"),
+        MessageSource("node-2", 7, "/a.pdf", "2", 0.9, "a.pdf", "SpaceDataSourceFileBased"),
+    ]
+    writer = WriteBehindWriter(flush_interval_sec=60)
+    if write_behind_enabled:
+        writer.start()
+    try:
+        with patch("docq.support.write_behind._writer", writer):
+            thread_id = create_history_thread("topic", feature)
+            _save_messages(
+                [("question", True, datetime.now(), thread_id), ("answer", False, datetime.now(), thread_id)],
+                feature,
+                [None, sources],
+            )
+            rows = history_page(feature, thread_id, 10)[0]
+            answer_id = rows[1][0]
+
+            assert [row[1] for row in rows] == ["question", "answer"]
+            expected = {answer_id: [sources[1], sources[0]]}  # highest score first
+            assert get_sources_for_messages(feature, [row[0] for row in rows]) == expected
+
+            assert delete_thread(thread_id, feature)
+            assert get_sources_for_messages(feature, [answer_id]) == {}
+    finally:
+        writer.stop()
+
+
+def test_run_queries(usage_file: str) -> None:
+    """Every question gets a result, a failed one has the error, and history is only saved when asked."""
+    from docq.run_queries import create_history_thread, history_page, run_queries
+
+    feature = FeatureKey(OrganisationFeatureType.ASK_SHARED, TEST_USER_ID)
+    thread_id = create_history_thread("topic", feature)
+
+    def _run_ask_batch(inputs: list, *args: object) -> Generator:
+        yield 1, ValueError("failed")
+        yield 0, Mock(response="answer 0", source_nodes=[])
+
+    with patch("docq.run_queries.run_ask_batch", side_effect=_run_ask_batch):
+        results = list(run_queries(["question 0", "question 1"], feature, Mock(), Mock(), [Mock()], thread_id))
+        assert history_page(feature, thread_id, 10)[0] == []
+
+        saved = list(run_queries(["question 0", "question 1"], feature, Mock(), Mock(), [Mock()], thread_id, True))
+
+    assert [(r.index, r.input_, r.response, r.error) for r in results] == [
+        (1, "question 1", None, "failed"),
+        (0, "question 0", "answer 0", None),
+    ]
+    assert saved == results
+    assert [row[1] for row in history_page(feature, thread_id, 10, sort_order="ASC")[0]] == ["question 0", "answer 0"]
+    with pytest.raises(ValueError, match="thread_id is required"):
+        run_queries(["question 0"], feature, Mock(), Mock(), [Mock()], save_history=True)
+
+
+def test_thread_history_version(usage_file: str) -> None:
+    """The version changes when messages are added to the thread and not when other threads change."""
+    from docq.run_queries import create_history_thread, get_thread_history_version
+
+    feature = FeatureKey(OrganisationFeatureType.ASK_SHARED, TEST_USER_ID)
+    thread_id, other_thread_id = create_history_thread("topic", feature), create_history_thread("other", feature)
+    assert get_thread_history_version(feature, thread_id) == (None, 0)
+
+    _save_test_messages(feature, thread_id, 2)
+    version = get_thread_history_version(feature, thread_id)
+    _save_test_messages(feature, other_thread_id, 2)
+
+    assert version[1] == 2
+    assert get_thread_history_version(feature, thread_id) == version
+    _save_test_messages(feature, thread_id, 1)
+    assert get_thread_history_version(feature, thread_id) != version
@@ -0,0 +1,80 @@
+"""Tests for docq.services.google_drive module."""
+import os
+from typing import Self
+from unittest.mock import MagicMock
+
+from docq.services.google_drive import PARTIAL_DOWNLOAD_SUFFIX, PARTIAL_VERSION_SUFFIX, download_file
+
+CONTENT = b"0123456789abc"
+
+
+class _Response(dict):
+    def __init__(self: Self, status: int, content_range: str) -> None:
+        super().__init__({"content-range": content_range})
+        self.status = status
+
+
+class _Http:
+    """Serves `Range` requests for CONTENT and records the start of each range."""
+
+    def __init__(self: Self) -> None:
+        self.starts: list[int] = []
+
+    def request(self: Self, uri: str, method: str, headers: dict) -> tuple[_Response, bytes]:
+        start, end = (int(x) for x in headers["range"].removeprefix("bytes=").split("-"))
+        self.starts.append(start)
+        if start >= len(CONTENT):
+            return _Response(416, f"bytes */{len(CONTENT)}"), b""
+        chunk = CONTENT[start : end + 1]
+        return _Response(206, f"bytes {start}-{start + len(chunk) - 1}/{len(CONTENT)}"), chunk
+
+
+def _download(tmp_path: str, partial: bytes | None, partial_version: str | None) -> tuple[bool, str, _Http]:
+    file_name = os.path.join(tmp_path, "file.pdf")
+    if partial is not None:
+        with open(file_name + PARTIAL_DOWNLOAD_SUFFIX, "wb") as f:
+            f.write(partial)
+    if partial_version is not None:
+        with open(file_name + PARTIAL_VERSION_SUFFIX, "w", encoding="utf-8") as f:
+            f.write(partial_version)
+    http = _Http()
+    service = MagicMock()
+    service.files.return_value.get_media.return_value = MagicMock(headers={}, uri="https://drive/file", http=http)
+
+    downloaded = download_file(service, "id", file_name, "application/pdf", chunk_size=4, version="v1")
+    return downloaded, file_name, http
+
+
+def _read(file_name: str) -> bytes:
+    with open(file_name, "rb") as f:
+        return f.read()
+
+
+def test_download_resumes_partial_of_same_version(tmp_path: str) -> None:
+    """A partial download of the same version continues from where it stopped."""
+    downloaded, file_name, http = _download(tmp_path, CONTENT[:5], "v1")
+
+    assert downloaded
+    assert http.starts == [5, 9]
+    assert _read(file_name) == CONTENT
+    assert not os.path.exists(file_name + PARTIAL_DOWNLOAD_SUFFIX)
+    assert not os.path.exists(file_name + PARTIAL_VERSION_SUFFIX)
+
+
+def test_download_discards_partial_of_another_version(tmp_path: str) -> None:
+    """A partial download of another version, or of an unknown version, is discarded and the download starts over."""
+    for partial_version in ("v0", None):
+        downloaded, file_name, http = _download(tmp_path, b"stale", partial_version)
+
+        assert downloaded
+        assert http.starts == [0, 4, 8, 12]
+        assert _read(file_name) == CONTENT
+
+
+def test_download_of_complete_partial_finishes(tmp_path: str) -> None:
+    """A partial download that's already complete gets a 416 for the range after it, and is done."""
+    downloaded, file_name, http = _download(tmp_path, CONTENT, "v1")
+
+    assert downloaded
+    assert http.starts == [len(CONTENT)]
+    assert _read(file_name) == CONTENT
@@ -0,0 +1,61 @@
+"""Tests for docq.services.ms_onedrive module."""
+import os
+from unittest.mock import MagicMock, patch
+
+import requests
+from docq.services.ms_onedrive import PARTIAL_DOWNLOAD_SUFFIX, download_file
+
+
+def _download(
+    tmp_path: str, status_code: int, content: bytes, etag: str | None = "v2", headers: dict | None = None
+) -> tuple[bool, str, MagicMock]:
+    file_path = os.path.join(tmp_path, "file.pdf")
+    with open(file_path + PARTIAL_DOWNLOAD_SUFFIX, "wb") as f:
+        f.write(b"01234")
+    response = MagicMock(status_code=status_code, headers=headers or {})
+    response.iter_content.return_value = [content]
+    with patch("docq.services.ms_onedrive.requests.get") as get:
+        get.return_value.__enter__.return_value = response
+        downloaded = download_file(MagicMock(), "id", file_path, "https://onedrive/download", etag=etag)
+    return downloaded, file_path, get
+
+
+def _read(file_path: str) -> bytes:
+    with open(file_path, "rb") as f:
+        return f.read()
+
+
+def test_download_resumes_unchanged_file(tmp_path: str) -> None:
+    """A partial download is resumed with If-Range so only the rest of an unchanged file is sent."""
+    downloaded, file_path, get = _download(tmp_path, requests.codes.partial_content, b"56789")
+
+    assert downloaded
+    assert get.call_args.kwargs["headers"] == {"Range": "bytes=5-", "If-Range": "v2"}
+    assert _read(file_path) == b"0123456789"
+
+
+def test_download_of_changed_file_starts_over(tmp_path: str) -> None:
+    """When the file changed since the partial download the whole new version is sent and replaces it."""
+    downloaded, file_path, _ = _download(tmp_path, requests.codes.ok, b"new version")
+
+    assert downloaded
+    assert _read(file_path) == b"new version"
+
+
+def test_download_without_etag_starts_over(tmp_path: str) -> None:
+    """Without an eTag to check the partial download against it isn't resumed."""
+    downloaded, file_path, get = _download(tmp_path, requests.codes.ok, b"whole file", etag=None)
+
+    assert downloaded
+    assert get.call_args.kwargs["headers"] == {}
+    assert _read(file_path) == b"whole file"
+
+
+def test_download_of_complete_partial_finishes(tmp_path: str) -> None:
+    """A partial download that's already complete gets a 416 for the range after it, and is done."""
+    downloaded, file_path, _ = _download(
+        tmp_path, requests.codes.requested_range_not_satisfiable, b"", headers={"Content-Range": "bytes */5"}
+    )
+
+    assert downloaded
+    assert _read(file_path) == b"01234"
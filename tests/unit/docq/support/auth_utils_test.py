@@ -4,7 +4,7 @@ from secrets import token_hex
 from typing import Self
 from unittest.mock import Mock, PropertyMock, patch
 
-from docq.support import auth_utils
+from docq.support import auth_utils, session_store
 from docq.support.auth_utils import (
     SESSION_COOKIE_NAME,
     _clear_cookie,
@@ -16,8 +16,6 @@ from docq.support.auth_utils import (
     _set_cookie,
     _set_cookie_session_id,
     _verify_hmac,
-    cached_session_data,
-    cached_session_ids,
     generate_hmac_session_id,
     get_cache_auth_session,
     reset_cache_and_cookie_auth_session,
@@ -31,6 +29,10 @@ class TestAuthUtils(unittest.TestCase):
     def setUp(self: Self) -> None:
         """Setup module."""
         auth_utils.AUTH_SESSION_SECRET_KEY = token_hex(32)
+        self.store = session_store.MemorySessionStore()
+        patcher = patch("docq.support.session_store._store", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     @patch("docq.support.auth_utils.html")
     def test_set_cookie(self: Self, mock_html: Mock) -> None:
@@ -82,7 +84,6 @@ class TestAuthUtils(unittest.TestCase):
     def test_get_cookie_session_id(self: Self, mock_get_cookies: Mock) -> None:
         """Test get session id."""
         session_id = generate_hmac_session_id()
-        cached_session_data[session_id] = _encrypt(("9999", "user", 1))
         mock_get_cookies.return_value = {SESSION_COOKIE_NAME: session_id}
         result = _get_cookie_session_id()
         assert result == session_id
@@ -101,7 +102,7 @@ class TestAuthUtils(unittest.TestCase):
         session_id = generate_hmac_session_id()
         mock_get_cookie_session_id.return_value = session_id
         set_cache_auth_session(payload)
-        assert session_id in cached_session_data
+        assert self.store.get(session_id).data is not None
 
     @patch("docq.support.auth_utils._get_cookie_session_id")
     def test_auth_result(
@@ -121,9 +122,7 @@ class TestAuthUtils(unittest.TestCase):
     def test_session_logout(self: Self, mock_get_cookie_session_id: Mock) -> None:
         """Test session logout."""
         session_id = generate_hmac_session_id()
-        cached_session_data[session_id] = _encrypt(("9999", "user", 1))
-        cached_session_ids[session_id] = session_id
+        self.store.put(session_id, session_store.Session(session_id=session_id, data=_encrypt({"user_id": 1})))
         mock_get_cookie_session_id.return_value = session_id
         reset_cache_and_cookie_auth_session()
-        assert session_id not in cached_session_data, "Cached session should be deleted on logout"
-        assert session_id not in cached_session_ids, "Session data should be deleted on logout"
+        assert self.store.get(session_id) is None, "Session should be deleted on logout"
@@ -0,0 +1,81 @@
+"""Tests for docq.support.dedupe_store module."""
+import os
+import tempfile
+from typing import Generator
+from unittest.mock import patch
+
+import pytest
+from docq.support.dedupe_store import MemoryDedupeStore, SqliteDedupeStore
+
+
+@pytest.fixture
+def sqlite_file() -> Generator:
+    """A temp SQLite file for dedupe keys."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield os.path.join(temp_dir, "dedupe.db")
+
+
+def test_claims_shared_between_stores(sqlite_file: str) -> None:
+    """A key claimed by one process is a duplicate for another until it's removed."""
+    store_a, store_b = SqliteDedupeStore(sqlite_file), SqliteDedupeStore(sqlite_file)
+
+    assert store_a.add("C1_Ev1")
+    assert not store_b.add("C1_Ev1")
+    assert store_b.add("C1_Ev2")
+
+    assert store_b.remove("C1_Ev1")
+    assert not store_b.remove("C1_Ev1")
+    assert store_a.add("C1_Ev1")
+
+
+def test_expired_claims_reclaimed_and_swept(sqlite_file: str) -> None:
+    """An expired key can be claimed again, and the sweep deletes expired keys only."""
+    store = SqliteDedupeStore(sqlite_file, ttl_sec=100, sweep_batch_size=2)
+
+    with patch("docq.support.dedupe_store.time.time", return_value=1000):
+        for i in range(5):
+            store.add(f"key-{i}")
+    with patch("docq.support.dedupe_store.time.time", return_value=1050):
+        store.add("key-new")
+        assert not store.add("key-0")
+    with patch("docq.support.dedupe_store.time.time", return_value=1100):
+        assert store.add("key-0")
+        assert store.sweep_expired() == 4
+        assert not store.add("key-new")
+
+
+def test_sqlite_store_trimmed_to_max_keys(sqlite_file: str) -> None:
+    """A sweep trims the keys closest to expiry once there are more than `max_keys`."""
+    store = SqliteDedupeStore(sqlite_file, ttl_sec=100, sweep_batch_size=2, max_keys=3)
+
+    for i in range(6):
+        with patch("docq.support.dedupe_store.time.time", return_value=1000 + i):
+            store.add(f"key-{i}")
+    with patch("docq.support.dedupe_store.time.time", return_value=1010):
+        assert store.sweep_expired() == 3
+        assert store.add("key-0")
+        assert not store.add("key-5")
+
+
+def test_memory_store_expiry_and_bound() -> None:
+    """Keys expire off the heap, the key closest to expiry is evicted when full, and removed keys can be reclaimed."""
+    now = [0.0]
+    store = MemoryDedupeStore(ttl_sec=10, max_keys=3, clock=lambda: now[0])
+
+    for i in range(3):
+        now[0] = i
+        assert store.add(f"key-{i}")
+    assert not store.add("key-1")
+
+    now[0] = 3
+    assert store.add("key-3")  # evicts key-0, the closest to expiry
+    assert len(store) == 3
+    assert store.add("key-0")
+
+    assert store.remove("key-3")
+    assert not store.remove("key-3")
+    assert store.add("key-3")
+
+    now[0] = 100
+    assert store.sweep_expired() == 3
+    assert len(store) == 0
@@ -0,0 +1,86 @@
+"""Tests for docq.support.llm_rate_limiter module."""
+import threading
+import time
+
+import pytest
+from docq.support.llm_rate_limiter import (
+    FairScheduler,
+    LlmRateLimiter,
+    LlmRateLimitExceededError,
+    TokenBucket,
+    get_llm_caller,
+    llm_caller,
+)
+
+
+def test_token_bucket_reserves_future_tokens() -> None:
+    """Once the burst is used up callers are told how long to wait, and turned away past the max wait."""
+    now = [0.0]
+    bucket = TokenBucket(rate_per_sec=1.0, capacity=2.0, clock=lambda: now[0])
+
+    assert bucket.reserve(max_wait=0) == 0.0
+    assert bucket.reserve(max_wait=0) == 0.0
+    assert bucket.reserve(max_wait=5) == pytest.approx(1.0)
+    assert bucket.reserve(max_wait=5) == pytest.approx(2.0)
+    assert bucket.reserve(max_wait=2.5) is None
+
+    now[0] = 10.0
+    assert bucket.reserve(max_wait=0) == 0.0
+
+
+def test_fair_scheduler_interleaves_orgs() -> None:
+    """A waiting call from a quiet org is admitted ahead of the queued backlog of a busy org."""
+    scheduler = FairScheduler("test", max_concurrency=1)
+    assert scheduler.acquire("busy", timeout=0)
+
+    admitted = []
+    threads = []
+    for i, flow in enumerate(["busy", "busy", "busy", "quiet"]):
+        thread = threading.Thread(target=lambda f=flow, n=i: scheduler.acquire(f, timeout=5) and admitted.append(n))
+        thread.start()
+        threads.append(thread)
+        while scheduler.queue_depth < i + 1:
+            time.sleep(0.001)
+
+    for _ in range(4):
+        count = len(admitted)
+        scheduler.release()
+        while len(admitted) == count:
+            time.sleep(0.001)
+    scheduler.release()
+    for thread in threads:
+        thread.join()
+
+    assert admitted == [0, 3, 1, 2]
+    assert scheduler.active == 0
+    assert scheduler.queue_depth == 0
+
+
+def test_fair_scheduler_timeout() -> None:
+    """A waiter that times out gives up its place and doesn't take a slot released later."""
+    scheduler = FairScheduler("test", max_concurrency=1)
+    assert scheduler.acquire(1, timeout=0)
+
+    assert not scheduler.acquire(2, timeout=0.01)
+    assert scheduler.queue_depth == 0
+
+    scheduler.release()
+    assert scheduler.active == 0
+    assert scheduler.acquire(2, timeout=0)
+
+
+def test_limiter_rejects_over_rate_and_attributes_caller() -> None:
+    """Calls are limited per user, with the user taken from `llm_caller()`, and other users aren't affected."""
+    limiter = LlmRateLimiter(org_rpm=0, user_rpm=6, max_wait_sec=0)
+
+    with llm_caller(1, 10):
+        assert get_llm_caller().user_id == 10
+        with limiter.limit("test", max_concurrency=2):
+            pass
+        with pytest.raises(LlmRateLimitExceededError), limiter.limit("test", max_concurrency=2):
+            pass
+    with llm_caller(1, 11), limiter.limit("test", max_concurrency=2):
+        pass
+
+    assert get_llm_caller().user_id is None
+    assert limiter.get_scheduler("test", 2).active == 0
@@ -39,3 +39,31 @@ def test_run_chat() -> None:
         )
         mocked_chat.assert_called_once_with("My ask")
         assert response == "LLM response"
+
+
+def test_run_ask_batch() -> None:
+    """Test retrievers are created once, questions are embedded in batches and a failed question doesn't stop the batch."""
+    from docq.support.llm import RagRetrievers, run_ask_batch
+
+    embed_model = Mock()
+    embed_model.embed_batch_size = 2
+    embed_model._get_query_embeddings.side_effect = lambda batch: [[float(len(q))] for q in batch]
+    retrievers = RagRetrievers(
+        service_context=Mock(embed_model=embed_model), vector_retriever=Mock(callback_manager=None), bm25_retriever=Mock()
+    )
+
+    def _run_ask_pipeline(input_: str, *args: object) -> str:
+        if input_ == "fail":
+            raise ValueError("failed")
+        return f"answer to {input_}"
+
+    with patch("docq.support.llm.get_rag_retrievers", return_value=retrievers) as get_rag_retrievers, patch(
+        "docq.support.llm._run_ask_pipeline", side_effect=_run_ask_pipeline
+    ):
+        results = dict(run_ask_batch(["a", "fail", "c", "a"], [], Mock(), Mock(Assistant), [Mock()], max_concurrency=2))
+
+    get_rag_retrievers.assert_called_once()
+    assert embed_model._get_query_embeddings.call_count == 2  # 3 distinct questions in batches of 2
+    assert results[0] == results[3] == "answer to a"
+    assert results[2] == "answer to c"
+    assert isinstance(results[1], ValueError)
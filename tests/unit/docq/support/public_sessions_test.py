@@ -0,0 +1,83 @@
+"""Public session cleanup unit tests."""
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+from datetime import datetime
+from typing import Generator
+from unittest.mock import patch
+
+import pytest
+from docq.config import OrganisationFeatureType
+from docq.domain import FeatureKey
+from docq.support import public_sessions
+from docq.support.store import (
+    get_public_sqlite_usage_dir,
+    get_public_sqlite_usage_file,
+    get_sqlite_global_system_file,
+    get_sqlite_shared_system_file,
+)
+
+EXPIRED = int(time.time()) - public_sessions.INACTIVITY_THRESHOLD - 60
+
+
+@pytest.fixture(autouse=True)
+def _data_dir() -> Generator:
+    with tempfile.TemporaryDirectory() as temp_dir, patch.dict(os.environ, {"DOCQ_DATA": temp_dir}):
+        public_sessions._init_tables()
+        yield
+
+
+def _activity_session_ids() -> list[str]:
+    with closing(sqlite3.connect(get_sqlite_global_system_file())) as connection:
+        return [row[0] for row in connection.execute("SELECT session_id FROM public_session_activity ORDER BY 1")]
+
+
+def test_acquire_lease() -> None:
+    """Only one holder gets the lease until it expires. The holder can renew it."""
+    assert public_sessions.acquire_lease("cleanup", "a", 60)
+    assert not public_sessions.acquire_lease("cleanup", "b", 60)
+    assert public_sessions.acquire_lease("cleanup", "a", 60)
+
+    assert public_sessions.acquire_lease("expired", "a", -1)
+    assert public_sessions.acquire_lease("expired", "b", 60)
+
+
+def test_reap_expired_sessions_in_batches() -> None:
+    """Expired sessions' dirs and activity are deleted in batches. Active sessions are kept."""
+    for session_id in ("expired-1", "expired-2", "expired-3", "active"):
+        get_public_sqlite_usage_file(session_id)
+        public_sessions.record_activity(session_id, EXPIRED if session_id.startswith("expired") else None)
+
+    with patch.object(public_sessions, "sessions_reaped_counter") as counter:
+        assert public_sessions.reap_expired_sessions(batch_size=2) == 3
+
+    assert [call.args[0] for call in counter.add.call_args_list] == [2, 1]
+    assert _activity_session_ids() == ["active"]
+    assert not os.path.exists(get_public_sqlite_usage_dir("expired-1"))
+    assert os.path.exists(get_public_sqlite_usage_dir("active"))
+
+
+def test_reap_expired_sessions_consolidated() -> None:
+    """With the consolidated usage db only the expired session's rows are deleted."""
+    from docq import manage_spaces
+    from docq.run_queries import _save_messages, create_history_thread, list_thread_history
+
+    # not manage_spaces._init(), other tests patch its system file path for the session
+    with closing(sqlite3.connect(get_sqlite_shared_system_file())) as connection:
+        connection.execute(manage_spaces.SQL_CREATE_THREAD_SPACES_TABLE)
+    features = {session_id: FeatureKey(OrganisationFeatureType.ASK_PUBLIC, session_id) for session_id in ("old", "new")}
+    with patch.dict(os.environ, {"DOCQ_USAGE_DB_MODE": "consolidated"}):
+        for feature in features.values():
+            thread_id = create_history_thread("topic", feature)
+            _save_messages([("hello", True, datetime.now(), thread_id)], feature)
+        with closing(sqlite3.connect(get_sqlite_global_system_file())) as connection:
+            connection.execute(
+                "UPDATE public_session_activity SET last_activity_at = ? WHERE session_id = ?", (EXPIRED, "old")
+            )
+            connection.commit()
+
+        assert public_sessions.reap_expired_sessions() == 1
+        assert list_thread_history(features["old"]) == []
+        assert len(list_thread_history(features["new"])) == 1
@@ -0,0 +1,57 @@
+"""Tests for docq.support.session_store module."""
+import os
+import sqlite3
+import tempfile
+from contextlib import closing
+from typing import Generator
+from unittest.mock import patch
+
+import pytest
+from docq.support.session_store import Session, SqliteSessionStore
+
+
+@pytest.fixture
+def sqlite_file() -> Generator:
+    """A temp SQLite file for sessions."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield os.path.join(temp_dir, "sessions.db")
+
+
+def test_sessions_shared_between_stores(sqlite_file: str) -> None:
+    """A session written by one process is read by another, and a delete is seen by both."""
+    store_a, store_b = SqliteSessionStore(sqlite_file), SqliteSessionStore(sqlite_file)
+
+    store_a.put("hmac-1", Session(session_id="id-1", data=b"encrypted"))
+    assert store_b.get("hmac-1") == Session(session_id="id-1", data=b"encrypted")
+
+    store_b.delete("hmac-1")
+    assert store_a.get("hmac-1") is None
+    with closing(sqlite3.connect(sqlite_file)) as connection:
+        assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_sliding_expiry(sqlite_file: str) -> None:
+    """A read extends the expiry once the touch interval has passed, and expired sessions aren't returned."""
+    store = SqliteSessionStore(sqlite_file, ttl_sec=100, touch_interval_sec=10)
+
+    with patch("docq.support.session_store.time.time", return_value=1000):
+        store.put("hmac-1", Session(session_id="id-1"))
+    with patch("docq.support.session_store.time.time", return_value=1050):
+        assert store.get("hmac-1") is not None
+    with patch("docq.support.session_store.time.time", return_value=1140):
+        assert store.get("hmac-1") is not None
+    with patch("docq.support.session_store.time.time", return_value=1300):
+        assert store.get("hmac-1") is None
+
+
+def test_sweep_expired_in_batches(sqlite_file: str) -> None:
+    """Expired sessions are deleted in batches and live sessions are kept."""
+    store = SqliteSessionStore(sqlite_file, ttl_sec=100, sweep_batch_size=2)
+
+    with patch("docq.support.session_store.time.time", return_value=1000):
+        for i in range(5):
+            store.put(f"expired-{i}", Session(session_id=str(i)))
+    with patch("docq.support.session_store.time.time", return_value=2000):
+        store.put("live", Session(session_id="live"))
+        assert store.sweep_expired() == 5
+        assert store.get("live") is not None
@@ -0,0 +1,202 @@
+"""Write-behind persistence unit tests."""
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import closing
+from typing import Generator
+from unittest.mock import patch
+
+import pytest
+from docq.support.write_behind import SPILL_FILE_SUFFIX, WriteBehindWriter
+
+SQL_CREATE_TABLE = "CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY, text TEXT NOT NULL)"
+SQL_INSERT = "INSERT INTO messages (id, text) VALUES (?, ?)"
+
+
+@pytest.fixture
+def db_file() -> Generator:
+    """A temp SQLite file."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield os.path.join(temp_dir, "usage.db")
+
+
+def _read_ids(db_file: str) -> list[int]:
+    with closing(sqlite3.connect(db_file)) as connection, closing(connection.cursor()) as cursor:
+        return [row[0] for row in cursor.execute("SELECT id FROM messages ORDER BY id").fetchall()]
+
+
+def test_writes_batched_in_one_executemany(db_file: str) -> None:
+    """Consecutive writes with the same statement are written with a single executemany."""
+    writer = WriteBehindWriter(flush_interval_sec=60)
+    writer.start()
+    try:
+        for i in range(1, 6):
+            writer.enqueue(db_file, SQL_INSERT, [(i, f"message {i}")], init_sql=(SQL_CREATE_TABLE,))
+        assert writer.has_pending(db_file)
+
+        with patch("docq.support.write_behind.sqlite3.connect", wraps=sqlite3.connect) as connect:
+            writer.flush(db_file)
+        assert connect.call_count == 1
+    finally:
+        writer.stop()
+
+    assert not writer.has_pending()
+    assert _read_ids(db_file) == [1, 2, 3, 4, 5]
+
+
+def test_stop_flushes_pending(db_file: str) -> None:
+    """Pending writes are written when the writer stops."""
+    writer = WriteBehindWriter(flush_interval_sec=60, wal=True)
+    writer.start()
+    writer.enqueue(db_file, SQL_INSERT, [(1, "a"), (2, "b")], init_sql=(SQL_CREATE_TABLE,))
+    writer.stop()
+
+    assert _read_ids(db_file) == [1, 2]
+    with closing(sqlite3.connect(db_file)) as connection:
+        assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_not_running_writes_synchronously(db_file: str) -> None:
+    """Without the background flusher enqueue writes straight away."""
+    writer = WriteBehindWriter()
+    writer.enqueue(db_file, SQL_INSERT, [(1, "a")], init_sql=(SQL_CREATE_TABLE,))
+
+    assert not writer.has_pending()
+    assert _read_ids(db_file) == [1]
+
+
+def test_failed_write_requeued_in_order(db_file: str) -> None:
+    """A batch that fails is retried ahead of writes queued since."""
+    writer = WriteBehindWriter(flush_interval_sec=60)
+    writer.start()
+    try:
+        writer.enqueue(db_file, SQL_INSERT, [(1, "a")])  # no table yet so this fails
+        writer.flush(db_file)
+        assert writer.has_pending(db_file)
+
+        writer.enqueue(db_file, SQL_INSERT, [(2, "b")], init_sql=(SQL_CREATE_TABLE,))
+        writer.flush(db_file)
+    finally:
+        writer.stop()
+
+    assert _read_ids(db_file) == [1, 2]
+
+
+def test_submitted_write_gets_sqlite_assigned_ids(db_file: str) -> None:
+    """A submitted write runs in the flush transaction and its future has what SQLite assigned, here the row ids."""
+    writer = WriteBehindWriter(flush_interval_sec=60)
+    writer.start()
+    try:
+        writer.enqueue(db_file, SQL_INSERT, [(1, "a")], init_sql=(SQL_CREATE_TABLE,))
+        future = writer.submit(
+            db_file,
+            lambda cursor: [
+                cursor.execute("INSERT INTO messages (text) VALUES (?)", (text,)).lastrowid for text in ("b", "c")
+            ],
+            init_sql=(SQL_CREATE_TABLE,),
+        )
+        assert not future.done()
+        writer.flush(db_file)
+    finally:
+        writer.stop()
+
+    assert future.result() == [2, 3]
+    assert _read_ids(db_file) == [1, 2, 3]
+
+
+def _insert_texts(cursor: sqlite3.Cursor, texts: list[str]) -> None:
+    for text in texts:
+        cursor.execute("INSERT INTO messages (text) VALUES (?)", (text,))
+
+
+def test_enqueued_write_retried_then_spilled(db_file: str) -> None:
+    """A queued function write is retried when its batch fails, and spilled with its args when it's rejected."""
+    writer = WriteBehindWriter(flush_interval_sec=60)
+    writer.start()
+    try:
+        writer.enqueue_write(db_file, _insert_texts, ["a", "b"])  # no table yet so this fails
+        writer.flush(db_file)
+        assert writer.has_pending(db_file)
+
+        writer.enqueue_write(db_file, _insert_texts, ["c"], init_sql=(SQL_CREATE_TABLE,))
+        writer.enqueue_write(db_file, _insert_texts, [None])
+        writer.flush(db_file)
+    finally:
+        writer.stop()
+
+    assert _read_ids(db_file) == [1, 2, 3]
+    with open(db_file + SPILL_FILE_SUFFIX, encoding="utf-8") as f:
+        spilled = [json.loads(line) for line in f]
+    assert [(line["sql"], line["rows"]) for line in spilled] == [(f"{__name__}._insert_texts", [[[None]]])]
+
+
+def test_flushes_of_different_files_run_concurrently(db_file: str) -> None:
+    """A flush of one file doesn't wait for a flush of another file in progress."""
+    other_db_file = db_file + ".other"
+    writer = WriteBehindWriter(flush_interval_sec=60)
+    writer.start()
+    in_flush, release = threading.Event(), threading.Event()
+
+    def blocking_write(cursor: sqlite3.Cursor) -> None:
+        in_flush.set()
+        release.wait(10)
+        _insert_texts(cursor, ["slow"])
+
+    try:
+        writer.enqueue_write(other_db_file, blocking_write, init_sql=(SQL_CREATE_TABLE,))
+        background = threading.Thread(target=writer.flush, args=(other_db_file,))
+        background.start()
+        assert in_flush.wait(10)
+
+        writer.enqueue(db_file, SQL_INSERT, [(1, "a")], init_sql=(SQL_CREATE_TABLE,))
+        writer.flush(db_file)
+        assert _read_ids(db_file) == [1]
+        assert background.is_alive()
+    finally:
+        release.set()
+        background.join()
+        writer.stop()
+
+    assert _read_ids(other_db_file) == [1]
+
+
+def test_rejected_write_spilled_and_rest_committed(db_file: str) -> None:
+    """A write the database rejects is spilled to disk and the rest of the batch is committed.
+
+    A rejected submitted write fails its future instead.
+    """
+    writer = WriteBehindWriter(flush_interval_sec=60)
+    writer.start()
+    try:
+        writer.enqueue(db_file, SQL_INSERT, [(1, "a")], init_sql=(SQL_CREATE_TABLE,))
+        writer.enqueue(db_file, SQL_INSERT, [(1, "duplicate")])
+        writer.enqueue(db_file, SQL_INSERT, [(2, "b")])
+        future = writer.submit(db_file, lambda cursor: cursor.execute(SQL_INSERT, (2, "duplicate")))
+        writer.flush(db_file)
+    finally:
+        writer.stop()
+
+    assert _read_ids(db_file) == [1, 2]
+    assert isinstance(future.exception(), sqlite3.IntegrityError)
+    with open(db_file + SPILL_FILE_SUFFIX, encoding="utf-8") as f:
+        spilled = [json.loads(line) for line in f]
+    assert [(line["sql"], line["rows"]) for line in spilled] == [(SQL_INSERT, [[1, "duplicate"]])]
+
+
+def test_failing_batch_kept_until_stop_then_spilled(db_file: str) -> None:
+    """A batch that keeps failing stays queued however many flushes fail, and is spilled to disk on stop."""
+    writer = WriteBehindWriter(flush_interval_sec=60)
+    writer.start()
+    writer.enqueue(db_file, "INSERT INTO missing (id) VALUES (?)", [(1,)])
+    for _ in range(5):
+        writer.flush(db_file)
+        assert writer.has_pending(db_file)
+    writer.stop()
+
+    assert not writer.has_pending()
+    with open(db_file + SPILL_FILE_SUFFIX, encoding="utf-8") as f:
+        spilled = [json.loads(line) for line in f]
+    assert [line["rows"] for line in spilled] == [[[1]]]
+    assert spilled[0]["attempts"] >= 6
@@ -0,0 +1,84 @@
+"""Tests for web.api.utils.auth_utils module."""
+import os
+import time
+from typing import Generator
+from unittest.mock import patch
+
+import pytest
+from tornado.web import HTTPError
+
+from web.api.models import UserModel
+from web.api.utils import auth_utils
+
+USER = UserModel(uid=1, fullname="Test User", super_admin=False, username="test@docq.ai")
+
+
+@pytest.fixture(autouse=True)
+def key_ring(tmp_path: str, monkeypatch: pytest.MonkeyPatch) -> Generator:
+    """A key ring over an empty key dir that checks the key files on every use."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(auth_utils, "KEY_RING", auth_utils.JwtKeyRing(reload_check_sec=0))
+    auth_utils._verified_tokens.clear()
+    yield auth_utils.KEY_RING
+    auth_utils._verified_tokens.clear()
+
+
+def _kid(token: str) -> str:
+    return auth_utils._get_token_kid(token)
+
+
+def test_key_rotation(key_ring: auth_utils.JwtKeyRing) -> None:
+    """Tokens signed with a retired key verify by kid until the retired public key is removed."""
+    old_token = auth_utils.encode_jwt(USER)
+    old_kid, _ = key_ring.signing_key()
+    assert _kid(old_token) == old_kid
+
+    key_dir_path = auth_utils._get_key_dir_path()
+    os.rename(os.path.join(key_dir_path, "public.pem"), os.path.join(key_dir_path, "public.old.pem"))
+    os.remove(os.path.join(key_dir_path, "private.pem"))
+
+    new_token = auth_utils.encode_jwt(USER)
+    new_kid, _ = key_ring.signing_key()
+    assert new_kid != old_kid
+    assert _kid(new_token) == new_kid
+    assert auth_utils.get_user_from_jwt(old_token) == USER
+    assert auth_utils.get_user_from_jwt(new_token) == USER
+
+    os.remove(os.path.join(key_dir_path, "public.old.pem"))
+
+    with pytest.raises(HTTPError) as e:
+        auth_utils.get_user_from_jwt(old_token)
+    assert e.value.status_code == 401
+    assert auth_utils.get_user_from_jwt(new_token) == USER
+
+
+def test_verified_token_cache_expiry() -> None:
+    """A verified token is verified again after the cache TTL, or sooner if the token itself expires first."""
+    now = time.time()
+    token = auth_utils.encode_jwt(USER)
+    kid, key = auth_utils.KEY_RING.signing_key()
+    short_lived_token = auth_utils.INSTANCE.encode(
+        {"exp": int(now) + 10, "data": USER.model_dump(by_alias=True)},
+        key,
+        alg="RS256",
+        optional_headers={"kid": kid},
+    )
+
+    with patch("web.api.utils.auth_utils.time.time", return_value=now):
+        assert auth_utils.get_user_from_jwt(token) == USER
+        assert auth_utils.get_user_from_jwt(short_lived_token) == USER
+
+    with patch.object(auth_utils.INSTANCE, "decode", wraps=auth_utils.INSTANCE.decode) as decode:
+        with patch("web.api.utils.auth_utils.time.time", return_value=now + 5):
+            assert auth_utils.get_user_from_jwt(token) == USER
+            assert auth_utils.get_user_from_jwt(short_lived_token) == USER
+        assert decode.call_count == 0
+
+        with patch("web.api.utils.auth_utils.time.time", return_value=int(now) + 10):
+            assert auth_utils.get_user_from_jwt(token) == USER
+            assert auth_utils.get_user_from_jwt(short_lived_token) == USER
+        assert decode.call_count == 1
+
+        with patch("web.api.utils.auth_utils.time.time", return_value=now + auth_utils.VERIFIED_TOKEN_CACHE_TTL_SEC):
+            assert auth_utils.get_user_from_jwt(token) == USER
+        assert decode.call_count == 2
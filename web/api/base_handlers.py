@@ -1,12 +1,14 @@
 """Base request handlers."""
+import hashlib
 import json
 from typing import Any, Optional, Self
 
-import docq.manage_organisations as m_orgs
+from docq.access_control.authorization import AuthorizationContext, get_authorization_context
 from opentelemetry import trace
 from tornado.web import HTTPError, RequestHandler
 
 from web.api.models import UserModel
+from web.api.utils.compression_utils import get_output_transform, negotiate_encoding
 from web.utils.handlers import _default_org_id as get_default_org_id
 
 tracer = trace.get_tracer(__name__)
@@ -16,7 +18,46 @@ class BaseRequestHandler(RequestHandler):
     """Base request Handler."""
 
     __selected_org_id: Optional[int] = None
+    __authorization_context: Optional[AuthorizationContext] = None
     _current_user = None
+    _content_encoding: Optional[str] = None
+
+    def prepare(self: Self) -> None:
+        """Compress the response with the encoding negotiated from the request's Accept-Encoding header."""
+        self._content_encoding = negotiate_encoding(self.request.headers.get("Accept-Encoding", ""))
+        transform = get_output_transform(self._content_encoding, self.request)
+        if transform is not None:
+            self._transforms.append(transform)
+
+    def _etag_for_encoding(self: Self, etag: Optional[str]) -> Optional[str]:
+        """Strong ETags must differ between encodings of the same response."""
+        if etag is None or self._content_encoding is None:
+            return etag
+        return f'{etag[:-1]}-{self._content_encoding}"'
+
+    def compute_etag(self: Self) -> Optional[str]:
+        """(Override) Tornado's hash of the response body, made distinct per content encoding."""
+        return self._etag_for_encoding(super().compute_etag())
+
+    def check_not_modified(self: Self, *version: Any) -> bool:
+        """Set a strong ETag derived from the version of the data a GET response is built from and check If-None-Match.
+
+        Call before loading and serializing the data, with e.g. row ids and `updated_at`s, so a poll for unchanged data
+        costs only the version lookup.
+
+        Returns:
+            bool: True if the client's copy is current. The response has been finished as a 304 and the handler
+                should return.
+        """
+        user_id = self.current_user.uid if self.current_user else None
+        digest = hashlib.sha256(repr((self.request.uri, user_id, version)).encode()).hexdigest()[:40]
+        self.set_header("Etag", self._etag_for_encoding(f'"{digest}"'))
+        self.set_header("Cache-Control", "private, no-cache")  # always revalidate, never share between users
+        if self.check_etag_header():
+            self.set_status(304)
+            self.finish()
+            return True
+        return False
 
     def check_origin(self: Self, origin: Any) -> bool:
         """Override the origin check if it's causing problems."""
@@ -29,13 +70,23 @@ class BaseRequestHandler(RequestHandler):
         # print("check_xsrf_cookie() called")
         return False
 
+    @property
+    def authorization_context(self: Self) -> AuthorizationContext:
+        """Get what the current user is authorized to access. Raises a 403 if the user is archived or has no org."""
+        if self.__authorization_context is None:
+            context = get_authorization_context(self.current_user.uid)
+            if context is None or not context.member_orgs:
+                raise HTTPError(403, reason="Forbidden", log_message="User archived or not a member of any org.")
+            self.__authorization_context = context
+        return self.__authorization_context
+
     @property
     def selected_org_id(self: Self) -> int:
         """Get the selected org id."""
         if self.__selected_org_id is None:
             u = self.current_user
-            member_orgs = m_orgs.list_organisations(user_id=u.uid)
-            self.__selected_org_id = get_default_org_id(member_orgs, (u.uid, u.fullname, u.super_admin, u.username))
+            member_orgs = self.authorization_context.member_orgs
+            self.__selected_org_id = get_default_org_id(member_orgs, (u.uid, u.fullname, u.super_admin, u.username))  # type: ignore[arg-type]
         return self.__selected_org_id
 
     @property
@@ -6,6 +6,7 @@ from docq.config import OrganisationFeatureType
 from docq.domain import FeatureKey
 from docq.manage_assistants import get_assistant_fixed
 from docq.model_selection.main import get_model_settings_collection
+from docq.support.llm_rate_limiter import llm_caller
 from opentelemetry import trace
 from pydantic import Field, ValidationError
 from tornado.web import HTTPError
@@ -89,13 +90,14 @@ class ChatCompletionHandler(BaseRequestHandler):
                 span.record_exception(ValueError(f"Thread with thread_id '{thread_id}' not found."))
                 raise HTTPError(status_code=400, log_message=f"Thread with thread_id '{thread_id}' not found.")
 
-            result = rq.query(
-                input_=payload.input_,
-                feature=feature,
-                thread_id=thread_id,
-                model_settings_collection=model_usage_settings,
-                assistant=assistant,
-            )
+            with llm_caller(self.selected_org_id, current_user_id):
+                result = rq.query(
+                    input_=payload.input_,
+                    feature=feature,
+                    thread_id=thread_id,
+                    model_settings_collection=model_usage_settings,
+                    assistant=assistant,
+                )
             messages = list(map(get_message_object, result))
             response_model = MessagesResponseModel(response=messages, meta={"model_settings": model_usage_settings.key})
 
@@ -1,29 +1,68 @@
-"""Slack event handlers aka listeners."""
+"""Slack event handlers aka listeners.
+
+Listeners ack straight away and queue the slow work on the Slack event queue, see `slack_event_queue`.
+"""
+
+import logging as log
 
 from docq.integrations.slack.slack_application import slack_app
 from opentelemetry import trace
 from slack_bolt import Ack
 from slack_bolt.context.say import Say
+from slack_sdk import WebClient
 
 from web.api.integration.utils import rag_completion
 
 from .slack_event_handler_middleware import (
     filter_duplicate_event_middleware,
     persist_message_middleware,
+    slack_event_tracker,
 )
+from .slack_event_queue import SlackEventQueueFullError, get_slack_event_queue
 
 tracer = trace.get_tracer(__name__)
 
 
 CHANNEL_TEMPLATE = "<@{user}> {response}"
 
+FALLBACK_RESPONSE = "I am sorry, something went wrong."
+
 # NOTE: middleware calls inject args so name needs to match. See for all available args https://slack.dev/bolt-python/api-docs/slack_bolt/kwargs_injection/args.html
 
 
+def reply_to_app_mention(client: WebClient, text: str, channel_id: str, thread_ts: str, user_id: str) -> None:
+    """Answer a mention with a RAG completion, replying in the thread. Run on the Slack event queue.
+
+    The event is acked before this runs so Slack won't retry it. If answering fails the fallback reply is posted
+    instead, so the mention isn't left unanswered, and the error is raised for the queue to record.
+    """
+    try:
+        response = rag_completion(text=text, channel_id=channel_id, thread_ts=thread_ts)
+        _post_reply(client, response, channel_id, thread_ts, user_id)
+    except Exception:
+        try:
+            _post_reply(client, FALLBACK_RESPONSE, channel_id, thread_ts, user_id)
+        except Exception as e:
+            log.error("Failed to post the fallback reply to a mention in channel '%s': %s", channel_id, e)
+        raise
+
+
+def _post_reply(client: WebClient, response: str, channel_id: str, thread_ts: str, user_id: str) -> None:
+    client.chat_postMessage(
+        text=CHANNEL_TEMPLATE.format(user=user_id, response=response),
+        channel=channel_id,
+        thread_ts=thread_ts,
+        mrkdwn=True,
+    )
+
+
 @slack_app.event("app_mention", middleware=[filter_duplicate_event_middleware])
 @tracer.start_as_current_span(name="handle_app_mention")
-def handle_app_mention_event(body: dict, ack: Ack, say: Say) -> None:
-    """Handle of type app_mention. i.e. [at]botname."""
+def handle_app_mention_event(body: dict, ack: Ack, client: WebClient) -> None:
+    """Handle of type app_mention. i.e. [at]botname.
+
+    The reply is queued and the event acked. If the queue is full the event is failed so Slack retries it later.
+    """
     span = trace.get_current_span()
     is_thread_message = False
     if body["event"].get("thread_ts", False):
@@ -41,14 +80,15 @@ def handle_app_mention_event(body: dict, ack: Ack, say: Say) -> None:
     user_id = body["event"]["user"]
 
     try:
-        ack()
-        response = rag_completion(text=text, channel_id=channel_id, thread_ts=thread_ts)
-        say(
-            text=CHANNEL_TEMPLATE.format(user=user_id, response=response),
-            channel=channel_id,
-            thread_ts=thread_ts,
-            mrkdwn=True,
+        queued = get_slack_event_queue().submit(
+            "reply_to_app_mention", reply_to_app_mention, client, text, channel_id, thread_ts, user_id
         )
+        if not queued:
+            # forget the event so the retry isn't dropped as a duplicate
+            if event_id:
+                slack_event_tracker.remove_event(event_id=event_id, channel_id=channel_id)
+            raise SlackEventQueueFullError(f"Slack event queue full, event '{event_id}' left for Slack to retry")
+        ack()
     except Exception as e:
         span.record_exception(e)
         span.set_status(trace.StatusCode.ERROR, str(e))
@@ -59,7 +99,7 @@ def handle_app_mention_event(body: dict, ack: Ack, say: Say) -> None:
 @tracer.start_as_current_span(name="handle_message")
 def handle_message(body: dict, ack: Ack, say: Say) -> None:
     """Events of type message. This fires for multiple types including app_mention."""
-    Ack()
+    ack()
 
 @slack_app.event("reaction_added", middleware=[filter_duplicate_event_middleware])
 @tracer.start_as_current_span(name="handle_reaction_added")
@@ -1,4 +1,8 @@
-"""Middleware for Slack event handlers."""
+"""Middleware for Slack event handlers.
+
+These run before the ack is sent so they only do what's needed to decide whether to handle an event. Anything slower
+goes on the Slack event queue.
+"""
 import json
 from typing import Callable
 
@@ -6,6 +10,7 @@ import docq.integrations.slack.manage_slack_messages as manage_slack_messages
 from opentelemetry import trace
 from slack_bolt import Ack
 
+from .slack_event_queue import get_slack_event_queue
 from .slack_event_tracker import SlackEventTracker
 from .slack_utils import get_org_id
 
@@ -35,7 +40,6 @@ def filter_duplicate_event_middleware(ack: Ack, body: dict, next_: Callable) ->
     event_id = body.get("event_id")
     thread_ts = body["event"].get("thread_ts")  # None if not a threaded message
     channel_id = body["event"]["channel"]
-    org_id = get_org_id(team_id)
 
     is_duplicate = False
     if event_id:
@@ -52,7 +56,6 @@ def filter_duplicate_event_middleware(ack: Ack, body: dict, next_: Callable) ->
             "event__event_id": str(event_id),
             "event__channel_id": channel_id,
             "event__is_duplicate": is_duplicate,
-            "org_id": org_id if org_id else "None",
         }
     )
 
@@ -62,9 +65,29 @@ def filter_duplicate_event_middleware(ack: Ack, body: dict, next_: Callable) ->
         ack()  # acknowledge the duplicate event to prevent Slack from resending it
 
 
+def persist_message(
+    client_msg_id: str, type_: str, channel: str, team: str, user: str, text: str, ts: str, thread_ts: str
+) -> None:
+    """Persist a message to the org's Slack messages. Run on the Slack event queue."""
+    org_id = get_org_id(team)
+    if org_id is None:
+        raise ValueError(f"No Org ID found for Slack team ID '{team}'")
+    manage_slack_messages.insert_or_update_message(
+        client_msg_id=client_msg_id,
+        type_=type_,
+        channel=channel,
+        team=team,
+        user=user,
+        text=text,
+        ts=ts,
+        thread_ts=thread_ts,
+        org_id=org_id,
+    )
+
+
 @tracer.start_as_current_span(name="persist_message_middleware")
 def persist_message_middleware(body: dict, next_: Callable) -> None:
-    """Middleware to persist messages."""
+    """Middleware to persist messages. The write is queued, or made here if the queue is full so it isn't lost."""
     span = trace.get_current_span()
     print(json.dumps(body, indent=4))
     client_msg_id = body["event"].get("client_msg_id")
@@ -76,7 +99,6 @@ def persist_message_middleware(body: dict, next_: Callable) -> None:
     ts = body["event"]["ts"]
     event_id = body.get("event_id")
     thread_ts = str(body["event"].get("thread_ts", None))  # None if not a threaded message
-    org_id = get_org_id(team)
 
     span.set_attributes(
         attributes={
@@ -88,23 +110,10 @@ def persist_message_middleware(body: dict, next_: Callable) -> None:
             "event__user_id": user,
             "event__event_id": str(event_id),
             "event__channel_id": channel,
-            "org_id": org_id or "None",
         }
     )
 
-    if org_id is None:
-        span.record_exception(ValueError(f"No Org ID found for Slack team ID '{team}'"))
-        span.set_status(trace.StatusCode.ERROR, "No Org ID found")
-        raise ValueError(f"No Org ID found for Slack team ID '{team}'")
-    manage_slack_messages.insert_or_update_message(
-        client_msg_id=client_msg_id,
-        type_=type_,
-        channel=channel,
-        team=team,
-        user=user,
-        text=text,
-        ts=ts,
-        thread_ts=thread_ts,
-        org_id=org_id,
-    )
+    message = (client_msg_id, type_, channel, team, user, text, ts, thread_ts)
+    if not get_slack_event_queue().submit("persist_message", persist_message, *message):
+        persist_message(*message)
     next_()
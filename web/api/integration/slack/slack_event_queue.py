@@ -0,0 +1,148 @@
+"""Bounded queue of Slack event work run by a pool of worker threads.
+
+Slack retries an event that isn't acked within 3 seconds, and Bolt only sends the ack once the listener returns. So
+listeners just queue the slow work, e.g. a RAG completion and posting the reply, and return. The workers do the rest.
+
+When the queue is full `submit` returns False and the listener fails the event so Slack redelivers it later, which is
+the backpressure.
+"""
+
+import atexit
+import logging as log
+import os
+import queue
+import threading
+from contextvars import Context, copy_context
+from typing import Any, Callable, Optional, Self
+
+import docq
+from docq.config import ENV_VAR_DOCQ_SLACK_EVENT_QUEUE_SIZE, ENV_VAR_DOCQ_SLACK_EVENT_WORKERS
+from opentelemetry import metrics, trace
+
+tracer = trace.get_tracer(__name__)
+meter = metrics.get_meter(__name__, docq.__version_str__)
+
+pending_counter = meter.create_up_down_counter(
+    "docq.slack.events.pending", unit="1", description="Slack event work queued or running."
+)
+rejected_counter = meter.create_counter(
+    "docq.slack.events.rejected", unit="1", description="Slack event work turned away because the queue was full."
+)
+
+WORKERS = 4
+"""Default number of worker threads."""
+
+MAX_PENDING = 100
+"""Default number of events queued before new ones are turned away."""
+
+STOP_TIMEOUT_SEC = 30
+"""How long shutdown waits for queued work to finish."""
+
+
+class SlackEventQueueFullError(Exception):
+    """The Slack event queue is full. Raised by listeners so Slack retries the event later."""
+
+
+class SlackEventQueue:
+    """Bounded queue of Slack event work with a pool of worker threads."""
+
+    def __init__(self: Self, workers: int = WORKERS, max_pending: int = MAX_PENDING) -> None:
+        """Initialise the queue. Workers are started on the first `submit`.
+
+        Args:
+            workers (int): number of worker threads.
+            max_pending (int): work queued before `submit` turns work away.
+        """
+        self.workers = workers
+        self._queue: queue.Queue[tuple[str, Context, Callable[..., None], tuple]] = queue.Queue(max_pending)
+        self._threads: list[threading.Thread] = []
+        self._running = False
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self: Self) -> int:
+        """Work queued and not yet picked up by a worker."""
+        return self._queue.qsize()
+
+    def start(self: Self) -> None:
+        """Start the workers."""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._threads = [
+                threading.Thread(target=self._run, name=f"docq-slack-events-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+        atexit.register(self.stop)
+
+    def stop(self: Self, timeout: float = STOP_TIMEOUT_SEC) -> None:
+        """Stop the workers once they have finished the queued work, waiting up to `timeout` seconds."""
+        with self._lock:
+            self._running = False
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout / max(1, len(threads)))
+        if self.pending:
+            log.warning("Slack event queue stopped with %s events not handled", self.pending)
+
+    def submit(self: Self, name: str, fn: Callable[..., None], *args: Any) -> bool:
+        """Queue `fn(*args)` to run on a worker.
+
+        The work runs in a copy of the caller's context, so its span is a child of the listener's.
+
+        Returns:
+            bool: True if queued, False if the queue is full.
+        """
+        self.start()
+        try:
+            self._queue.put_nowait((name, copy_context(), fn, args))
+        except queue.Full:
+            rejected_counter.add(1, {"work": name})
+            log.warning("Slack event queue full, turning away '%s'", name)
+            return False
+        pending_counter.add(1, {"work": name})
+        return True
+
+    def _run(self: Self) -> None:
+        while True:
+            try:
+                name, context, fn, args = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if not self._running:
+                    return
+                continue
+            try:
+                context.run(self._run_work, name, fn, args)
+            finally:
+                pending_counter.add(-1, {"work": name})
+                self._queue.task_done()
+
+    @staticmethod
+    def _run_work(name: str, fn: Callable[..., None], args: tuple) -> None:
+        with tracer.start_as_current_span(f"slack_event_queue.{name}") as span:
+            try:
+                fn(*args)
+            except Exception as e:
+                span.record_exception(e)
+                span.set_status(trace.StatusCode.ERROR, str(e))
+                log.exception("Slack event work '%s' failed: %s", name, e)
+
+
+_queue: Optional[SlackEventQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_slack_event_queue() -> SlackEventQueue:
+    """Get the process wide Slack event queue, sized from the environment."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = SlackEventQueue(
+                    workers=int(os.environ.get(ENV_VAR_DOCQ_SLACK_EVENT_WORKERS, WORKERS)),
+                    max_pending=int(os.environ.get(ENV_VAR_DOCQ_SLACK_EVENT_QUEUE_SIZE, MAX_PENDING)),
+                )
+    return _queue
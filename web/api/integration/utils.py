@@ -7,6 +7,7 @@ from docq.integrations.slack.manage_slack_messages import (
 from docq.manage_assistants import get_assistant_fixed
 from docq.model_selection.main import get_model_settings_collection, get_saved_model_settings_collection
 from docq.support.llm import run_ask, run_chat
+from docq.support.llm_rate_limiter import LlmRateLimitExceededError, llm_caller
 
 
 def chat_completion(text: str) -> str:
@@ -36,6 +37,10 @@ def rag_completion(text: str, channel_id: str, thread_ts: str) -> str:
         assistant = get_assistant_fixed(model_collection_settings.key)[
             "default"
         ]  # TODO: switch to using an assistant that saved so we can adjust per org.
-        response = run_ask(text, history, model_collection_settings, assistant, spaces)
+        try:
+            with llm_caller(org_id):
+                response = run_ask(text, history, model_collection_settings, assistant, spaces)
+        except LlmRateLimitExceededError:
+            return "I am getting too many questions right now. Please try again in a minute."
 
     return str(response.response) if response else "I am sorry, I could not find any relevant information." # type: ignore
@@ -18,14 +18,37 @@ class UserModel(BaseModel):
     super_admin: bool
     username: str
 
+class MessageSourceModel(CamelModel):
+    """Pydantic model for a document source of a message."""
+
+    node_id: str
+    space_id: Optional[int] = None
+    uri: Optional[str] = None
+    page: Optional[str] = None
+    score: Optional[float] = None
+    name: Optional[str] = None
+    source_type: Optional[str] = None
+
+
 class MessageModel(CamelModel):
     """Pydantic model for a message data."""
 
-    id_: int = Field(..., alias="id")
+    id_: Optional[int] = Field(..., alias="id")  # None until written when write-behind persistence is enabled.
     content: str
     human: bool
     timestamp: str
     thread_id: int
+    sources: list[MessageSourceModel] = []
+
+
+class BatchCompletionResultModel(CamelModel):
+    """Pydantic model for the answer to one question of a batch completion. Sent as a line of NDJSON."""
+
+    index: int
+    input_: str = Field(..., alias="input")
+    response: Optional[str] = None
+    sources: list[MessageSourceModel] = []
+    error: Optional[str] = None
 
 
 class ThreadModel(CamelModel):
@@ -43,6 +66,16 @@ class ThreadHistoryModel(CamelModel):
     messages: list[MessageModel]
 
 
+class ThreadSearchResultModel(CamelModel):
+    """Model for a Thread matching a search, with a snippet of its best matching message."""
+
+    thread_id: int
+    topic: Optional[str] = None
+    message_id: int
+    snippet: str
+    rank: float
+
+
 class SpaceModel(CamelModel):
     """Model for a Space."""
 
@@ -63,6 +96,16 @@ class FileModel(CamelModel):
     size: int
 
 
+class UploadedFileModel(CamelModel):
+    """Model for the result of a streamed file upload."""
+
+    filename: str
+    size: int
+    sha256: str
+    complete: bool
+    """False if the upload is incomplete and can be resumed."""
+
+
 class BaseResponseModel(CamelModel, ABC):
     """All HTTP API response models should inherit from this class."""
 
@@ -91,6 +134,13 @@ class ThreadHistoryResponseModel(BaseResponseModel):
     """HTTP response model for a single Thread with history messages."""
 
     response: ThreadHistoryModel
+    meta: Optional[dict[str, Optional[str]]] = None
+
+
+class ThreadSearchResponseModel(BaseResponseModel):
+    """HTTP response model for a **list** of Thread search results, best match first."""
+
+    response: list[ThreadSearchResultModel]
 
 
 class SpaceResponseModel(BaseResponseModel):
@@ -111,6 +161,12 @@ class SpaceFilesResponseModel(BaseResponseModel):
     response: list[FileModel]
 
 
+class UploadedFilesResponseModel(BaseResponseModel):
+    """HTTP response model for a list of streamed file uploads."""
+
+    response: list[UploadedFileModel]
+
+
 class ThreadPostRequestModel(CamelModel):
     """Pydantic model for the request body."""
     topic: str
@@ -1,21 +1,26 @@
 """Handle /api/rag/completion requests."""
 import logging
+from contextvars import copy_context
+from dataclasses import asdict
 from typing import Optional, Self
 
 import docq.run_queries as rq
 from docq import manage_spaces
-from docq.config import OrganisationFeatureType, SpaceType
-from docq.domain import FeatureKey, SpaceKey
+from docq.config import OrganisationFeatureType
+from docq.domain import Assistant, BatchQueryResult, FeatureKey, SpaceKey
 from docq.manage_assistants import get_assistant_or_default
-from docq.manage_spaces import get_shared_spaces
 from docq.model_selection.main import get_model_settings_collection
+from docq.support.llm import BATCH_MAX_CONCURRENCY
+from docq.support.llm_rate_limiter import llm_caller
 from opentelemetry import trace
 from pydantic import Field, ValidationError
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
 from tornado.web import HTTPError
 
 from web.api.base_handlers import BaseRequestHandler
-from web.api.models import MessagesResponseModel
-from web.api.utils.docq_utils import get_message_object
+from web.api.models import BatchCompletionResultModel, MessageSourceModel, MessagesResponseModel
+from web.api.utils.docq_utils import get_message_objects
 from web.utils.streamlit_application import st_app
 
 from .utils.auth_utils import authenticated
@@ -23,6 +28,9 @@ from .utils.pydantic_utils import CamelModel
 
 tracer = trace.get_tracer(__name__)
 
+BATCH_MAX_INPUTS = 5000
+BATCH_MAX_CONCURRENCY_LIMIT = 16
+
 
 class PostRequestModel(CamelModel):
     """Pydantic model for the RAG completion request."""
@@ -33,6 +41,17 @@ class PostRequestModel(CamelModel):
     space_ids: Optional[list[int]] = Field(None)  # for now only shared spaces are supported
 
 
+class BatchPostRequestModel(CamelModel):
+    """Pydantic model for the batch RAG completion request."""
+
+    inputs: list[str] = Field(..., min_length=1, max_length=BATCH_MAX_INPUTS)
+    assistant_scoped_id: str
+    space_ids: list[int] = Field(..., min_length=1)  # for now only shared spaces are supported
+    thread_id: Optional[int] = Field(None)
+    save_history: bool = False
+    max_concurrency: int = Field(BATCH_MAX_CONCURRENCY, ge=1, le=BATCH_MAX_CONCURRENCY_LIMIT)
+
+
 @tracer.start_as_current_span(name="RagCompletionHandler")
 @st_app.api_route("/api/v1/rag/completion")
 class RagCompletionHandler(BaseRequestHandler):
@@ -56,41 +75,22 @@ class RagCompletionHandler(BaseRequestHandler):
             if not assistant:
                 raise HTTPError(400, reason="Invalid assistant_scoped_id")
 
-            space_exists = manage_spaces.thread_space_exists(thread_id=request_model.thread_id)
-
-            thread_space = None
-            if space_exists:
-                # space exists globally, check if it's in this org_id
-                thread_space = manage_spaces.get_thread_space(self.selected_org_id, request_model.thread_id)
-
-            # thread_space = get_thread_space(self.selected_org_id, request_model.thread_id)
-
-            if thread_space is None:
-                raise HTTPError(404, reason="This threads Thread Space not available")
-
-            space_keys = []
-            if request_model.space_ids:
-                spaces = get_shared_spaces(space_ids=request_model.space_ids)
-                space_keys = [SpaceKey(id_=space[0], org_id=space[1], type_=SpaceType.SHARED) for space in spaces]
-
-            print("space_keys:", space_keys)
-            if not manage_spaces.is_space_empty(thread_space):
-                # is empty i.e. no docs then theirs no index so ignore thread_space
-                space_keys.append(thread_space)
+            space_keys = self._get_space_keys(request_model, feature)
 
             model_settings_collection = get_model_settings_collection(assistant.llm_settings_collection_key)
 
-            result = rq.query(
-                input_=request_model.input_,
-                feature=feature,
-                thread_id=request_model.thread_id,
-                model_settings_collection=model_settings_collection,
-                assistant=assistant,
-                spaces=space_keys,
-            )
+            with llm_caller(self.selected_org_id, self.current_user.uid):
+                result = rq.query(
+                    input_=request_model.input_,
+                    feature=feature,
+                    thread_id=request_model.thread_id,
+                    model_settings_collection=model_settings_collection,
+                    assistant=assistant,
+                    spaces=space_keys,
+                )
 
             if result:
-                messages = list(map(get_message_object, result))
+                messages = get_message_objects(feature, result)
                 self.write(MessagesResponseModel(response=messages).model_dump(by_alias=True))
             else:
                 raise HTTPError(500, reason="Internal server error", log_message="Internal server error")
@@ -109,3 +109,115 @@ class RagCompletionHandler(BaseRequestHandler):
         except Exception as e:
             logging.error("Exception:", e)
             raise HTTPError(500, reason="Internal server error", log_message=str(e)) from e
+
+    def _get_space_keys(self: Self, request_model: PostRequestModel, feature: FeatureKey) -> list[SpaceKey]:
+        """The spaces to answer from, the requested shared spaces and the thread's space. Raises HTTPError if the thread space isn't available."""
+        # None if it doesn't exist or isn't in this org_id
+        thread_space = manage_spaces.get_thread_space(self.selected_org_id, request_model.thread_id, feature)
+
+        if thread_space is None:
+            raise HTTPError(404, reason="This threads Thread Space not available")
+
+        space_keys = []
+        if request_model.space_ids:
+            # only shared spaces in the user's orgs
+            space_keys = self.authorization_context.get_shared_space_keys(request_model.space_ids)
+
+        print("space_keys:", space_keys)
+        if not manage_spaces.is_space_empty(thread_space):
+            # is empty i.e. no docs then theirs no index so ignore thread_space
+            space_keys.append(thread_space)
+        return space_keys
+
+
+@st_app.api_route("/api/v1/rag/completion/batch")
+class RagBatchCompletionHandler(BaseRequestHandler):
+    """Handle /api/v1/rag/completion/batch requests.
+
+    Answers many questions against the same spaces in one request, e.g. an evaluation set. The spaces are loaded once
+    for the whole batch. Results stream back as NDJSON, one `BatchCompletionResultModel` per line in the order the
+    answers complete. Use `index` to match them to `inputs`.
+
+    Thread history is only used and saved if `threadId` is given, and only saved if `saveHistory` is true.
+    """
+
+    @authenticated
+    async def post(self: Self) -> None:
+        """Handle batch RAG completion request."""
+        try:
+            feature = FeatureKey(type_=OrganisationFeatureType.ASK_SHARED, id_=self.current_user.uid)
+            request_model = BatchPostRequestModel.model_validate_json(self.request.body)
+            assistant, space_keys = self._get_assistant_and_spaces(request_model, feature)
+
+            results = rq.run_queries(
+                inputs=request_model.inputs,
+                feature=feature,
+                model_settings_collection=get_model_settings_collection(assistant.llm_settings_collection_key),
+                assistant=assistant,
+                spaces=space_keys,
+                thread_id=request_model.thread_id,
+                save_history=request_model.save_history,
+                max_concurrency=request_model.max_concurrency,
+            )
+            # the answers are generated on executor threads. run them in a context with the caller set
+            with llm_caller(self.selected_org_id, self.current_user.uid):
+                context = copy_context()
+            # the first result is waited for before anything is written so setup errors get a normal error response
+            result = await IOLoop.current().run_in_executor(None, context.run, next, results, None)
+        except ValidationError as e:
+            logging.error("ValidationError: %s", e)
+            raise HTTPError(
+                400,
+                reason="Invalid request body",
+                log_message=f"POST payload failed request model Pydantic validation. Error: {e}",
+            ) from e
+        except ValueError as e:
+            logging.error("ValueError: %s", e)
+            raise HTTPError(400, reason=f"Bad request. {e}", log_message=str(e)) from e
+        except HTTPError as e:
+            raise e
+        except Exception as e:
+            logging.error("Exception: %s", e)
+            raise HTTPError(500, reason="Internal server error", log_message=str(e)) from e
+
+        self.set_header("Content-Type", "application/x-ndjson")
+        try:
+            while result is not None:
+                await self._write_result(result)
+                result = await IOLoop.current().run_in_executor(None, context.run, next, results, None)
+        except StreamClosedError:
+            logging.info("Batch completion client disconnected, cancelling the remaining questions.")
+        finally:
+            results.close()
+
+    def _get_assistant_and_spaces(
+        self: Self, request_model: BatchPostRequestModel, feature: FeatureKey
+    ) -> tuple[Assistant, list[SpaceKey]]:
+        """The assistant and the spaces to answer from. Raises HTTPError if the user can't use them."""
+        assistant = get_assistant_or_default(request_model.assistant_scoped_id, self.selected_org_id)
+        if not assistant:
+            raise HTTPError(400, reason="Invalid assistant_scoped_id")
+
+        # only shared spaces in the user's orgs
+        space_keys = self.authorization_context.get_shared_space_keys(request_model.space_ids)
+        if request_model.thread_id is not None:
+            thread_space = manage_spaces.get_thread_space(self.selected_org_id, request_model.thread_id, feature)
+            if thread_space is None:
+                raise HTTPError(404, reason="This threads Thread Space not available")
+            if not manage_spaces.is_space_empty(thread_space):
+                space_keys.append(thread_space)
+        if not space_keys:
+            raise HTTPError(404, reason="None of the spaces are available")
+        return assistant, space_keys
+
+    async def _write_result(self: Self, result: BatchQueryResult) -> None:
+        """Write a result as an NDJSON line and flush it to the client."""
+        model = BatchCompletionResultModel(
+            index=result.index,
+            input_=result.input_,
+            response=result.response,
+            sources=[MessageSourceModel(**asdict(source)) for source in result.sources],
+            error=result.error,
+        )
+        self.write(model.model_dump_json(by_alias=True) + "\n")
+        await self.flush()
@@ -1,24 +1,29 @@
 """This module contains the API endpoint to upload files."""
 
+import json
 import logging
-from typing import Self
+from typing import Optional, Self
 
 from docq import manage_spaces
 from docq.config import SpaceType
 from docq.domain import SpaceKey
-from docq.manage_documents import upload
+from docq.manage_documents import ChunkedUpload, enqueue_reindex, get_upload_offset, upload
 from docq.manage_spaces import get_shared_space
 from pydantic import ValidationError
-from tornado.web import HTTPError, escape
+from tornado.httputil import HTTPHeaders
+from tornado.web import HTTPError, escape, stream_request_body
 
 from web.api.base_handlers import BaseRequestHandler
 from web.api.utils.auth_utils import authenticated
+from web.api.utils.multipart_utils import MultipartStreamParser, get_multipart_boundary, get_part_form_field
 from web.utils.streamlit_application import st_app
 
-from .models import FileModel, SpaceFilesResponseModel
+from .models import FileModel, SpaceFilesResponseModel, UploadedFileModel, UploadedFilesResponseModel
 
 # Configuration
 ALLOWED_EXTENSIONS = {"txt", "pdf", "png", "jpg", "jpeg", "gif", "md", "docx", "pptx", "xlsx"}
+UPLOAD_FORM_FIELD = "docq_files"
+MAX_STREAMED_UPLOAD_BYTES = 1024 * 1024 * 1024 * 2  # 2GB
 
 
 def allowed_file(filename: str) -> bool:
@@ -103,6 +108,177 @@ class UploadFileHandler(BaseRequestHandler):
             raise HTTPError(500, reason="Internal server error", log_message=f"Error: {str(e)}") from e
 
 
+def _get_space_key(space_id: int, org_id: int) -> SpaceKey:
+    """Get the key of a space in the org or raise a 404."""
+    space = get_shared_space(space_id, org_id)
+    if not space:
+        raise HTTPError(404, reason=f"Space id {space_id} not found")
+    return SpaceKey(org_id=org_id, id_=space_id, type_=SpaceType(str(space[7]).lower()))
+
+
+@st_app.api_route("/api/v1/spaces/{space_id}/files/upload/stream")
+@stream_request_body
+class StreamUploadFileHandler(BaseRequestHandler):
+    """Handle /api/v1/spaces/{space_id}/files/upload/stream requests.
+
+    Files in the `docq_files` field of a multipart/form-data body are written to disk as they arrive, so they aren't
+    held in memory or limited by Tornado's max body size. The space is queued for indexing once files are complete.
+
+    A single file upload can be resumed:
+    - `HEAD ...?filename=<name>` returns the bytes received so far in the `Upload-Offset` header.
+    - `POST` with an `Upload-Offset` header continues from there.
+    - `Upload-Length` is the total file size. The file is complete once that many bytes are received, and a 202 is
+      returned until then. Without it the file is complete at the end of the request.
+    - `Upload-Sha256` is checked against the hex SHA-256 of the complete file.
+
+    The partial files of a request that fails, or whose client goes away, are removed. Only an upload with an
+    `Upload-Length` is kept when the client goes away, up to what was received, so it can be resumed.
+    """
+
+    def initialize(self: Self) -> None:
+        """Reset the per request upload state."""
+        self._space_key: Optional[SpaceKey] = None
+        self._parser: Optional[MultipartStreamParser] = None
+        self._upload: Optional[ChunkedUpload] = None
+        self._uploads: list[ChunkedUpload] = []
+        self._error: Optional[HTTPError] = None
+        self._error_headers: dict[str, str] = {}
+        self._length: Optional[int] = None
+
+    @authenticated
+    def prepare(self: Self) -> None:
+        """Authenticate and check the request before the body is streamed."""
+        super().prepare()
+        self._space_key = _get_space_key(int(self.path_args[0]), self.selected_org_id)
+        if self.request.method != "POST":
+            return
+
+        self.request.connection.set_max_body_size(MAX_STREAMED_UPLOAD_BYTES)
+        boundary = get_multipart_boundary(self.request.headers.get("Content-Type", ""))
+        if boundary is None:
+            raise HTTPError(400, reason="Expected a multipart/form-data body")
+        try:
+            self._offset = int(self.request.headers.get("Upload-Offset", "0"))
+            length = self.request.headers.get("Upload-Length")
+            self._length = int(length) if length is not None else None
+        except ValueError as e:
+            raise HTTPError(400, reason="Invalid Upload-Offset or Upload-Length header") from e
+        self._sha256 = self.request.headers.get("Upload-Sha256")
+        self._parser = MultipartStreamParser(boundary, self._on_part_begin, self._on_part_data, self._on_part_end)
+
+    def data_received(self: Self, chunk: bytes) -> None:
+        """Parse the next chunk of the body. After an error the rest of the body is ignored."""
+        if self._error is not None:
+            return
+        try:
+            self._parser.feed(chunk)
+        except HTTPError as e:
+            self._fail(e)
+        except ValueError as e:
+            self._fail(HTTPError(400, reason=str(e)))
+
+    def _fail(self: Self, error: HTTPError) -> None:
+        self._discard_uploads()
+        self._error = error
+
+    def _discard_uploads(self: Self) -> None:
+        """Drop what this request wrote to partial files."""
+        if self._upload is not None:
+            self._uploads.append(self._upload)
+            self._upload = None
+        for upload_ in self._uploads:
+            upload_.discard()
+        self._uploads = []
+
+    def _on_part_begin(self: Self, headers: HTTPHeaders) -> None:
+        name, filename = get_part_form_field(headers)
+        if name != UPLOAD_FORM_FIELD or filename is None:
+            return
+        if filename == "":
+            raise HTTPError(400, reason="No selected file")
+        if not allowed_file(filename):
+            raise HTTPError(
+                400, reason=f"File type not allowed. Allowed file types are: {', '.join(list(ALLOWED_EXTENSIONS))}"
+            )
+        resumable = self._offset > 0 or self._length is not None or self._sha256 is not None
+        if resumable and self._uploads:
+            raise HTTPError(400, reason="Upload-Offset, Upload-Length and Upload-Sha256 only apply to a single file")
+
+        # Secure the filename
+        filename = escape.native_str(escape.url_escape(filename))
+        try:
+            self._upload = ChunkedUpload(filename, self._space_key, self._offset, self._length)
+        except ValueError as e:
+            self._error_headers["Upload-Offset"] = str(get_upload_offset(filename, self._space_key))
+            raise HTTPError(409, reason=str(e)) from e
+
+    def _on_part_data(self: Self, chunk: bytes) -> None:
+        if self._upload is not None:
+            self._upload.write(chunk)
+
+    def _on_part_end(self: Self) -> None:
+        if self._upload is not None:
+            self._upload.close()
+            self._uploads.append(self._upload)
+            self._upload = None
+
+    def on_connection_close(self: Self) -> None:
+        """Remove the partial files if the client goes away, unless the upload has a length so it can be resumed."""
+        if self._length is not None:
+            if self._upload is not None:
+                self._upload.close()
+            return
+        self._discard_uploads()
+
+    def _write_error_response(self: Self, error: HTTPError) -> None:
+        """Like write_error but keeps headers set for the error, e.g. the Upload-Offset for a 409."""
+        self.set_status(error.status_code, error.reason)
+        for name, value in self._error_headers.items():
+            self.set_header(name, value)
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps({"reason": error.reason, "statusCode": error.status_code}))
+
+    def post(self: Self, space_id: str) -> None:
+        """Complete the streamed uploads and queue the space for indexing if any file is complete."""
+        if self._error is None:
+            try:
+                self._parser.finish()
+                if not self._uploads:
+                    raise HTTPError(400, reason="No file part")
+            except HTTPError as e:
+                self._fail(e)
+            except ValueError as e:
+                self._fail(HTTPError(400, reason=str(e)))
+        if self._error is not None:
+            self._write_error_response(self._error)
+            return
+
+        results = []
+        uploads, self._uploads = self._uploads, []
+        for upload_ in uploads:
+            try:
+                complete = upload_.finish(self._sha256)
+            except ValueError as e:
+                raise HTTPError(422, reason=str(e)) from e
+            results.append(
+                UploadedFileModel(filename=upload_.filename, size=upload_.size, sha256=upload_.sha256, complete=complete)
+            )
+
+        if any(result.complete for result in results):
+            enqueue_reindex(self._space_key)
+        if all(result.complete for result in results):
+            self.set_status(201)  # 201 Created
+        else:
+            self.set_status(202)  # 202 Accepted, resume from Upload-Offset
+            self.set_header("Upload-Offset", str(uploads[0].size))
+        self.write(UploadedFilesResponseModel(response=results).model_dump(by_alias=True))
+
+    def head(self: Self, space_id: str) -> None:
+        """Get the bytes received so far of an incomplete upload in the `Upload-Offset` header."""
+        filename = escape.native_str(escape.url_escape(self.get_query_argument("filename")))
+        self.set_header("Upload-Offset", str(get_upload_offset(filename, self._space_key)))
+
+
 @st_app.api_route("/api/v1/spaces/{space_id}/files")
 class SpaceFilesHandler(BaseRequestHandler):
     """Handle /api/v1/spaces/{space_id}/files requests."""
@@ -123,6 +299,10 @@ class SpaceFilesHandler(BaseRequestHandler):
             type_=space_type,
         )
 
+        version = manage_spaces.get_documents_version(space_key)
+        if version is not None and self.check_not_modified(version):
+            return
+
         files = manage_spaces.list_documents(space_key)
 
         files_response = SpaceFilesResponseModel(
@@ -67,6 +67,7 @@ class SpacesHandler(BaseRequestHandler):
                         thread_id,
                         request.summary,
                         SpaceDataSources.MANUAL_UPLOAD.name,
+                        feature,
                     )
                     self.set_status(201)  # 201 Created
                     self.write(PostResponseModel(thread_id=thread_id, space_value=space.value()).model_dump_json())
@@ -89,6 +90,8 @@ class SpacesHandler(BaseRequestHandler):
             space_type = self.get_query_argument("space_type", None)
 
             spaces = m_spaces.list_space(self.selected_org_id, space_type)
+            if self.check_not_modified([(space[0], space[9]) for space in spaces]):
+                return
 
             space_model_list: list[SpaceModel] = [_map_to_space_model(space) for space in spaces]
 
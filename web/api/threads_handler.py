@@ -1,6 +1,5 @@
 """Handle chat and rag threads."""
 import logging
-from datetime import datetime
 from typing import Self
 
 import docq.manage_spaces as ms
@@ -23,10 +22,12 @@ from web.api.models import (
     ThreadModel,
     ThreadPostRequestModel,
     ThreadResponseModel,
+    ThreadSearchResponseModel,
+    ThreadSearchResultModel,
     ThreadsResponseModel,
 )
 from web.api.utils.auth_utils import authenticated
-from web.api.utils.docq_utils import get_feature_key, get_message_object, get_thread_space
+from web.api.utils.docq_utils import get_feature_key, get_message_objects, get_thread_space
 from web.utils.streamlit_application import st_app
 
 
@@ -64,6 +65,8 @@ class ThreadsHandler(BaseRequestHandler):
 
         try:
             threads = rq.list_thread_history(feature)
+            if self.check_not_modified([(thread[0], thread[1], thread[3]) for thread in threads]):
+                return
             # print("threads:")
             # for thread in threads:
             #     print(thread[0], thread[1], thread[2], thread[3])
@@ -101,7 +104,7 @@ class ThreadsHandler(BaseRequestHandler):
                 raise HTTPError(status_code=500, reason="Internal server error", log_message="Thread creation failed.")
 
             space_thread = ms.create_thread_space(
-                self.selected_org_id, thread_id, request.topic, SpaceDataSources.MANUAL_UPLOAD.name
+                self.selected_org_id, thread_id, request.topic, SpaceDataSources.MANUAL_UPLOAD.name, feature
             )
             print("space_thread: ", space_thread)
             self.set_status(201)  # 201 Created
@@ -129,7 +132,7 @@ class ThreadHandler(BaseRequestHandler):
 
         try:
             thread = rq.list_thread_history(feature, thread_id)
-            thread_space_id = get_thread_space(self.selected_org_id, thread_id).id_
+            thread_space_id = get_thread_space(self.selected_org_id, thread_id, feature).id_
             thread_response = (
                 ThreadModel(**_get_thread_object(thread[0]), space_id=thread_space_id) if len(thread) > 0 else None
             )
@@ -169,6 +172,48 @@ class ThreadHandler(BaseRequestHandler):
         raise HTTPError(status_code=501, reason="Update thread - Not implemented")
 
 
+# NOTE: registered after /threads/{thread_id} so it takes precedence, the most recently added route matches first.
+@st_app.api_route("/api/v1/{feature}/threads/search")
+class ThreadsSearchHandler(BaseRequestHandler):
+    """Handle /api/v1/{feature}/threads/search requests.
+
+    Path Parameters:
+        feature (Literal["rag", "chat"]): The feature type, used to select between general chat and shared ask.
+    """
+
+    @authenticated
+    def get(self: Self, feature_: FEATURE) -> None:
+        """GET: full text search over the messages in the user's threads.
+
+        Query Parameters:
+            q: str - The search text. The last word is matched as a prefix so it can be called as the user types.
+            limit: int - The maximum number of threads to return. Default 20, max 100.
+
+        Response:
+            ThreadSearchResponseModel - one result per thread, best match first.
+        """
+        feature = get_feature_key(self.current_user.uid, feature_)
+        q = self.get_argument("q", "")
+        limit = self.get_argument("limit", "20")
+
+        if not limit.isdigit() or not 1 <= int(limit) <= 100:
+            raise HTTPError(status_code=400, reason="Invalid limit")
+
+        try:
+            results = rq.search_threads(feature, q, int(limit))
+            response = ThreadSearchResponseModel(
+                response=[
+                    ThreadSearchResultModel(thread_id=r[0], topic=r[1], message_id=r[2], snippet=r[3], rank=r[4])
+                    for r in results
+                ]
+            )
+            self.write(response.model_dump(by_alias=True))
+        except ValidationError as e:
+            raise HTTPError(status_code=400, reason="Bad request", log_message=str(e)) from e
+        except Exception as e:
+            raise HTTPError(status_code=500, reason="Internal server error", log_message=str(e)) from e
+
+
 @st_app.api_route("/api/v1/{feature}/threads/{thread_id}/history")
 class ThreadHistoryHandler(BaseRequestHandler):
     """Handle /api/v1/{thread_type}threads/{thread_id}/history requests.
@@ -180,26 +225,50 @@ class ThreadHistoryHandler(BaseRequestHandler):
 
     @authenticated
     def get(self: Self, feature_: FEATURE, thread_id: str) -> None:
-        """GET: history messages for a thread."""
+        """GET: history messages for a thread.
+
+        Query Parameters:
+            cursor: int - The `nextCursor` from the previous page's meta. Omit for the first page.
+            page_size: int - The number of messages per page.
+            order: Literal["asc", "desc"] - desc pages back from the latest message, asc forward from the first.
+
+        Response:
+            ThreadHistoryResponseModel - messages oldest first. `meta.nextCursor` is null on the last page.
+        """
         feature = get_feature_key(self.current_user.uid, feature_)
-        page = self.get_argument("page", "1")  # noqa: F841
+        cursor = self.get_argument("cursor", None)
         page_size = self.get_argument("page_size", "10")
         order = self.get_argument("order", "desc")
 
         try:
+            if cursor is not None and not cursor.isdigit():
+                raise HTTPError(status_code=400, reason="Invalid cursor")
+            if not page_size.isdigit() or int(page_size) < 1:
+                raise HTTPError(status_code=400, reason="Invalid page_size")
+
             thread = rq.list_thread_history(feature, int(thread_id))
 
             if not len(thread) > 0:
                 raise HTTPError(status_code=404, reason="Thread not found")
 
-            thread_history = rq._retrieve_messages(
-                datetime.now(), int(page_size), feature, int(thread_id), "ASC" if order == "asc" else "DESC"
+            if self.check_not_modified(thread[0][1], thread[0][3], rq.get_thread_history_version(feature, int(thread_id))):
+                return
+
+            thread_history, next_cursor = rq.history_page(
+                feature,
+                int(thread_id),
+                int(page_size),
+                cursor=int(cursor) if cursor is not None else None,
+                sort_order="ASC" if order == "asc" else "DESC",
             )
 
-            messages = list(map(get_message_object, thread_history))
+            messages = get_message_objects(feature, thread_history)
             thread_history_model = ThreadHistoryModel(**_get_thread_object(thread[0]), messages=messages)
 
-            thread_history_response = ThreadHistoryResponseModel(response=thread_history_model)
+            thread_history_response = ThreadHistoryResponseModel(
+                response=thread_history_model,
+                meta={"nextCursor": str(next_cursor) if next_cursor is not None else None},
+            )
 
             self.write(thread_history_response.model_dump(by_alias=True))
         except ValidationError as e:
@@ -243,7 +312,7 @@ class TopQuestionsHandler(BaseRequestHandler):
     @authenticated
     def get(self: Self, thread_id: int) -> None:
         """Handle GET top questions request."""
-        thread_space = get_thread_space(self.selected_org_id, thread_id)
+        thread_space = get_thread_space(self.selected_org_id, thread_id, get_feature_key(self.current_user.uid, "rag"))
         try:
             self.write(self.get_summary_questions(thread_space))
         except Exception as e:
@@ -1,17 +1,32 @@
-"""API Auth related utilities."""
+"""API Auth related utilities.
+
+JWTs are signed with the current key pair, `private.pem` and `public.pem` in the key dir, and carry its key id (kid) in
+the header. To rotate keys rename `public.pem` to e.g. `public.2024-06.pem` and remove `private.pem`. A new pair is
+generated and tokens signed with the old key still verify, using the renamed public key, until they expire.
+
+Parsed keys are cached and reloaded when the key files change. Verified tokens are cached for a short time, by digest,
+so repeat requests with the same token skip RSA verification.
+"""
 import functools
+import glob
+import hashlib
+import json
 import logging as log
 import os
+import threading
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Any, Callable, Literal, Optional
+from typing import Any, Callable, Literal, Optional, Self
 
 import jwt.exceptions as jwt_exceptions
+from cachetools import TTLCache
 from cryptography.hazmat.backends import default_backend as crypto_default_backend
 from cryptography.hazmat.primitives import serialization as crypto_serialization
 from cryptography.hazmat.primitives.asymmetric import rsa
 from docq.config import ENV_VAR_DOCQ_API_SECRET
-from jwt import JWT, jwk_from_pem
-from jwt.utils import get_int_from_datetime
+from jwt import JWT, AbstractJWKBase, jwk_from_pem
+from jwt.utils import b64decode, get_int_from_datetime
 from opentelemetry import trace
 from tornado.web import HTTPError
 
@@ -21,8 +36,108 @@ from web.api.models import UserModel
 INSTANCE = JWT()
 KEY_ERROR = (jwt_exceptions.UnsupportedKeyTypeError, jwt_exceptions.InvalidKeyTypeError)
 
+KEY_RELOAD_CHECK_SEC = 5
+"""How often the key files are checked for changes."""
+
+VERIFIED_TOKEN_CACHE_TTL_SEC = 60
+"""How long a verified token is trusted without verifying it again. Never past the token's own expiry."""
+
+VERIFIED_TOKEN_CACHE_SIZE = 4096
+
 tracer = trace.get_tracer(__name__)
 
+
+@dataclass
+class _VerifiedToken:
+    payload: dict
+    expires_at: float
+    user: Optional[UserModel] = None
+
+
+# verified tokens keyed by sha256 digest of the token. Cleared when the keys change.
+_verified_tokens: TTLCache[str, _VerifiedToken] = TTLCache(VERIFIED_TOKEN_CACHE_SIZE, VERIFIED_TOKEN_CACHE_TTL_SEC)
+_verified_tokens_lock = threading.Lock()
+
+
+class JwtKeyRing:
+    """The JWT signing key and the verification keys by kid, parsed once and reloaded when the key files change."""
+
+    def __init__(self: Self, reload_check_sec: float = KEY_RELOAD_CHECK_SEC) -> None:
+        """Initialise an empty key ring. Keys are loaded on first use."""
+        self.reload_check_sec = reload_check_sec
+        self._lock = threading.Lock()
+        self._files_signature: Optional[tuple] = None
+        self._checked_at = 0.0
+        self._signing_kid: Optional[str] = None
+        self._signing_key: Optional[AbstractJWKBase] = None
+        self._verification_keys: dict[str, AbstractJWKBase] = {}
+
+    def signing_key(self: Self) -> tuple[str, AbstractJWKBase]:
+        """The kid and key to sign new tokens with."""
+        self.reload_if_changed()
+        if self._signing_kid is None or self._signing_key is None:
+            raise jwt_exceptions.InvalidKeyTypeError("No signing key loaded")
+        return self._signing_kid, self._signing_key
+
+    def verification_keys(self: Self, kid: Optional[str] = None) -> list[AbstractJWKBase]:
+        """The keys to verify a token with. Only the matching key if the token has a kid, else the current key first."""
+        self.reload_if_changed()
+        if kid is not None:
+            key = self._verification_keys.get(kid)
+            return [key] if key is not None else []
+        keys = [self._verification_keys[self._signing_kid]] if self._signing_kid in self._verification_keys else []
+        return keys + [key for kid_, key in self._verification_keys.items() if kid_ != self._signing_kid]
+
+    def reload_if_changed(self: Self) -> None:
+        """Reload the keys, and clear the verified tokens, if the key files changed. Checked every `reload_check_sec`."""
+        now = time.monotonic()
+        if self._files_signature is not None and now - self._checked_at < self.reload_check_sec:
+            return
+        with self._lock:
+            if self._files_signature is not None and now - self._checked_at < self.reload_check_sec:
+                return
+            get_key("private")  # generates a key pair if there isn't one.
+            signature = _key_files_signature()
+            if signature != self._files_signature:
+                self._load()
+                self._files_signature = signature
+                with _verified_tokens_lock:
+                    _verified_tokens.clear()
+            self._checked_at = now
+
+    def _load(self: Self) -> None:
+        key_dir_path = _get_key_dir_path()
+        public_pem = get_key("public")
+        self._signing_kid = _get_kid(public_pem)
+        self._signing_key = jwk_from_pem(get_key("private"))
+        verification_keys = {self._signing_kid: jwk_from_pem(public_pem)}
+        for path in sorted(glob.glob(os.path.join(key_dir_path, "public.*.pem"))):
+            with open(path, "rb") as f:
+                pem = f.read()
+            try:
+                verification_keys[_get_kid(pem)] = jwk_from_pem(pem)
+            except KEY_ERROR as e:
+                log.error("Error loading retired public key %s: %s", path, e)
+        self._verification_keys = verification_keys
+        log.info("Loaded JWT keys. Signing kid: %s, verification kids: %s", self._signing_kid, list(verification_keys))
+
+
+def _get_kid(public_pem: bytes) -> str:
+    """Key id derived from the public key so each process derives the same kid without sharing state."""
+    return hashlib.sha256(public_pem.strip()).hexdigest()[:16]
+
+
+def _key_files_signature() -> tuple:
+    """Changes when a key file is added, removed or rewritten."""
+    signature = []
+    for path in sorted(glob.glob(os.path.join(_get_key_dir_path(), "*.pem"))):
+        stat = os.stat(path)
+        signature.append((os.path.basename(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+KEY_RING = JwtKeyRing()
+
 def authenticated(method: Callable[..., Any]) -> Callable[..., Any]:
     """Decorate RequestHandler methods with this to require authentication."""
 
@@ -50,14 +165,11 @@ def authenticated(method: Callable[..., Any]) -> Callable[..., Any]:
                 scheme, token = auth_header.split(" ")
                 if scheme.lower() == "bearer":
                     try:
-                        from web.api.utils.auth_utils import decode_jwt
-
-                        payload = decode_jwt(token)  # validate JWT token or blow up
-                        self.current_user = UserModel.model_validate(
-                            payload.get("data")
-                        )  # validate and set the Tornado RequestHandler default property
+                        # validate JWT token or blow up. The payload json must be a valid UserModel.
+                        # set the Tornado RequestHandler default property
+                        self.current_user = get_user_from_jwt(token)
 
-                        # made it here, authenticated - JWT decode was successful. And payload json is a valid UserModel.
+                        # made it here, authenticated - JWT decode was successful.
                         # set the authentication method used to JWT
                         authentication_successful = True
                         # return method(self, *args, **kwargs)
@@ -103,27 +215,76 @@ def encode_jwt(data: UserModel) -> Optional[str]:
             "iat": get_int_from_datetime(datetime.now(tz=timezone.utc)),
             "data": data.model_dump(by_alias=True),
         }
-        key = jwk_from_pem(get_key("private"))
-        return INSTANCE.encode(payload, key, alg="RS256")
+        kid, key = KEY_RING.signing_key()
+        return INSTANCE.encode(payload, key, alg="RS256", optional_headers={"kid": kid})
 
     except (*KEY_ERROR, jwt_exceptions.JWTEncodeError) as e:
         log.error("Error encoding token: %s", e)
         raise HTTPError(500, "Error encoding token") from e
 
 
-def decode_jwt(token: str, check_expired: bool = True) -> dict:
-    """Decode a JWT."""
+def _get_token_kid(token: str) -> Optional[str]:
+    """The kid from the token header. None for tokens signed before kids were added."""
     try:
-        key = jwk_from_pem(get_key("public"))
+        header = json.loads(b64decode(token.split(".")[0]))
+    except (ValueError, IndexError) as e:
+        raise HTTPError(401, reason="Unauthorized") from e
+    return header.get("kid") if isinstance(header, dict) else None
+
+
+def _get_verified_token(token: str, check_expired: bool = True) -> _VerifiedToken:
+    """Verify a token, or get it from the verified token cache."""
+    digest = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    try:
+        # before the cache lookup so a token signed with a removed key isn't served from the cache.
+        KEY_RING.reload_if_changed()
     except KEY_ERROR as e:
         log.error("Error loading key: %s", e)
         raise HTTPError(500, "Error loading key") from e
+    if check_expired:
+        with _verified_tokens_lock:
+            verified = _verified_tokens.get(digest)
+        if verified is not None and time.time() < verified.expires_at:
+            return verified
 
     try:
-        return INSTANCE.decode(token, key, algorithms={"RS256"}, do_time_check=check_expired)
-    except (jwt_exceptions.JWSDecodeError, jwt_exceptions.JWTDecodeError) as e:
-        log.error("Error decoding token: %s", e)
-        raise HTTPError(401, reason="Unauthorized") from e
+        keys = KEY_RING.verification_keys(_get_token_kid(token))
+    except KEY_ERROR as e:
+        log.error("Error loading key: %s", e)
+        raise HTTPError(500, "Error loading key") from e
+    if not keys:
+        log.error("Error decoding token: unknown kid")
+        raise HTTPError(401, reason="Unauthorized")
+
+    for i, key in enumerate(keys):
+        try:
+            payload = INSTANCE.decode(token, key, algorithms={"RS256"}, do_time_check=check_expired)
+            break
+        except (jwt_exceptions.JWSDecodeError, jwt_exceptions.JWTDecodeError) as e:
+            if i == len(keys) - 1:
+                log.error("Error decoding token: %s", e)
+                raise HTTPError(401, reason="Unauthorized") from e
+
+    verified = _VerifiedToken(
+        payload=payload, expires_at=min(time.time() + VERIFIED_TOKEN_CACHE_TTL_SEC, payload.get("exp", 0))
+    )
+    if check_expired:
+        with _verified_tokens_lock:
+            _verified_tokens[digest] = verified
+    return verified
+
+
+def decode_jwt(token: str, check_expired: bool = True) -> dict:
+    """Decode a JWT."""
+    return dict(_get_verified_token(token, check_expired).payload)
+
+
+def get_user_from_jwt(token: str) -> UserModel:
+    """Verify a JWT and get the user from its payload. The validated user is cached with the verified token."""
+    verified = _get_verified_token(token)
+    if verified.user is None:
+        verified.user = UserModel.model_validate(verified.payload.get("data"))
+    return verified.user
 
 
 def validate_api_key(key: str) -> bool:
@@ -1,12 +1,15 @@
 """"Utils to interact with Docq backend service."""
+from dataclasses import asdict
 from datetime import datetime
+from typing import Optional
 
 import docq.manage_spaces as m_spaces
+import docq.run_queries as rq
 from docq.config import OrganisationFeatureType, SpaceType
-from docq.domain import FeatureKey, SpaceKey
+from docq.domain import FeatureKey, MessageSource, SpaceKey
 from tornado.web import HTTPError
 
-from web.api.models import FEATURE, MessageModel
+from web.api.models import FEATURE, MessageModel, MessageSourceModel
 
 
 def get_feature_key(user_id: int, feature: FEATURE = "rag") -> FeatureKey:
@@ -26,16 +29,18 @@ def get_space(org_id: int, space_id: int) -> SpaceKey:
     return SpaceKey(SpaceType[space[7]], space_id, org_id, space[3])
 
 
-def get_thread_space(org_id: int, thread_id: int) -> SpaceKey:
-    """Get thread space key from org_id and thread_id."""
-    space = m_spaces.get_thread_space(org_id, thread_id)
+def get_thread_space(org_id: int, thread_id: int, feature: FeatureKey) -> SpaceKey:
+    """Get thread space key from org_id, thread_id and the feature key of the thread's owner."""
+    space = m_spaces.get_thread_space(org_id, thread_id, feature)
 
     if space is None:
         raise HTTPError(404, reason="Not Found", log_message="Space not found")
     return space
 
 
-def get_message_object(message: tuple[int, str, bool, datetime, int]) -> MessageModel:
+def get_message_object(
+    message: tuple[Optional[int], str, bool, datetime, int], sources: Optional[list[MessageSource]] = None
+) -> MessageModel:
     """Format chat message."""
     return MessageModel(
         **{
@@ -44,5 +49,14 @@ def get_message_object(message: tuple[int, str, bool, datetime, int]) -> Message
             "human": message[2],
             "timestamp": str(message[3]),
             "thread_id": message[4],
+            "sources": [MessageSourceModel(**asdict(source)) for source in sources or []],
         }
     )
+
+
+def get_message_objects(
+    feature: FeatureKey, messages: list[tuple[int, str, bool, datetime, int]]
+) -> list[MessageModel]:
+    """Format chat messages with their document sources."""
+    sources = rq.get_sources_for_messages(feature, [message[0] for message in messages if not message[2] and message[0] is not None])
+    return [get_message_object(message, sources.get(message[0])) for message in messages]
@@ -0,0 +1,150 @@
+"""Incremental multipart/form-data parsing for streamed request bodies."""
+
+from email.message import Message
+from enum import Enum
+from typing import Callable, Optional, Self
+
+from tornado.httputil import HTTPHeaders
+
+MAX_PART_HEADER_BYTES = 16 * 1024
+
+
+class _State(Enum):
+    PREAMBLE = 1
+    AFTER_BOUNDARY = 2
+    HEADERS = 3
+    BODY = 4
+    END = 5
+
+
+def get_multipart_boundary(content_type: str) -> Optional[bytes]:
+    """Get the boundary from a multipart/form-data Content-Type header. None if it's not multipart or has no boundary."""
+    if not content_type.startswith("multipart/form-data"):
+        return None
+    for field in content_type.split(";"):
+        key, _, value = field.strip().partition("=")
+        if key == "boundary" and value:
+            return value.strip('"').encode("latin-1")
+    return None
+
+
+def get_part_form_field(headers: HTTPHeaders) -> tuple[Optional[str], Optional[str]]:
+    """Get the form field name and file name, if it's a file, from a part's Content-Disposition header."""
+    message = Message()
+    message["Content-Disposition"] = headers.get("Content-Disposition", "")
+    return message.get_param("name", header="Content-Disposition"), message.get_filename()  # type: ignore[return-value]
+
+
+class MultipartStreamParser:
+    """Parse a multipart/form-data body fed in chunks, without holding a whole part in memory.
+
+    Part bodies are passed to `on_part_data` as they arrive. Only the few bytes that could be the start of the next
+    boundary are held back.
+    """
+
+    def __init__(
+        self: Self,
+        boundary: bytes,
+        on_part_begin: Callable[[HTTPHeaders], None],
+        on_part_data: Callable[[bytes], None],
+        on_part_end: Callable[[], None],
+    ) -> None:
+        """Initialise the parser.
+
+        Args:
+            boundary (bytes): the boundary from the Content-Type header.
+            on_part_begin (Callable[[HTTPHeaders], None]): called with the headers of each part.
+            on_part_data (Callable[[bytes], None]): called with each chunk of the current part's body.
+            on_part_end (Callable[[], None]): called at the end of each part.
+        """
+        self._boundary = b"--" + boundary
+        self._delimiter = b"\r\n" + self._boundary
+        self._on_part_begin = on_part_begin
+        self._on_part_data = on_part_data
+        self._on_part_end = on_part_end
+        self._buffer = b""
+        self._state = _State.PREAMBLE
+
+    def feed(self: Self, data: bytes) -> None:
+        """Parse the next chunk of the body.
+
+        Raises:
+            ValueError: if the body isn't valid multipart.
+        """
+        self._buffer += data
+        while self._parse_buffer():
+            pass
+
+    def finish(self: Self) -> None:
+        """Call at the end of the body.
+
+        Raises:
+            ValueError: if the body ended before the closing boundary.
+        """
+        if self._state != _State.END:
+            raise ValueError("Multipart body ended before the closing boundary")
+
+    def _parse_buffer(self: Self) -> bool:
+        """Parse as much of the buffer as possible. Returns True if there may be more to parse."""
+        if self._state == _State.PREAMBLE:
+            return self._parse_preamble()
+        if self._state == _State.AFTER_BOUNDARY:
+            return self._parse_after_boundary()
+        if self._state == _State.HEADERS:
+            return self._parse_headers()
+        if self._state == _State.BODY:
+            return self._parse_body()
+        # END: ignore the epilogue
+        self._buffer = b""
+        return False
+
+    def _parse_preamble(self: Self) -> bool:
+        index = self._buffer.find(self._boundary)
+        if index == -1:
+            # keep enough to match a boundary split across chunks
+            self._buffer = self._buffer[-len(self._boundary) :]
+            return False
+        self._buffer = self._buffer[index + len(self._boundary) :]
+        self._state = _State.AFTER_BOUNDARY
+        return True
+
+    def _parse_after_boundary(self: Self) -> bool:
+        if len(self._buffer) < 2:
+            return False
+        if self._buffer.startswith(b"--"):
+            self._state = _State.END
+            self._buffer = b""
+            return False
+        if not self._buffer.startswith(b"\r\n"):
+            raise ValueError("Invalid multipart boundary")
+        self._buffer = self._buffer[2:]
+        self._state = _State.HEADERS
+        return True
+
+    def _parse_headers(self: Self) -> bool:
+        index = self._buffer.find(b"\r\n\r\n")
+        if index == -1:
+            if len(self._buffer) > MAX_PART_HEADER_BYTES:
+                raise ValueError("Multipart part headers too long")
+            return False
+        headers = HTTPHeaders.parse(self._buffer[:index].decode("utf-8"))
+        self._buffer = self._buffer[index + 4 :]
+        self._state = _State.BODY
+        self._on_part_begin(headers)
+        return True
+
+    def _parse_body(self: Self) -> bool:
+        """Stream the part body to `on_part_data`, holding back only what could be the start of the delimiter."""
+        index = self._buffer.find(self._delimiter)
+        if index == -1:
+            keep = len(self._delimiter) - 1
+            if len(self._buffer) > keep:
+                self._on_part_data(self._buffer[:-keep])
+                self._buffer = self._buffer[-keep:]
+            return False
+        if index > 0:
+            self._on_part_data(self._buffer[:index])
+        self._buffer = self._buffer[index + len(self._delimiter) :]
+        self._state = _State.AFTER_BOUNDARY
+        self._on_part_end()
+        return True
@@ -43,7 +43,7 @@ class SessionKeyNameForSettings(Enum):
 class SessionKeyNameForChat(Enum):
     """Third-level names for session keys in chat."""
 
-    CUTOFF = "cutoff"
+    CURSOR = "cursor"
     HISTORY = "history"
     THREAD = "thread"
 
@@ -42,6 +42,7 @@ from docq.model_selection.main import (
 from docq.services.smtp_service import mailer_ready, send_verification_email
 from docq.support.auth_utils import _get_cookies as get_cookies
 from docq.support.auth_utils import reset_cache_and_cookie_auth_session
+from docq.support.llm_rate_limiter import llm_caller
 from opentelemetry import baggage, trace
 from pydantic import RootModel
 from streamlit.components.v1 import html
@@ -530,13 +531,12 @@ def list_space_groups(name_match: str = None) -> List[Tuple]:
 @tracer.start_as_current_span("query_chat_history")
 def query_chat_history(feature: domain.FeatureKey) -> None:
     """Query chat history."""
-    curr_cutoff = get_chat_session(feature.type_, SessionKeyNameForChat.CUTOFF)
-    if curr_cutoff is None:
-        raise ValueError("Cutoff in session state was None")
+    # id of the oldest message loaded so far. None until the first page is loaded.
+    curr_cursor = get_chat_session(feature.type_, SessionKeyNameForChat.CURSOR)
     thread_id = get_chat_session(feature.type_, SessionKeyNameForChat.THREAD)
     if thread_id is None:
         raise ValueError("Thread id in session state was None")
-    history = run_queries.history(curr_cutoff, NUMBER_OF_MSGS_TO_LOAD, feature, thread_id)
+    history, _ = run_queries.history_page(feature, thread_id, NUMBER_OF_MSGS_TO_LOAD, cursor=curr_cursor)
 
     history_from_session = get_chat_session(feature.type_, SessionKeyNameForChat.HISTORY)
     if history_from_session is None:
@@ -546,7 +546,12 @@ def query_chat_history(feature: domain.FeatureKey) -> None:
         feature.type_,
         SessionKeyNameForChat.HISTORY,
     )
-    set_chat_session(history[0][3] if history else curr_cutoff, feature.type_, SessionKeyNameForChat.CUTOFF)
+    if history:
+        next_cursor = history[0][0]
+    else:
+        # nothing older. Message ids start at 1, so a cursor of 0 stops newer messages being loaded as "earlier".
+        next_cursor = curr_cursor if curr_cursor is not None else 0
+    set_chat_session(next_cursor, feature.type_, SessionKeyNameForChat.CURSOR)
 
 
 @tracer.start_as_current_span("_get_chat_spaces")
@@ -589,15 +594,14 @@ def _setup_chat_thread_space(feature: domain.FeatureKey, org_id:int, thread_id:
     """Create a thread space or add more files and index if the space already exists."""
     space: Optional[SpaceKey] = None
 
-    space_exists = manage_spaces.thread_space_exists(thread_id=thread_id)
-
-    if space_exists:
-        # space exists globally, check if it's in this org_id
-        space = manage_spaces.get_thread_space(org_id, thread_id)
+    # also links a thread space from before thread_spaces to the thread on first use
+    space = manage_spaces.get_thread_space(org_id, thread_id, feature)
 
     if space is None:
         topic = run_queries.get_thread_topic(feature, thread_id)
-        space = manage_spaces.create_thread_space(org_id, thread_id, topic, SpaceDataSources.MANUAL_UPLOAD.name)
+        space = manage_spaces.create_thread_space(
+            org_id, thread_id, topic, SpaceDataSources.MANUAL_UPLOAD.name, feature
+        )
 
     if space is not None:
         file = st.session_state.get(f"chat_file_uploader_{feature.value()}", None)
@@ -650,18 +654,26 @@ def handle_chat_input(feature: domain.FeatureKey) -> None:
                 assistant.llm_settings_collection_key
             )  # get_saved_model_settings_collection(select_org_id)
 
-            result = run_queries.query(req, feature, thread_id, saved_model_settings, assistant, spaces)
+            with llm_caller(select_org_id, get_authenticated_user_id()):
+                result = run_queries.query(req, feature, thread_id, saved_model_settings, assistant, spaces)
 
     get_chat_session(feature.type_, SessionKeyNameForChat.HISTORY).extend(result)
 
 
+@tracer.start_as_current_span("handle_get_message_sources_markdown")
+def handle_get_message_sources_markdown(feature: domain.FeatureKey, message_ids: List[int]) -> Dict[int, str]:
+    """Get the document sources of messages rendered as markdown, keyed by message id."""
+    sources = run_queries.get_sources_for_messages(feature, message_ids)
+    return {id_: manage_documents.format_message_sources(message_sources) for id_, message_sources in sources.items()}
+
+
 def handle_get_thread_space(feature: domain.FeatureKey) -> Optional[SpaceKey]:
     """Get the current thread space."""
     selected_org_id = get_selected_org_id()
     thread_id = get_chat_session(feature.type_, SessionKeyNameForChat.THREAD)
 
     if thread_id and selected_org_id:
-        return manage_spaces.get_thread_space(selected_org_id, thread_id)
+        return manage_spaces.get_thread_space(selected_org_id, thread_id, feature)
 
 
 def handle_index_thread_space(feature: domain.FeatureKey) -> None:
@@ -946,8 +958,8 @@ def prepare_for_chat(feature: domain.FeatureKey) -> None:
         thread_id = thread[0] if thread else _create_new_thread(feature)
         set_chat_session(thread_id, feature.type_, SessionKeyNameForChat.THREAD)
 
-    if SessionKeyNameForChat.CUTOFF.name not in get_chat_session(feature.type_):
-        set_chat_session(datetime.now(), feature.type_, SessionKeyNameForChat.CUTOFF)
+    if SessionKeyNameForChat.CURSOR.name not in get_chat_session(feature.type_):
+        set_chat_session(None, feature.type_, SessionKeyNameForChat.CURSOR)
 
     if SessionKeyNameForChat.HISTORY.name not in get_chat_session(feature.type_):
         set_chat_session([], feature.type_, SessionKeyNameForChat.HISTORY)
@@ -966,7 +978,8 @@ def handle_create_new_chat(feature: domain.FeatureKey) -> None:
     """Create a new chat session. Create a new thread_id and force reset session state."""
     thread_id = _create_new_thread(feature)
     set_chat_session(thread_id, feature.type_, SessionKeyNameForChat.THREAD)
-    set_chat_session(datetime.now(), feature.type_, SessionKeyNameForChat.CUTOFF)
+    # a new thread has nothing older to load. 0 stops messages sent in this session being loaded again as "earlier".
+    set_chat_session(0, feature.type_, SessionKeyNameForChat.CURSOR)
     set_chat_session(
         [("0", "Hi there! This is Docq, ask me anything.", False, datetime.now(), thread_id)],
         feature.type_,
@@ -1085,7 +1098,7 @@ def handle_get_chat_history_threads(feature: domain.FeatureKey) -> List[Tuple[in
 def handle_click_chat_history_thread(feature: domain.FeatureKey, thread_id: int) -> None:
     """Set chat history thread."""
     set_chat_session(thread_id, feature.type_, SessionKeyNameForChat.THREAD)
-    set_chat_session(datetime.now(), feature.type_, SessionKeyNameForChat.CUTOFF)
+    set_chat_session(None, feature.type_, SessionKeyNameForChat.CURSOR)
     set_chat_session([], feature.type_, SessionKeyNameForChat.HISTORY)
     query_chat_history(feature)
 
@@ -84,6 +84,7 @@ from .handlers import (
     handle_get_chat_history_threads,
     handle_get_gravatar_url,
     handle_get_linked_space_group_index,
+    handle_get_message_sources_markdown,
     handle_get_system_settings,
     handle_get_thread_space,
     handle_get_user_email,
@@ -764,7 +765,7 @@ def list_space_groups_ui(name_match: str = None) -> None:
                             st.form_submit_button("Confirm", on_click=handle_delete_space_group, args=(id_))
 
 
-def _chat_message(message_: str, is_user: bool) -> None:
+def _chat_message(message_: str, is_user: bool, sources_markdown: Optional[str] = None) -> None:
     if is_user:
         with st.chat_message("user", avatar=handle_get_gravatar_url()):
             st.write(message_)
@@ -773,6 +774,8 @@ def _chat_message(message_: str, is_user: bool) -> None:
             "assistant", avatar="https://github.com/docqai/docq/blob/main/docs/assets/logo.jpg?raw=true"
         ):
             st.markdown(message_, unsafe_allow_html=True)
+            if sources_markdown:
+                st.markdown(sources_markdown, unsafe_allow_html=True)
 
 
 def _personal_ask_style() -> None:
@@ -1097,6 +1100,10 @@ def chat_ui(feature: FeatureKey) -> None:
         chat_history = get_chat_session(feature.type_, SessionKeyNameForChat.HISTORY)
 
         if chat_history:
+            # sources are rendered only for the messages displayed. Agent messages have a str id.
+            sources_markdown = handle_get_message_sources_markdown(
+                feature, [x[0] for x in chat_history if not x[2] and isinstance(x[0], int)]
+            )
             for x in chat_history:
                 # x = (id, text, is_user, time, thread_id)
                 # if format_datetime(x[3]) != day:
@@ -1143,7 +1150,7 @@ def chat_ui(feature: FeatureKey) -> None:
                                 st.image(images, image_names)
 
                 else:
-                    _chat_message(x[1], x[2])
+                    _chat_message(x[1], x[2], sources_markdown.get(x[0]))
 
     st.chat_input(
         "Type your question here",